@@ -17,6 +17,8 @@ parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 os.sys.path.insert(0, parentdir)
 from helpers.utils import init_logger
 import helpers.docker_builder
+from helpers.resource_manager import ResourceManager, Allocation
+from configfinder import config_settings
 
 logger = init_logger("tasks", use_celery=True)
 
@@ -25,8 +27,61 @@ This file contains all the task descriptions for celery
 """
 
 app = Celery('celery_tasks.tasks', backend='rpc://', broker='pyamqp://guest@localhost//')
+app.conf.worker_send_task_events = True  # The RepoFuzzer schedules on task-succeeded/-failed events
 KEEP_IMAGES = False
 docker_client = docker.from_env()
+resource_manager = ResourceManager() if config_settings.USE_RESOURCE_MANAGER else None
+
+
+def acquire_resources(task, cores: int, memory: int) -> typing.Optional[Allocation]:
+    """
+    Admits the task only if the host has enough free cores and memory, otherwise it is retried later.
+    :return: The allocation of the task, None without resource manager.
+    """
+    if resource_manager is None:
+        return None
+    allocation = resource_manager.acquire(cores=cores, memory=memory,
+                                          owner="{0} {1}".format(task.name, task.request.id))
+    if allocation is None:
+        raise task.retry(countdown=config_settings.RESOURCE_RETRY_DELAY, max_retries=None)
+    return allocation
+
+
+def release_resources(allocation: typing.Optional[Allocation]):
+    if allocation is not None:
+        resource_manager.release(allocation)
+
+
+def resource_args(allocation: typing.Optional[Allocation], default: typing.List[str]) -> typing.List[str]:
+    """
+    :return: The docker run arguments confining a container to the allocation, default without resource manager.
+    """
+    return allocation.docker_args() if allocation is not None else default
+
+
+def current_package_image(task, package: str, fuzzer_image: str, build_file: str, qemu: bool = False,
+                          timeout: float = None) -> str:
+    """
+    :return: The image of the package from the build file, built first if it does not exist (anymore).
+             The build gets its own allocation of BUILD_MEMORY, the allocations of the other tasks are too small.
+    """
+    if os.path.exists(build_file):
+        with open(build_file, "r") as jsonfp:
+            build_dict = json.load(jsonfp)
+            package_image_name = build_dict["docker_image_name"]
+    else:
+        package_image_name = package + "_" + str(uuid.uuid4())[:8]
+    if not os.path.exists(os.path.dirname(build_file)):
+        os.mkdir(os.path.dirname(build_file))
+    if helpers.docker_builder.package_image_exists(package_image_name):
+        return package_image_name
+    allocation = acquire_resources(task, cores=1, memory=config_settings.BUILD_MEMORY)
+    try:
+        return helpers.docker_builder.return_current_package_image(
+            package=package, fuzzer_image=fuzzer_image, package_image=package_image_name, json_output_path=build_file,
+            qemu=qemu, timeout=timeout, resource_args=resource_args(allocation, None))
+    finally:
+        release_resources(allocation)
 
 
 @app.task(bind=True, base=AbortableTask, name="celery_tasks.tasks.run_fuzzer")
@@ -39,7 +94,7 @@ def run_fuzzer(self, docker_name, package: str, docker_args: [str], base_image:
         print("Int handler!")
         if fuzzer_command is not None:
             try:
-                docker_command.stop(docker_name,
+                docker_command.stop("-t", config_settings.AFL_STOP_GRACE, docker_name,
                                     _timeout=120)  # It should not take longer than 120 seconds to kill a docker container, right????
             except sh.ErrorReturnCode:
                 return package, True
@@ -50,21 +105,14 @@ def run_fuzzer(self, docker_name, package: str, docker_args: [str], base_image:
             return package, True
 
     signals['INT'] = int_handler
+    allocation = None
     try:
-        if os.path.exists(build_file):
-            with open(build_file, "r") as jsonfp:
-                build_dict = json.load(jsonfp)
-                package_image_name = build_dict["docker_image_name"]
-        else:
-            package_image_name = package + "_" + str(uuid.uuid4())[:8]
-        # TODO: Limit build process to one cpu
-        package_image_name = helpers.docker_builder.return_current_package_image(package=package,
-                                                                                 fuzzer_image=base_image,
-                                                                                 package_image=package_image_name,
-                                                                                 json_output_path=build_file)
+        package_image_name = current_package_image(self, package=package, fuzzer_image=base_image,
+                                                   build_file=build_file)
         if package_image_name is None:
             return False
-        # docker_args.insert(0,'--cpus=0.90')
+        allocation = acquire_resources(self, cores=1, memory=config_settings.TASK_MEMORY)
+        docker_args = resource_args(allocation, []) + docker_args
         print("Invoking the fuzzing docker")
         # TODO: This throws an exception in the background thread right now, which seems to be a bug in sh:
         # https://github.com/amoffat/sh/issues/399. For now, we are ignoring the issue.
@@ -85,13 +133,15 @@ def run_fuzzer(self, docker_name, package: str, docker_args: [str], base_image:
     except sh.TimeoutException as e:
         print("Fuzzing {0} timed out... Next one!".format(package))
         try:
-            docker_command.stop(docker_name)
+            docker_command.stop("-t", config_settings.AFL_STOP_GRACE, docker_name)  # afl checkpoints on SIGTERM
         except sh.ErrorReturnCode as e:  # Container is already removed
             pass
         return package, True
     except sh.SignalException_SIGKILL as e:
         print("Killed")
         return package, True
+    finally:
+        release_resources(allocation)
     return package, True
 
 
@@ -116,18 +166,12 @@ def run_minimizer(self, docker_name, package: str, docker_args: [str], fuzzer_im
             return package, True
 
     signals['INT'] = int_handler
+    allocation = None
     try:
-        if os.path.exists(build_file):
-            with open(build_file, "r") as jsonfp:
-                build_dict = json.load(jsonfp)
-                package_image_name = build_dict["docker_image_name"]
-        else:
-            package_image_name = package + "_" + str(uuid.uuid4())[:8]
-        package_image_name = helpers.docker_builder.return_current_package_image(package=package,
-                                                                                 fuzzer_image=fuzzer_image,
-                                                                                 package_image=package_image_name,
-                                                                                 json_output_path=build_file)
-        docker_args.insert(0, '--cpus=1.0')
+        package_image_name = current_package_image(self, package=package, fuzzer_image=fuzzer_image,
+                                                   build_file=build_file)
+        allocation = acquire_resources(self, cores=1, memory=config_settings.TASK_MEMORY)
+        docker_args = resource_args(allocation, ['--cpus=1.0']) + docker_args
         print("Invoking the minimizing docker")
         minimizer_command = docker_command.run(docker_args, package_image_name, fuzzer_command_args, _out=sys.stdout,
                                                _bg=True)  # No timeout here, the timeouts are build into the minimizer
@@ -149,6 +193,8 @@ def run_minimizer(self, docker_name, package: str, docker_args: [str], fuzzer_im
     except sh.SignalException_SIGKILL as e:
         print("Killed")
         return package, True
+    finally:
+        release_resources(allocation)
     return package, True
 
 
@@ -188,20 +234,13 @@ def run_inference(self, docker_name, package: str, docker_args: [str], fuzzer_im
 
     signals['INT'] = int_handler
     print("Now working on {0}".format(package))
+    allocation = None
     try:
-        if os.path.exists(build_file):
-            with open(build_file, "r") as jsonfp:
-                build_dict = json.load(jsonfp)
-                package_image_name = build_dict["docker_image_name"]
-        else:
-            package_image_name = package + "_" + str(uuid.uuid4())[:8]
-        if not os.path.exists(os.path.dirname(build_file)):
-            os.mkdir(os.path.dirname(build_file))
         # TODO: There is an issue with qemu here. Fix this!
-        package_image_name = helpers.docker_builder.return_current_package_image(package=package,
-                                                                                 fuzzer_image=fuzzer_image,
-                                                                                 package_image=package_image_name,
-                                                                                 json_output_path=build_file, qemu=qemu)
+        package_image_name = current_package_image(self, package=package, fuzzer_image=fuzzer_image,
+                                                   build_file=build_file, qemu=qemu)
+        allocation = acquire_resources(self, cores=1, memory=config_settings.TASK_MEMORY)
+        docker_args = resource_args(allocation, ['--cpus=1.0']) + docker_args
         print("docker run", " ".join(docker_args), package_image_name,
               " ".join(map(lambda x: str(x), inference_command_args)))
         build_dict = {}
@@ -211,7 +250,6 @@ def run_inference(self, docker_name, package: str, docker_args: [str], fuzzer_im
             inference_command_args.append("-Q")
         elif not build_dict["qemu"] and "-Q" in inference_command_args:
             inference_command_args.remove("-Q")
-        docker_args.insert(0, '--cpus=1.0')
         inference_command = docker_command.run(docker_args, package_image_name, inference_command_args, _out=sys.stdout,
                                                _timeout=timeout_per_package)  # type: sh.RunningCommand
         if inference_command.exit_code != 0:
@@ -238,31 +276,22 @@ def run_inference(self, docker_name, package: str, docker_args: [str], fuzzer_im
     except sh.SignalException_SIGKILL as e:
         print("Killed")
         return True
+    finally:
+        release_resources(allocation)
     return True
 
 
 @app.task(bind=True, base=AbortableTask, name="celery_tasks.tasks.build_package")
 def build_package(self, package: str, fuzzer_image: str, build_file: str, qemu: bool = False):
-    if os.path.exists(build_file):
-        with open(build_file, "r") as jsonfp:
-            build_dict = json.load(jsonfp)
-            package_image_name = build_dict["docker_image_name"]
-    else:
-        package_image_name = package + "_" + str(uuid.uuid4())[:8]
-    if not os.path.exists(os.path.dirname(build_file)):
-        os.mkdir(os.path.dirname(build_file))
     # TODO: There is an issue with qemu here. Fix this!
-    package_image_name = helpers.docker_builder.return_current_package_image(package=package, fuzzer_image=fuzzer_image,
-                                                                             package_image=package_image_name,
-                                                                             json_output_path=build_file, qemu=qemu,
-                                                                             timeout=30 * 60)
-    return package_image_name
+    return current_package_image(self, package=package, fuzzer_image=fuzzer_image, build_file=build_file, qemu=qemu,
+                                 timeout=30 * 60)
 
 
 @app.task(bind=True, name="celery_tasks.tasks.run_eval")
 def run_eval(self, package: str, fuzzer_image: str, volume_path: str, seeds_path: str, fuzz_duration: int = 45 * 60,
              use_asan: int = False, exec_timeout: int = None, qemu: bool = False,
-             config_dict: typing.Dict[str, object] = None):
+             config_dict: typing.Dict[str, object] = None, phase: str = None):
     """
 
     :param self:
@@ -275,6 +304,7 @@ def run_eval(self, package: str, fuzzer_image: str, volume_path: str, seeds_path
     :param exec_timeout:
     :param qemu:
     :param config_dict:
+    :param phase: config_settings.EVAL_PHASE_INFERENCE or EVAL_PHASE_FUZZ to run only that phase, None for both.
     :return:
     """
     print("Got eval task for package {0}".format(package))
@@ -290,24 +320,35 @@ def run_eval(self, package: str, fuzzer_image: str, volume_path: str, seeds_path
         additional_env_variables["AFL_USE_ASAN"] = "1"
     eval_package_dict = {"package": package, "volume": "/results", "fuzz_duration": int(fuzz_duration),
                          "exec_timeout": exec_timeout, "qemu": qemu, "seeds": "/fuzz/seeds",
-                         "fuzzing_cores_per_binary": config_dict.get("fuzzing_cores_per_binary"), "asan": use_asan}
+                         "fuzzing_cores_per_binary": config_dict.get("fuzzing_cores_per_binary"), "asan": use_asan,
+                         "phase": phase}
     os.makedirs(os.path.join(volume_path, "run_configurations"), exist_ok=True)
     with open(os.path.join(volume_path, "run_configurations", package + ".json"), "w") as fp:
         json.dump(eval_package_dict, fp, indent=4, sort_keys=True)
     eval_args = ["/inputinferer/configfinder/eval_package.py", "/run_configurations/" + package + ".json"]
-    container = docker_client.containers.run(image=fuzzer_image, remove=True, cap_add=["SYS_PTRACE"],
-                                             security_opt=["seccomp=unconfined"],
-                                             entrypoint="python",
-                                             volumes=volumes_dict,
-                                             command=eval_args,
-                                             detach=True, stream=True, stdout=True, stderr=True,
-                                             name=package + "_fuzz_" + str(uuid.uuid4())[:4],
-                                             environment=additional_env_variables)
-    container_output = ""
-    for line in container.logs(stream=True):
-        logger.info(line.decode("utf-8").strip())
-        container_output += line.decode("utf-8")
-    status = container.wait()
+    cores = config_dict.get("fuzzing_cores_per_binary") or 1
+    allocation = acquire_resources(self, cores=cores, memory=max(config_settings.TASK_MEMORY,
+                                                                 cores * config_settings.FUZZING_MEMORY_PER_CORE))
+    try:
+        resource_kwargs = {}
+        if allocation is not None:
+            resource_kwargs = allocation.container_kwargs()
+            additional_env_variables["AFL_NO_AFFINITY"] = "1"
+        container = docker_client.containers.run(image=fuzzer_image, remove=True, cap_add=["SYS_PTRACE"],
+                                                 security_opt=["seccomp=unconfined"],
+                                                 entrypoint="python",
+                                                 volumes=volumes_dict,
+                                                 command=eval_args,
+                                                 detach=True, stream=True, stdout=True, stderr=True,
+                                                 name=package + "_fuzz_" + str(uuid.uuid4())[:4],
+                                                 environment=additional_env_variables, **resource_kwargs)
+        container_output = ""
+        for line in container.logs(stream=True):
+            logger.info(line.decode("utf-8").strip())
+            container_output += line.decode("utf-8")
+        status = container.wait()
+    finally:
+        release_resources(allocation)
     if status["StatusCode"] != 0:
         logger.error(
             "Error while running docker command. Docker Output:\n {0}. Return value {1}".format(container_output,
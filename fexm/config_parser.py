@@ -22,6 +22,8 @@ default_config = {
     "force": True,  # TODO: Should be commandline switch.
     "exec_timeout": "1000+",
     "fuzzing_cores_per_binary": 1,
+    "eval_concurrency": 0,  # Packages fuzzed at once, 0 for no limit
+    "inference_concurrency": 0,  # Packages built and inferred at once, 0 for no limit
 }
 
 
@@ -44,6 +46,8 @@ def check_types(
         # pacmanfuzzer
         exec_timeout: Union[int, str],
         fuzzing_cores_per_binary: Optional[int],
+        eval_concurrency: Optional[int] = 0,
+        inference_concurrency: Optional[int] = 0,
         packages_file: Optional[str] = None,
 
         # Autofilled and will be overwritten.
@@ -0,0 +1,251 @@
+"""
+Probes the filetypes of a parameter adaptively instead of sweeping every filetype directory.
+Every filetype is an arm of a multi-armed bandit, pulling an arm runs one more (random) seed of that filetype
+and observes the coverage the seed yields. After a few initial seeds per filetype, the prober runs rounds of
+successive elimination: A filetype is dropped once its upper confidence bound falls below the lower confidence
+bound of the leader. The bounds are normal approximations of the mean coverage, with the variance pooled over all
+filetypes as a floor (a few seeds say little about the variance of one filetype) and shrunk by the finite
+population correction, since a filetype has only so many seeds. The remaining budget is spent on the filetypes
+still in contention.
+"""
+import math
+import random
+import typing
+
+ArmSeed = typing.Tuple[str, str]
+
+
+def normal_cdf(x: float) -> float:
+    return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+
+def normal_quantile(p: float) -> float:
+    """
+    :return: x with normal_cdf(x) = p, found by bisection.
+    """
+    low, high = -40.0, 40.0
+    for _ in range(100):
+        middle = (low + high) / 2
+        if normal_cdf(middle) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+class ArmStatistics(object):
+    def __init__(self, arm: str, seeds: typing.List[str]):
+        """
+        :param arm: The name of the arm, e.g. the filetype directory.
+        :param seeds: The seeds of the arm, pulled in this order.
+        """
+        self.arm = arm
+        self.seeds = seeds
+        self.values = []  # type: typing.List[float]
+        self.eliminated_in_round = None  # type: int
+
+    @property
+    def pulls(self) -> int:
+        return len(self.values)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.pulls >= len(self.seeds)
+
+    @property
+    def mean(self) -> float:
+        return sum(self.values) / self.pulls if self.values else 0.0
+
+    @property
+    def variance(self) -> float:
+        if self.pulls < 2:
+            return 0.0
+        mean = self.mean
+        return sum((value - mean) ** 2 for value in self.values) / (self.pulls - 1)
+
+    @property
+    def finite_population_correction(self) -> float:
+        """
+        :return: How much of the uncertainty about the mean is left: 1 for few pulls, 0 once all seeds were pulled.
+        """
+        if len(self.seeds) <= 1:
+            return 0.0
+        return math.sqrt(max(len(self.seeds) - self.pulls, 0) / (len(self.seeds) - 1))
+
+    def radius(self, delta: float, variance_floor: float = 0.0) -> float:
+        """
+        :return: The radius of the (two-sided) confidence interval of the mean, holding with probability 1 - delta.
+        """
+        if not self.pulls:
+            return math.inf
+        return normal_quantile(1 - delta / 2) * self.standard_error(variance_floor)
+
+    def standard_error(self, variance_floor: float = 0.0) -> float:
+        if not self.pulls:
+            return math.inf
+        return math.sqrt(max(self.variance, variance_floor) / self.pulls) * self.finite_population_correction
+
+
+class ProbeResult(object):
+    def __init__(self, arms: typing.Dict[str, ArmStatistics], contenders: typing.List[str], delta: float,
+                 rounds: int, variance_floor: float = 0.0):
+        """
+        :param arms: The statistics of all arms.
+        :param contenders: The arms not eliminated, best mean first.
+        :param delta: The error probability the arms were eliminated with.
+        :param rounds: The number of rounds it took.
+        :param variance_floor: The pooled variance of the arms.
+        """
+        self.arms = arms
+        self.contenders = contenders
+        self.delta = delta
+        self.rounds = rounds
+        self.variance_floor = variance_floor
+
+    @property
+    def leader(self) -> typing.Optional[str]:
+        return self.contenders[0] if self.contenders else None
+
+    @property
+    def pulls(self) -> int:
+        return sum(statistics.pulls for statistics in self.arms.values())
+
+    @property
+    def means(self) -> typing.Dict[str, float]:
+        return {arm: statistics.mean for arm, statistics in self.arms.items()}
+
+    @property
+    def eliminated(self) -> typing.List[str]:
+        return [arm for arm, statistics in self.arms.items() if statistics.eliminated_in_round is not None]
+
+    def confidence_of(self, arm: str) -> float:
+        """
+        :return: How sure the probe is that the arm is the best one: The eliminated arms are worse with
+                 probability 1 - delta, the other contenders are compared by a normal approximation of the difference
+                 of the means. 0 for an eliminated or unknown arm.
+        """
+        statistics = self.arms.get(arm)
+        if statistics is None or statistics.eliminated_in_round is not None:
+            return 0.0
+        confidence = 1 - self.delta
+        for other in self.contenders:
+            if other == arm:
+                continue
+            other_statistics = self.arms[other]
+            gap = statistics.mean - other_statistics.mean
+            standard_error = math.sqrt(statistics.standard_error(self.variance_floor) ** 2 +
+                                       other_statistics.standard_error(self.variance_floor) ** 2)
+            if standard_error == 0:
+                confidence = min(confidence, 1.0 if gap > 0 else 0.5 if gap == 0 else 0.0)
+            else:
+                confidence = min(confidence, normal_cdf(gap / standard_error))
+        return confidence
+
+    @property
+    def confidence(self) -> float:
+        """
+        :return: How sure the probe is that the leader is the best arm.
+        """
+        return self.confidence_of(self.leader) if self.leader is not None else 0.0
+
+
+class AdaptiveProber(object):
+    INITIAL_PULLS = 3  # Like afl_probe, which takes three random files per filetype
+    PULLS_PER_ROUND = 2
+    DELTA = 0.05
+
+    def __init__(self, arms: typing.Dict[str, typing.List[str]],
+                 measure: typing.Callable[[typing.List[ArmSeed]], typing.List[float]], budget: int = None,
+                 delta: float = DELTA, initial_pulls: int = INITIAL_PULLS, pulls_per_round: int = PULLS_PER_ROUND,
+                 random_seed: int = 0, preferred: typing.Dict[str, typing.List[str]] = None):
+        """
+        :param arms: The seeds per arm. Arms without seeds are ignored.
+        :param measure: Runs a batch of (arm, seed) pulls and returns the coverage of every seed, in the same order.
+                        All pulls of a round are handed over at once, so measure can run them in parallel.
+        :param budget: The maximum number of seeds to run in total, None for no limit.
+        :param delta: The probability of eliminating the best arm (split up over all arms and rounds).
+        :param initial_pulls: The seeds every arm gets before the first elimination.
+        :param pulls_per_round: The seeds every contender gets per round.
+        :param random_seed: The seed for shuffling the seeds of the arms, to keep probing reproducible.
+        :param preferred: Seeds per arm that are pulled first, in their order, e.g. the representatives of a filetype.
+        """
+        rng = random.Random(random_seed)
+        self.arms = {}  # type: typing.Dict[str, ArmStatistics]
+        for arm, seeds in sorted(arms.items()):
+            if not seeds:
+                continue
+            seeds = sorted(seeds)
+            rng.shuffle(seeds)
+            seed_set = set(seeds)
+            first = [seed for seed in (preferred or {}).get(arm, []) if seed in seed_set]
+            first_set = set(first)
+            self.arms[arm] = ArmStatistics(arm, first + [seed for seed in seeds if seed not in first_set])
+        self.measure = measure
+        self.budget = budget
+        self.delta = delta
+        self.initial_pulls = initial_pulls
+        self.pulls_per_round = pulls_per_round
+        self.pulls = 0
+        self.rounds = 0
+
+    def contenders(self) -> typing.List[ArmStatistics]:
+        return [statistics for statistics in self.arms.values() if statistics.eliminated_in_round is None]
+
+    def _pull(self, pulls_per_arm: typing.Dict[str, int]):
+        batch = []
+        for arm, count in pulls_per_arm.items():
+            statistics = self.arms[arm]
+            batch += [(arm, seed) for seed in statistics.seeds[statistics.pulls:statistics.pulls + count]]
+        if self.budget is not None:
+            batch = batch[:max(self.budget - self.pulls, 0)]
+        if not batch:
+            return
+        values = self.measure(batch)
+        for (arm, _), value in zip(batch, values):
+            self.arms[arm].values.append(float(value))
+        self.pulls += len(batch)
+
+    def _eliminate(self):
+        contenders = self.contenders()
+        # Union bound over the arms and rounds (sum of 1 / ((r + 1) * (r + 2)) over all rounds r is 1)
+        delta = self.delta / (len(self.arms) * (self.rounds + 1) * (self.rounds + 2))
+        variance_floor = self.pooled_variance()
+        lower_bound = max(statistics.mean - statistics.radius(delta, variance_floor) for statistics in contenders)
+        for statistics in contenders:
+            if statistics.mean + statistics.radius(delta, variance_floor) < lower_bound:
+                statistics.eliminated_in_round = self.rounds
+
+    def pooled_variance(self) -> float:
+        """
+        :return: The variance of the coverage within the arms, pooled over all arms.
+        """
+        degrees_of_freedom = sum(statistics.pulls - 1 for statistics in self.arms.values() if statistics.pulls > 1)
+        if not degrees_of_freedom:
+            return 0.0
+        return sum(statistics.variance * (statistics.pulls - 1) for statistics in self.arms.values()
+                   if statistics.pulls > 1) / degrees_of_freedom
+
+    def _done(self) -> bool:
+        contenders = self.contenders()
+        if len(contenders) <= 1:
+            return True
+        if self.budget is not None and self.pulls >= self.budget:
+            return True
+        return all(statistics.exhausted for statistics in contenders)
+
+    def run(self) -> ProbeResult:
+        """
+        Probes until one arm is left, the budget is spent or all contenders ran all their seeds.
+        """
+        if not self.arms:  # No filetype has seeds
+            return ProbeResult(self.arms, [], self.delta, self.rounds)
+        self._pull({arm: self.initial_pulls for arm in self.arms})
+        self._eliminate()
+        while not self._done():
+            self.rounds += 1
+            self._pull({statistics.arm: self.pulls_per_round for statistics in self.contenders()
+                        if not statistics.exhausted})
+            self._eliminate()
+        contenders = sorted(self.contenders(), key=lambda statistics: statistics.mean, reverse=True)
+        return ProbeResult(self.arms, [statistics.arm for statistics in contenders], self.delta, self.rounds,
+                           variance_floor=self.pooled_variance())
@@ -18,6 +18,8 @@ os.sys.path.insert(0, parentdir)
 from builders import builder
 import logging
 import helpers.utils
+from corpus_minimizer import CorpusMinimizer
+from helpers.exceptions import ForkserverError
 
 
 class AsanAnalyzer:
@@ -33,6 +35,15 @@ class AsanAnalyzer:
 
     def analyze_crashes_for_afl_session(self, afl_dir, out_dir, binary_path: str, parameter: str):
         os.makedirs(out_dir, exist_ok=True)
+        if config_settings.USE_NATIVE_CMIN:
+            try:
+                kept = CorpusMinimizer(binary_path, parameter, crash_only=True).minimize(
+                    os.path.join(afl_dir, "queue"), out_dir)
+                if kept:
+                    return
+                print("No crashing inputs found by the native cmin, trying afl-cmin")
+            except ForkserverError as e:
+                print("ASAN: native cmin failed for {0}: {1}".format(binary_path, e))
         aflcmin = sh.Command("afl-cmin")
         # First: Minimize the seeds
         cmin_out_dir = os.path.join("/tmp", str(uuid.uuid4()))
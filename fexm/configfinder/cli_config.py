@@ -1,10 +1,11 @@
-from coverage_evaluator import CoverageEvaluator
+from coverage_scoring import CoverageScores
 
 
 class CliConfig(object):
     def __init__(self, invocation: str, filetypes: [str], max_coverage: int = 0, coverages: [int] = None,
                  coverage_list: [(str, int)] = None, repo_str: str = None, binary_path: str = None,
-                 took_max_file=False):
+                 took_max_file=False, coverage_scores: CoverageScores = None, coverage_scores_row: int = 0,
+                 confidence: float = None):
         """"
         A CliConfiguration Class, consists of a parameter, a filetype and the coverage this filetype yields.
         :param invocation: The invocation the program needs to be called with. Same format as afl "@@" stands for file.
@@ -12,6 +13,9 @@ class CliConfig(object):
         :param coverage: The coverage the file yields in percent
         :param repo_path: The repo path of the binary. Optional
         :param binary_path: The path to the binary. Optional.
+        :param coverage_scores: The scores of coverage_list, if already calculated together with other parameters.
+        :param coverage_scores_row: The row of this parameter in coverage_scores.
+        :param confidence: How sure the inference is that the filetype is the right one (0 to 1), None if unknown.
         """
         if coverages is None:
             coverages = [0]
@@ -25,19 +29,32 @@ class CliConfig(object):
         self.max_coverage = max_coverage
         self.best_chebyshev_tuple = (0, 0)
         self.took_max_file = took_max_file
+        self.confidence = confidence
         if coverage_list:
+            coverage_list = list(coverage_list)  # Might be a zip iterator
             self.coverage_list = list(zip(*coverage_list))
             unzipped_coverage_list = self.coverage_list
             if len(unzipped_coverage_list) != 2:
                 return
-            ce = CoverageEvaluator(type_coverage_list=unzipped_coverage_list)  # type:CoverageEvaluator
-            self.chebyshev_scores = ce.calculate_chebyshev_score()
+            if coverage_scores is None:
+                coverage_scores = CoverageScores([list(coverage_list)])
+                coverage_scores_row = 0
+            self.chebyshev_scores = coverage_scores.chebyshev_scores_of(coverage_scores_row)
             print(self.chebyshev_scores)
-            max_index, max_value = max(enumerate(self.chebyshev_scores[1]), key=lambda p: p[1])
-            self.best_chebyshev_tuple = (self.chebyshev_scores[0][max_index], max_value)
-            self.deviation_scores = ce.calculate_deviation_scores()
-            max_index, max_value = max(enumerate(self.deviation_scores[1]), key=lambda p: p[1])
-            self.best_deviation_tuple = (self.deviation_scores[0][max_index], max_value)
+            self.best_chebyshev_tuple = coverage_scores.best_chebyshev_tuple(coverage_scores_row)
+            self.deviation_scores = coverage_scores.deviation_scores_of(coverage_scores_row)
+            self.best_deviation_tuple = coverage_scores.best_deviation_tuple(coverage_scores_row)
+
+    @staticmethod
+    def from_dict(config_dict: dict) -> "CliConfig":
+        """
+        Restores a CliConfig from its __dict__, e.g. as stored by store_input_vectors_in_volume.
+        :param config_dict: The attributes of the CliConfig.
+        :return: The CliConfig object.
+        """
+        cli_config = CliConfig(invocation=config_dict.get("parameter"), filetypes=config_dict.get("file_types"))
+        cli_config.__dict__.update(config_dict)
+        return cli_config
 
     def get_string_parameter(self):
         """
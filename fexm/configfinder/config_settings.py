@@ -24,6 +24,36 @@ aflerrors = {"AFL_ALREADY_INSTRUMENTED": "Instrumentation found in -Q mode",
              "AFL_NOT_INSTRUMENTED_ALTERNATIVE": "doesn't appear to be instrumented.",
              "AFL_TIMEOUT": "Target binary times out"}
 PREENY_PATH = "/preeny"
+TRIAGE_CORES = os.cpu_count() or 1  # How many binaries are triaged in parallel
+ANALYSIS_CACHE_DIR_NAME = ".analysis_cache"  # Directory of the analysis cache, relative to the volume
+ANALYSIS_CACHE_MAX_SIZE = 256 * 1024 * 1024  # 256 MB of cached analysis results
+USE_COVERAGE_ORACLE = True  # Measure coverage with a long-lived forkserver instead of afl-cmin/afl-showmap runs
+EVAL_PHASE_INFERENCE = "inference"  # eval_package builds, infers and minimizes, the afl configs are fuzzed later
+EVAL_PHASE_FUZZ = "fuzz"  # eval_package fuzzes the binaries that have an afl config from the inference phase
+USE_FILE_ACCESS_TRACER = True  # Find file accesses with preeny's fileaccess.so instead of strace when possible
+EARLY_EXIT_ON_FILE_ACCESS = True  # Kill probed binaries as soon as they access the file instead of waiting for them
+USE_NATIVE_CMIN = True  # Minimize corpora with configfinder.corpus_minimizer instead of afl-cmin when possible
+USE_MINIMIZATION_CACHE = True  # Reuse minimized corpora of the same binary, invocation and seeds
+MINIMIZATION_CACHE_DIR_NAME = ".minimization_cache"  # Directory of the minimization cache, relative to the volume
+MINIMIZATION_CACHE_MAX_AGE = 14 * 24 * 60 * 60  # Unreferenced cached corpora not used for two weeks are removed
+MINIMIZATION_ORPHAN_GRACE = 60 * 60  # Minimization directories modified within the last hour might still be in use
+STORE_COVERAGE_BITMAPS = True  # Keep the bitmaps measured by the coverage oracle in <results>/coverage_bitmaps
+ADAPTIVE_PROBING = True  # Probe filetypes seed by seed on the coverage oracle, dropping filetypes out of contention
+ADAPTIVE_PROBING_BUDGET = 300  # The maximum number of seeds run when probing the filetypes of one parameter
+SEEDS_INDEX_MANIFEST_NAME = ".representatives.json"  # The manifest of representative seeds, in the seeds directory
+SEEDS_INDEX_REPRESENTATIVES = 8  # Representative seeds chosen per filetype
+SEEDS_INDEX_REFERENCE_PARSERS = []  # (binary, invocation) pairs whose coverage tells seeds apart when indexing
+SEEDS_MANIFEST_NAME = ".seeds_manifest.json"  # The manifest of all seeds (files, sizes, hashes), in the seeds directory
+SEEDS_MANIFEST_MAX_AGE = 300  # Seconds until a shared seeds manifest checks the seeds directory for changes again
+ANALYSIS_CACHE_VERSION = 1  # Bump this whenever the analysis itself changes, invalidates the analysis cache
+USE_RESOURCE_MANAGER = True  # Pin task containers to exclusive cores (--cpuset-cpus) and limit their memory
+RESOURCE_STATE_FILE = "/tmp/fexm_resources.json"  # The allocations of all workers on the host, guarded by flock
+RESOURCE_RESERVED_MEMORY = 2 * 1024 ** 3  # Memory left to the host and the workers themselves
+RESOURCE_RETRY_DELAY = 30  # Seconds until a task that found no free cores or memory is tried again
+BUILD_MEMORY = 8 * 1024 ** 3  # Memory limit of a package build
+TASK_MEMORY = 2 * 1024 ** 3  # Memory limit of an inference, minimization or single afl container
+FUZZING_MEMORY_PER_CORE = 1 * 1024 ** 3  # Memory limit per afl instance of a parallel fuzzing container
+AFL_STOP_GRACE = 30  # Seconds a stopped fuzzing container has to stop afl gracefully and checkpoint before it is killed
 
 
 class Status(IntEnum):
@@ -28,6 +28,8 @@ if __name__ == "__main__":
                                  help="Where should the afl configuration be stored?")
     minimize_parser.add_argument("-tmintotal", "--tmin_total_time", type=int, required=False, default=None,
                                  help="For how long should tmin run in total at max?")
+    minimize_parser.add_argument("-c", "--cores", type=int, required=False, default=1,
+                                 help="How many afl-tmin instances run in parallel?")
     minimize_parser.set_defaults(
         which='minimize')  # https://stackoverflow.com/questions/8250010/argparse-identify-which-subparser-was-used
     fuzz_parser = subparsers.add_parser("fuzz", help="Fuzz the binary")
@@ -44,6 +46,10 @@ if __name__ == "__main__":
     fuzz_parser.add_argument("-b", "--binary", required=False, type=str, help="Path to the binary to fuzz.")
     fuzz_parser.add_argument("-v", "--output_volume", required=True, help="In which should the files be stored?")
     fuzz_parser.add_argument("-n", "--name", required=False, help="The name of the docker container", default=None)
+    fuzz_parser.add_argument("-d", "--fuzz_duration", required=False, type=float, default=None,
+                             help="Stop afl gracefully after this many seconds (a time slice), then checkpoint")
+    fuzz_parser.add_argument("--no_reseed", dest="reseed", action="store_false", default=True,
+                             help="Resume without minimizing the queue first (e.g. for the next time slice).")
     group = fuzz_parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-adir", "--afl_resume_dir", help="Resume from afl out dir.")
     group.add_argument("-afile", "--afl_out_file", type=str,
@@ -94,7 +100,8 @@ if __name__ == "__main__":
 
         minimzer.minize(parameter=parameter, seeds_dir=args.seeds, binary_path=args.binary, package=args.package,
                         volume_path=args.output_volume, afl_config_file_name=args.afl_out_file,
-                        qemu=use_qemu, name=args.name, tmin_total_time=args.tmin_total_time)
+                        qemu=use_qemu, name=args.name, tmin_total_time=args.tmin_total_time,
+                        cores=args.cores)
     if args.which == "fuzz":
         use_qemu = args.qemu
         if args.afl_out_file:
@@ -104,14 +111,16 @@ if __name__ == "__main__":
                                                           binary_path=args.binary, package=args.package,
                                                           volume_path=args.output_volume,
                                                           afl_config_file_name=args.afl_out_file, qemu=use_qemu,
-                                                          name=args.name, timeout=args.timeout)
+                                                          name=args.name, timeout=args.timeout,
+                                                          fuzz_duration=args.fuzz_duration)
             if not res:
                 sys.exit(-1)
         else:
             import fuzzer_wrapper
 
             res = fuzzer_wrapper.resume_fuzzer(afl_dir=args.afl_resume_dir, binary_path=args.binary,
-                                               parameter=parameter, qemu=use_qemu, timeout=args.timeout)
+                                               parameter=parameter, qemu=use_qemu, timeout=args.timeout,
+                                               reseed=args.reseed, fuzz_duration=args.fuzz_duration)
             if not res:
                 sys.exit(-1)
     if args.which == "evalfuzz":
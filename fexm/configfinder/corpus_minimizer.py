@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+A corpus minimizer in Python, instead of the afl-cmin shell scripts that trace serially and pay for bash and sort.
+All inputs are traced in parallel on a pool of forkservers (see coverage_oracle), or with afl-showmap if the binary
+does not come up with a forkserver. Every trace is stored compactly as the sorted ids of its (edge, hit count bucket)
+tuples. The minimized corpus is chosen by a greedy weighted set cover: The input covering the most tuples not covered
+so far per cost (its size plus a constant execution overhead) is taken until every tuple seen is covered.
+The output directory looks like the one of afl-cmin: The chosen inputs under their original names.
+Like afl-cmin, crashes and timeouts do not count, and in crash_only mode (afl-cmin -C) only crashes count.
+"""
+import argparse
+import logging
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings as config_settings
+from configfinder import coverage_oracle
+from configfinder.coverage_oracle import CoverageOraclePool, RunResult
+from helpers import utils
+from helpers.exceptions import ForkserverError
+
+logger = logging.getLogger(__name__)
+
+TRACE_CHUNK = 64  # Inputs traced per task, the deadline is checked between tasks
+COST_OVERHEAD = 1024  # The cost of an execution regardless of the input size, in bytes
+
+
+def _bucket_bit_lookup() -> np.ndarray:
+    """
+    Maps a classified bitmap byte (one bit per hit count bucket) to the index of its bucket.
+    """
+    lookup = np.zeros(256, dtype=np.uint32)
+    for bit in range(8):
+        lookup[1 << bit] = bit
+    return lookup
+
+
+BUCKET_BIT_LOOKUP = _bucket_bit_lookup()
+
+
+def tuples_of_bitmap(bitmap: np.ndarray) -> np.ndarray:
+    """
+    :param bitmap: A classified bitmap, see coverage_oracle.COUNT_CLASS_LOOKUP.
+    :return: The sorted ids (edge * 8 + bucket) of its tuples.
+    """
+    edges = np.flatnonzero(bitmap).astype(np.uint32)
+    return edges * 8 + BUCKET_BIT_LOOKUP[bitmap[edges]]
+
+
+class ShowmapTracer(object):
+    """
+    Traces inputs with one afl-showmap run each, for binaries without a working forkserver.
+    Has the same run_batch as a CoverageOraclePool.
+    """
+
+    def __init__(self, binary_path: str, invocation: str, qemu: bool = False, env: typing.Dict[str, str] = None,
+                 timeout: float = None):
+        self.binary_path = binary_path
+        self.invocation = invocation or ""
+        self.qemu = qemu
+        self.env = env
+        self.timeout = timeout if timeout is not None else config_settings.AFL_CMIN_INVOKE_TIMEOUT
+        self.showmap = shutil.which("afl-showmap")
+        if not self.showmap:
+            raise ForkserverError(binary_path, "afl-showmap not found")
+
+    def run(self, input_path: str) -> RunResult:
+        with tempfile.NamedTemporaryFile(prefix="showmap_") as out_file:
+            argv = [self.showmap, "-q", "-o", out_file.name, "-m", "none", "-t",
+                    str(int(self.timeout * 1000))]
+            if self.qemu:
+                argv.append("-Q")
+            argv += ["--", self.binary_path] + coverage_oracle.invocation_argv(self.invocation, input_path)
+            uses_stdin = "@@" not in self.invocation
+            with open(input_path if uses_stdin else os.devnull, "rb") as stdin:
+                returncode = subprocess.call(argv, stdin=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                             env=self.env)
+            bitmap = np.zeros(coverage_oracle.MAP_SIZE, dtype=np.uint8)
+            for line in out_file:
+                edge, _, bucket = line.partition(b":")
+                if bucket.strip():
+                    bitmap[int(edge)] = 1 << (int(bucket) - 1)  # afl-showmap writes the buckets as 1 to 8
+        # afl-showmap exits with 1 on a timeout and 2 on a crash
+        status = {1: coverage_oracle.RUN_TIMEOUT, 2: coverage_oracle.RUN_CRASH}.get(returncode, coverage_oracle.RUN_OK)
+        return RunResult(input_path, status, bitmap)
+
+    def run_batch(self, input_paths: typing.Iterable[str]) -> typing.List[RunResult]:
+        return [self.run(input_path) for input_path in input_paths]
+
+    def close(self):
+        pass
+
+
+def _concatenated_ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    :return: The concatenation of all np.arange(start, end), without a python loop.
+    """
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    range_starts = np.cumsum(lengths) - lengths
+    return np.repeat(starts - range_starts, lengths) + np.arange(total, dtype=np.int64)
+
+
+class CorpusTraces(object):
+    """
+    The tuples of all traced inputs that count, in compressed sparse rows: The tuples of input i are
+    tuples[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, paths: typing.List[str], sizes: np.ndarray, tuples: np.ndarray, offsets: np.ndarray,
+                 untraced: typing.List[str]):
+        """
+        :param untraced: The inputs that were not traced before the deadline.
+        """
+        self.paths = paths
+        self.sizes = sizes
+        self.tuples = tuples
+        self.offsets = offsets
+        self.untraced = untraced
+
+    def __len__(self):
+        return len(self.paths)
+
+    def tuples_of(self, index: int) -> np.ndarray:
+        return self.tuples[self.offsets[index]:self.offsets[index + 1]]
+
+
+def greedy_cover(traces: CorpusTraces) -> typing.List[int]:
+    """
+    Greedy weighted set cover: Takes the input with the most uncovered tuples per cost until every tuple is covered.
+    The gains are updated incrementally through the inverted index (tuple -> inputs), so every tuple is only
+    touched once when it gets covered.
+    :return: The indices of the chosen inputs, in the order they were chosen.
+    """
+    if not len(traces) or not len(traces.tuples):
+        return []
+    row_of_entry = np.repeat(np.arange(len(traces), dtype=np.int64), np.diff(traces.offsets))
+    # Inverted index: The inputs of every tuple, in compressed sparse columns
+    tuple_ids, tuple_of_entry = np.unique(traces.tuples, return_inverse=True)
+    order = np.argsort(tuple_of_entry, kind="stable")
+    inputs_of_tuple = row_of_entry[order]
+    tuple_offsets = np.concatenate([[0], np.cumsum(np.bincount(tuple_of_entry, minlength=len(tuple_ids)))])
+    # The tuples of every input as indices into tuple_ids
+    tuples_of_input = tuple_of_entry
+    gains = np.diff(traces.offsets).astype(np.float64)
+    costs = traces.sizes.astype(np.float64) + COST_OVERHEAD
+    covered = np.zeros(len(tuple_ids), dtype=bool)
+    chosen = []
+    while True:
+        best = int(np.argmax(gains / costs))
+        if gains[best] <= 0:
+            break
+        chosen.append(best)
+        new_tuples = tuples_of_input[traces.offsets[best]:traces.offsets[best + 1]]
+        new_tuples = new_tuples[~covered[new_tuples]]
+        covered[new_tuples] = True
+        affected = inputs_of_tuple[_concatenated_ranges(tuple_offsets[new_tuples], tuple_offsets[new_tuples + 1])]
+        gains -= np.bincount(affected, minlength=len(traces))
+    return chosen
+
+
+class CorpusMinimizer(object):
+    def __init__(self, binary_path: str, invocation: str, qemu: bool = False, env: typing.Dict[str, str] = None,
+                 timeout: float = None, cores: int = 1, crash_only: bool = False):
+        """
+        :param binary_path: The path to the binary.
+        :param invocation: The parameters, "@@" stands for the input file. Without "@@", the input is given on stdin.
+        :param qemu: Run the binary in afl-qemu-trace.
+        :param env: The environment for the binary, defaults to the fuzzing environment for the invocation.
+        :param timeout: The timeout per execution in seconds, defaults to config_settings.AFL_CMIN_INVOKE_TIMEOUT.
+        :param cores: The number of inputs traced in parallel.
+        :param crash_only: Only keep crashing inputs, like afl-cmin -C.
+        """
+        self.binary_path = binary_path
+        self.invocation = invocation or ""
+        self.qemu = qemu
+        self.env = env if env is not None else utils.get_fuzzing_env_for_invocation(self.invocation)
+        self.timeout = timeout if timeout is not None else config_settings.AFL_CMIN_INVOKE_TIMEOUT
+        self.cores = max(1, cores)
+        self.crash_only = crash_only
+
+    def _tracer(self):
+        """
+        :return: A forkserver pool, or an afl-showmap tracer if the binary does not come up with a forkserver.
+        """
+        pool = CoverageOraclePool(self.binary_path, self.invocation, qemu=self.qemu, env=self.env,
+                                  timeout=self.timeout, size=self.cores)
+        try:
+            pool.run_batch([])  # Starts one forkserver to see if it works
+            return pool
+        except ForkserverError as e:
+            pool.close()
+            logger.info("{0}, tracing with afl-showmap instead".format(e))
+            return ShowmapTracer(self.binary_path, self.invocation, qemu=self.qemu, env=self.env,
+                                 timeout=self.timeout)
+
+    def trace(self, files: typing.List[str], deadline: float = None) -> CorpusTraces:
+        """
+        :param files: The inputs to trace.
+        :param deadline: No new inputs are traced after this time.time(), the rest is returned as untraced.
+        :raises ForkserverError: If no tracer works for the binary.
+        """
+        wanted_status = coverage_oracle.RUN_CRASH if self.crash_only else coverage_oracle.RUN_OK
+        chunks = [files[i:i + TRACE_CHUNK] for i in range(0, len(files), TRACE_CHUNK)]
+        untraced = []
+        untraced_lock = threading.Lock()
+        tracer = self._tracer()
+
+        def trace_chunk(chunk: typing.List[str]) -> typing.List[typing.Tuple[str, np.ndarray]]:
+            if deadline is not None and time.time() > deadline:
+                with untraced_lock:
+                    untraced.extend(chunk)
+                return []
+            return [(result.input_path, tuples_of_bitmap(result.bitmap)) for result in tracer.run_batch(chunk)
+                    if result.status == wanted_status]
+
+        try:
+            with ThreadPool(processes=self.cores) as pool:
+                traced = [trace for chunk_traces in pool.map(trace_chunk, chunks, chunksize=1)
+                          for trace in chunk_traces]
+        finally:
+            tracer.close()
+        paths = [path for path, _ in traced]
+        lengths = [len(tuples) for _, tuples in traced]
+        tuples = np.concatenate([tuples for _, tuples in traced]) if traced else np.zeros(0, dtype=np.uint32)
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+        sizes = np.array([os.path.getsize(path) for path in paths], dtype=np.int64)
+        return CorpusTraces(paths, sizes, tuples, offsets, untraced)
+
+    def minimize(self, input_dir: str, output_dir: str, time_limit: float = None) -> typing.List[str]:
+        """
+        Writes the minimized corpus of input_dir to output_dir, like afl-cmin -i input_dir -o output_dir.
+        Inputs that were not traced within the time limit are kept, since their coverage is unknown.
+        :param time_limit: Seconds for tracing, defaults to config_settings.AFL_CMIN_TIMEOUT.
+        :return: The paths of the inputs written to output_dir.
+        """
+        if time_limit is None:
+            time_limit = config_settings.AFL_CMIN_TIMEOUT
+        files = sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir)
+                       if os.path.isfile(os.path.join(input_dir, name)))
+        start = time.time()
+        traces = self.trace(files, deadline=start + time_limit)
+        chosen = [traces.paths[i] for i in greedy_cover(traces)]
+        if traces.untraced:
+            logger.warning("Tracing {0} timed out, keeping {1} untraced inputs".format(self.binary_path,
+                                                                                       len(traces.untraced)))
+        logger.info("Minimized {0} inputs to {1} ({2} traced, {3:.1f}s)".format(
+            len(files), len(chosen) + len(traces.untraced), len(traces), time.time() - start))
+        os.makedirs(output_dir, exist_ok=True)
+        kept = chosen + traces.untraced
+        for path in kept:
+            target = os.path.join(output_dir, os.path.basename(path))
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+        return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimize a corpus like afl-cmin.")
+    parser.add_argument("-i", "--input", required=True, help="The corpus to minimize")
+    parser.add_argument("-o", "--output", required=True, help="Where the minimized corpus is written")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Timeout per execution in seconds")
+    parser.add_argument("-T", "--time_limit", type=float, default=None, help="Time limit for tracing in seconds")
+    parser.add_argument("-c", "--cores", type=int, default=1, help="Inputs traced in parallel")
+    parser.add_argument("-C", dest="crash_only", action="store_true", default=False, help="Keep crashing inputs only")
+    parser.add_argument("-Q", dest="qemu", action="store_true", default=False, help="Run the binary in qemu mode")
+    parser.add_argument("binary", help="The binary to trace")
+    parser.add_argument("invocation", nargs=argparse.REMAINDER, help="The parameters, @@ for the input file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    minimizer = CorpusMinimizer(args.binary, shlex.join(args.invocation), qemu=args.qemu, timeout=args.timeout,
+                                cores=args.cores, crash_only=args.crash_only)
+    kept = minimizer.minimize(args.input, args.output, time_limit=args.time_limit)
+    print("{0} inputs kept".format(len(kept)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import matplotlib
 import os
-import scipy as sp
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.coverage_scoring import CoverageScores
 
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
@@ -18,6 +22,21 @@ class CoverageEvaluator(object):
         """
         self.type_coverage_list = type_coverage_list
 
+    @staticmethod
+    def from_bitmap_store(bitmap_store, binary_path: str, parameter: str) -> "CoverageEvaluator":
+        """
+        Creates the evaluator from the bitmaps stored during inference, without running the binary again.
+        :param bitmap_store: A helpers.bitmap_store.BitmapStore
+        :param binary_path: The path to the binary.
+        :param parameter: The parameter (invocation) the binary was run with.
+        """
+        coverage_per_filetype = bitmap_store.coverage_per_label(binary_path, parameter)
+        file_types = sorted(coverage_per_filetype)
+        return CoverageEvaluator(type_coverage_list=[file_types, [coverage_per_filetype[f] for f in file_types]])
+
+    def _scores(self) -> CoverageScores:
+        return CoverageScores([list(zip(self.type_coverage_list[0], self.type_coverage_list[1]))])
+
     def calculate_deviation_scores(self) -> [[str], [float]]:
         """
         For each file type, calculate a deviation score: 
@@ -28,18 +47,9 @@ class CoverageEvaluator(object):
 	    where $x$ is the coverage corresponding to that filetype.
         :return: A list of two lists: The file types and the corresponding deviation scores.
         """
-        deviation_scores = sp.zeros(len(self.type_coverage_list[1]))
-        mean = sp.mean(self.type_coverage_list[1])  # Calculate $bar{x}$, the mean over all code coverages
-        above_zero_idx = sp.where(self.type_coverage_list[1] >= mean)[0]
-        sum_of_above_zero = 0  # sum_{x > \bar{x}} x-\bar{x}
-        for idx in above_zero_idx:
-            sum_of_above_zero += (self.type_coverage_list[1][idx] - mean)
-            deviation_scores[idx] = self.type_coverage_list[1][idx] - mean
-        # if sum_of_above_zero>0:
-        #    deviation_scores = deviation_scores/sum_of_above_zero # Normalize
-        self.deviation_scores = deviation_scores
-        deviation_scores_list = list(deviation_scores)
-        return [self.type_coverage_list[0], deviation_scores_list]
+        scores = self._scores()
+        self.deviation_scores = scores.deviation_scores[0]
+        return [self.type_coverage_list[0], scores.deviation_scores_of(0)[1]]
 
     def calculate_chebyshev_score(self):
         """
@@ -49,24 +59,9 @@ class CoverageEvaluator(object):
         k^2 = \frac{(x-\bar{x})^2}{\frac{1}{N-1}\sum_{x \in X} {(x - \bar{x})^2}}$$
         :return: 
         """
-        chebyshev_scores = sp.zeros(len(self.type_coverage_list[1]))
-        mean = sp.mean(self.type_coverage_list[1])  # Calculate $bar{x}$, the mean over all code coverages
-        above_zero_idx = sp.where(self.type_coverage_list[1] >= mean)[0]
-        # variance = sp.var(self.type_coverage_list[1])
-        std = sp.std(self.type_coverage_list[1])
-        for idx in above_zero_idx:
-            # chebyshev_scores[idx] = (self.type_coverage_list[1][idx] - mean)**2
-            chebyshev_scores[idx] = (self.type_coverage_list[1][idx] - mean)
-        if std > 0:
-            chebyshev_scores = chebyshev_scores / std
-        # if variance>0:
-        #    chebyshev_scores = chebyshev_scores / variance
-        # sum = sp.sum(chebyshev_scores)
-        # if sum > 0:
-        #    chebyshev_scores /= sum
-        self.chebyshev_scores = chebyshev_scores
-
-        return [self.type_coverage_list[0], list(chebyshev_scores)]
+        scores = self._scores()
+        self.chebyshev_scores = scores.chebyshev_scores[0]
+        return [self.type_coverage_list[0], scores.chebyshev_scores_of(0)[1]]
 
     def plot(self, binary_path: str, figure_path: str, parameter: str, plot_format: str = "png"):
         """
@@ -95,8 +90,8 @@ class CoverageEvaluator(object):
         ordered_cov_list = list(zip(*zipped_list))[1]
         # ordered_cov_list = list(map(lambda x: ((float(x) / number_of_tuples) * 100), ordered_cov_list))
         # print(number_of_tuples)
-        max_index = sp.where(sp.array(ordered_cov_list) == max(ordered_cov_list))
-        rects1 = ax.bar(sp.arange(len(cov_list)), ordered_cov_list, 0.35, color='r')
+        max_index = np.where(np.array(ordered_cov_list) == max(ordered_cov_list))
+        rects1 = ax.bar(np.arange(len(cov_list)), ordered_cov_list, 0.35, color='r')
 
         y_label_list = [''] * len(ordered_file_list)
         for ind in max_index[0]:  # Mark highest bar blue
@@ -108,7 +103,7 @@ class CoverageEvaluator(object):
         # ax.xticks(cov_list,file_list)
         # ax.set_ylim(0,max(ordered_cov_list))
         # ax.set_ylim(0,100)
-        ax.set_xticks(sp.arange(len(ordered_file_list)))
+        ax.set_xticks(np.arange(len(ordered_file_list)))
         ax.set_xlabel("Filetypes", fontsize=14, fontweight='bold')
         ax.set_ylabel("Coverage in tuples", fontsize=14, fontweight='bold')
         ax.set_xticklabels(y_label_list, fontsize=12, rotation=90)
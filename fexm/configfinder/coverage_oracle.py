@@ -0,0 +1,459 @@
+"""
+A long-lived coverage oracle for a binary and an invocation.
+Instead of starting afl-cmin/afl-showmap for every probe, the oracle starts the
+binary once (natively or in afl-qemu-trace), speaks the afl forkserver protocol
+with it and reads the edge bitmap directly from shared memory.
+"""
+import ctypes
+import logging
+import queue
+import random
+import select
+import shlex
+import shutil
+import signal
+import struct
+import tempfile
+import threading
+import typing
+
+import numpy as np
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings as config_settings
+from helpers import constants
+from helpers.exceptions import ForkserverError
+
+logger = logging.getLogger(__name__)
+
+MAP_SIZE = 1 << 16  # The size of the afl edge bitmap
+FORKSRV_FD = 198  # The forkserver reads commands on FORKSRV_FD and writes status to FORKSRV_FD + 1
+FORK_WAIT_MULT = 10  # Like afl: wait this times the execution timeout for the forkserver to come up
+PROBE_FILES = 5  # Like afl_probe: Number of random files per directory when probing
+ACQUIRE_RECHECK_INTERVAL = 0.5  # Seconds a thread waits for an idle oracle before checking for a free slot again
+
+IPC_PRIVATE = 0
+IPC_RMID = 0
+IPC_CREAT = 0o1000
+IPC_EXCL = 0o2000
+
+RUN_OK = 0
+RUN_CRASH = 1
+RUN_TIMEOUT = 2
+
+
+def _count_class_lookup() -> np.ndarray:
+    """
+    afl's count_class_lookup8: Maps hit counts to buckets, one bit per bucket.
+    """
+    lookup = np.zeros(256, dtype=np.uint8)
+    lookup[1] = 1
+    lookup[2] = 2
+    lookup[3] = 4
+    lookup[4:8] = 8
+    lookup[8:16] = 16
+    lookup[16:32] = 32
+    lookup[32:128] = 64
+    lookup[128:256] = 128
+    return lookup
+
+
+COUNT_CLASS_LOOKUP = _count_class_lookup()
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+_libc.shmget.restype = ctypes.c_int
+_libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+_libc.shmat.restype = ctypes.c_void_p
+_libc.shmdt.argtypes = [ctypes.c_void_p]
+_libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+
+class SharedMemoryBitmap:
+    """
+    The SysV shared memory segment afl-instrumented binaries (and afl-qemu-trace) write their edge counts to.
+    """
+
+    def __init__(self, size: int = MAP_SIZE):
+        self.size = size
+        self.shm_id = _libc.shmget(IPC_PRIVATE, size, IPC_CREAT | IPC_EXCL | 0o600)
+        if self.shm_id < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        address = _libc.shmat(self.shm_id, None, 0)
+        if address is None or address == ctypes.c_void_p(-1).value:
+            _libc.shmctl(self.shm_id, IPC_RMID, None)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self.address = address
+        self.trace_bits = np.ctypeslib.as_array((ctypes.c_uint8 * size).from_address(address))
+
+    def clear(self):
+        ctypes.memset(self.address, 0, self.size)
+
+    def classified(self) -> np.ndarray:
+        """
+        :return: A copy of the bitmap with the hit counts classified into afl's buckets.
+        """
+        return COUNT_CLASS_LOOKUP[self.trace_bits]
+
+    def close(self):
+        if self.address is not None:
+            self.trace_bits = None
+            _libc.shmdt(self.address)
+            _libc.shmctl(self.shm_id, IPC_RMID, None)
+            self.address = None
+
+
+class RunResult:
+    def __init__(self, input_path: str, status: int, bitmap: np.ndarray):
+        """
+        :param input_path: The file the binary was run with.
+        :param status: RUN_OK, RUN_CRASH or RUN_TIMEOUT
+        :param bitmap: The classified edge bitmap of the run.
+        """
+        self.input_path = input_path
+        self.status = status
+        self.bitmap = bitmap
+
+
+def count_tuples(bitmaps: typing.Iterable[np.ndarray]) -> int:
+    """
+    Counts the unique (edge, hit count bucket) tuples across the classified bitmaps,
+    which is what afl-cmin reports as "Found X unique tuples".
+    """
+    union = np.zeros(MAP_SIZE, dtype=np.uint8)
+    for bitmap in bitmaps:
+        np.bitwise_or(union, bitmap, out=union)
+    return int(np.unpackbits(union).sum())
+
+
+def tuples_of_results(results: typing.Iterable[RunResult], crash_only: bool = False) -> int:
+    """
+    Like afl-showmap -Z: Timeouts never count, crashes only count in crash_only mode (and then exclusively).
+    """
+    wanted_status = RUN_CRASH if crash_only else RUN_OK
+    return count_tuples(r.bitmap for r in results if r.status == wanted_status)
+
+
+def sample_directory(directory: str, probe: bool = False, representatives: typing.List[str] = None,
+                     files: typing.List[str] = None) -> typing.List[str]:
+    """
+    :param representatives: Files of the directory to probe first (see helpers.seeds_index).
+    :param files: The files of the directory, if already known (e.g. from the seeds manifest).
+    :return: All files in the directory, or PROBE_FILES files if probe is set (like afl_probe):
+             The representatives first, filled up with random files.
+    """
+    if files is None:
+        files = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                       if os.path.isfile(os.path.join(directory, f)))
+    if probe and len(files) > PROBE_FILES:
+        file_set = set(files)
+        sample = [f for f in representatives or [] if f in file_set][:PROBE_FILES]
+        others = [f for f in files if f not in sample]
+        files = sample + random.sample(others, PROBE_FILES - len(sample))
+    return files
+
+
+def invocation_argv(invocation: str, input_path: str) -> typing.List[str]:
+    """
+    Splits the invocation like the shell (and afl-cmin's callers) do and puts the input file in place of "@@".
+    """
+    return [parameter.replace("@@", input_path) for parameter in shlex.split(invocation or "")]
+
+
+def _read_exactly(fd: int, length: int, timeout: float) -> typing.Optional[bytes]:
+    """
+    Reads length bytes from fd. Returns None on timeout or EOF.
+    """
+    data = b""
+    while len(data) < length:
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if not readable:
+            return None
+        chunk = os.read(fd, length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _spawn_file_actions(control_read: int, status_write: int, stdin_fd: typing.Optional[int]) -> typing.List[tuple]:
+    """
+    The file actions that set up the fds of a forkserver in the child, so the fd table of this process (and of the
+    other threads starting oracles) is never touched: The pipes go to FORKSRV_FD and FORKSRV_FD + 1, stdin is
+    stdin_fd (or /dev/null), stdout and stderr are /dev/null and inheritable fds of this process are closed, so the
+    target only has its forkserver pipes and sees EOF on them once its oracle is gone.
+    """
+    keep = {control_read, status_write, stdin_fd}
+    actions = []
+    for name in os.listdir("/proc/self/fd"):
+        fd = int(name)
+        if fd <= 2 or fd in keep:
+            continue
+        try:
+            if os.get_inheritable(fd):
+                actions.append((os.POSIX_SPAWN_CLOSE, fd))
+        except OSError:  # Closed in the meantime (e.g. the fd of the listdir)
+            pass
+    pipes = [(control_read, FORKSRV_FD), (status_write, FORKSRV_FD + 1)]
+    if status_write == FORKSRV_FD:  # Move it away before the control pipe takes its place
+        pipes.reverse()
+    actions += [(os.POSIX_SPAWN_DUP2, fd, target_fd) for fd, target_fd in pipes]
+    if stdin_fd is not None:
+        actions.append((os.POSIX_SPAWN_DUP2, stdin_fd, 0))
+    else:
+        actions.append((os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0))
+    actions += [(os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_WRONLY, 0) for fd in (1, 2)]
+    return actions
+
+
+class CoverageOracle:
+    """
+    Keeps one forkserver alive for a binary and an invocation. Not thread safe, use a CoverageOraclePool
+    to run inputs in parallel.
+    """
+
+    def __init__(self, binary_path: str, invocation: str, qemu: bool = False, env: typing.Dict[str, str] = None,
+                 timeout: float = None):
+        """
+        :param binary_path: The path to the binary.
+        :param invocation: The parameters, "@@" stands for the input file. Without "@@", the input is given on stdin.
+        :param qemu: Run the binary in afl-qemu-trace.
+        :param env: The environment for the binary, AFL_PRELOAD is translated like afl-fuzz does.
+        :param timeout: The timeout per execution in seconds.
+        """
+        self.binary_path = binary_path
+        self.invocation = invocation or ""
+        self.qemu = qemu
+        self.env = dict(env if env is not None else os.environ)
+        self.timeout = timeout if timeout is not None else config_settings.AFL_CMIN_INVOKE_TIMEOUT
+        self.work_dir = None
+        self.input_path = None
+        self.input_fd = None
+        self.shm = None
+        self.pid = None
+        self.control_fd = None
+        self.status_fd = None
+        self.last_run_timed_out = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _target_argv(self) -> typing.List[str]:
+        parameters = invocation_argv(self.invocation, self.input_path)
+        if self.qemu:
+            qemu_trace = shutil.which("afl-qemu-trace", path=self.env.get("AFL_PATH", "/usr/local/bin")) or \
+                         shutil.which("afl-qemu-trace")
+            if not qemu_trace:
+                raise ForkserverError(self.binary_path, "afl-qemu-trace not found")
+            return [qemu_trace, "--", self.binary_path] + parameters
+        return [self.binary_path] + parameters
+
+    def _target_env(self) -> typing.Dict[str, str]:
+        env = dict(self.env)
+        env[constants.SHM_ENV_VAR] = str(self.shm.shm_id)
+        preload = env.pop("AFL_PRELOAD", None)
+        if preload:
+            if self.qemu:
+                env["QEMU_SET_ENV"] = "LD_PRELOAD=" + preload.strip()
+            else:
+                env["LD_PRELOAD"] = preload.strip()
+        return env
+
+    def start(self):
+        """
+        Starts the forkserver.
+        :raises ForkserverError: If the binary does not come up with a forkserver (not instrumented, static, ...).
+        """
+        self.work_dir = tempfile.mkdtemp(prefix="coverage_oracle_")
+        self.input_path = os.path.join(self.work_dir, ".cur_input")
+        self.input_fd = os.open(self.input_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.shm = SharedMemoryBitmap()
+        control_read, control_write = os.pipe()
+        status_read, status_write = os.pipe()
+        uses_stdin = "@@" not in self.invocation
+        try:
+            argv = self._target_argv()
+            self.pid = os.posix_spawnp(argv[0], argv, self._target_env(),
+                                       file_actions=_spawn_file_actions(control_read, status_write,
+                                                                        self.input_fd if uses_stdin else None),
+                                       setsid=True, setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+        except OSError as e:
+            self.close()
+            raise ForkserverError(self.binary_path, str(e))
+        finally:
+            os.close(control_read)
+            os.close(status_write)
+        self.control_fd = control_write
+        self.status_fd = status_read
+        if _read_exactly(self.status_fd, 4, self.timeout * FORK_WAIT_MULT) is None:
+            self.close()
+            raise ForkserverError(self.binary_path, "no forkserver handshake")
+        logger.debug("Forkserver up for {0} {1}".format(self.binary_path, self.invocation))
+
+    def run(self, input_path: str) -> RunResult:
+        """
+        Runs the binary with the content of input_path.
+        :raises ForkserverError: If the forkserver died.
+        """
+        with open(input_path, "rb") as fp:
+            data = fp.read()
+        return self.run_data(data, input_path=input_path)
+
+    def run_data(self, data: bytes, input_path: str = None) -> RunResult:
+        if self.pid is None:
+            raise ForkserverError(self.binary_path, "forkserver is not running")
+        os.ftruncate(self.input_fd, 0)
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+        os.write(self.input_fd, data)
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+        self.shm.clear()
+        try:
+            os.write(self.control_fd, struct.pack("I", int(self.last_run_timed_out)))
+        except OSError as e:
+            raise ForkserverError(self.binary_path, "forkserver is gone: {0}".format(e))
+        raw_pid = _read_exactly(self.status_fd, 4, self.timeout * FORK_WAIT_MULT)
+        if raw_pid is None:
+            raise ForkserverError(self.binary_path, "forkserver did not fork")
+        child_pid = struct.unpack("i", raw_pid)[0]
+        raw_status = _read_exactly(self.status_fd, 4, self.timeout)
+        self.last_run_timed_out = raw_status is None
+        if self.last_run_timed_out:
+            try:
+                os.kill(child_pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            raw_status = _read_exactly(self.status_fd, 4, self.timeout * FORK_WAIT_MULT)
+            if raw_status is None:
+                raise ForkserverError(self.binary_path, "no status after killing a timed out child")
+        wait_status = struct.unpack("i", raw_status)[0]
+        if self.last_run_timed_out:
+            status = RUN_TIMEOUT
+        elif os.WIFSIGNALED(wait_status):
+            status = RUN_CRASH
+        else:
+            status = RUN_OK
+        return RunResult(input_path, status, self.shm.classified())
+
+    def run_batch(self, input_paths: typing.Iterable[str]) -> typing.List[RunResult]:
+        return [self.run(input_path) for input_path in input_paths]
+
+    def close(self):
+        if self.pid is not None:
+            try:
+                os.killpg(self.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            os.waitpid(self.pid, 0)
+            self.pid = None
+        for fd in (self.control_fd, self.status_fd, self.input_fd):
+            if fd is not None:
+                os.close(fd)
+        self.control_fd = self.status_fd = self.input_fd = None
+        if self.shm:
+            self.shm.close()
+            self.shm = None
+        if self.work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = None
+
+
+class CoverageOraclePool:
+    """
+    Up to size coverage oracles for the same binary and invocation, shared between threads.
+    Oracles are started lazily and reused until close() is called.
+    """
+
+    def __init__(self, binary_path: str, invocation: str, qemu: bool = False, env: typing.Dict[str, str] = None,
+                 timeout: float = None, size: int = 1):
+        self.binary_path = binary_path
+        self.invocation = invocation
+        self.qemu = qemu
+        self.env = env
+        self.timeout = timeout
+        self.size = max(1, size or 1)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._oracles = []  # type: typing.List[CoverageOracle]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _acquire(self) -> CoverageOracle:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                start_new = len(self._oracles) < self.size
+                if start_new:
+                    oracle = CoverageOracle(self.binary_path, self.invocation, qemu=self.qemu, env=self.env,
+                                            timeout=self.timeout)
+                    self._oracles.append(oracle)
+            if start_new:
+                break
+            try:  # An oracle that breaks is not handed back, then its slot is free for a new one
+                return self._idle.get(timeout=ACQUIRE_RECHECK_INTERVAL)
+            except queue.Empty:
+                pass
+        try:
+            oracle.start()
+        except ForkserverError:
+            with self._lock:
+                self._oracles.remove(oracle)
+            raise
+        return oracle
+
+    def _release(self, oracle: CoverageOracle, broken: bool = False):
+        if broken:
+            with self._lock:
+                self._oracles.remove(oracle)
+            oracle.close()
+        else:
+            self._idle.put(oracle)
+
+    def run_batch(self, input_paths: typing.Iterable[str]) -> typing.List[RunResult]:
+        """
+        Runs all inputs on one oracle of the pool.
+        """
+        oracle = self._acquire()
+        try:
+            results = oracle.run_batch(input_paths)
+        except ForkserverError:
+            self._release(oracle, broken=True)
+            raise
+        self._release(oracle)
+        return results
+
+    def coverage(self, input_paths: typing.Iterable[str], crash_only: bool = False) -> typing.Tuple[int, typing.List[
+            RunResult]]:
+        """
+        :return: The number of unique tuples (like afl-cmin) and the single run results.
+        """
+        results = self.run_batch(input_paths)
+        return tuples_of_results(results, crash_only=crash_only), results
+
+    def coverage_of_directory(self, directory: str, probe: bool = False, crash_only: bool = False,
+                              representatives: typing.List[str] = None) -> typing.Tuple[int, typing.List[RunResult]]:
+        """
+        The coverage of all files in the directory, or of PROBE_FILES files if probe is set (like afl_probe).
+        """
+        return self.coverage(sample_directory(directory, probe=probe, representatives=representatives),
+                             crash_only=crash_only)
+
+    def close(self):
+        with self._lock:
+            oracles = self._oracles
+            self._oracles = []
+        for oracle in oracles:
+            oracle.close()
+        self._idle = queue.Queue()
@@ -0,0 +1,107 @@
+"""
+Scores the coverage of filetypes for many parameters at once.
+The coverage lists of all parameters form one (parameter x filetype) matrix, padded and masked
+where a parameter has fewer filetypes. Means, standard deviations, deviation, chebyshev and
+z-scores are computed for all rows in one numpy pass instead of per parameter in python loops.
+"""
+import typing
+
+import numpy as np
+
+
+class CoverageScores(object):
+    def __init__(self, coverage_lists: typing.List[typing.List[typing.Tuple[str, float]]],
+                 abs_statistics: bool = False):
+        """
+        :param coverage_lists: One list of (filetype, coverage) tuples per parameter. The lists may differ in length,
+                               filetypes are only labels and may repeat (e.g. None for filetypes without coverage).
+        :param abs_statistics: Calculate means and standard deviations over the absolute coverages.
+                               The inference marks failed invocations with -1, those should count as 1.
+        """
+        rows = len(coverage_lists)
+        width = max((len(coverage_list) for coverage_list in coverage_lists), default=0)
+        self.filetypes = [[filetype for filetype, _ in coverage_list] for coverage_list in coverage_lists]
+        self.coverage = np.zeros((rows, width), dtype=np.float64)
+        self.valid = np.zeros((rows, width), dtype=bool)
+        for row, coverage_list in enumerate(coverage_lists):
+            self.coverage[row, :len(coverage_list)] = [coverage for _, coverage in coverage_list]
+            self.valid[row, :len(coverage_list)] = True
+        counts = np.maximum(self.valid.sum(axis=1), 1)
+        statistics_coverage = np.abs(self.coverage) if abs_statistics else self.coverage
+        statistics_coverage = np.where(self.valid, statistics_coverage, 0)
+        self.means = statistics_coverage.sum(axis=1) / counts
+        centered_statistics = np.where(self.valid, statistics_coverage - self.means[:, None], 0)
+        self.stds = np.sqrt((centered_statistics ** 2).sum(axis=1) / counts)
+        centered = np.where(self.valid, self.coverage - self.means[:, None], 0)
+        divisor = np.where(self.stds > 0, self.stds, 1)[:, None]
+        # Deviation score: How far above the mean a filetype is, 0 for filetypes below the mean
+        self.deviation_scores = np.where(self.valid & (self.coverage >= self.means[:, None]), centered, 0)
+        # Chebyshev score: The deviation score in standard deviations (if there is any deviation)
+        self.chebyshev_scores = self.deviation_scores / divisor
+        # z-score: Deviation in standard deviations, 0 for rows without any deviation
+        self.z_scores = np.where(self.stds[:, None] > 0, centered / divisor, 0)
+
+    @staticmethod
+    def from_dict(coverage_per_filetype: typing.Dict[str, float], abs_statistics: bool = False) -> "CoverageScores":
+        """
+        Scores a single parameter, given as a filetype -> coverage dict.
+        """
+        return CoverageScores([list(coverage_per_filetype.items())], abs_statistics=abs_statistics)
+
+    def __len__(self):
+        return len(self.filetypes)
+
+    def _row_list(self, row: int, scores: np.ndarray) -> typing.List[float]:
+        return [float(score) for score in scores[row, :len(self.filetypes[row])]]
+
+    def deviation_scores_of(self, row: int) -> typing.List:
+        """
+        :return: Like CoverageEvaluator.calculate_deviation_scores: The filetypes and their deviation scores.
+        """
+        return [self.filetypes[row], self._row_list(row, self.deviation_scores)]
+
+    def chebyshev_scores_of(self, row: int) -> typing.List:
+        """
+        :return: Like CoverageEvaluator.calculate_chebyshev_score: The filetypes and their chebyshev scores.
+        """
+        return [self.filetypes[row], self._row_list(row, self.chebyshev_scores)]
+
+    def _best(self, row: int, scores: np.ndarray) -> typing.Tuple[str, float]:
+        if not self.filetypes[row]:
+            raise ValueError("No coverage for parameter {0}".format(row))
+        index = int(np.argmax(scores[row, :len(self.filetypes[row])]))  # The first maximum, like max()
+        return self.filetypes[row][index], float(scores[row, index])
+
+    def best_deviation_tuple(self, row: int) -> typing.Tuple[str, float]:
+        return self._best(row, self.deviation_scores)
+
+    def best_chebyshev_tuple(self, row: int) -> typing.Tuple[str, float]:
+        return self._best(row, self.chebyshev_scores)
+
+    def outliers(self, row: int, threshold: float) -> typing.List[str]:
+        """
+        :return: The filetypes more than threshold standard deviations above the mean, in their original order.
+        """
+        return [self.filetypes[row][i] for i in np.flatnonzero(self.valid[row] & (self.z_scores[row] > threshold))]
+
+    def above_mean(self, row: int) -> typing.List[str]:
+        """
+        :return: The filetypes with a coverage above the mean, in their original order.
+        """
+        return [self.filetypes[row][i] for i in
+                np.flatnonzero(self.valid[row] & (self.coverage[row] > self.means[row]))]
+
+
+def rank(values: typing.Sequence[float]) -> typing.List[int]:
+    """
+    :return: The indices of the values, highest value first. Equal values keep their order,
+             just like sorted(..., reverse=True).
+    """
+    return [int(i) for i in np.argsort(-np.asarray(values, dtype=np.float64), kind="mergesort")]
+
+
+def rank_input_vectors(cli_configs: typing.List) -> typing.List:
+    """
+    :return: The CliConfigs ordered by their max coverage, highest first, ties in their original order.
+    """
+    return [cli_configs[i] for i in rank([cli_config.max_coverage for cli_config in cli_configs])]
@@ -12,10 +12,14 @@ parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 os.sys.path.insert(0, parentdir)
 from builders import builder
 import helpers.utils
+from helpers.analysis_cache import AnalysisCache, INPUT_VECTORS_NAMESPACE, seeds_fingerprint
+from cli_config import CliConfig
 from heuristic_config_creator import HeuristicConfigCreator
+from invocation_memo import InvocationMemo, memo_path_for
 from configfinder.minimzer import minize
 from fuzzer_wrapper import AflFuzzWrapper
 from sh import chmod
+from configfinder.config_settings import EVAL_PHASE_INFERENCE, EVAL_PHASE_FUZZ
 
 
 class PackageEvaluator:
@@ -45,11 +49,22 @@ class PackageEvaluator:
         self.seeds = config_dict.get("seeds")
         self.fuzzing_cores_per_binary = config_dict.get("fuzzing_cores_per_binary")
         self.use_asan = config_dict.get("asan")
+        self.phase = config_dict.get("phase")  # None: Both phases in one run
+        if self.phase not in (None, EVAL_PHASE_INFERENCE, EVAL_PHASE_FUZZ):
+            print("Unknown phase {0}!".format(self.phase))
+            exit(0)
+        self.analysis_cache = None  # type: AnalysisCache
+        if config_dict.get("analysis_cache", True):
+            self.analysis_cache = AnalysisCache.for_volume(self.output_volume)
         logfilename = os.path.join(self.output_volume, self.package)
         self.logger = helpers.utils.init_logger(logfilename)
         # logging.basicConfig(handlers=[logging.FileHandler(logfilename, 'w', 'utf-8')], level=logging.INFO,
         #                   format='%(levelname)s %(asctime)s: %(message)s')
         self.package_log_dict = {"name": self.package}
+        self.package_log_path = os.path.join(self.output_volume, "{0}_log.json".format(self.package))
+        if self.phase == EVAL_PHASE_FUZZ and os.path.exists(self.package_log_path):
+            with open(self.package_log_path) as fp:
+                self.package_log_dict.update(json.load(fp))  # Keep what the inference run logged
         os.makedirs(os.path.join(self.output_volume, self.package), exist_ok=True)
 
     def append_to_status(self, status_text):
@@ -76,16 +91,25 @@ class PackageEvaluator:
         volume = self.output_volume
         self.append_to_status("Searching for fuzzable binaries")
         fuzzable_binaries = helpers.utils.return_fuzzable_binaries_from_file_list(packages_files,
-                                                                                  log_dict=self.package_log_dict)
+                                                                                  log_dict=self.package_log_dict,
+                                                                                  cache=self.analysis_cache)
         self.logger.info("Fuzzable binaries detected: {0}".format(" ".join(fuzzable_binaries)))
         self.append_to_status("Fuzzable binaries detected: {0}".format(" ".join(fuzzable_binaries)))
-        self.package_log_dict["inference_success"] = []
-        self.package_log_dict["inference_fail"] = []
+        if self.phase != EVAL_PHASE_FUZZ:
+            self.package_log_dict["inference_success"] = []
+            self.package_log_dict["inference_fail"] = []
+        self.package_log_dict.setdefault("inference_success", [])
+        self.package_log_dict.setdefault("inference_fail", [])
         self.package_log_dict["fuzzing_success"] = []
         self.package_log_dict["fuzzing_fail"] = []
 
         for b in fuzzable_binaries:
-            self.eval_binary(binary_path=b)
+            if self.phase == EVAL_PHASE_FUZZ:
+                inferred = os.path.exists(self.afl_config_path(b))
+            else:
+                inferred = self.infer_binary(binary_path=b)
+            if inferred and self.phase != EVAL_PHASE_INFERENCE:
+                self.fuzz_binary(binary_path=b)
         # else:
         #    logging.info("Skipping binary {0} as non fuzzable".format(b))
 
@@ -97,7 +121,7 @@ class PackageEvaluator:
         self.package_log_dict["num_fuzzing_success"] = len(self.package_log_dict["fuzzing_success"])
         self.package_log_dict["num_fuzzing_fail"] = len(self.package_log_dict["fuzzing_fail"])
         print(self.package_log_dict)
-        with open(os.path.join(self.output_volume, "{0}_log.json".format(self.package)), "w") as fp:
+        with open(self.package_log_path, "w") as fp:
             json.dump(self.package_log_dict, fp)
         try:
             chmod("-R", "0777",
@@ -105,27 +129,61 @@ class PackageEvaluator:
         except sh.ErrorReturnCode as e:
             self.logger.error("Could not set chmod permissions for package volume. Error: {0}".format((str(e))))
 
-    def eval_binary(self, binary_path: str):
-        if self.package_log_dict:
-            if not self.package_log_dict.get(binary_path):
-                self.package_log_dict[binary_path] = {}
-        use_qemu = helpers.utils.qemu_required_for_binary(binary_path)
-        self.package_log_dict[binary_path]["qemu"] = use_qemu
-        self.logger.info("Now inferring invocation for {0}".format(binary_path))
-        self.append_to_status("Now inferring invocation for {0}".format(binary_path))
+    def infer_input_vectors_sorted(self, binary_path: str, use_qemu: bool) -> [CliConfig]:
+        """
+        Infers the input vectors of the binary, sorted by coverage.
+        If the binary, the seeds and the tools did not change since the last inference,
+        the input vectors are taken from the analysis cache instead.
+        """
+        seeds = ""
+        if self.analysis_cache:
+            seeds = seeds_fingerprint(self.seeds)
+            cached_input_vectors = self.analysis_cache.get(binary_path, INPUT_VECTORS_NAMESPACE,
+                                                           seeds_fingerprint=seeds)
+            if cached_input_vectors:  # Failed inferences are not cached, but older caches may hold them
+                self.logger.info("Using cached input vectors for {0}".format(binary_path))
+                return [CliConfig.from_dict(d) for d in cached_input_vectors]
+        # Invocations tried by an interrupted earlier inference are not traced again
+        invocation_memo = InvocationMemo(binary_path,
+                                         path=memo_path_for(self.output_volume, self.package, binary_path),
+                                         binary_hash=self.analysis_cache.binary_hash(
+                                             binary_path) if self.analysis_cache else None)
         h = HeuristicConfigCreator(binary_path=binary_path,
                                    results_out_dir=self.output_volume + "/" + self.package + "/" + os.path.basename(
                                        binary_path),
-                                   qemu=use_qemu, cores=self.fuzzing_cores_per_binary, seeds_dir=self.seeds)
+                                   qemu=use_qemu, cores=self.fuzzing_cores_per_binary, seeds_dir=self.seeds,
+                                   invocation_memo=invocation_memo)
         input_vectors = h.infer_input_vectors()
         if not input_vectors:
             if self.package_log_dict:
                 self.package_log_dict["inference_fail"].append(binary_path)
         input_vectors_sorted = h.get_input_vectors_sorted()
+        if self.analysis_cache and input_vectors_sorted:  # A failure may be transient, it is retried next time
+            self.analysis_cache.put(binary_path, INPUT_VECTORS_NAMESPACE,
+                                    [v.__dict__ for v in input_vectors_sorted], seeds_fingerprint=seeds)
+        return input_vectors_sorted
+
+    def afl_config_path(self, binary_path: str) -> str:
+        return os.path.join(self.output_volume, self.package,
+                            helpers.utils.get_filename_from_binary_path(binary_path) + ".afl_config")
+
+    def infer_binary(self, binary_path: str) -> bool:
+        """
+        Infers the input vectors of the binary and minimizes the seeds of the best one into its afl config.
+        :return: True if the binary can be fuzzed.
+        """
+        if self.package_log_dict:
+            if not self.package_log_dict.get(binary_path):
+                self.package_log_dict[binary_path] = {}
+        use_qemu = helpers.utils.qemu_required_for_binary(binary_path)
+        self.package_log_dict[binary_path]["qemu"] = use_qemu
+        self.logger.info("Now inferring invocation for {0}".format(binary_path))
+        self.append_to_status("Now inferring invocation for {0}".format(binary_path))
+        input_vectors_sorted = self.infer_input_vectors_sorted(binary_path, use_qemu)
         if not input_vectors_sorted:
             if self.package_log_dict:
                 self.package_log_dict["inference_fail"].append(binary_path)
-            return
+            return False
         if self.package_log_dict:
             self.package_log_dict["inference_success"].append(binary_path)
         helpers.utils.store_input_vectors_in_volume(package=self.package, binary=binary_path,
@@ -138,8 +196,13 @@ class PackageEvaluator:
                volume_path=self.output_volume,
                afl_config_file_name=helpers.utils.get_filename_from_binary_path(binary_path) + ".afl_config",
                tmin_total_time=120, do_tmin=True, cores=self.fuzzing_cores_per_binary)
-        with open(os.path.join(self.output_volume, self.package, helpers.utils.get_filename_from_binary_path(
-                binary_path) + ".afl_config")) as afl_config_fp:
+        return True
+
+    def fuzz_binary(self, binary_path: str):
+        """
+        Fuzzes the binary with the input vector and the minimized seeds of its afl config.
+        """
+        with open(self.afl_config_path(binary_path)) as afl_config_fp:
             config_dict = json.load(afl_config_fp)
             seeds_dir = config_dict["min_seeds_dir"]
             config_dict["status"] = 2
@@ -148,13 +211,11 @@ class PackageEvaluator:
         #    json.dump(config_dict, afl_config_fp)
         self.append_to_status("Fuzzing {0}!".format(binary_path))
         fuzz_wrapper = AflFuzzWrapper(package=self.package, volume_path=self.output_volume, binary_path=binary_path,
-                                      parameter=input_vectors_sorted[0].parameter,
-                                      seeds_dir=seeds_dir, file_types=input_vectors_sorted[0].file_types,
+                                      parameter=config_dict["parameter"],
+                                      seeds_dir=seeds_dir, file_types=config_dict["file_types"],
                                       fuzz_duration=self.fuzz_duration,
                                       timeout=self.exec_timeout,
-                                      afl_config_file_path=os.path.join(self.output_volume, self.package,
-                                                                        helpers.utils.get_filename_from_binary_path(
-                                                                            binary_path) + ".afl_config"),
+                                      afl_config_file_path=self.afl_config_path(binary_path),
                                       log_dict=self.package_log_dict)
         res = fuzz_wrapper.start_fuzzer(cores=self.fuzzing_cores_per_binary)
         if res:
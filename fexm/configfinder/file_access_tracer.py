@@ -0,0 +1,191 @@
+"""
+Finds out if a binary opens or reads a file without running it under strace.
+The binary is started with preeny's fileaccess.so preloaded, which reports the accesses
+to the watched file as a few bytes of events over a pipe (see preeny/src/fileaccess.c).
+Static binaries and binaries run in qemu can not preload the library, those still need strace.
+"""
+import logging
+import select
+import signal
+import subprocess
+import threading
+import typing
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings as config_settings
+from helpers.elf_reader import ElfReader
+from helpers.exceptions import InvalidElfFile
+
+logger = logging.getLogger(__name__)
+
+FILEACCESS_LIBRARY = "src/fileaccess.so"  # Relative to the preeny path
+FD_ENV_VAR = "FILEACCESS_FD"
+PATH_ENV_VAR = "FILEACCESS_PATH"
+EVENT_OPEN = "O"
+EVENT_READ = "R"
+POLL_INTERVAL = 0.05  # How often (in seconds) the tracer checks if the binary exited or was cancelled
+
+
+class FileAccessEvent(object):
+    def __init__(self, kind: str, fd: int, flags: int = None):
+        """
+        :param kind: EVENT_OPEN or EVENT_READ
+        :param fd: The fd of the watched file in the binary.
+        :param flags: The open(2) flags, only for EVENT_OPEN.
+        """
+        self.kind = kind
+        self.fd = fd
+        self.flags = flags
+
+    def reads_file(self) -> bool:
+        """
+        :return: True if the binary read the file or opened it for reading, like the strace heuristic in try_invocation.
+        """
+        return self.kind == EVENT_READ or (self.flags & os.O_ACCMODE) != os.O_WRONLY
+
+
+def parse_events(data: bytes) -> typing.List[FileAccessEvent]:
+    """
+    Parses the events written by fileaccess.so, malformed lines are skipped.
+    """
+    events = []
+    for line in data.decode("ascii", errors="ignore").splitlines():
+        fields = line.split()
+        try:
+            if fields[0] == EVENT_OPEN and len(fields) == 3:
+                events.append(FileAccessEvent(EVENT_OPEN, int(fields[2]), flags=int(fields[1])))
+            elif fields[0] == EVENT_READ and len(fields) == 2:
+                events.append(FileAccessEvent(EVENT_READ, int(fields[1])))
+        except (IndexError, ValueError):
+            continue
+    return events
+
+
+class FileAccessTracer(object):
+    def __init__(self, binary_path: str, qemu: bool = False, library_path: str = None):
+        """
+        :param binary_path: The path to the binary.
+        :param qemu: If the binary is run in qemu, then the tracer is not available.
+        :param library_path: The path to fileaccess.so, defaults to the one in config_settings.PREENY_PATH.
+        """
+        self.binary_path = binary_path
+        self.qemu = qemu
+        self.library_path = library_path or os.path.join(config_settings.PREENY_PATH, FILEACCESS_LIBRARY)
+        self._available = None
+
+    @property
+    def available(self) -> bool:
+        """
+        :return: True if the library can be preloaded into the binary:
+                 The library exists, the binary is dynamically linked and built for the same architecture.
+        """
+        if self._available is None:
+            self._available = self._check_available()
+        return self._available
+
+    def _check_available(self) -> bool:
+        if self.qemu or not os.path.exists(self.library_path):
+            return False
+        try:
+            with ElfReader(self.binary_path) as binary, ElfReader(self.library_path) as library:
+                if binary.interpreter() is None:
+                    logger.debug("{0} is statically linked, can not trace file accesses".format(self.binary_path))
+                    return False
+                return (binary.elf_class, binary.machine) == (library.elf_class, library.machine)
+        except (InvalidElfFile, OSError):
+            return False
+
+    def trace(self, arguments: typing.List[str], watched_path: str, env: typing.Dict[str, str],
+              stdin: bool = False, timeout: float = None, cancel_event: threading.Event = None,
+              stop_on_access: bool = False) -> typing.Tuple[bool, bool]:
+        """
+        Runs the binary and watches its accesses to watched_path.
+        :param arguments: The arguments for the binary.
+        :param watched_path: The file the binary should open or read.
+        :param env: The environment for the binary, the library is prepended to its LD_PRELOAD.
+        :param stdin: Redirect watched_path to stdin.
+        :param timeout: The timeout (using the timeout command, like check_output_with_timeout_command).
+        :param cancel_event: Kill the binary once the event is set, it then counts as timed out.
+        :param stop_on_access: Kill the binary as soon as it accessed the file. It then does not count as timed out.
+        :return: A tuple (file accessed?, timed out?)
+        """
+        exec_list = []
+        if timeout:
+            exec_list += ["timeout", str(timeout)]
+        exec_list += [self.binary_path] + arguments
+        env = dict(env)
+        env["LD_PRELOAD"] = " ".join(p for p in [self.library_path, env.get("LD_PRELOAD", "").strip()] if p)
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)  # Never block the binary, fileaccess.so only writes a few events anyway
+        env[FD_ENV_VAR] = str(write_fd)
+        env[PATH_ENV_VAR] = watched_path
+        stdin_fp = open(watched_path, "rb") if stdin else None
+        try:
+            try:
+                process = subprocess.Popen(exec_list, stdin=stdin_fp, stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.DEVNULL, env=env, pass_fds=(write_fd,),
+                                           start_new_session=True)
+            finally:
+                os.close(write_fd)
+            data, cancelled, stopped = self._collect(process, read_fd, cancel_event, stop_on_access)
+            # The shared offset of stdin moved if the binary read it, even with libc internal reads
+            stdin_read = stdin_fp is not None and os.lseek(stdin_fp.fileno(), 0, os.SEEK_CUR) > 0
+        finally:
+            os.close(read_fd)
+            if stdin_fp:
+                stdin_fp.close()
+        if stopped:
+            return True, False
+        accessed = stdin_read or any(event.reads_file() for event in parse_events(data))
+        return accessed, cancelled or process.returncode == 124
+
+    @staticmethod
+    def _kill(process: subprocess.Popen):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    @staticmethod
+    def _collect(process: subprocess.Popen, read_fd: int, cancel_event: threading.Event = None,
+                 stop_on_access: bool = False) -> typing.Tuple[bytes, bool, bool]:
+        """
+        Reads the events until the binary exited.
+        :return: The event data, if the binary was cancelled and if it was stopped because it accessed the file.
+        """
+        data = b""
+        cancelled = False
+        pipe_open = True
+        while process.poll() is None:
+            if cancel_event is not None and cancel_event.is_set():
+                FileAccessTracer._kill(process)
+                cancelled = True
+                break
+            if pipe_open:
+                readable, _, _ = select.select([read_fd], [], [], POLL_INTERVAL)
+                if readable:
+                    chunk = os.read(read_fd, 4096)
+                    data += chunk
+                    pipe_open = bool(chunk)
+                    if stop_on_access and any(event.reads_file() for event in parse_events(data)):
+                        FileAccessTracer._kill(process)
+                        return data, False, True
+            else:
+                try:
+                    process.wait(POLL_INTERVAL)
+                except subprocess.TimeoutExpired:
+                    pass
+        # Children of the binary might still hold the pipe open, only take what is already there
+        os.set_blocking(read_fd, False)
+        try:
+            while pipe_open:
+                chunk = os.read(read_fd, 4096)
+                data += chunk
+                pipe_open = bool(chunk)
+        except BlockingIOError:
+            pass
+        return data, cancelled, False
@@ -16,6 +16,7 @@ os.sys.path.insert(0, parentdir)
 import signal
 import sys
 import multiprocessing as mp
+import threading
 import uuid
 from typing import List
 import logging
@@ -23,6 +24,8 @@ import analyze_wrapper
 import sh
 import config_settings
 import helpers.utils
+from helpers import seed_staging
+from helpers.fuzzing_checkpoint import begin_slice, stopped_cleanly, write_checkpoint
 from cli_config import CliConfig
 import typing
 from sh import afl_fuzz, tail
@@ -34,10 +37,13 @@ Wraps afl-fuzz
 global aflfuzzerprocess
 
 
-def signal_term_handler(signal, frame):
+def signal_term_handler(signum, frame):
     print('got SIGTERM')
-    if aflfuzzerprocess:
-        aflfuzzerprocess.kill()
+    if aflfuzzerprocess and aflfuzzerprocess.is_alive():
+        # afl stops gracefully on SIGINT: It finishes the current execution and writes its queue and stats.
+        # afl_fuzz_wrapper then checkpoints the session, so it can be resumed consistently.
+        aflfuzzerprocess.signal(signal.SIGINT)
+        return
     sys.exit(0)
 
 
@@ -243,12 +249,15 @@ class AflFuzzWrapper:
         return success
 
 
-def afl_fuzz_wrapper(fuzzer_args: List[str], binary_path: str, fuzz_duration: float = None, log_dict=None):
+def afl_fuzz_wrapper(fuzzer_args: List[str], binary_path: str, fuzz_duration: float = None, log_dict=None,
+                     parameter: str = None, afl_out_dir: str = None):
     """
     Start the fuzzer for the given binary.
     :param fuzzer_args: The args for afl.
     :param binary_path: The path to the binary.
-    :param fuzz_duration: The timeout for afl
+    :param fuzz_duration: The timeout for afl, e.g. a time slice. afl is stopped with SIGINT after it.
+    :param parameter: The invocation of the binary.
+    :param afl_out_dir: Checkpoint the session when afl was stopped (after fuzz_duration or on SIGTERM).
     :return: 
     """
     global aflfuzzerprocess
@@ -277,12 +286,19 @@ def afl_fuzz_wrapper(fuzzer_args: List[str], binary_path: str, fuzz_duration: fl
             timeout_signal_send = None
         logging.getLogger().info("Starting fuzzing of {0} with args: {1}".format(binary_path, " ".join(fuzzer_args)))
         log_dict[binary_path]["fuzz_debug"]["invocation"] = "afl-fuzz " + " ".join(fuzzer_args)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, signal_term_handler)  # docker stop preempts the session
+        fuzzing_start = time.time()
+        if afl_out_dir:
+            begin_slice(afl_out_dir)
         aflfuzzerprocess = afl_fuzz(fuzzer_args, _env=helpers.utils.get_fuzzing_env_for_invocation(parameter),
                                     _tty_size=(1024, 1024),
-                                    _timeout=afl_fuzz_duration, _timeout_signal=timeout_signal_send, _bg=False)
+                                    _timeout=afl_fuzz_duration, _timeout_signal=timeout_signal_send, _bg=True)
         log_dict[binary_path]["fuzz_debug"]["invocation"] = " ".join(
             [part.decode("utf-8") for part in aflfuzzerprocess.cmd])
         aflfuzzerprocess.wait()
+        if afl_out_dir:  # Stopped by SIGTERM (or afl quit by itself)
+            write_checkpoint(afl_out_dir, time.time() - fuzzing_start, clean=True)
     except sh.ErrorReturnCode as e:
         # if aflerrors["AFL_ALREADY_INSTRUMENTED"] in e.stdout.decode("utf-8"):
         #    print("Binary is already instrumented, trying without QEMU Mode")
@@ -292,6 +308,8 @@ def afl_fuzz_wrapper(fuzzer_args: List[str], binary_path: str, fuzz_duration: fl
         #    print("Binary is not instrumented, trying with QEMU Mode")
         #    fuzzer_args.insert(0,"-Q")
         #    return afl_fuzz_wrapper(fuzzer_args,binary_path,timeout=timeout)
+        if afl_out_dir:  # afl failed or was killed, its queue and stats may be inconsistent
+            write_checkpoint(afl_out_dir, time.time() - fuzzing_start, clean=False)
         if log_dict:
             if not log_dict.get("fuzzing_fail"):
                 log_dict["fuzzing_fail"] = []
@@ -311,6 +329,8 @@ def afl_fuzz_wrapper(fuzzer_args: List[str], binary_path: str, fuzz_duration: fl
     except sh.TimeoutException as e:
         print("Fuzzing {0} timed out... ".format(binary_path))
         logging.info("Fuzzing {0} timed out.".format(binary_path))
+        if afl_out_dir:  # The end of the slice, afl got SIGINT
+            write_checkpoint(afl_out_dir, time.time() - fuzzing_start, clean=True)
         return True
     return True
 
@@ -337,6 +357,10 @@ def resume_fuzzer(afl_dir: str, binary_path: str, parameter: str, qemu: bool = F
         raise FileNotFoundError("Could not resolve path for {0}".format(binary_path))
     if parameter is not None:
         binary_invocation += shlex.split(parameter)
+    if not reseed and not stopped_cleanly(afl_dir):
+        print("afl did not stop gracefully in the last slice of {0}, reseeding".format(afl_dir))
+        logging.info("afl did not stop gracefully in the last slice of {0}, reseeding".format(afl_dir))
+        reseed = True
     if reseed:
         aflminimize = sh.Command("afl-minimize")
         aflminimize_commands = ["-j", "1", "-c", "reseed_" + os.path.basename(binary_path) + str(uuid.uuid4())]
@@ -362,7 +386,8 @@ def resume_fuzzer(afl_dir: str, binary_path: str, parameter: str, qemu: bool = F
     fuzzer_args += ["-i-", "-o", afl_dir, "--"] + binary_invocation
     print("Resuming afl_fuzz, for", binary_path, "parameter:", parameter, flush=True)
     logging.info("Resuming afl_fuzz for {0} {1}".format(binary_path, parameter))
-    return afl_fuzz_wrapper(fuzzer_args=fuzzer_args, binary_path=binary_path, fuzz_duration=fuzz_duration)
+    return afl_fuzz_wrapper(fuzzer_args=fuzzer_args, binary_path=binary_path, fuzz_duration=fuzz_duration,
+                            parameter=parameter, afl_out_dir=afl_dir)
 
 
 def start_fuzzer(input_dir: str, afl_out_dir: str, binary_path: str, parameter: str, qemu: bool = False,
@@ -372,13 +397,8 @@ def start_fuzzer(input_dir: str, afl_out_dir: str, binary_path: str, parameter:
     afl_input_dir = input_dir
     if any(os.path.getsize(os.path.join(input_dir, file)) >= 850 * 1000 for file in os.listdir(input_dir)):
         afl_input_dir = input_dir + "_minimized" + str(uuid.uuid4())
-        for file in os.listdir(input_dir):
-            if os.path.getsize(
-                    os.path.join(input_dir, file)) < 850 * 1000:  # If file is smaller than 850 kb just copy it
-                copyfile(os.path.join(input_dir, file), os.path.join(afl_input_dir, file))
-            else:  # Reduce the file to 1kb
-                helpers.utils.crop_file(os.path.join(input_dir, file), os.path.join(afl_input_dir, file),
-                                        1 * 1000)
+        # Files smaller than 850 kb are linked, bigger files are reduced to 1kb
+        seed_staging.stage_directories([input_dir], afl_input_dir, max_size=850 * 1000 - 1, crop_size=1 * 1000)
 
     fuzzer_args += ["-i", afl_input_dir, "-o", afl_out_dir]
     fuzzer_args += ["--", binary_path]
@@ -389,7 +409,7 @@ def start_fuzzer(input_dir: str, afl_out_dir: str, binary_path: str, parameter:
     print("Starting afl_fuzz, for", binary_path, "parameter:", parameter, "seeds", input_dir, flush=True)
     if wrapper_function is afl_fuzz_wrapper:
         return afl_fuzz_wrapper(fuzzer_args=fuzzer_args, binary_path=binary_path, fuzz_duration=fuzz_duration,
-                                log_dict=log_dict)
+                                log_dict=log_dict, parameter=parameter, afl_out_dir=afl_out_dir)
     else:
         return wrapper_function(fuzzer_args=fuzzer_args, binary_path=binary_path, timeout=None, afl_out_dir=afl_out_dir,
                                 fuzz_duration=fuzz_duration)
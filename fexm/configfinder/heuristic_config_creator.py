@@ -8,14 +8,28 @@ import uuid
 import operator
 import os
 import re
-import scipy as sp
 import shutil
+import threading
+import time
+import typing
 from enum import Enum
 
+import numpy as np
+
 import config_settings
 import helpers.utils
+from adaptive_prober import AdaptiveProber, ProbeResult
 from cli_config import CliConfig
-from helpers.utils import check_output_with_timeout_command
+from coverage_scoring import CoverageScores, rank_input_vectors
+from file_access_tracer import FileAccessTracer
+from invocation_memo import InvocationMemo, channel_for, env_variant_for, hash_file
+import coverage_oracle
+from coverage_oracle import CoverageOraclePool
+from helpers.bitmap_store import BitmapStore
+from helpers.exceptions import ForkserverError
+from helpers.seeds_index import SeedsIndex
+from helpers.seeds_manifest import SeedsManifest
+from helpers.utils import check_output_with_timeout_command, check_output_until_match
 
 logger = helpers.utils.init_logger(__name__)
 
@@ -134,7 +148,9 @@ class HeuristicConfigCreator(object):
                 return int(match.groups(0)[1])
 
     def __init__(self, binary_path: str, results_out_dir: str, timeout: float = 1.5, qemu: bool = False,
-                 seeds_dir: str = "seeds/", cores=1, verbose=False):
+                 seeds_dir: str = "seeds/", cores=1, verbose=False,
+                 use_coverage_oracle: bool = config_settings.USE_COVERAGE_ORACLE,
+                 invocation_memo: InvocationMemo = None):
         """
         :param binary_path: The path to the elf bianry.
         :type binary_path: str 
@@ -143,6 +159,9 @@ class HeuristicConfigCreator(object):
         :type dummyfiles_path: str
         :param timeout: The timeout
         :param qemu: Qemu mode? yes/no
+        :param use_coverage_oracle: Measure coverage with a forkserver (see coverage_oracle) instead of afl-cmin
+        :param invocation_memo: The memo of already tried invocations, e.g. persisted by a previous run.
+                                Defaults to a memo that only lives as long as this object.
         """
         # Perform sanity checks
         if not isinstance(binary_path, str):
@@ -168,6 +187,24 @@ class HeuristicConfigCreator(object):
         self.results_out_dir = results_out_dir
         self.cores = cores
         self.verbose = verbose
+        self.use_coverage_oracle = use_coverage_oracle
+        self.coverage_oracles = {}  # Matches invocation to its CoverageOraclePool, None if the forkserver failed
+        self.coverage_oracles_lock = threading.Lock()
+        self.file_access_tracer = FileAccessTracer(binary_path, qemu=qemu)
+        self.bitmap_store = None  # type: BitmapStore
+        self.binary_hash = None  # The build the stored bitmaps belong to
+        if use_coverage_oracle and config_settings.STORE_COVERAGE_BITMAPS:
+            self.bitmap_store = BitmapStore(os.path.join(results_out_dir, "coverage_bitmaps"))
+            if os.path.isfile(binary_path):
+                self.binary_hash = invocation_memo.binary_hash if invocation_memo else hash_file(binary_path)
+            self.bitmap_store.forget_stale(binary_path, self.binary_hash)  # From a previous build or other seeds
+        self.invocation_memo = invocation_memo
+        self.invocation_memo_lock = threading.Lock()
+        self.probe_results = {}  # type: typing.Dict[str, ProbeResult] # Matches parameter to its adaptive probe
+        self.seeds_index = SeedsIndex(seeds_dir)  # The representative seeds to probe first, if the seeds are indexed
+        self.seeds_manifest = None  # type: SeedsManifest # The seed files, listed once instead of for every probe
+        if os.path.isdir(seeds_dir):
+            self.seeds_manifest = SeedsManifest.for_directory(seeds_dir)
 
     def invoke_afl_cmin(self, invocation: str, sample_files_path: str, crash_only: bool = False, out_dir: str = None,
                         probe: bool = False) -> str:
@@ -240,6 +277,112 @@ class HeuristicConfigCreator(object):
                 return 0  # No coverage
         return HeuristicConfigCreator.get_coverage_from_afl_showmap_output(output)
 
+    def get_coverage_oracle(self, invocation: str) -> CoverageOraclePool:
+        """
+        Returns the coverage oracle pool for the invocation, starting it if necessary.
+        :return: The pool, None if the oracle is disabled or the binary does not come up with a forkserver.
+        """
+        if not self.use_coverage_oracle:
+            return None
+        with self.coverage_oracles_lock:
+            if invocation not in self.coverage_oracles:
+                self.coverage_oracles[invocation] = CoverageOraclePool(
+                    binary_path=self.binary_path, invocation=invocation, qemu=self.qemu,
+                    env=helpers.utils.get_fuzzing_env_for_invocation(invocation),
+                    timeout=config_settings.AFL_CMIN_INVOKE_TIMEOUT, size=self.cores)
+            return self.coverage_oracles[invocation]
+
+    def disable_coverage_oracle(self, invocation: str):
+        with self.coverage_oracles_lock:
+            pool = self.coverage_oracles.get(invocation)
+            self.coverage_oracles[invocation] = None
+        if pool:
+            pool.close()
+
+    def close_coverage_oracles(self):
+        with self.coverage_oracles_lock:
+            pools = [pool for pool in self.coverage_oracles.values() if pool]
+            self.coverage_oracles = {}
+        for pool in pools:
+            pool.close()
+        if self.bitmap_store is not None:
+            self.bitmap_store.flush()
+
+    def coverage_via_oracle(self, invocation: str, sample_files_path: str, probe: bool = False) -> int:
+        """
+        Like invoke_afl_cmin_and_extract_coverage, but runs the files on the forkserver of the coverage oracle.
+        :return: The number of unique tuples, None if the oracle can not be used for this invocation.
+        """
+        pool = self.get_coverage_oracle(invocation)
+        if pool is None:
+            return None
+        try:
+            if self.bitmap_store is not None:
+                coverage, crashes = self.coverage_via_bitmap_store(pool, invocation, sample_files_path, probe=probe)
+            else:
+                coverage, results = pool.coverage(coverage_oracle.sample_directory(
+                    sample_files_path, probe=probe, representatives=self.representatives_of(sample_files_path),
+                    files=self.seed_files(sample_files_path)))
+                crashes = [r.input_path for r in results if r.status == coverage_oracle.RUN_CRASH]
+        except ForkserverError as e:
+            logger.info("{0}, falling back to afl-cmin".format(e))
+            self.disable_coverage_oracle(invocation)
+            return None
+        if not coverage and crashes:  # Same as afl-cmin failing but afl-cmin -C narrowing down some crashes
+            out_dir = self.results_out_dir + "/crashes" + str(uuid.uuid4())
+            os.makedirs(out_dir, exist_ok=True)
+            for crash in crashes:
+                shutil.copyfile(crash, os.path.join(out_dir, os.path.basename(crash)))
+            logger.error("Found a crash for {0}, stored trace in {1}".format(self.binary_path, out_dir))
+            return 1
+        return coverage
+
+    def seed_filetypes(self, include_empty: bool = False) -> [str]:
+        """
+        :return: The filetype directories of the seeds, according to the seeds manifest.
+        """
+        if self.seeds_manifest is None:
+            return []
+        return self.seeds_manifest.filetypes(include_empty=include_empty)
+
+    def seed_files(self, sample_files_path: str) -> [str]:
+        """
+        :return: The files in sample_files_path, from the seeds manifest if it is a filetype directory of the seeds.
+        """
+        filetype = os.path.basename(os.path.normpath(sample_files_path))
+        if self.seeds_manifest is not None and filetype in self.seeds_manifest and os.path.samefile(
+                os.path.dirname(os.path.normpath(sample_files_path)), self.seeds_path):
+            return self.seeds_manifest.files(filetype)
+        return sorted(os.path.join(sample_files_path, f) for f in os.listdir(sample_files_path)
+                      if os.path.isfile(os.path.join(sample_files_path, f)))
+
+    def representatives_of(self, sample_files_path: str) -> [str]:
+        """
+        :return: The representative seeds of the filetype directory (see helpers.seeds_index), empty if not indexed.
+        """
+        return self.seeds_index.representatives(os.path.basename(os.path.normpath(sample_files_path)))
+
+    def coverage_via_bitmap_store(self, pool: CoverageOraclePool, invocation: str, sample_files_path: str,
+                                  probe: bool = False) -> (int, [str]):
+        """
+        Runs only those files of sample_files_path on the oracle that have no stored bitmap yet
+        (e.g. the files already run while probing) and computes the coverage from the bitmap store.
+        :return: The number of unique tuples and the list of crashing files.
+        """
+        files = coverage_oracle.sample_directory(sample_files_path, probe=probe,
+                                                 representatives=self.representatives_of(sample_files_path),
+                                                 files=self.seed_files(sample_files_path))
+        new_files = [f for f in files if self.bitmap_store.get(self.binary_path, invocation, f) is None]
+        label = os.path.basename(os.path.normpath(sample_files_path))
+        for result in pool.run_batch(new_files):
+            self.bitmap_store.put(self.binary_path, invocation, result.input_path, result.bitmap, label=label,
+                                  status=result.status, binary_hash=self.binary_hash)
+        coverage = self.bitmap_store.coverage(self.bitmap_store.select(binary=self.binary_path, invocation=invocation,
+                                                                       seeds=files))
+        crashes = [f for f in files if self.bitmap_store.status(self.binary_path, invocation, f) ==
+                   coverage_oracle.RUN_CRASH]
+        return coverage, crashes
+
     def invoke_afl_cmin_and_extract_coverage(self, invocation: str, sample_files_path: str, probe=False):
         output = None
         try:
@@ -278,48 +421,96 @@ class HeuristicConfigCreator(object):
         coverage = int(self.get_coverage_from_afl_cmin_ouput(output))
         return coverage
 
-    def try_invocation(self, invocation, stdin=False, without_desock=False) -> bool:
+    def get_invocation_memo(self) -> InvocationMemo:
+        with self.invocation_memo_lock:
+            if self.invocation_memo is None:
+                self.invocation_memo = InvocationMemo(self.binary_path)
+            return self.invocation_memo
+
+    def try_invocation(self, invocation, stdin=False, without_desock=False, dummyfile_path: str = None,
+                       cancel_event: threading.Event = None) -> bool:
         """
-        Try the argument and see if it works correctly
+        Try the argument and see if it works correctly.
+        Invocations that were already tried (with the same channel and env) are answered from the invocation memo.
         :param invocation: The argument to try.
         :param stdin: Check for stdin or file
         :param without_desock: Force without desock
+        :param dummyfile_path: The dummyfile to use, defaults to self.dummyfile_path
+        :param cancel_event: Kill the strace run once this event is set, the invocation then counts as not working.
         :return: True if the argument worked, False if not
         """
+        memo = self.get_invocation_memo()
+        channel = channel_for(stdin)
+        env_variant = env_variant_for(invocation, without_desock)
+        verdict = memo.get(invocation, channel, env_variant)
+        if verdict is not None:
+            logger.debug("Invocation {0} ({1}, {2}) already tried".format(invocation, channel, env_variant))
+            return verdict.accepted
+        start = time.monotonic()
+        accepted = self.trace_invocation(invocation, stdin=stdin, without_desock=without_desock,
+                                         dummyfile_path=dummyfile_path, cancel_event=cancel_event)
+        if cancel_event is None or not cancel_event.is_set():  # A cancelled probe says nothing about the invocation
+            memo.put(invocation, channel, env_variant, accepted, time.monotonic() - start)
+        return accepted
+
+    def trace_invocation(self, invocation, stdin=False, without_desock=False, dummyfile_path: str = None,
+                         cancel_event: threading.Event = None) -> bool:
+        """
+        Runs the binary with the invocation and checks if it accesses the dummyfile, see try_invocation.
+        """
         # We try different heuristics to see if it worked:
         # We say that an argument worked if the program tried to open the file
-        # We check that via strace
-        if not os.path.exists(self.dummyfile_path):
-            with open(self.dummyfile_path, "w") as dummyfile:
+        # We check that via fileaccess.so, or via strace if it can not be preloaded
+        if dummyfile_path is None:
+            dummyfile_path = self.dummyfile_path
+        if not os.path.exists(dummyfile_path):
+            with open(dummyfile_path, "w") as dummyfile:
                 dummyfile.write("CONTENT")
-        file = os.path.abspath(self.dummyfile_path)
+        file = os.path.abspath(dummyfile_path)
         # print("Trying invocation", invocation.replace("@@",file))
         # logging.info("Trying invocation {0}".format(invocation.replace("@@",file)))
+        if not stdin:
+            binary_arguments = invocation.replace("@@", file).split(" ")
+        else:
+            binary_arguments = invocation.split(" ")
+        if without_desock:
+            env = config_settings.get_inference_env_without_desock()
+        else:
+            env = helpers.utils.get_inference_env_for_invocation(invocation)
+        if config_settings.USE_FILE_ACCESS_TRACER and self.file_access_tracer.available:
+            logger.info("Trying invocation {0}".format(" ".join([self.binary_path] + binary_arguments)))
+            accessed, timeout = self.file_access_tracer.trace(
+                binary_arguments, file, env, stdin=stdin, timeout=self.MAX_TIMEOUT, cancel_event=cancel_event,
+                stop_on_access=config_settings.EARLY_EXIT_ON_FILE_ACCESS)
+            return accessed and not timeout  # The process timed out - we are not going to accept it as a parameter.
 
         strace_arguments = ["-y", "-f", "-v", "-s", "65000", "--",
                             self.binary_path]  # No abbreviation of output, -f to trace forks, -y to show full file path
-        if not stdin:
-            strace_arguments += invocation.replace("@@", file).split(" ")
-        else:
-            strace_arguments += invocation.split(" ")
+        strace_arguments += binary_arguments
         # print(" ".join(strace_arguments))
         # Calling the binary with strace best works combined with the timeout command
         # print(strace_arguments)
         # print(check_output_with_timeout_command("strace",strace_arguments, timeout=self.MAX_TIMEOUT))
-        if without_desock:
-            env = config_settings.get_inference_env_without_desock()
-        else:
-            env = helpers.utils.get_inference_env_for_invocation(invocation)
 
         logger.info("Trying invocation strace {0}".format(" ".join(strace_arguments)))
-        output, timeout = check_output_with_timeout_command("strace", strace_arguments, timeout=self.MAX_TIMEOUT,
-                                                            test_stdin=stdin, dummyfile_path=self.dummyfile_path,
-                                                            env=env)
+        if config_settings.EARLY_EXIT_ON_FILE_ACCESS:
+            # Parse the trace while it is written and stop the binary at the first access of the file
+            output, timeout, accessed = check_output_until_match(
+                "strace", strace_arguments, lambda line: self.strace_line_accesses_file(line, file),
+                timeout=self.MAX_TIMEOUT, test_stdin=stdin, dummyfile_path=dummyfile_path, cancel_event=cancel_event,
+                skip_lines=1, env=env)
+        else:
+            output, timeout = check_output_with_timeout_command("strace", strace_arguments, timeout=self.MAX_TIMEOUT,
+                                                                test_stdin=stdin, dummyfile_path=dummyfile_path,
+                                                                env=env, cancel_event=cancel_event)
+            accessed = None
         logger.info(output)
         if "/usr/bin/strace: ptrace(PTRACE_TRACEME, ...): Operation not permitted" in output:
             raise PermissionError("Strace is not allowed to trace. Try starting docker with --cap-add=SYS_PTRACE")
         if self.verbose:
             logger.debug(output)
+        if accessed is not None:
+            return accessed
         if timeout:  # The process timed out - we are not going to accept it as a parameter.
             return False
 
@@ -331,11 +522,20 @@ class HeuristicConfigCreator(object):
         # return self.check_strace_for_fopen(output_lines,file)
         # output = "\n".join(output_lines[1:])
         for line in output_lines[1:]:
-            # if file in line and ("read" in line or ("open" in line and "O_WRONLY" not in line)):
-            if ("<" + file + ">") in line and ("read" in line or ("open" in line and "O_WRONLY" not in line)):
+            if self.strace_line_accesses_file(line, file):
                 return True
         return False
 
+    @staticmethod
+    def strace_line_accesses_file(line: str, file: str) -> bool:
+        """
+        :param line: A line of strace -y output.
+        :param file: The absolute path of the file.
+        :return: True if the line shows a read from the file or opening it for reading.
+        """
+        # if file in line and ("read" in line or ("open" in line and "O_WRONLY" not in line)):
+        return ("<" + file + ">") in line and ("read" in line or ("open" in line and "O_WRONLY" not in line))
+
     def figure_out_parameters(self):
         """
         Figure out the argument which is needed to force the binary to take a file. 
@@ -368,28 +568,89 @@ class HeuristicConfigCreator(object):
             parameter_candidates["dependent arguments"].append([p + " -d" for p in sublist])
             parameter_candidates["dependent arguments"].append([p + " -p" for p in sublist])
 
-        valid_invocations = set()
-        for subcommand in subcommand_list:
-            # for h in help_parameters: # Try the help parameters in any case
-            #    valid = self.try_invocation(invocation=subcommand+h)
-            #    if valid:
-            #        valid_invocations.add(h)
-            for key, candidate_list in parameter_candidates.items():
-                for candidatetuples in candidate_list:
-                    for invocation in candidatetuples:
-                        if key == "stdin_candidates" or key == "server_candidates":
-                            valid = self.try_invocation(invocation=subcommand + invocation, stdin=True)
-                        else:
-                            valid = self.try_invocation(invocation=subcommand + invocation)
-                        if valid:
-                            valid_invocations.add(invocation)
-                            break
-                if valid_invocations:
-                    self.parameters = valid_invocations
-                    return valid_invocations
+        candidate_sets = [(subcommand, key, candidate_list) for subcommand in subcommand_list for key, candidate_list in
+                          parameter_candidates.items()]
+        valid_invocations = self.try_parameter_candidate_sets(candidate_sets)
         self.parameters = valid_invocations
         return valid_invocations
 
+    def try_parameter_candidate_sets(self, candidate_sets: [(str, str, [[str]])]) -> set:
+        """
+        Tries the parameter candidate sets with self.cores strace runs in parallel.
+        The first set (in the given order) with a valid invocation wins: As soon as a set finds one,
+        all probes of later sets are cancelled, but earlier sets still run to completion.
+        The result is the same as trying the sets one after another.
+        :param candidate_sets: (subcommand, key, candidate_list) tuples, ordered by priority.
+                               For every list of candidate_list, the invocations are tried until one is accepted.
+        :return: The valid invocations of the winning set (without the subcommand), an empty set if none was found.
+        """
+        cancel_events = [threading.Event() for _ in candidate_sets]
+        found = [set() for _ in candidate_sets]
+        pending = [len(candidate_list) for _, _, candidate_list in candidate_sets]
+        errors = []
+        condition = threading.Condition()
+        worker_state = threading.local()
+        dummyfile_paths = set()
+
+        def try_candidates(set_index: int, candidates: [str]):
+            subcommand, key, _ = candidate_sets[set_index]
+            cancel_event = cancel_events[set_index]
+            valid_invocation = None
+            try:
+                if not hasattr(worker_state, "dummyfile_path"):  # Every worker gets its own dummyfile
+                    worker_state.dummyfile_path = "{0}_{1}".format(self.dummyfile_path, threading.get_ident())
+                    with condition:
+                        dummyfile_paths.add(worker_state.dummyfile_path)
+                for invocation in candidates:
+                    if cancel_event.is_set():
+                        break
+                    stdin = key == "stdin_candidates" or key == "server_candidates"
+                    if self.try_invocation(invocation=subcommand + invocation, stdin=stdin,
+                                           dummyfile_path=worker_state.dummyfile_path, cancel_event=cancel_event):
+                        valid_invocation = invocation
+                        break
+            except BaseException as e:
+                with condition:
+                    errors.append(e)
+            with condition:
+                if valid_invocation is not None and not cancel_event.is_set():
+                    found[set_index].add(valid_invocation)
+                    for event in cancel_events[set_index + 1:]:  # Lower priority sets can not win anymore
+                        event.set()
+                pending[set_index] -= 1
+                condition.notify_all()
+
+        def winner() -> typing.Optional[set]:
+            for set_index in range(len(candidate_sets)):
+                if pending[set_index] > 0:
+                    return None  # Still waiting for a set with a higher priority
+                if found[set_index]:
+                    return found[set_index]
+            return set()
+
+        try:
+            with multiprocessing.pool.ThreadPool(processes=max(1, self.cores)) as pool:
+                for set_index, (_, _, candidate_list) in enumerate(candidate_sets):
+                    for candidates in candidate_list:
+                        pool.apply_async(try_candidates, (set_index, candidates))
+                with condition:
+                    valid_invocations = winner()
+                    while valid_invocations is None and not errors:
+                        condition.wait()
+                        valid_invocations = winner()
+                    for event in cancel_events:
+                        event.set()
+                # Let the cancelled probes finish, they only have to kill their strace runs
+                pool.close()
+                pool.join()
+            if errors:
+                raise errors[0]
+        finally:
+            for dummyfile_path in dummyfile_paths:
+                if os.path.exists(dummyfile_path):
+                    os.remove(dummyfile_path)
+        return valid_invocations
+
     @staticmethod
     def get_parameters_from_help_output(output: str):
         file_regex_space_file_pattern = r"\s*(-[^\s]+)\s+.*file.*"  # For things like -r <infile>
@@ -475,13 +736,15 @@ class HeuristicConfigCreator(object):
         if self.failed_invocations >= self.FAILED_INVOCATIONS_THRESHOLD:
             result_dict[file_type] = -1
             return -1  # TODO: Do not return the same as "no coverage"
-        dummyfiles = os.listdir(dummyfiles_path)
+        dummyfiles = self.seed_files(dummyfiles_path)
         if not dummyfiles:
             logger.error(dummyfiles_path, "has no dummyfiles!")
             result_dict[file_type] = 0
             return 0  # No dummyfile, no coverage
-        coverage = self.invoke_afl_cmin_and_extract_coverage(invocation=parameter, sample_files_path=dummyfiles_path,
-                                                             probe=probe)
+        coverage = self.coverage_via_oracle(invocation=parameter, sample_files_path=dummyfiles_path, probe=probe)
+        if coverage is None:
+            coverage = self.invoke_afl_cmin_and_extract_coverage(invocation=parameter,
+                                                                 sample_files_path=dummyfiles_path, probe=probe)
         result_dict[file_type] = coverage
         logger.debug("Got {0} coverage for filetype: {1}".format(coverage, file_type))
         logger.info(
@@ -507,42 +770,97 @@ class HeuristicConfigCreator(object):
         type and calls afl-showmap on them. It returns only those filetypes that have a higher coverage than the lowest coverage yielded.
         :return: A list of subdirectories of self.seeds_path that could be the right file type and the minimum coverage.
         """
+        if config_settings.ADAPTIVE_PROBING:
+            adaptive_probe = self.probe_filetypes_adaptively(parameter)
+            if adaptive_probe is not None:
+                return adaptive_probe
         PROBE_FILES = 3
         files_to_try = {}
         max_coverage_per_filetype = {}
         cmin_argument_list = []
         result_dict = {}
-        for filetype in os.listdir(self.seeds_path):
-            if filetype == ".git":  # Ignore .git directory
-                continue
-            if not os.path.isdir(os.path.join(self.seeds_path, filetype)):
-                continue
-            if len(os.listdir(os.path.join(self.seeds_path, filetype))) <= 0:
-                continue
+        for filetype in self.seed_filetypes():
             cmin_argument_list.append(
                 (parameter, self.seeds_path + "/" + filetype, "." + str(filetype.split("_")[0]), result_dict, True))
         with multiprocessing.pool.ThreadPool(processes=self.cores) as pool:  # instead of multiprocessor.cpu_count()
             results = pool.starmap(self.try_filetype_with_coverage, cmin_argument_list)
-        coverage = [result_dict.get("." + filetype.split("_")[0], 0) for filetype in os.listdir(self.seeds_path)]
+        filetypes = self.seed_filetypes(include_empty=True)
+        coverage = [result_dict.get("." + filetype.split("_")[0], 0) for filetype in filetypes]
         max_coverage_per_filetype = {filetype: result_dict.get("." + filetype.split("_")[0], 0) for filetype in
-                                     os.listdir(self.seeds_path)}
+                                     filetypes}
         # coverage = self.invoke_afl_cmin_and_extract_coverage(invocation=parameter,sample_files_path=os.path.join(self.seeds_path,filetype),probe=True)
         # print(coverage)
         # max_coverage_per_filetype[filetype] = int(coverage)
         # logging.info("{0}: Got {1} coverage probing filetype {2} and parameter {3}".format(self.binary_path, coverage, filetype,
         # parameter))
-        value_list = list([abs(x) for x in max_coverage_per_filetype.values()])
-        std = sp.std(value_list)
-        avg_value = sp.mean(value_list)
-        logger.debug("Average:", avg_value)
-        logger.debug("Probing, std:", std)
-        if std > 0:
-            possible_filetypes = [k for k, v in max_coverage_per_filetype.items() if ((v - avg_value) / std) > 2]
-            if len(possible_filetypes) >= 1:  # 4 ticks away, that is pretty obvious
-                return possible_filetypes, avg_value, max_coverage_per_filetype
-        possible_filetypes = [k for k, v in max_coverage_per_filetype.items() if v > avg_value]
+        scores = CoverageScores.from_dict(max_coverage_per_filetype, abs_statistics=True)
+        avg_value = float(scores.means[0])
+        logger.debug("Average: %s", avg_value)
+        logger.debug("Probing, std: %s", scores.stds[0])
+        possible_filetypes = scores.outliers(0, 2)
+        if len(possible_filetypes) >= 1:  # 4 ticks away, that is pretty obvious
+            return possible_filetypes, avg_value, max_coverage_per_filetype
+        possible_filetypes = scores.above_mean(0)
         return possible_filetypes, avg_value, max_coverage_per_filetype
 
+    def probe_filetypes_adaptively(self, parameter: str) -> ([str], int, {}):
+        """
+        Like probe_possible_filetypes_for_parameter, but runs the seeds one by one on the coverage oracle
+        and stops running filetypes that are out of contention (see adaptive_prober).
+        The coverage of a filetype is the number of unique tuples of its seeds run so far.
+        :return: The filetypes still in contention (best first), the average coverage and the coverage per filetype.
+                 None if the coverage oracle can not be used.
+        """
+        oracle_pool = self.get_coverage_oracle(parameter)
+        if oracle_pool is None:
+            return None
+        arms = {}
+        for filetype in self.seed_filetypes():
+            arms[filetype] = self.seeds_manifest.files(filetype)
+        unions = {}  # Matches filetype to the union of the bitmaps of its seeds
+        unions_lock = threading.Lock()
+
+        def run_chunk(chunk: [(str, str)]) -> [float]:
+            results = oracle_pool.run_batch([seed for _, seed in chunk])
+            values = []
+            for (filetype, _), result in zip(chunk, results):
+                if self.bitmap_store is not None:
+                    self.bitmap_store.put(self.binary_path, parameter, result.input_path, result.bitmap,
+                                          label=filetype, status=result.status, binary_hash=self.binary_hash)
+                if result.status != coverage_oracle.RUN_OK:  # Like afl-cmin, crashes and timeouts add no coverage
+                    values.append(0)
+                    continue
+                with unions_lock:
+                    union = unions.setdefault(filetype, np.zeros(coverage_oracle.MAP_SIZE, dtype=np.uint8))
+                    np.bitwise_or(union, result.bitmap, out=union)
+                values.append(coverage_oracle.count_tuples([result.bitmap]))
+            return values
+
+        def measure(batch: [(str, str)]) -> [float]:
+            chunk_size = max(1, -(-len(batch) // self.cores))
+            chunks = [batch[i:i + chunk_size] for i in range(0, len(batch), chunk_size)]
+            with multiprocessing.pool.ThreadPool(processes=self.cores) as pool:
+                return [value for values in pool.map(run_chunk, chunks) for value in values]
+
+        prober = AdaptiveProber(arms, measure, budget=config_settings.ADAPTIVE_PROBING_BUDGET,
+                                preferred={filetype: self.seeds_index.representatives(filetype) for filetype in arms})
+        try:
+            result = prober.run()
+        except ForkserverError as e:
+            logger.info("{0}, probing with afl_probe instead".format(e))
+            self.disable_coverage_oracle(parameter)
+            return None
+        self.probe_results["None" if not parameter else parameter] = result
+        max_coverage_per_filetype = {filetype: coverage_oracle.count_tuples([unions[filetype]])
+                                     if filetype in unions else 0 for filetype in prober.arms}
+        logger.info("{0}: Probed {1} seeds in {2} rounds for parameter {3}, contenders: {4} (confidence {5:.3f})"
+                    .format(self.binary_path, result.pulls, result.rounds, parameter, result.contenders,
+                            result.confidence))
+        avg_value = float(CoverageScores.from_dict(max_coverage_per_filetype, abs_statistics=True).means[0])
+        if all(coverage == 0 for coverage in max_coverage_per_filetype.values()):
+            return [], avg_value, max_coverage_per_filetype  # Nothing yields coverage, same as all equal for afl_probe
+        return result.contenders, avg_value, max_coverage_per_filetype
+
     def infer_filetype_via_coverage_for_parameter_parallel(self, parameter: str, probe: bool = True) -> (
             str, int, bool):
         """
@@ -588,16 +906,11 @@ class HeuristicConfigCreator(object):
                 self.coverage_lists[p] = zip(file_list, cov_list)
                 return [max_file], [max_cov], False
         else:
-            probed_filetypes = [entity for entity in os.listdir(self.seeds_path) if
-                                os.path.isdir(os.path.join(self.seeds_path, entity))]
+            probed_filetypes = self.seed_filetypes(include_empty=True)
             cov_list = [0] * len(probed_filetypes)
             file_list = [None] * len(probed_filetypes)
         for entity in probed_filetypes:
-            if not os.path.isdir(self.seeds_path + "/" + entity):
-                continue
-            if len(os.listdir(self.seeds_path + "/" + entity)) <= 0:
-                continue
-            if entity == ".git":
+            if self.seeds_manifest.count(entity) <= 0:
                 continue
             if (entity == "pcap-network_samples" or entity == "pcap-network") and (
                     not is_network_param):  # Do not try the network seeds for file handling programs - it simply takes too long
@@ -607,7 +920,7 @@ class HeuristicConfigCreator(object):
         with multiprocessing.pool.ThreadPool(processes=self.cores) as pool:  # instead of multiprocessor.cpu_count()
             results = pool.starmap(self.try_filetype_with_coverage, cmin_argument_list)
         for counter, entity in enumerate(probed_filetypes):
-            if not os.path.isdir(self.seeds_path + "/" + entity):
+            if entity not in self.seeds_manifest:
                 continue
             cov = result_dict.get("." + str(entity.split("_")[0]))
             if cov is None:
@@ -625,16 +938,13 @@ class HeuristicConfigCreator(object):
         if parameter:
             p = parameter
         self.coverage_lists[p] = zip(file_list, cov_list)
-        value_list = list([abs(x) for x in max_coverage_per_filetype.values()])
-        std = sp.std(value_list)
-        avg_value = sp.mean(value_list)
-        logger.debug("Average: %s", avg_value)
-        logger.debug("Std. Deviation: %s", std)
-        if std > 0:
-            possible_filetypes = [k for k, v in max_coverage_per_filetype.items() if ((v - avg_value) / std) > 2.5]
-            if len(possible_filetypes) >= 1:  # 4 ticks away, that is pretty obvious
-                return [os.path.join(self.seeds_path, p) for p in possible_filetypes], [
-                    max_coverage_per_filetype[filetype] for filetype in possible_filetypes], False
+        scores = CoverageScores.from_dict(max_coverage_per_filetype, abs_statistics=True)
+        logger.debug("Average: %s", scores.means[0])
+        logger.debug("Std. Deviation: %s", scores.stds[0])
+        possible_filetypes = scores.outliers(0, 2.5)
+        if len(possible_filetypes) >= 1:  # 4 ticks away, that is pretty obvious
+            return [os.path.join(self.seeds_path, p) for p in possible_filetypes], [
+                max_coverage_per_filetype[filetype] for filetype in possible_filetypes], False
         # No file over >4 ticks from std deviation:
         logger.debug("Max file")
         logger.debug(max_file)
@@ -647,7 +957,10 @@ class HeuristicConfigCreator(object):
         :return: A list of CliConfig object, each representing one input vector.
         """
         logger.info("Figuring out parameters for {0}".format(self.binary_path))
-        param = self.figure_out_parameters()
+        try:
+            param = self.figure_out_parameters()
+        finally:
+            self.get_invocation_memo().save()
         if os.path.exists(self.dummyfile_path):
             os.remove(self.dummyfile_path)
         if not param:
@@ -655,7 +968,11 @@ class HeuristicConfigCreator(object):
             return None
         else:
             logger.info("Now searching for right filetype for %s", self.binary_path)
-            return self.infer_filetypes()
+            try:
+                return self.infer_filetypes()
+            finally:
+                self.close_coverage_oracles()
+                self.get_invocation_memo().save()
 
     def infer_filetypes_via_coverage(self) -> [(str, str, int)]:
         """
@@ -663,22 +980,32 @@ class HeuristicConfigCreator(object):
         :return: A list of triples: (parameter,filetype,coverage)
         """
         self.cli_config_list = []
+        inference_results = []
         for param in self.parameters:
             inference_result = self.infer_filetype_via_coverage_for_parameter_parallel(param)
             if inference_result is None:  # Everything yielded the same coverage
                 continue  # Next one
-            max_files, max_covs, took_max_file = inference_result
             p = "None"
             if param:
                 p = param
+            self.coverage_lists[p] = list(self.coverage_lists[p])
+            inference_results.append(
+                (param, p, inference_result, self.failed_invocations >= self.FAILED_INVOCATIONS_THRESHOLD))
+        # Score the filetypes of all parameters in one go
+        coverage_scores = CoverageScores([self.coverage_lists[p] for _, p, _, _ in inference_results])
+        for row, (param, p, (max_files, max_covs, took_max_file), failed) in enumerate(inference_results):
+            confidence = None
+            if p in self.probe_results and max_files and max_files[0]:
+                confidence = self.probe_results[p].confidence_of(os.path.basename(os.path.normpath(max_files[0])))
             c = CliConfig(invocation=param, filetypes=max_files, coverage_list=self.coverage_lists[p],
                           coverages=max_covs, binary_path=self.binary_path, max_coverage=max(max_covs),
-                          took_max_file=took_max_file)
-            if self.failed_invocations >= self.FAILED_INVOCATIONS_THRESHOLD:
+                          took_max_file=took_max_file, coverage_scores=coverage_scores, coverage_scores_row=row,
+                          confidence=confidence)
+            if failed:
                 c.invocation_always_possible = False
             c.qemu = self.qemu
             self.cli_config_list.append(c)
-        return sorted(self.cli_config_list, key=operator.attrgetter("max_coverage"), reverse=True)
+        return rank_input_vectors(self.cli_config_list)
 
     def infer_filetypes(self):
         """
@@ -711,7 +1038,7 @@ class HeuristicConfigCreator(object):
     def get_input_vectors_sorted(self) -> [CliConfig]:
         if not self.cli_config_list:
             return None
-        return sorted(self.cli_config_list, key=operator.attrgetter("max_coverage"), reverse=True)
+        return rank_input_vectors(self.cli_config_list)
 
     def print_json_input_vectors(self):
         logger.debug("JSON Result")
@@ -0,0 +1,146 @@
+"""
+Remembers the outcome of every invocation tried on a binary, so the inference phases
+(figure_out_parameters, the filetype inference, resumed runs) do not trace the same invocation again.
+A verdict is keyed by (binary hash, invocation, input channel, env variant) and stored with the time the
+probe took. The memo is persisted next to the input vector json of the binary
+(<volume>/<package>/<binary filename>.invocations.json).
+"""
+import hashlib
+import json
+import threading
+import time
+import typing
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import helpers.utils
+from helpers.analysis_cache import tool_fingerprint
+
+MEMO_FILE_SUFFIX = ".invocations.json"
+MEMO_VERSION = 1
+SAVE_EVERY = 32  # Persist the memo after this many new verdicts, so an interrupted inference loses little work
+
+CHANNEL_FILE = "file"
+CHANNEL_STDIN = "stdin"
+ENV_DESOCK = "desock"
+ENV_WITHOUT_DESOCK = "without_desock"
+
+
+def channel_for(stdin: bool) -> str:
+    return CHANNEL_STDIN if stdin else CHANNEL_FILE
+
+
+def env_variant_for(invocation: str, without_desock: bool = False) -> str:
+    """
+    :return: The env variant try_invocation runs the invocation with,
+             see helpers.utils.get_inference_env_for_invocation.
+    """
+    if without_desock or "@@" in invocation:
+        return ENV_WITHOUT_DESOCK
+    return ENV_DESOCK
+
+
+def hash_file(path: str) -> str:
+    hash_object = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+            hash_object.update(chunk)
+    return hash_object.hexdigest()
+
+
+def memo_path_for(volume_path: str, package: str, binary_path: str) -> str:
+    """
+    :return: The path of the memo for the binary, next to the json written by store_input_vectors_in_volume.
+    """
+    return os.path.join(volume_path, package, helpers.utils.get_filename_from_binary_path(binary_path) +
+                        MEMO_FILE_SUFFIX)
+
+
+class InvocationVerdict(object):
+    def __init__(self, accepted: bool, duration: float, timestamp: float = None):
+        """
+        :param accepted: True if the binary accessed the file with this invocation.
+        :param duration: How long (in seconds) the probe took.
+        :param timestamp: When the probe was run.
+        """
+        self.accepted = accepted
+        self.duration = duration
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+
+class InvocationMemo(object):
+    def __init__(self, binary_path: str, path: str = None, binary_hash: str = None):
+        """
+        :param binary_path: The binary the invocations are tried on.
+        :param path: Where the memo is persisted, None for a memo that only lives in memory.
+        :param binary_hash: The sha256 of the binary, if already known (e.g. from the analysis cache).
+        """
+        self.binary_path = binary_path
+        self.path = path
+        self.binary_hash = binary_hash or hash_file(binary_path)
+        self.tools = tool_fingerprint()
+        self._lock = threading.Lock()
+        self._verdicts = {}  # type: typing.Dict[typing.Tuple[str, str, str, str], InvocationVerdict]
+        self._unsaved = 0
+        self.hits = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def _key(self, invocation: str, channel: str, env_variant: str) -> typing.Tuple[str, str, str, str]:
+        return self.binary_hash, invocation, channel, env_variant
+
+    def __len__(self):
+        return len(self._verdicts)
+
+    def get(self, invocation: str, channel: str, env_variant: str) -> typing.Optional[InvocationVerdict]:
+        with self._lock:
+            verdict = self._verdicts.get(self._key(invocation, channel, env_variant))
+            if verdict is not None:
+                self.hits += 1
+            return verdict
+
+    def put(self, invocation: str, channel: str, env_variant: str, accepted: bool, duration: float):
+        with self._lock:
+            self._verdicts[self._key(invocation, channel, env_variant)] = InvocationVerdict(accepted, duration)
+            self._unsaved += 1
+            save = self.path and self._unsaved >= SAVE_EVERY
+        if save:
+            self.save()
+
+    def load(self):
+        """
+        Loads the persisted verdicts. Verdicts for another build of the binary or other tracing tools are dropped.
+        """
+        try:
+            with open(self.path) as fp:
+                memo_dict = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if memo_dict.get("version") != MEMO_VERSION or memo_dict.get("tools") != self.tools:
+            return
+        with self._lock:
+            for entry in memo_dict.get("verdicts", []):
+                if entry["binary_hash"] != self.binary_hash:
+                    continue
+                self._verdicts[self._key(entry["invocation"], entry["channel"], entry["env"])] = InvocationVerdict(
+                    entry["accepted"], entry["duration"], entry.get("timestamp"))
+
+    def save(self):
+        """
+        Atomically writes the memo to its path (if any).
+        """
+        if not self.path:
+            return
+        with self._lock:
+            verdicts = [{"binary_hash": binary_hash, "invocation": invocation, "channel": channel, "env": env,
+                         "accepted": verdict.accepted, "duration": verdict.duration, "timestamp": verdict.timestamp}
+                        for (binary_hash, invocation, channel, env), verdict in self._verdicts.items()]
+            self._unsaved = 0
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                json.dump({"version": MEMO_VERSION, "binary": self.binary_path, "tools": self.tools,
+                           "verdicts": verdicts}, fp)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Caches minimized corpora, so a rescheduled minimization or a forced reevaluation of a package
+does not run afl-cmin and afl-tmin again.
+An entry is keyed by the sha256 of the binary, the invocation, the content of the seeds, the minimization settings
+(timeouts, qemu, tmin) and the tools. The cache lives in the output volume, one directory per entry with the corpus
+and an entry.json. The afl_config of a binary points directly to the cached corpus.
+The cache also removes the minseeds_/afl_cmin_/afl_tmin_ directories minimizations leave behind in the volume
+that no afl_config refers to anymore, and entries that are neither referenced nor used for a while.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import shutil
+import time
+import typing
+import uuid
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings as config_settings
+from fuzz_managers.campaign_index import local_path
+from helpers.analysis_cache import AnalysisCache, tool_fingerprint
+from helpers.seeds_manifest import SeedsManifest
+
+logger = logging.getLogger(__name__)
+
+MINIMIZATION_CACHE_VERSION = 1
+MINIMIZATION_TOOLS = ["afl-cmin", "afl-tmin", "afl-showmap", "afl-qemu-trace"]
+ENTRY_FILE_NAME = "entry.json"
+CORPUS_DIR_NAME = "corpus"
+MINIMIZATION_DIR_PREFIXES = ("minseeds_", "afl_cmin_", "afl_tmin_")  # The directories minize creates per run
+
+
+def seeds_content_fingerprint(seeds_dirs: typing.List[str], cores: int = 1) -> str:
+    """
+    :param seeds_dirs: Filetype directories of seeds corpora, e.g. seeds/png_samples.
+    :return: A fingerprint of the content of all their seeds.
+    """
+    hash_object = hashlib.sha256()
+    for seeds_dir in sorted(os.path.normpath(seeds_dir) for seeds_dir in seeds_dirs):
+        manifest = SeedsManifest.for_directory(os.path.dirname(seeds_dir))
+        hash_object.update("{0}:{1}\n".format(os.path.basename(seeds_dir), manifest.content_fingerprint(
+            os.path.basename(seeds_dir), cores=cores)).encode("utf-8"))
+    return hash_object.hexdigest()
+
+
+def volume_local_path(volume_path: str, path: str) -> str:
+    """
+    afl_configs store the paths as seen in the containers (/results/<package>/...), where the volume is mounted.
+    :return: The path in the volume as seen here, paths that already point into the volume are kept.
+    """
+    volume_path = os.path.realpath(volume_path)
+    if os.path.realpath(path).startswith(volume_path + os.sep):
+        return path
+    return local_path(volume_path, path)
+
+
+def referenced_corpora(volume_path: str, packages: typing.List[str] = None) -> typing.Set[str]:
+    """
+    :return: The real paths (in the volume as seen here) of all min_seeds_dir the afl_configs of the packages
+             (default: all) refer to.
+    """
+    if packages is None:
+        packages = [p for p in os.listdir(volume_path) if os.path.isdir(os.path.join(volume_path, p))]
+    referenced = set()
+    for package in packages:
+        package_dir = os.path.join(volume_path, package)
+        if not os.path.isdir(package_dir):
+            continue
+        for name in os.listdir(package_dir):
+            if not name.endswith(".afl_config"):
+                continue
+            try:
+                with open(os.path.join(package_dir, name)) as fp:
+                    min_seeds_dir = json.load(fp).get("min_seeds_dir")
+            except (OSError, ValueError, AttributeError):
+                continue
+            if min_seeds_dir:
+                referenced.add(os.path.realpath(volume_local_path(volume_path, min_seeds_dir)))
+    return referenced
+
+
+def remove_orphans(volume_path: str, packages: typing.List[str] = None, grace_period: float = None) -> typing.List[
+        str]:
+    """
+    Removes the minimization directories (minseeds_, afl_cmin_, afl_tmin_) no afl_config of their package refers to.
+    :param packages: The packages to clean up, defaults to all.
+    :param grace_period: Directories modified more recently than this many seconds ago are kept, they might belong to
+                         a minimization that is still running. Defaults to config_settings.MINIMIZATION_ORPHAN_GRACE.
+    :return: The removed directories.
+    """
+    if grace_period is None:
+        grace_period = config_settings.MINIMIZATION_ORPHAN_GRACE
+    if packages is None:
+        packages = [p for p in os.listdir(volume_path) if os.path.isdir(os.path.join(volume_path, p)) and
+                    not p.startswith(".")]
+    removed = []
+    now = time.time()
+    for package in packages:
+        package_dir = os.path.join(volume_path, package)
+        if not os.path.isdir(package_dir):
+            continue
+        referenced = referenced_corpora(volume_path, [package])
+        for binary_dir in (os.path.join(package_dir, name) for name in os.listdir(package_dir)):
+            if not os.path.isdir(binary_dir):
+                continue
+            for name in os.listdir(binary_dir):
+                path = os.path.join(binary_dir, name)
+                if not name.startswith(MINIMIZATION_DIR_PREFIXES) or not os.path.isdir(path):
+                    continue
+                if os.path.realpath(path) in referenced or now - os.stat(path).st_mtime < grace_period:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+    return removed
+
+
+class MinimizationCache(object):
+    def __init__(self, cache_dir: str, tools_fingerprint: str = None):
+        """
+        :param cache_dir: The directory of the cache, usually <volume>/.minimization_cache.
+        :param tools_fingerprint: The fingerprint of the minimization tools. Defaults to tool_fingerprint().
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.tools_fingerprint = tools_fingerprint if tools_fingerprint is not None else tool_fingerprint(
+            MINIMIZATION_TOOLS)
+
+    @staticmethod
+    def for_volume(volume_path: str) -> "MinimizationCache":
+        return MinimizationCache(os.path.join(volume_path, config_settings.MINIMIZATION_CACHE_DIR_NAME))
+
+    def key_for(self, binary_hash: str, invocation: str, seeds_fingerprint: str, qemu: bool, do_tmin: bool,
+                tmin_total_time: float = None) -> str:
+        """
+        :param binary_hash: The sha256 of the binary, see AnalysisCache.binary_hash.
+        :param seeds_fingerprint: The content of the seeds, see seeds_content_fingerprint.
+        """
+        settings = [MINIMIZATION_CACHE_VERSION, config_settings.AFL_CMIN_INVOKE_TIMEOUT,
+                    config_settings.AFL_TMIN_INVOKE_TIMEOUT, config_settings.USE_NATIVE_CMIN, bool(qemu),
+                    bool(do_tmin), tmin_total_time if do_tmin else None]
+        return hashlib.sha256("\0".join(str(part) for part in [binary_hash, invocation or "", seeds_fingerprint,
+                                                                self.tools_fingerprint] + settings)
+                              .encode("utf-8")).hexdigest()
+
+    def key_for_binary(self, binary_path: str, invocation: str, seeds_dirs: typing.List[str], qemu: bool,
+                       do_tmin: bool, tmin_total_time: float = None, cores: int = 1) -> str:
+        volume_path = os.path.dirname(self.cache_dir)
+        binary_hash = AnalysisCache.for_volume(volume_path).binary_hash(binary_path)
+        return self.key_for(binary_hash, invocation, seeds_content_fingerprint(seeds_dirs, cores=cores), qemu,
+                            do_tmin, tmin_total_time)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> typing.Optional[str]:
+        """
+        :return: The path of the cached minimized corpus, None if there is none.
+        """
+        entry_dir = self._entry_dir(key)
+        corpus_dir = os.path.join(entry_dir, CORPUS_DIR_NAME)
+        if not os.path.isfile(os.path.join(entry_dir, ENTRY_FILE_NAME)) or not os.path.isdir(corpus_dir) or \
+                not os.listdir(corpus_dir):
+            return None
+        os.utime(os.path.join(entry_dir, ENTRY_FILE_NAME))  # The mtime of the entry file is its last access
+        return corpus_dir
+
+    def put(self, key: str, corpus_dir: str, metadata: typing.Dict[str, typing.Any] = None) -> str:
+        """
+        Moves the minimized corpus into the cache (renaming it, the cache is in the same volume).
+        If another minimization stored the key in the meantime, that corpus is kept and corpus_dir is removed.
+        :return: The path of the cached corpus.
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = "{0}.tmp-{1}".format(entry_dir, uuid.uuid4())
+        os.makedirs(tmp_dir)
+        try:
+            shutil.move(corpus_dir, os.path.join(tmp_dir, CORPUS_DIR_NAME))
+            with open(os.path.join(tmp_dir, ENTRY_FILE_NAME), "w") as fp:
+                json.dump(dict(metadata or {}, created=time.time()), fp)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            if self.get(key) is None:
+                raise
+            logger.info("{0} was cached concurrently, keeping the cached corpus".format(key))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return os.path.join(entry_dir, CORPUS_DIR_NAME)
+
+    def entries(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        entries = []
+        for key in sorted(os.listdir(self.cache_dir)):
+            entry_file = os.path.join(self._entry_dir(key), ENTRY_FILE_NAME)
+            try:
+                with open(entry_file) as fp:
+                    entry = json.load(fp)
+                entry_stat = os.stat(entry_file)
+            except (OSError, ValueError):
+                continue
+            entry["key"] = key
+            entry["last_access"] = entry_stat.st_mtime
+            entry["files"] = len(os.listdir(os.path.join(self._entry_dir(key), CORPUS_DIR_NAME)))
+            entries.append(entry)
+        return entries
+
+    def collect_garbage(self, max_age: float = None, grace_period: float = None) -> typing.List[str]:
+        """
+        Removes the orphaned minimization directories in the volume of the cache,
+        cache entries no afl_config refers to that were not used within max_age seconds
+        and leftovers of interrupted puts.
+        :param max_age: Defaults to config_settings.MINIMIZATION_CACHE_MAX_AGE.
+        :return: The removed directories.
+        """
+        if max_age is None:
+            max_age = config_settings.MINIMIZATION_CACHE_MAX_AGE
+        if grace_period is None:
+            grace_period = config_settings.MINIMIZATION_ORPHAN_GRACE
+        volume_path = os.path.dirname(self.cache_dir)
+        removed = remove_orphans(volume_path, grace_period=grace_period)
+        referenced = referenced_corpora(volume_path)
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(name)
+            if ".tmp-" in name:
+                if now - os.stat(entry_dir).st_mtime >= grace_period:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    removed.append(entry_dir)
+                continue
+            if os.path.realpath(os.path.join(entry_dir, CORPUS_DIR_NAME)) in referenced:
+                continue
+            entry_file = os.path.join(entry_dir, ENTRY_FILE_NAME)
+            last_access = os.stat(entry_file).st_mtime if os.path.exists(entry_file) else 0
+            if now - last_access >= max_age:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed.append(entry_dir)
+        return removed
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            shutil.rmtree(self._entry_dir(name), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clean up the minimization cache of a volume.")
+    parser.add_argument("volume", help="The output volume")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("list", help="List the cached corpora")
+    gc_parser = subparsers.add_parser("gc", help="Remove orphaned minimization directories and unused entries")
+    gc_parser.add_argument("-a", "--max_age", type=float, default=None,
+                           help="Remove unreferenced entries not used for this many seconds")
+    subparsers.add_parser("clear", help="Remove all cached corpora")
+    args = parser.parse_args()
+    cache = MinimizationCache.for_volume(args.volume)
+    if args.command == "list":
+        for entry in cache.entries():
+            print("{0}  {1:>6} files  {2}  {3} {4}".format(entry["key"][:16], entry["files"],
+                                                          time.ctime(entry["last_access"]), entry.get("binary_path"),
+                                                          entry.get("invocation")))
+    elif args.command == "gc":
+        for path in cache.collect_garbage(max_age=args.max_age):
+            print("Removed {0}".format(path))
+    elif args.command == "clear":
+        cache.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,12 @@ import signal
 import sys
 from config_settings import aflerrors
 import helpers.utils
+from helpers import seed_staging
+from helpers import seeds_manifest
+from tmin_scheduler import TminScheduler
+from corpus_minimizer import CorpusMinimizer
+from helpers.exceptions import ForkserverError
+from minimization_cache import MinimizationCache, remove_orphans
 from sh import afl_tmin, afl_cmin
 
 
@@ -46,82 +52,121 @@ def minize(parameter: str, seeds_dir: str, binary_path: str, package: str, volum
     out_dir = volume_path + "/" + package + "/" + os.path.basename(input_vector.binary_path)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir, exist_ok=True)
+    use_qemu = helpers.utils.qemu_required_for_binary(
+        input_vector.binary_path)  # TODO: There seems to be an issue here
+    minimization_cache = None
+    cache_key = None
+    if config_settings.USE_MINIMIZATION_CACHE:
+        try:
+            minimization_cache = MinimizationCache.for_volume(volume_path)
+            cache_key = minimization_cache.key_for_binary(input_vector.binary_path, input_vector.parameter,
+                                                          seeds_dir.split(";"), qemu=use_qemu, do_tmin=do_tmin,
+                                                          tmin_total_time=tmin_total_time, cores=cores)
+        except OSError as e:
+            print("Can not use the minimization cache: {0}".format(e))
+            minimization_cache = None
+    if minimization_cache:
+        cached_seeds_dir = minimization_cache.get(cache_key)
+        if cached_seeds_dir:
+            print("Reusing the minimized seeds in {0}".format(cached_seeds_dir), flush=True)
+            dump_into_json(input_vector=input_vector, min_seeds_dir=cached_seeds_dir, package=package, name=name,
+                           volume_path=volume_path, afl_config_file_name=afl_config_file_name)
+            return True
+
+    def store_in_cache(minimized_seeds_dir: str) -> str:
+        """
+        Moves the minimized seeds into the cache and cleans up what earlier minimizations of the package left behind.
+        :return: Where the minimized seeds are now.
+        """
+        if not minimization_cache:
+            return minimized_seeds_dir
+        try:
+            minimized_seeds_dir = minimization_cache.put(cache_key, minimized_seeds_dir, metadata={
+                "binary_path": input_vector.binary_path, "invocation": input_vector.parameter, "seeds": seeds_dir,
+                "package": package})
+            dump_into_json(input_vector=input_vector, min_seeds_dir=minimized_seeds_dir, package=package, name=name,
+                           volume_path=volume_path, afl_config_file_name=afl_config_file_name)
+            remove_orphans(volume_path, packages=[package])
+        except OSError as e:
+            print("Can not store the minimized seeds in the cache: {0}".format(e))
+        return minimized_seeds_dir
+
     min_seeds_dir = os.path.join(out_dir, "minseeds_" + str(uuid.uuid4()))
     file_list = []
     print(seeds_dir)
     for filetype_seeds in seeds_dir.split(";"):
-        for file in os.listdir(filetype_seeds):
-            file_path = os.path.join(filetype_seeds, file)
-            if os.path.isfile(file_path):
-                file_list.append(file_path)
-            else:
-                print("Ignored non-file at {}".format(file_path))
+        file_list += seeds_manifest.filetype_files(filetype_seeds)
 
     os.makedirs(min_seeds_dir, exist_ok=True)
-    for file in file_list:
-        if os.path.getsize(file) < 850 * 1000:  # If file is smaller than 850 kb just copy it
-            copyfile(file, os.path.join(min_seeds_dir, os.path.basename(file)))
-        else:  # Reduce the file to 1kb
-            helpers.utils.crop_file(file, os.path.join(min_seeds_dir, os.path.basename(file)), 1 * 1000)
+    # Files smaller than 850 kb are linked, bigger files are reduced to 1kb
+    seed_staging.stage_files([(file, os.path.join(min_seeds_dir, os.path.basename(file))) for file in file_list],
+                             max_size=850 * 1000 - 1, crop_size=1 * 1000, cores=cores)
     dump_into_json(input_vector=input_vector, min_seeds_dir=min_seeds_dir, package=package, name=name,
                    volume_path=volume_path, afl_config_file_name=afl_config_file_name)
-    use_qemu = helpers.utils.qemu_required_for_binary(
-        input_vector.binary_path)  # TODO: There seems to be an issue here
     # First: Minimize the seeds
     cmin_dir = os.path.join(out_dir, "afl_cmin_" + str(uuid.uuid4()))
-    cmin_params = []
-    if use_qemu:
-        cmin_params.append("-Q")
-    cmin_params += ["-I", "-i", min_seeds_dir, "-o", cmin_dir, "-m", "none", "-t",
-                    str(config_settings.AFL_CMIN_INVOKE_TIMEOUT * 1000), "--", input_vector.binary_path]
-    if input_vector.parameter:
-        cmin_params += input_vector.parameter.split(" ")
-    print("Calling afl-cmin {0}".format(" ".join(cmin_params)), flush=True)
-    try:
-        afl_cmin(cmin_params, _timeout=config_settings.AFL_CMIN_TIMEOUT,
-                 _env=helpers.utils.get_fuzzing_env_for_invocation(parameter), _out=sys.stdout, _error=sys.stderr)
-        print("afl cmin done", flush=True)
-    except sh.ErrorReturnCode as e:
-        print("afl cmin failed for {0}".format(input_vector.binary_path))
-        print("STDOUT:\n", e.stdout.decode("utf-8"))
-        print("STDERR:\n", e.stderr.decode("utf-8"))
-        sys.exit(-1)
-    except sh.TimeoutException as e:
-        print("afl cmin timed out for {0}".format(input_vector.binary_path))
-        # print("STDOUT:\n", e.stdout.decode("utf-8"))
-        # print("STDERR:\n", e.stderr.decode("utf-8"))
-        for f in os.listdir(min_seeds_dir):
-            shutil.copyfile(os.path.join(min_seeds_dir, f), os.path.join(cmin_dir, f))
+    native_cmin_done = False
+    if config_settings.USE_NATIVE_CMIN:
+        try:
+            kept = CorpusMinimizer(input_vector.binary_path, input_vector.parameter, qemu=use_qemu,
+                                   env=helpers.utils.get_fuzzing_env_for_invocation(parameter),
+                                   cores=cores).minimize(min_seeds_dir, cmin_dir)
+            native_cmin_done = bool(kept)  # Without any traces, afl-cmin reports what is wrong
+            print("cmin done, kept {0} seeds".format(len(kept)), flush=True)
+        except ForkserverError as e:
+            print("Native cmin failed for {0}: {1}. Falling back to afl-cmin".format(input_vector.binary_path, e))
+    if not native_cmin_done:
+        shutil.rmtree(cmin_dir, ignore_errors=True)
+        cmin_params = []
+        if use_qemu:
+            cmin_params.append("-Q")
+        cmin_params += ["-I", "-i", min_seeds_dir, "-o", cmin_dir, "-m", "none", "-t",
+                        str(config_settings.AFL_CMIN_INVOKE_TIMEOUT * 1000), "--", input_vector.binary_path]
+        if input_vector.parameter:
+            cmin_params += input_vector.parameter.split(" ")
+        print("Calling afl-cmin {0}".format(" ".join(cmin_params)), flush=True)
+        try:
+            afl_cmin(cmin_params, _timeout=config_settings.AFL_CMIN_TIMEOUT,
+                     _env=helpers.utils.get_fuzzing_env_for_invocation(parameter), _out=sys.stdout, _error=sys.stderr)
+            print("afl cmin done", flush=True)
+        except sh.ErrorReturnCode as e:
+            print("afl cmin failed for {0}".format(input_vector.binary_path))
+            print("STDOUT:\n", e.stdout.decode("utf-8"))
+            print("STDERR:\n", e.stderr.decode("utf-8"))
+            sys.exit(-1)
+        except sh.TimeoutException as e:
+            print("afl cmin timed out for {0}".format(input_vector.binary_path))
+            minimization_cache = None  # The seeds are not minimized, try again next time
+            # print("STDOUT:\n", e.stdout.decode("utf-8"))
+            # print("STDERR:\n", e.stderr.decode("utf-8"))
+            seed_staging.stage_directories([min_seeds_dir], cmin_dir, cores=cores)
     dump_into_json(input_vector=input_vector, min_seeds_dir=cmin_dir, package=package, name=name,
                    volume_path=volume_path, afl_config_file_name=afl_config_file_name)
     shutil.rmtree(min_seeds_dir)  # We do not want to store the minimized seeds again
     if not do_tmin:
+        store_in_cache(cmin_dir)
         return True
     tmin_dir = out_dir + "/afl_tmin_" + str(uuid.uuid4())
     os.makedirs(tmin_dir, exist_ok=True)
-    for iter_num, file in enumerate(os.listdir(cmin_dir)):
+
+    def keep_file(file: str):
+        if not os.path.exists(os.path.join(tmin_dir, file)):
+            copyfile(os.path.join(cmin_dir, file), os.path.join(tmin_dir, file))
+
+    def tmin_file(path: str, timeout: float) -> bool:
+        file = os.path.basename(path)
         tmin_params = []
         if use_qemu:
             tmin_params.append("-Q")
-        if os.path.isdir(os.path.join(cmin_dir, file)):  # Maybe .traces is still in there or so?
-            continue
         tmin_params += ["-t", str(config_settings.AFL_TMIN_INVOKE_TIMEOUT * 1000), "-i", cmin_dir + "/" + file, "-o",
                         tmin_dir + "/" + file, "-m", "none", "--",
                         input_vector.binary_path]
         if input_vector.parameter:
             tmin_params += input_vector.parameter.split(" ")
-        if iter_num == 0:
-            print("Minimizing seed file size", flush=True)
-        print("Calling afl-tmin {0}".format(" ".join(tmin_params)), flush=True)
-        if tmin_total_time:
-            afl_tmin_timeout_per_file = tmin_total_time / len(os.listdir(cmin_dir))  # Divide time per file
-        else:
-            afl_tmin_timeout_per_file = config_settings.AFL_TMIN_TIMEOUT / len(
-                os.listdir(cmin_dir))  # Divide time per file
         try:
-            helpers.utils.temp_print("Calling afl-tmin {0}".format(" ".join(tmin_params)))
+            helpers.utils.temp_print("Calling afl-tmin {0} ({1:.0f}s)".format(" ".join(tmin_params), timeout))
             afl_tmin(tmin_params, _out=sys.stdout,
-                     _timeout=afl_tmin_timeout_per_file,
+                     _timeout=timeout,
                      _timeout_signal=signal.SIGTERM,
                      _env=config_settings.get_fuzzing_env_without_desock())  # AFL tmin can be very slow. We should only use a limited amount of time on it. If we send SIGTERM though, the current progress is saved
         except sh.ErrorReturnCode as e:
@@ -130,17 +175,24 @@ def minize(parameter: str, seeds_dir: str, binary_path: str, package: str, volum
             print("STDERR:\n", e.stderr.decode("utf-8"))
             if aflerrors["AFL_TIMEOUT"] in e.stderr.decode("utf-8"):
                 print("afl-tmin timed out for {0}. Going to use current progress or raw file".format(package))
-                if not os.path.exists(os.path.join(tmin_dir, file)):
-                    copyfile(os.path.join(cmin_dir, file), os.path.join(tmin_dir, file))
+                keep_file(file)
             else:
-                sys.exit(-1)
+                return False
         except sh.TimeoutException as e:
-            # print("STDOUT:\n", e.stdout.decode("utf-8"))
-            # print("STDERR:\n", e.stderr.decode("utf-8"))
             print("afl-tmin timed out for {0}. Going to use current progress or raw file".format(package))
-            if not os.path.exists(os.path.join(tmin_dir, file)):
-                copyfile(os.path.join(cmin_dir, file), os.path.join(tmin_dir, file))
-                # seeds_dir = cmin_dir
+            keep_file(file)
+        return True
+
+    # Maybe .traces is still in there or so?
+    cmin_files = [os.path.join(cmin_dir, file) for file in os.listdir(cmin_dir)
+                  if not os.path.isdir(os.path.join(cmin_dir, file))]
+    print("Minimizing seed file size on {0} cores".format(cores), flush=True)
+    scheduler = TminScheduler(cmin_files, minimize=tmin_file, keep=lambda path: keep_file(os.path.basename(path)),
+                              total_time=tmin_total_time or config_settings.AFL_TMIN_TIMEOUT, cores=cores)
+    if not scheduler.run():
+        sys.exit(-1)
     dump_into_json(input_vector=input_vector, min_seeds_dir=tmin_dir, package=package, name=name,
                    volume_path=volume_path, afl_config_file_name=afl_config_file_name)
+    if store_in_cache(tmin_dir) != tmin_dir:
+        shutil.rmtree(cmin_dir, ignore_errors=True)  # Only the cached seeds are referenced now
     return True
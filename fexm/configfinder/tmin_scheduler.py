@@ -0,0 +1,126 @@
+"""
+Runs afl-tmin over the seeds afl-cmin kept on all assigned cores within one global deadline.
+Instead of splitting the time evenly, every file gets a share of the remaining core time in proportion to its weight:
+Its size (afl-tmin needs more executions for bigger files) times its expected gain (redundant files shrink more).
+The heaviest files are started first, so they do not starve at the end. Budgets are computed when a file is started,
+from the time left until the deadline, so time a finished file did not use goes to the files still waiting.
+Once the deadline is too close to give a file a useful budget, the remaining files are kept as they are.
+"""
+import threading
+import time
+import typing
+import zlib
+from multiprocessing.pool import ThreadPool
+
+import os
+
+GAIN_SAMPLE_BYTES = 64 * 1024  # The expected gain is estimated from the start of the file
+
+
+def expected_gain(path: str) -> float:
+    """
+    Estimates which fraction of the file afl-tmin could remove by its redundancy (how well it compresses).
+    Incompressible files, e.g. jpgs, still get half the weight, since afl-tmin also trims unused chunks.
+    :return: A value between 0.5 and 1.
+    """
+    with open(path, "rb") as fp:
+        data = fp.read(GAIN_SAMPLE_BYTES)
+    if not data:
+        return 0.5
+    ratio = min(len(zlib.compress(data, 1)) / len(data), 1.0)
+    return 0.5 + 0.5 * (1 - ratio)
+
+
+class TminJob(object):
+    def __init__(self, path: str, weight: float):
+        self.path = path
+        self.weight = weight
+        self.budget = None  # type: float
+        self.started = None  # type: float
+        self.finished = None  # type: float
+        self.minimized = False
+
+
+class TminScheduler(object):
+    MIN_BUDGET = 5  # Seconds, afl-tmin does not get anything done in less
+    MIN_SIZE = 16  # Bytes, smaller files are kept as they are
+
+    def __init__(self, files: typing.List[str], minimize: typing.Callable[[str, float], bool],
+                 keep: typing.Callable[[str], None], total_time: float, cores: int = 1, min_budget: float = MIN_BUDGET,
+                 min_size: int = MIN_SIZE, clock: typing.Callable[[], float] = time.monotonic):
+        """
+        :param files: The files to minimize.
+        :param minimize: Runs afl-tmin on a file with a timeout in seconds (keeping the progress or the file itself
+                         once the timeout hits). Returns False if afl-tmin failed, which cancels the remaining files.
+        :param keep: Keeps a file as it is, for the files that are not minimized.
+        :param total_time: The wall clock time in seconds all files have to be minimized in.
+        :param cores: The number of afl-tmin instances run in parallel.
+        :param min_budget: Files are only started with at least this many seconds left.
+        :param min_size: Files smaller than this are not worth minimizing.
+        :param clock: The clock for the deadline.
+        """
+        self.minimize = minimize
+        self.keep = keep
+        self.cores = max(1, cores)
+        self.min_budget = min_budget
+        self.clock = clock
+        self.deadline = clock() + total_time
+        self.jobs = []  # type: typing.List[TminJob]
+        self.kept = []  # type: typing.List[str]
+        for path in files:
+            size = os.path.getsize(path)
+            if size < min_size:
+                self.kept.append(path)
+            else:
+                self.jobs.append(TminJob(path, size * expected_gain(path)))
+        self.jobs.sort(key=lambda job: job.weight, reverse=True)
+        self.pending_weight = sum(job.weight for job in self.jobs)
+        self.running = set()  # type: typing.Set[TminJob]
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def budget_for(self, job: TminJob) -> float:
+        """
+        Hands the job its share of the core time left until the deadline, minus the time reserved for the running jobs.
+        :return: The budget in seconds, 0 if the job should not be started anymore.
+        """
+        with self._lock:
+            now = self.clock()
+            self.pending_weight -= job.weight
+            remaining = self.deadline - now
+            if self.failed or remaining < self.min_budget:
+                return 0
+            reserved = sum(max(running.started + running.budget - now, 0) for running in self.running)
+            capacity = max(self.cores * remaining - reserved, 0)
+            share = capacity * job.weight / (job.weight + self.pending_weight)
+            job.budget = min(max(share, self.min_budget), remaining)
+            job.started = now
+            self.running.add(job)
+            return job.budget
+
+    def _run_job(self, job: TminJob):
+        budget = self.budget_for(job)
+        if not budget:
+            self.keep(job.path)
+            return
+        try:
+            job.minimized = self.minimize(job.path, budget)
+        finally:
+            with self._lock:
+                self.running.discard(job)
+                job.finished = self.clock()
+                if not job.minimized:
+                    self.failed = True
+
+    def run(self) -> bool:
+        """
+        :return: False if afl-tmin failed on any file.
+        """
+        for path in self.kept:
+            self.keep(path)
+        if self.jobs:
+            with ThreadPool(processes=min(self.cores, len(self.jobs))) as pool:
+                # chunksize 1 and imap keep the order: The heaviest files are started first
+                for _ in pool.imap(self._run_job, self.jobs, chunksize=1):
+                    pass
+        return not self.failed
@@ -0,0 +1,362 @@
+#define _GNU_SOURCE
+
+// Reports how a program accesses one file, as a lightweight replacement for strace.
+// FILEACCESS_PATH is the watched file, FILEACCESS_FD the (inherited) fd of a pipe the events are written to:
+//   "O <flags> <fd>\n"  the watched file was opened with the given open(2) flags
+//   "R <fd>\n"          a read from an fd that refers to the watched file (including inherited fds, e.g. stdin)
+// Once the file was opened for reading or read, nothing more is reported.
+
+#include <dlfcn.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/types.h>
+#include <sys/uio.h>
+#include <unistd.h>
+#include "logging.h"
+
+#define MAX_TRACKED_FD 4096
+#define MAX_OPEN_EVENTS 16
+
+#ifndef O_TMPFILE
+#define O_TMPFILE 0
+#endif
+
+// Resolved on first use, other preloaded libraries might call these before our constructor ran
+#define RESOLVE(name) if (!original_##name) original_##name = dlsym(RTLD_NEXT, #name)
+
+static int report_fd = -1;
+static dev_t watched_dev;
+static ino_t watched_ino;
+static int accessed = 0;
+static int open_events = 0;
+static unsigned char tracked[MAX_TRACKED_FD];
+
+//
+// originals
+//
+static int (*original_open)(const char *, int, ...);
+static int (*original_open64)(const char *, int, ...);
+static int (*original_openat)(int, const char *, int, ...);
+static int (*original_openat64)(int, const char *, int, ...);
+static FILE *(*original_fopen)(const char *, const char *);
+static FILE *(*original_fopen64)(const char *, const char *);
+static FILE *(*original_freopen)(const char *, const char *, FILE *);
+static FILE *(*original_freopen64)(const char *, const char *, FILE *);
+static int (*original_close)(int);
+static ssize_t (*original_read)(int, void *, size_t);
+static ssize_t (*original_pread)(int, void *, size_t, off_t);
+static ssize_t (*original_pread64)(int, void *, size_t, off64_t);
+static ssize_t (*original_readv)(int, const struct iovec *, int);
+static void *(*original_mmap)(void *, size_t, int, int, int, off_t);
+static void *(*original_mmap64)(void *, size_t, int, int, int, off64_t);
+static size_t (*original_fread)(void *, size_t, size_t, FILE *);
+static size_t (*original_fread_unlocked)(void *, size_t, size_t, FILE *);
+static char *(*original_fgets)(char *, int, FILE *);
+static int (*original_fgetc)(FILE *);
+static int (*original_getc)(FILE *);
+static int (*original__IO_getc)(FILE *);
+static int (*original_getchar)(void);
+static ssize_t (*original_getdelim)(char **, size_t *, int, FILE *);
+static ssize_t (*original_getline)(char **, size_t *, FILE *);
+static int (*original___isoc99_vfscanf)(FILE *, const char *, va_list);
+
+static void report(const char *fmt, ...)
+{
+	char buffer[64];
+	int saved_errno = errno;
+	va_list args;
+	va_start(args, fmt);
+	int length = vsnprintf(buffer, sizeof(buffer), fmt, args);
+	va_end(args);
+	if (length > 0 && length < (int) sizeof(buffer) && write(report_fd, buffer, length) < 0)
+		preeny_debug("could not report file access\n");
+	errno = saved_errno;
+}
+
+static int refers_to_watched_file(int fd)
+{
+	struct stat st;
+	return fd >= 0 && fstat(fd, &st) == 0 && st.st_dev == watched_dev && st.st_ino == watched_ino;
+}
+
+__attribute__((constructor)) void preeny_fileaccess_init()
+{
+	char *fd_str = getenv("FILEACCESS_FD");
+	char *path_str = getenv("FILEACCESS_PATH");
+	struct stat st;
+	if (!fd_str || !path_str || stat(path_str, &st) != 0) return;
+	report_fd = atoi(fd_str);
+	watched_dev = st.st_dev;
+	watched_ino = st.st_ino;
+	// Inherited fds, e.g. stdin redirected from the watched file
+	for (int fd = 0; fd <= 2; fd++)
+		if (refers_to_watched_file(fd)) tracked[fd] = 1;
+}
+
+static void opened(int fd, int flags)
+{
+	if (report_fd < 0 || accessed || fd < 0 || fd >= MAX_TRACKED_FD || !refers_to_watched_file(fd)) return;
+	tracked[fd] = 1;
+	if ((flags & O_ACCMODE) != O_WRONLY) accessed = 1;
+	else if (++open_events > MAX_OPEN_EVENTS) return;
+	report("O %d %d\n", flags, fd);
+}
+
+static void closed(int fd)
+{
+	if (fd >= 0 && fd < MAX_TRACKED_FD) tracked[fd] = 0;
+}
+
+static void read_from(int fd)
+{
+	if (report_fd < 0 || accessed || fd < 0 || fd >= MAX_TRACKED_FD || !tracked[fd]) return;
+	accessed = 1;
+	report("R %d\n", fd);
+}
+
+static void read_from_stream(FILE *stream)
+{
+	if (report_fd < 0 || accessed || !stream) return;
+	read_from(fileno(stream));
+}
+
+static int fopen_flags(const char *mode)
+{
+	if (!mode) return O_RDONLY;
+	if (strchr(mode, '+')) return O_RDWR;
+	if (mode[0] == 'w' || mode[0] == 'a') return O_WRONLY;
+	return O_RDONLY;
+}
+
+static mode_t open_mode(int flags, va_list args)
+{
+	if (flags & (O_CREAT | O_TMPFILE)) return va_arg(args, mode_t);
+	return 0;
+}
+
+//
+// opening
+//
+int open(const char *pathname, int flags, ...)
+{
+	va_list args;
+	va_start(args, flags);
+	mode_t mode = open_mode(flags, args);
+	va_end(args);
+	RESOLVE(open);
+	int fd = original_open(pathname, flags, mode);
+	opened(fd, flags);
+	return fd;
+}
+
+int open64(const char *pathname, int flags, ...)
+{
+	va_list args;
+	va_start(args, flags);
+	mode_t mode = open_mode(flags, args);
+	va_end(args);
+	RESOLVE(open64);
+	int fd = original_open64(pathname, flags, mode);
+	opened(fd, flags);
+	return fd;
+}
+
+int openat(int dirfd, const char *pathname, int flags, ...)
+{
+	va_list args;
+	va_start(args, flags);
+	mode_t mode = open_mode(flags, args);
+	va_end(args);
+	RESOLVE(openat);
+	int fd = original_openat(dirfd, pathname, flags, mode);
+	opened(fd, flags);
+	return fd;
+}
+
+int openat64(int dirfd, const char *pathname, int flags, ...)
+{
+	va_list args;
+	va_start(args, flags);
+	mode_t mode = open_mode(flags, args);
+	va_end(args);
+	RESOLVE(openat64);
+	int fd = original_openat64(dirfd, pathname, flags, mode);
+	opened(fd, flags);
+	return fd;
+}
+
+FILE *fopen(const char *pathname, const char *mode)
+{
+	RESOLVE(fopen);
+	FILE *stream = original_fopen(pathname, mode);
+	if (stream) opened(fileno(stream), fopen_flags(mode));
+	return stream;
+}
+
+FILE *fopen64(const char *pathname, const char *mode)
+{
+	RESOLVE(fopen64);
+	FILE *stream = original_fopen64(pathname, mode);
+	if (stream) opened(fileno(stream), fopen_flags(mode));
+	return stream;
+}
+
+FILE *freopen(const char *pathname, const char *mode, FILE *old_stream)
+{
+	RESOLVE(freopen);
+	FILE *stream = original_freopen(pathname, mode, old_stream);
+	if (stream) opened(fileno(stream), fopen_flags(mode));
+	return stream;
+}
+
+FILE *freopen64(const char *pathname, const char *mode, FILE *old_stream)
+{
+	RESOLVE(freopen64);
+	FILE *stream = original_freopen64(pathname, mode, old_stream);
+	if (stream) opened(fileno(stream), fopen_flags(mode));
+	return stream;
+}
+
+int close(int fd)
+{
+	closed(fd);
+	RESOLVE(close);
+	return original_close(fd);
+}
+
+//
+// reading
+//
+ssize_t read(int fd, void *buf, size_t count)
+{
+	read_from(fd);
+	RESOLVE(read);
+	return original_read(fd, buf, count);
+}
+
+ssize_t pread(int fd, void *buf, size_t count, off_t offset)
+{
+	read_from(fd);
+	RESOLVE(pread);
+	return original_pread(fd, buf, count, offset);
+}
+
+ssize_t pread64(int fd, void *buf, size_t count, off64_t offset)
+{
+	read_from(fd);
+	RESOLVE(pread64);
+	return original_pread64(fd, buf, count, offset);
+}
+
+ssize_t readv(int fd, const struct iovec *iov, int iovcnt)
+{
+	read_from(fd);
+	RESOLVE(readv);
+	return original_readv(fd, iov, iovcnt);
+}
+
+void *mmap(void *addr, size_t length, int prot, int flags, int fd, off_t offset)
+{
+	if (!(flags & MAP_ANONYMOUS)) read_from(fd);
+	RESOLVE(mmap);
+	return original_mmap(addr, length, prot, flags, fd, offset);
+}
+
+void *mmap64(void *addr, size_t length, int prot, int flags, int fd, off64_t offset)
+{
+	if (!(flags & MAP_ANONYMOUS)) read_from(fd);
+	RESOLVE(mmap64);
+	return original_mmap64(addr, length, prot, flags, fd, offset);
+}
+
+// stdio reads its buffers with libc internal calls, so these are not covered by read() above
+size_t fread(void *ptr, size_t size, size_t nmemb, FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(fread);
+	return original_fread(ptr, size, nmemb, stream);
+}
+
+size_t fread_unlocked(void *ptr, size_t size, size_t nmemb, FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(fread_unlocked);
+	return original_fread_unlocked(ptr, size, nmemb, stream);
+}
+
+char *fgets(char *s, int size, FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(fgets);
+	return original_fgets(s, size, stream);
+}
+
+int fgetc(FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(fgetc);
+	return original_fgetc(stream);
+}
+
+int getc(FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(getc);
+	return original_getc(stream);
+}
+
+int _IO_getc(FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(_IO_getc);
+	return original__IO_getc(stream);
+}
+
+int getchar(void)
+{
+	read_from_stream(stdin);
+	RESOLVE(getchar);
+	return original_getchar();
+}
+
+ssize_t getdelim(char **lineptr, size_t *n, int delim, FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(getdelim);
+	return original_getdelim(lineptr, n, delim, stream);
+}
+
+ssize_t getline(char **lineptr, size_t *n, FILE *stream)
+{
+	read_from_stream(stream);
+	RESOLVE(getline);
+	return original_getline(lineptr, n, stream);
+}
+
+int __isoc99_fscanf(FILE *stream, const char *format, ...)
+{
+	read_from_stream(stream);
+	va_list args;
+	va_start(args, format);
+	RESOLVE(__isoc99_vfscanf);
+	int result = original___isoc99_vfscanf(stream, format, args);
+	va_end(args);
+	return result;
+}
+
+int __isoc99_scanf(const char *format, ...)
+{
+	read_from_stream(stdin);
+	va_list args;
+	va_start(args, format);
+	RESOLVE(__isoc99_vfscanf);
+	int result = original___isoc99_vfscanf(stdin, format, args);
+	va_end(args);
+	return result;
+}
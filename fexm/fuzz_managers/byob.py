@@ -17,6 +17,7 @@ parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 os.sys.path.insert(0, parentdir)
 
 from helpers import utils
+from helpers.seeds_index import SeedsIndexer
 
 
 def sanity_checks() -> bool:
@@ -57,6 +58,10 @@ class ByobFuzzer:
         if not utils.is_valid_seeds_folder(self.seeds):
             raise ValueError("Seeds folder {0} is not valid. "
                              "Please read the documentation and fix the seed directory structure.".format(self.seeds))
+        try:
+            SeedsIndexer(self.seeds).update()  # Choose the representative seeds probed first during inference
+        except OSError as e:
+            print("Could not index the seeds in {0}: {1}".format(self.seeds, e))
         self.base_image = config["base_image"]
         self.configuration_dir = config["out_dir"]
         self.fuzz_duration = config["fuzz_duration"] * 60
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+A persistent index of the fuzzing campaign in a configuration (results) directory: Per package its build image and
+per config file (inference .json and .afl_config) the parsed config, its status and whether it can be scheduled,
+and per fuzzer instance of a binary the number of unique crashes.
+The index lives in a sqlite database (WAL mode) in the configuration directory and is updated incrementally:
+Either for the paths a file system watcher reported or by comparing the mtime and size of every config file,
+so every config is parsed once per change instead of several times per scan.
+Crash counts are taken from the fuzzer_stats and crashes directories of the known afl output directories
+and only recounted when those changed, so whether a package crashed is a lookup instead of a walk of its queues.
+"""
+import argparse
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+import typing
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings
+
+INDEX_DATABASE_NAME = ".campaign_index.sqlite"
+INDEX_VERSION = 2
+INFERENCE_CONFIG = "inference"
+AFL_CONFIG = "afl"
+BUILD_FILE_SUFFIX = ".build"
+RACY_WINDOW_NS = 2 * 10 ** 9  # Files modified this recently are parsed again on the next refresh
+
+
+def local_path(configuration_dir: str, container_path: str) -> str:
+    """
+    Configs store paths as seen in the containers (/results/<package>/...).
+    :return: The path in the configuration directory.
+    """
+    path = pathlib.Path(container_path)
+    return os.path.join(configuration_dir, str(path.relative_to(*path.parts[:2])))
+
+
+def config_kind(file_name: str) -> typing.Optional[str]:
+    if file_name.endswith(".afl_config"):
+        return AFL_CONFIG
+    if file_name.endswith(".json"):
+        return INFERENCE_CONFIG
+    return None
+
+
+class ConfigEntry(object):
+    def __init__(self, path: str, package: str, kind: str, status: typing.Optional[int], conf: typing.Any,
+                 valid: bool):
+        """
+        :param path: The path of the config file.
+        :param kind: AFL_CONFIG or INFERENCE_CONFIG.
+        :param status: The status of an afl config, see TaskStatus.
+        :param conf: The parsed config, None if it could not be parsed.
+        :param valid: For afl configs: Whether fuzzing can be started or resumed (see RepoFuzzer.valid_config).
+        """
+        self.path = path
+        self.package = package
+        self.kind = kind
+        self.status = status
+        self.conf = conf
+        self.valid = valid
+
+    @property
+    def file_name(self) -> str:
+        return os.path.basename(self.path)
+
+    def __repr__(self):
+        return "ConfigEntry({0!r}, status={1}, valid={2})".format(self.path, self.status, self.valid)
+
+
+class CampaignIndex(object):
+    def __init__(self, configuration_dir: str, database_path: str = None):
+        """
+        :param configuration_dir: The results directory, one directory per package.
+        :param database_path: Defaults to INDEX_DATABASE_NAME in the configuration directory.
+        """
+        self.configuration_dir = configuration_dir
+        self.database_path = database_path or os.path.join(configuration_dir, INDEX_DATABASE_NAME)
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(self.database_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != INDEX_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS configs")
+                self.connection.execute("DROP TABLE IF EXISTS packages")
+                self.connection.execute("DROP TABLE IF EXISTS crashes")
+                self.connection.execute("PRAGMA user_version = {0}".format(INDEX_VERSION))
+            self.connection.execute("CREATE TABLE IF NOT EXISTS configs (path TEXT PRIMARY KEY, package TEXT, "
+                                    "kind TEXT, mtime_ns INTEGER, size INTEGER, status INTEGER, conf TEXT, "
+                                    "dependency TEXT, valid INTEGER, out_dir TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS configs_package ON configs(package)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS packages (package TEXT PRIMARY KEY, "
+                                    "build_mtime_ns INTEGER, image_name TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS crashes (instance_dir TEXT PRIMARY KEY, "
+                                    "config_path TEXT, package TEXT, stats_mtime_ns INTEGER, "
+                                    "crashes_mtime_ns INTEGER, unique_crashes INTEGER)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS crashes_package ON crashes(package, unique_crashes)")
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _racy(mtime_ns: int) -> bool:
+        return int(time.time() * 10 ** 9) - mtime_ns < RACY_WINDOW_NS
+
+    def _dependency_of(self, kind: str, conf: typing.Any) -> typing.Tuple[typing.Optional[int], typing.Optional[str]]:
+        """
+        Like RepoFuzzer.valid_config: Resumable afl configs need the fuzzer_stats of their afl_out_dir,
+        startable ones their min_seeds_dir.
+        :return: The status and the path that has to exist for the config to be valid (None: never valid).
+        """
+        if kind != AFL_CONFIG or not isinstance(conf, dict) or not conf.get("status"):
+            return None, None
+        try:
+            status = int(conf.get("status"))
+        except (TypeError, ValueError):
+            return None, None
+        try:
+            if status == configfinder.config_settings.Status.FUZZING and conf.get("afl_out_dir"):
+                return status, os.path.join(local_path(self.configuration_dir, conf["afl_out_dir"]), "fuzzer_stats")
+            if status == configfinder.config_settings.Status.MINIMIZE_DONE and conf.get("min_seeds_dir"):
+                return status, local_path(self.configuration_dir, conf["min_seeds_dir"])
+        except ValueError:  # Not a /results/... path
+            pass
+        return status, None
+
+    def _update_file(self, package: str, path: str, file_stat: os.stat_result = None) -> bool:
+        """
+        Parses the config file again if it changed.
+        :return: True if the entry changed.
+        """
+        kind = config_kind(path)
+        row = self.connection.execute("SELECT mtime_ns, size FROM configs WHERE path = ?", (path,)).fetchone()
+        if file_stat is None:
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                file_stat = None
+        if file_stat is None:
+            if row is None:
+                return False
+            self.connection.execute("DELETE FROM configs WHERE path = ?", (path,))
+            return True
+        if row is not None and row[0] == file_stat.st_mtime_ns and row[1] == file_stat.st_size:
+            return False
+        try:
+            with open(path) as fp:
+                conf = json.load(fp)
+        except (OSError, ValueError):
+            conf = None  # Probably still being written, parsed again once it changes
+        status, dependency = self._dependency_of(kind, conf)
+        valid = dependency is not None and os.path.exists(dependency)
+        out_dir = None
+        if kind == AFL_CONFIG and isinstance(conf, dict) and conf.get("afl_out_dir"):
+            try:
+                out_dir = local_path(self.configuration_dir, conf["afl_out_dir"])
+            except ValueError:
+                pass
+        mtime_ns = None if self._racy(file_stat.st_mtime_ns) else file_stat.st_mtime_ns
+        self.connection.execute("INSERT OR REPLACE INTO configs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (path, package, kind, mtime_ns, file_stat.st_size, status,
+                                 json.dumps(conf) if conf is not None else None, dependency, int(valid), out_dir))
+        return True
+
+    def _update_build_file(self, package: str, path: str) -> bool:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        row = self.connection.execute("SELECT build_mtime_ns FROM packages WHERE package = ?", (package,)).fetchone()
+        if row is not None and row[0] == mtime_ns and mtime_ns is not None:
+            return False
+        image_name = None
+        if mtime_ns is not None:
+            try:
+                with open(path) as fp:
+                    image_name = json.load(fp).get("docker_image_name")
+            except (OSError, ValueError, AttributeError):
+                mtime_ns = None
+            if mtime_ns is not None and self._racy(mtime_ns):
+                mtime_ns = None
+        self.connection.execute("INSERT OR REPLACE INTO packages VALUES (?, ?, ?)", (package, mtime_ns, image_name))
+        return True
+
+    def _update_package(self, package: str) -> typing.Set[str]:
+        """
+        Lists the package directory and updates all of its files.
+        :return: The config paths that changed.
+        """
+        package_dir = os.path.join(self.configuration_dir, package)
+        changed = set()
+        seen = set()
+        try:
+            with os.scandir(package_dir) as entries:
+                for entry in entries:
+                    if not config_kind(entry.name) or not entry.is_file():
+                        continue
+                    seen.add(entry.path)
+                    if self._update_file(package, entry.path, entry.stat()):
+                        changed.add(entry.path)
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        for (path,) in self.connection.execute("SELECT path FROM configs WHERE package = ?", (package,)).fetchall():
+            if path not in seen:
+                self.connection.execute("DELETE FROM configs WHERE path = ?", (path,))
+                changed.add(path)
+        self._update_build_file(package, os.path.join(package_dir, package + BUILD_FILE_SUFFIX))
+        return changed
+
+    def refresh(self, paths: typing.Iterable[str] = None) -> typing.Set[str]:
+        """
+        Updates the index.
+        :param paths: The paths that changed (files or package directories), e.g. reported by inotify.
+                      None to compare the mtimes of all config files.
+        :return: The config paths whose entry changed (added, modified or removed).
+        """
+        changed = set()
+        with self._lock, self.connection:
+            if paths is None:
+                packages = set()
+                with os.scandir(self.configuration_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.startswith(".") and entry.is_dir():
+                            packages.add(entry.name)
+                            changed |= self._update_package(entry.name)
+                for (package,) in self.connection.execute("SELECT DISTINCT package FROM configs").fetchall():
+                    if package not in packages:
+                        changed |= self._update_package(package)
+            else:
+                configuration_dir = os.path.abspath(self.configuration_dir)
+                for path in set(paths):
+                    relative_parts = os.path.relpath(os.path.abspath(path), configuration_dir).split(os.sep)
+                    if relative_parts[0] in (".", "..") or relative_parts[0].startswith("."):
+                        continue
+                    package = relative_parts[0]
+                    if len(relative_parts) == 1:
+                        changed |= self._update_package(package)
+                    elif len(relative_parts) == 2:
+                        file_path = os.path.join(self.configuration_dir, package, relative_parts[1])
+                        if relative_parts[1] == package + BUILD_FILE_SUFFIX:
+                            self._update_build_file(package, file_path)
+                        elif config_kind(relative_parts[1]) and self._update_file(package, file_path):
+                            changed.add(file_path)
+            # Configs become valid once the fuzzer or the minimizer created their output
+            for path, dependency in self.connection.execute(
+                    "SELECT path, dependency FROM configs WHERE valid = 0 AND dependency IS NOT NULL").fetchall():
+                if os.path.exists(dependency):
+                    self.connection.execute("UPDATE configs SET valid = 1 WHERE path = ?", (path,))
+                    changed.add(path)
+        return changed
+
+    @staticmethod
+    def _instance_dirs(out_dir: str) -> typing.List[str]:
+        """
+        :return: The fuzzer instance directories of an afl output directory: The directory itself for a single afl,
+                 its subdirectories with fuzzer_stats or crashes for a parallel (-M/-S) session.
+        """
+        if os.path.exists(os.path.join(out_dir, "fuzzer_stats")) or os.path.isdir(os.path.join(out_dir, "crashes")):
+            return [out_dir]
+        try:
+            with os.scandir(out_dir) as entries:
+                return [entry.path for entry in entries if entry.is_dir() and (
+                        os.path.exists(os.path.join(entry.path, "fuzzer_stats")) or
+                        os.path.isdir(os.path.join(entry.path, "crashes")))]
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    @staticmethod
+    def _mtime_ns(path: str) -> typing.Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def count_crashes(instance_dir: str) -> int:
+        """
+        :return: The unique crashes of a fuzzer instance: The larger one of unique_crashes in its fuzzer_stats
+                 (written periodically) and the crashes in its crashes directory.
+        """
+        unique_crashes = 0
+        try:
+            with open(os.path.join(instance_dir, "fuzzer_stats")) as fp:
+                for line in fp:
+                    key, _, value = line.partition(":")
+                    if key.strip() == "unique_crashes":
+                        unique_crashes = int(value.strip())
+                        break
+        except (OSError, ValueError):
+            pass
+        try:
+            crashes = [name for name in os.listdir(os.path.join(instance_dir, "crashes")) if name != "README.txt"]
+            unique_crashes = max(unique_crashes, len(crashes))
+        except OSError:
+            pass
+        return unique_crashes
+
+    def refresh_crashes(self, packages: typing.Iterable[str] = None) -> typing.Set[str]:
+        """
+        Recounts the crashes of the fuzzer instances whose fuzzer_stats or crashes directory changed.
+        :param packages: Defaults to all packages.
+        :return: The packages whose crash count changed.
+        """
+        changed = set()
+        with self._lock, self.connection:
+            query = "SELECT path, package, out_dir FROM configs WHERE out_dir IS NOT NULL"
+            if packages is None:
+                config_rows = self.connection.execute(query).fetchall()
+                crash_rows = self.connection.execute("SELECT instance_dir, package, stats_mtime_ns, crashes_mtime_ns, "
+                                                     "unique_crashes FROM crashes").fetchall()
+            else:
+                config_rows, crash_rows = [], []
+                for package in set(packages):
+                    config_rows += self.connection.execute(query + " AND package = ?", (package,)).fetchall()
+                    crash_rows += self.connection.execute("SELECT instance_dir, package, stats_mtime_ns, "
+                                                          "crashes_mtime_ns, unique_crashes FROM crashes "
+                                                          "WHERE package = ?", (package,)).fetchall()
+            known = {row[0]: row for row in crash_rows}
+            seen = set()
+            for config_path, package, out_dir in config_rows:
+                for instance_dir in self._instance_dirs(out_dir):
+                    seen.add(instance_dir)
+                    stats_mtime_ns = self._mtime_ns(os.path.join(instance_dir, "fuzzer_stats"))
+                    crashes_mtime_ns = self._mtime_ns(os.path.join(instance_dir, "crashes"))
+                    row = known.get(instance_dir)
+                    if row is not None and row[2] == stats_mtime_ns and row[3] == crashes_mtime_ns and \
+                            None not in (stats_mtime_ns, crashes_mtime_ns):
+                        continue
+                    unique_crashes = self.count_crashes(instance_dir)
+                    # Changes within the racy window might not be visible yet, count them again next time
+                    if stats_mtime_ns is not None and self._racy(stats_mtime_ns):
+                        stats_mtime_ns = None
+                    if crashes_mtime_ns is not None and self._racy(crashes_mtime_ns):
+                        crashes_mtime_ns = None
+                    self.connection.execute("INSERT OR REPLACE INTO crashes VALUES (?, ?, ?, ?, ?, ?)",
+                                            (instance_dir, config_path, package, stats_mtime_ns, crashes_mtime_ns,
+                                             unique_crashes))
+                    if (row[4] if row is not None else 0) != unique_crashes:
+                        changed.add(package)
+            for instance_dir, row in known.items():
+                if instance_dir not in seen:
+                    self.connection.execute("DELETE FROM crashes WHERE instance_dir = ?", (instance_dir,))
+                    if row[4]:
+                        changed.add(row[1])
+        return changed
+
+    def crashed(self, package: str) -> bool:
+        """
+        :return: Whether any fuzzer instance of the package found a crash (as of the last refresh_crashes).
+        """
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM crashes WHERE package = ? AND unique_crashes > 0 LIMIT 1",
+                                           (package,)).fetchone() is not None
+
+    def crash_counts(self, package: str) -> typing.Dict[str, typing.Dict[str, int]]:
+        """
+        :return: The unique crashes per afl config (binary) and fuzzer instance directory.
+        """
+        counts = {}
+        with self._lock:
+            rows = self.connection.execute("SELECT config_path, instance_dir, unique_crashes FROM crashes "
+                                           "WHERE package = ?", (package,)).fetchall()
+        for config_path, instance_dir, unique_crashes in rows:
+            counts.setdefault(config_path, {})[instance_dir] = unique_crashes
+        return counts
+
+    def packages(self) -> typing.List[str]:
+        with self._lock:
+            return [package for (package,) in
+                    self.connection.execute("SELECT DISTINCT package FROM configs ORDER BY package").fetchall()]
+
+    def configs(self, package: str = None) -> typing.List[ConfigEntry]:
+        query = "SELECT path, package, kind, status, conf, valid FROM configs"
+        parameters = ()
+        if package is not None:
+            query += " WHERE package = ?"
+            parameters = (package,)
+        with self._lock:
+            rows = self.connection.execute(query + " ORDER BY package, path", parameters).fetchall()
+        return [ConfigEntry(path, row_package, kind, status, json.loads(conf) if conf is not None else None,
+                            bool(valid)) for path, row_package, kind, status, conf, valid in rows]
+
+    def config(self, path: str) -> typing.Optional[ConfigEntry]:
+        with self._lock:
+            row = self.connection.execute("SELECT path, package, kind, status, conf, valid FROM configs "
+                                          "WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        return ConfigEntry(row[0], row[1], row[2], row[3], json.loads(row[4]) if row[4] is not None else None,
+                           bool(row[5]))
+
+    def uninferred_packages(self, packages: typing.Iterable[str] = None) -> typing.List[str]:
+        """
+        :return: The packages (default: all) that have a build file, but no configs yet.
+        """
+        with self._lock:
+            uninferred = [package for (package,) in self.connection.execute(
+                "SELECT package FROM packages WHERE image_name IS NOT NULL "
+                "AND package NOT IN (SELECT DISTINCT package FROM configs) ORDER BY package").fetchall()]
+        if packages is not None:
+            packages = set(packages)
+            uninferred = [package for package in uninferred if package in packages]
+        return uninferred
+
+    def image_name(self, package: str) -> typing.Optional[str]:
+        with self._lock:
+            row = self.connection.execute("SELECT image_name FROM packages WHERE package = ?", (package,)).fetchone()
+        return row[0] if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or show the campaign index of a results directory.")
+    parser.add_argument("configuration_dir", help="The results directory, one directory per package")
+    args = parser.parse_args()
+    index = CampaignIndex(args.configuration_dir)
+    start = time.time()
+    changed = index.refresh()
+    index.refresh_crashes()
+    print("{0} configs changed ({1:.2f}s)".format(len(changed), time.time() - start))
+    for entry in index.configs():
+        crashes = sum(index.crash_counts(entry.package).get(entry.path, {}).values())
+        print("{0:<30} {1:<10} status={2} valid={3} crashes={4} {5}".format(entry.package, entry.kind, entry.status,
+                                                                           entry.valid, crashes, entry.file_name))
+
+
+if __name__ == "__main__":
+    main()
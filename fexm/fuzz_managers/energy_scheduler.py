@@ -0,0 +1,189 @@
+"""
+Decides which binaries get the limited resume slots of a RepoFuzzer.
+Every binary that finished a fuzzing session waits for a slot. The productivity of its campaign
+(new paths and crashes per CPU minute in the recent fuzzing time, from the plot_data of its afl instances)
+is the reward of a bandit: Slots go to the binaries with the highest upper confidence bound, so plateaued binaries
+are resumed less often, binaries without observations are tried first, and a fairness floor of the selections goes
+to the binaries that waited longest, so no binary starves.
+"""
+import math
+import time
+import typing
+
+import os
+
+PLOT_DATA_TAIL_BYTES = 256 * 1024  # Only the recent fuzzing time is of interest
+SESSION_GAP = 5 * 60  # Plot rows further apart than this belong to different sessions (not fuzzing in between)
+DEFAULT_WINDOW = 30 * 60  # Productivity over the last 30 CPU minutes of each instance
+DEFAULT_CRASH_WEIGHT = 10  # A new crash is worth this many new paths
+DEFAULT_FAIRNESS_FLOOR = 0.1
+DEFAULT_EXPLORATION = 1.0
+DEFAULT_DECAY = 0.5  # Weight of older observations, the productivity of a campaign changes over time
+
+
+def read_plot_data(instance_dir: str) -> typing.List[typing.Tuple[float, int, int]]:
+    """
+    :return: The (unix_time, paths_total, unique_crashes) rows of the tail of the plot_data of an afl instance.
+    """
+    path = os.path.join(instance_dir, "plot_data")
+    try:
+        with open(path, "rb") as fp:
+            fp.seek(0, os.SEEK_END)
+            size = fp.tell()
+            fp.seek(max(0, size - PLOT_DATA_TAIL_BYTES))
+            data = fp.read()
+    except OSError:
+        return []
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if size > PLOT_DATA_TAIL_BYTES and lines:
+        lines = lines[1:]  # Probably cut off
+    rows = []
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        # unix_time, cycles_done, cur_path, paths_total, pending_total, pending_favs, map_size, unique_crashes, ...
+        fields = [field.strip() for field in line.split(",")]
+        try:
+            rows.append((float(fields[0]), int(fields[3]), int(fields[7])))
+        except (IndexError, ValueError):
+            continue
+    return rows
+
+
+def instance_productivity(rows: typing.List[typing.Tuple[float, int, int]], window: float = DEFAULT_WINDOW,
+                          crash_weight: float = DEFAULT_CRASH_WEIGHT) -> typing.Tuple[float, float]:
+    """
+    Goes back from the last row until window seconds of fuzzing time are covered. Gaps between sessions are not
+    fuzzing time.
+    :return: The gain (new paths + crash_weight * new crashes) and the fuzzing time in seconds.
+    """
+    gain = 0.0
+    fuzzing_time = 0.0
+    for (previous_time, previous_paths, previous_crashes), (row_time, paths, crashes) in zip(
+            reversed(rows[:-1]), reversed(rows[1:])):
+        if fuzzing_time >= window:
+            break
+        delta = row_time - previous_time
+        if delta < 0 or delta > SESSION_GAP:
+            continue
+        fuzzing_time += delta
+        gain += max(0, paths - previous_paths) + crash_weight * max(0, crashes - previous_crashes)
+    return gain, fuzzing_time
+
+
+def campaign_productivity(afl_out_dir: str, window: float = DEFAULT_WINDOW,
+                          crash_weight: float = DEFAULT_CRASH_WEIGHT) -> typing.Optional[float]:
+    """
+    :param afl_out_dir: The output directory of a single afl or of parallel (-M/-S) instances.
+    :return: The new paths (and weighted crashes) per CPU minute of all instances, None if nothing was fuzzed yet.
+    """
+    if os.path.exists(os.path.join(afl_out_dir, "plot_data")):
+        instance_dirs = [afl_out_dir]
+    else:
+        try:
+            instance_dirs = [entry.path for entry in os.scandir(afl_out_dir) if entry.is_dir()]
+        except OSError:
+            return None
+    total_gain = 0.0
+    total_time = 0.0
+    for instance_dir in instance_dirs:
+        gain, fuzzing_time = instance_productivity(read_plot_data(instance_dir), window=window,
+                                                   crash_weight=crash_weight)
+        total_gain += gain
+        total_time += fuzzing_time
+    if total_time <= 0:
+        return None
+    return total_gain / (total_time / 60)
+
+
+class Arm(object):
+    def __init__(self, key: typing.Hashable, since: float):
+        self.key = key
+        self.plays = 0
+        self.estimate = None  # type: typing.Optional[float]
+        self.waiting_since = since
+
+
+class EnergyScheduler(object):
+    def __init__(self, fairness_floor: float = DEFAULT_FAIRNESS_FLOOR, exploration: float = DEFAULT_EXPLORATION,
+                 decay: float = DEFAULT_DECAY, clock: typing.Callable[[], float] = time.time):
+        """
+        :param fairness_floor: The share of all selections that goes to the binaries that waited longest.
+        :param exploration: The weight of the confidence bound, 0 always picks the most productive binaries.
+        :param decay: The weight of the previous estimate when a new productivity is observed.
+        """
+        if not 0 <= fairness_floor <= 1:
+            raise ValueError("The fairness floor has to be between 0 and 1, got {0}".format(fairness_floor))
+        self.fairness_floor = fairness_floor
+        self.exploration = exploration
+        self.decay = decay
+        self.clock = clock
+        self.arms = {}  # type: typing.Dict[typing.Hashable, Arm]
+        self.waiting = set()
+        self.total_plays = 0
+        self.fair_plays = 0
+
+    def _arm(self, key: typing.Hashable) -> Arm:
+        if key not in self.arms:
+            self.arms[key] = Arm(key, self.clock())
+        return self.arms[key]
+
+    def observe(self, key: typing.Hashable, productivity: typing.Optional[float]):
+        """
+        Records the productivity of a binary after one of its fuzzing sessions.
+        """
+        arm = self._arm(key)
+        if productivity is None:
+            return
+        if arm.estimate is None:
+            arm.estimate = productivity
+        else:
+            arm.estimate = self.decay * arm.estimate + (1 - self.decay) * productivity
+
+    def add(self, key: typing.Hashable):
+        """
+        The binary waits for a resume slot.
+        """
+        arm = self._arm(key)
+        if key not in self.waiting:
+            arm.waiting_since = self.clock()
+            self.waiting.add(key)
+
+    def remove(self, key: typing.Hashable):
+        self.waiting.discard(key)
+        self.arms.pop(key, None)
+
+    def _scale(self) -> float:
+        return max([arm.estimate for arm in self.arms.values() if arm.estimate is not None] + [1e-9])
+
+    def score(self, key: typing.Hashable, scale: float = None) -> float:
+        """
+        :param scale: The highest estimate, productivities are normalized by it.
+        :return: The upper confidence bound of the normalized productivity, infinite for binaries without estimate.
+        """
+        arm = self.arms[key]
+        if arm.estimate is None:
+            return math.inf
+        if scale is None:
+            scale = self._scale()
+        bonus = self.exploration * math.sqrt(math.log(self.total_plays + 1) / (arm.plays + 1))
+        return arm.estimate / scale + bonus
+
+    def select(self, slots: int) -> typing.List[typing.Hashable]:
+        """
+        Takes the binaries for the free slots out of the waiting ones.
+        :return: The binaries to resume.
+        """
+        selected = []
+        scale = self._scale()
+        for _ in range(min(slots, len(self.waiting))):
+            if self.fair_plays < self.fairness_floor * (self.total_plays + 1):
+                key = min(self.waiting, key=lambda k: self.arms[k].waiting_since)
+                self.fair_plays += 1
+            else:
+                key = max(self.waiting, key=lambda k: self.score(k, scale))
+            self.waiting.discard(key)
+            self.arms[key].plays += 1
+            self.total_plays += 1
+            selected.append(key)
+        return selected
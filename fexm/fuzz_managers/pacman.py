@@ -9,7 +9,6 @@ import json
 import logging
 import typing
 
-import celery
 import os
 from typing import *
 
@@ -18,15 +17,23 @@ from helpers.typechecker import checked
 parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 os.sys.path.insert(0, parentdir)
 import configfinder.config_settings
+from celery.result import AsyncResult
 from celery_tasks.tasks import run_eval
+from configfinder.config_settings import EVAL_PHASE_INFERENCE, EVAL_PHASE_FUZZ
+from fuzz_managers.pipeline import Pipeline, Stage
 from repo_crawlers.archcrawler import ArchCrawler
 import helpers.utils
+from helpers.seeds_index import SeedsIndexer
 import config_parser
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+EVAL_POLL_INTERVAL = 10  # Check this often whether an evaluation finished
+INFERENCE_STAGE = "inference"
+FUZZ_STAGE = "fuzz"
+
 
 def get_package_list_from_query(query: str):
     pacman_query = "q={0}&repo=Core&repo=Extra&repo=Community".format(query)
@@ -108,12 +115,18 @@ class PacmanFuzzer:
                 "Seeds folder {0} is not valid. Please read the documentation and fix the seed directory structure.".format(
                     self.seeds))
             exit(-1)
+        try:
+            SeedsIndexer(self.seeds).update()  # Choose the representative seeds probed first during inference
+        except OSError as e:
+            print("Could not index the seeds in {0}: {1}".format(self.seeds, e))
         self.docker_image = config_dict["base_image"]
         self.configuration_dir = config_dict["out_dir"]
         self.fuzz_duration = config_dict["fuzz_duration"] * 60
         self.force = config_dict["force"]  # Force reevaluation
         self.use_asan = config_dict["use_asan"]
         self.exec_timeout = config_dict["exec_timeout"]
+        self.eval_concurrency = config_dict["eval_concurrency"] or 0
+        self.inference_concurrency = config_dict["inference_concurrency"] or 0
         # TODO: Other vals to defaut_config!
         if config_dict.get("max_install_threshold"):
             self.max_install_threshold = config_dict.get("max_install_threshold")
@@ -140,8 +153,37 @@ class PacmanFuzzer:
     def fuzz(self):
         """
         Enqueue a list of packages for evaluation to celery and wait for the results.
+        Every package is built and inferred (at most inference_concurrency at once) and then fuzzed
+        (at most eval_concurrency at once) as soon as its own inference finished,
+        so packages are inferred while others are fuzzed.
         """
-        tasks = []
+        failed = []
+
+        def submit(phase):
+            def submit_phase(package, args):
+                print("Queuing package {0} for {1}".format(package, phase))
+                return run_eval.delay(*args, phase=phase).task_id
+
+            return submit_phase
+
+        def succeeded(package, task_id, phase) -> bool:
+            result = AsyncResult(task_id)
+            if result.failed() or not result.get(propagate=False):
+                print("{0} of package {1} failed".format(phase.capitalize(), package))
+                failed.append(package)
+                return False
+            print("{0} of package {1} done".format(phase.capitalize(), package))
+            return True
+
+        def on_inference_done(package, args, task_id):
+            if succeeded(package, task_id, EVAL_PHASE_INFERENCE):
+                evaluations.put(FUZZ_STAGE, package, args)
+
+        evaluations = Pipeline([Stage(INFERENCE_STAGE, submit(EVAL_PHASE_INFERENCE),
+                                      concurrency=self.inference_concurrency, on_done=on_inference_done),
+                                Stage(FUZZ_STAGE, submit(EVAL_PHASE_FUZZ), concurrency=self.eval_concurrency,
+                                      on_done=lambda package, args, task_id: succeeded(package, task_id,
+                                                                                       EVAL_PHASE_FUZZ))])
         for package_dict in self.packages_list:
             package = package_dict["pkgname"]
             if not self.force and os.path.exists(
@@ -157,20 +199,13 @@ class PacmanFuzzer:
             if int(package_dict["installed_size"]) > self.max_build_threshold:
                 print("Forcing qemu for package {0}".format(package))
                 force_qemu = True
-            print("Queuing package {0}".format(package))
-            tasks.append(run_eval.s(package, self.docker_image,
-                                    os.path.realpath(os.path.join(os.getcwd() + "/", self.configuration_dir)),
-                                    os.path.realpath(os.path.join(os.getcwd() + "/", self.seeds)), self.fuzz_duration,
-                                    self.use_asan,
-                                    self.exec_timeout, force_qemu, {"fuzzing_cores_per_binary": self.config_dict["fuzzing_cores_per_binary"]}))
-        jobs = celery.group(tasks)
-        results = jobs.apply_async()
-        results.get()
-        results.join()
-        for res in results.get():
-            if not res:
-                return False
-        return True
+            evaluations.put(INFERENCE_STAGE, package, (
+                package, self.docker_image, os.path.realpath(os.path.join(os.getcwd() + "/", self.configuration_dir)),
+                os.path.realpath(os.path.join(os.getcwd() + "/", self.seeds)), self.fuzz_duration, self.use_asan,
+                self.exec_timeout, force_qemu,
+                {"fuzzing_cores_per_binary": self.config_dict["fuzzing_cores_per_binary"]}))
+        evaluations.run(poll_interval=EVAL_POLL_INTERVAL)
+        return not failed
 
 
 def fuzz(config):
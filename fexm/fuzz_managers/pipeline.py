@@ -0,0 +1,124 @@
+"""
+A streaming pipeline of celery task stages (e.g. build -> minimize), replacing groups that are joined before the next
+stage starts: Every item moves on as soon as its own task finished, so one slow build does not stall the other
+packages, and every stage runs at most its own number of tasks at once.
+The pipeline does not wait for tasks itself, the manager reports finished tasks (task_done) from celery events or by
+polling (poll), which also moves the follow-up items into their stages.
+"""
+import collections
+import logging
+import time
+import typing
+
+from celery.result import AsyncResult
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(object):
+    def __init__(self, name: str, submit: typing.Callable[[typing.Hashable, typing.Any], typing.Optional[str]],
+                 concurrency: int = 0,
+                 on_done: typing.Callable[[typing.Hashable, typing.Any, str], None] = None):
+        """
+        :param submit: Enqueues the celery task for an item (key, item), returns its task id.
+                       A falsy return value means nothing was submitted (e.g. the item is not ready after all).
+        :param concurrency: How many tasks of the stage run at once, 0 for no limit.
+        :param on_done: Called with key, item and task id when the task of an item finished,
+                        e.g. to put the item into the next stage.
+        """
+        self.name = name
+        self.submit = submit
+        self.concurrency = concurrency
+        self.on_done = on_done
+        self.pending = collections.OrderedDict()  # type: typing.Dict[typing.Hashable, typing.Any]
+        self.running = {}  # type: typing.Dict[str, typing.Tuple[typing.Hashable, typing.Any]]  # task id -> item
+
+    @property
+    def free_slots(self) -> int:
+        if self.concurrency <= 0:
+            return len(self.pending)
+        return max(0, self.concurrency - len(self.running))
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        return key in self.pending or any(running_key == key for running_key, _ in self.running.values())
+
+
+class Pipeline(object):
+    def __init__(self, stages: typing.List[Stage]):
+        self.stages = collections.OrderedDict((stage.name, stage) for stage in stages)
+
+    def put(self, stage_name: str, key: typing.Hashable, item: typing.Any = None) -> bool:
+        """
+        Queues the item for the stage, unless it is already queued or running there.
+        :return: True if the item was queued.
+        """
+        stage = self.stages[stage_name]
+        if key in stage:
+            return False
+        stage.pending[key] = item
+        return True
+
+    def in_stage(self, stage_name: str, key: typing.Hashable) -> bool:
+        """
+        :return: Whether the item is queued or running in the stage.
+        """
+        return key in self.stages[stage_name]
+
+    def pump(self) -> typing.List[str]:
+        """
+        Submits queued items to the stages with free slots, in the order they were queued.
+        Items whose submit returned nothing leave the stage (and are logged), they can be put again.
+        :return: The ids of the submitted tasks.
+        """
+        submitted = []
+        for stage in self.stages.values():
+            while stage.pending and stage.free_slots > 0:
+                key, item = stage.pending.popitem(last=False)
+                task_id = stage.submit(key, item)
+                if task_id:
+                    stage.running[task_id] = (key, item)
+                    submitted.append(task_id)
+                else:  # Not re-queued, it would be submitted (and dropped) again by every pump
+                    logger.warning("Dropped {0} from the {1} stage, nothing was submitted for it".format(
+                        key, stage.name))
+        return submitted
+
+    def running_task_ids(self) -> typing.List[str]:
+        return [task_id for stage in self.stages.values() for task_id in stage.running]
+
+    def task_done(self, task_id: str) -> bool:
+        """
+        Frees the slot of the finished task and runs the on_done of its stage.
+        :return: False if the task does not belong to the pipeline.
+        """
+        for stage in self.stages.values():
+            if task_id in stage.running:
+                key, item = stage.running.pop(task_id)
+                if stage.on_done is not None:
+                    stage.on_done(key, item, task_id)
+                return True
+        return False
+
+    def poll(self, result_for: typing.Callable[[str], AsyncResult] = AsyncResult) -> typing.List[str]:
+        """
+        Asks celery which running tasks finished and handles them like task_done.
+        :return: The finished task ids.
+        """
+        finished = [task_id for task_id in self.running_task_ids() if result_for(task_id).ready()]
+        for task_id in finished:
+            self.task_done(task_id)
+        return finished
+
+    @property
+    def idle(self) -> bool:
+        return not any(stage.pending or stage.running for stage in self.stages.values())
+
+    def run(self, poll_interval: float = 1, result_for: typing.Callable[[str], AsyncResult] = AsyncResult):
+        """
+        Runs the pipeline until every item went through all its stages, polling for finished tasks.
+        """
+        self.pump()
+        while not self.idle:
+            time.sleep(poll_interval)
+            if self.poll(result_for=result_for):
+                self.pump()
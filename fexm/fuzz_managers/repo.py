@@ -6,7 +6,9 @@ Fuzzes a repo (arch, apt, ....)
 import json
 import pathlib
 import queue
+import threading
 import time
+import typing
 
 import os
 from celery.result import AsyncResult
@@ -16,8 +18,7 @@ os.sys.path.insert(0, parentdir)
 from enum import Enum
 import argparse
 import configfinder.config_settings
-from celery_tasks.tasks import run_fuzzer, run_minimizer, build_package
-from celery import group
+from celery_tasks.tasks import run_fuzzer, run_minimizer, build_package, run_inference
 import datetime
 import uuid
 from helpers import utils
@@ -25,6 +26,11 @@ import logging
 import docker
 import docker.errors
 from helpers.utils import get_afl_metadata, get_seeds_dir_from_input_vector_dict
+from helpers import inotify
+from fuzz_managers.campaign_index import CampaignIndex, AFL_CONFIG, INFERENCE_CONFIG, BUILD_FILE_SUFFIX, local_path
+from fuzz_managers.energy_scheduler import EnergyScheduler, campaign_productivity, DEFAULT_FAIRNESS_FLOOR
+from fuzz_managers.slice_scheduler import SliceScheduler, SLICE_STOP_MARGIN
+from fuzz_managers.pipeline import Pipeline, Stage
 
 logger = logging.getLogger("myLogger")
 hdlr = logging.FileHandler('tasks.log')
@@ -47,6 +53,17 @@ Directory, file, ...
 DEFAULT_MAX_TIMEOUT_PER_PACKAGE = 1800  # 30 Minutes should be enough
 MAX_TIMEOUT_PER_PACKAGE = configfinder.config_settings.MAX_TIMEOUT_PER_PACKAGE + (
         10 * 60)  # Reserve max. 10 Minuten for building
+FALLBACK_POLL_INTERVAL = 60  # Poll the tasks (and rescan without inotify) this often, in case events got lost
+EVENT_DEBOUNCE = 0.2  # Collect the events of a burst (e.g. a config written in several steps) before scheduling
+EVENT_RECONNECT_DELAY = 5  # Wait before listening for celery events again after the connection broke
+TASK_EVENT = "task"  # A celery task finished, the value is its id
+FILE_EVENT = "file"  # A file in the configuration directory changed, the value is its path
+RESCAN_EVENT = "rescan"  # File events got lost, the whole configuration directory has to be compared
+BUILD_STAGE = "build"
+INFERENCE_STAGE = "inference"
+MINIMIZE_STAGE = "minimize"
+BUILD_RETRY_DELAY = 10 * 60  # Wait this long before building a package again whose build failed, doubled per failure
+BUILD_RETRY_MAX_DELAY = 24 * 60 * 60
 
 
 def print_output(chunk):
@@ -99,7 +116,11 @@ class RepoFuzzer(object):
         self.configuration_dir = configuration_dir
         self.qemu = qemu
         self.timeout = timeout
-        self.task_lists = []
+        self.tasks = {}  # type: typing.Dict[str, FuzzTask]  # The outstanding tasks by celery task id
+        self.events = queue.Queue()  # (TASK_EVENT|FILE_EVENT|RESCAN_EVENT, value) tuples from the watcher threads
+        self.watching_files = False  # True while inotify reports all changes of the configuration directory
+        self.campaign_index = CampaignIndex(configuration_dir)
+        self.known_images = set()  # Image names that exist already, they are not checked with docker again
         self.ignore_package = set()
         self.currently_fuzzed = []
         self.already_enqueued = set()
@@ -108,6 +129,9 @@ class RepoFuzzer(object):
         self.docker_client = docker.from_env()
         self.packages_building_enqueued = set()
         self.packages_to_build = set()
+        self.packages_to_infer = set()  # Packages with a build file, but without configs
+        self.inferred = set()  # Packages whose inference was submitted, they are not inferred again
+        self.build_failures = {}  # type: typing.Dict[str, typing.Tuple[int, float]]  # package -> failures, retry at
         try:
             self.minimize = int(os.environ.get("LARGEFUZZ_MINIMIZATION", default=True))
         except ValueError:
@@ -127,6 +151,41 @@ class RepoFuzzer(object):
             self.skip_after_crash_found = int(os.environ.get("LARGEFUZZ_SKIPAFTERCRASH", default=True))
         except ValueError:
             print()
+        try:
+            self.resume_slots = int(os.environ.get("LARGEFUZZ_RESUME_SLOTS", default=0))  # 0: Resume everything
+        except ValueError:
+            print("Please provide the number of concurrent fuzzing tasks for LARGEFUZZ_RESUME_SLOTS")
+            exit(0)
+        try:
+            self.energy_scheduler = EnergyScheduler(fairness_floor=float(
+                os.environ.get("LARGEFUZZ_FAIRNESS_FLOOR", default=DEFAULT_FAIRNESS_FLOOR)))
+        except ValueError:
+            print("Please provide a share between 0 and 1 for LARGEFUZZ_FAIRNESS_FLOOR")
+            exit(0)
+        try:
+            self.slice_length = int(os.environ.get("LARGEFUZZ_SLICE", default=0))  # 0: Fuzz for the whole timeout
+        except ValueError:
+            print("Please provide the length of a fuzzing time slice in seconds for LARGEFUZZ_SLICE")
+            exit(0)
+        self.slice_scheduler = SliceScheduler(resume_scheduler=self.energy_scheduler)
+        try:
+            build_concurrency = int(os.environ.get("LARGEFUZZ_BUILD_CONCURRENCY", default=0))  # 0: No limit
+            inference_concurrency = int(os.environ.get("LARGEFUZZ_INFERENCE_CONCURRENCY", default=0))
+            minimize_concurrency = int(os.environ.get("LARGEFUZZ_MINIMIZE_CONCURRENCY", default=0))
+        except ValueError:
+            print("Please provide the number of concurrent tasks for LARGEFUZZ_BUILD_CONCURRENCY, "
+                  "LARGEFUZZ_INFERENCE_CONCURRENCY and LARGEFUZZ_MINIMIZE_CONCURRENCY")
+            exit(0)
+        # Every package moves on as soon as its own image is built: Packages without configs are inferred,
+        # the binaries of the others (and of inferred packages, once their configs are written) are minimized/fuzzed.
+        self.pipeline = Pipeline([Stage(BUILD_STAGE, self.submit_build, concurrency=build_concurrency,
+                                        on_done=self.on_build_done),
+                                  Stage(INFERENCE_STAGE, self.submit_inference, concurrency=inference_concurrency,
+                                        on_done=self.on_inference_done),
+                                  Stage(MINIMIZE_STAGE, lambda key, kwargs: self.append_minimize_to_tasklist(**kwargs),
+                                        concurrency=minimize_concurrency)])
+        self.pending_starts = {}  # The arguments of append_start_fuzzer_to_tasklist for the waiting binaries
+        self.pending_resumes = {}  # The arguments of append_resume_fuzzer_to_tasklist for the waiting binaries
         self.blacklisted_packages = []
         if blacklist_file:
             if not os.path.exists(blacklist_file):
@@ -147,58 +206,145 @@ class RepoFuzzer(object):
                         self.binary_list.append(line.strip())
 
     def found_crash_for_package(self, package: str):
-        contents = [os.path.join(dirpath, filename)
-                    for (dirpath, dirs, files) in os.walk(os.path.join(self.configuration_dir, package))
-                    for filename in (dirs + files)]
-        for entity in contents:
-            if "afl_fuzz" in entity and "crashes" in entity:  # entity.endswith("crashes"):
-                if len(os.listdir(entity)) > 0:
-                    return True
-        return False
+        return self.campaign_index.crashed(package)  # As of the last scan
+
+    def package_of(self, path: str) -> typing.Optional[str]:
+        """
+        :return: The package a path in the configuration directory belongs to, None outside of the packages.
+        """
+        package = os.path.relpath(os.path.abspath(path), os.path.abspath(self.configuration_dir)).split(os.sep)[0]
+        if package in (".", "..") or package.startswith("."):
+            return None
+        return package
+
+    def scan(self, changed_paths: typing.Iterable[str] = None):
+        """
+        :param changed_paths: The paths in the configuration directory that changed (from inotify),
+                              None to compare the whole configuration directory with the campaign index.
+                              Then only the packages whose configs or build file changed are scheduled again.
+        """
+        if changed_paths is None:
+            self.campaign_index.refresh()
+            self.schedule_packages()
+        else:
+            changed_paths = set(changed_paths)
+            packages = set(self.package_of(path) for path in self.campaign_index.refresh(changed_paths))
+            packages |= set(self.package_of(path) for path in changed_paths if path.endswith(BUILD_FILE_SUFFIX))
+            packages.discard(None)
+            if packages:
+                self.schedule_packages(packages)
+        self.first_start = False
 
-    def scan(self):
-        self.collect_info()
+    def schedule_packages(self, packages: typing.Set[str] = None):
+        """
+        Counts the crashes of the packages (default: all) and builds, minimizes or fuzzes their binaries.
+        """
+        self.campaign_index.refresh_crashes(packages)
+        self.collect_info(packages)
         self.build_packages()
         self.prepare_task_lists()
-        self.first_start = False
+        self.dispatch_fuzzing()
+        self.pipeline.pump()
 
     def fuzz(self):
         self.scan()
         self.scheduler()
 
     def build_packages(self):
-        packages_to_build = []
+        """
+        Queues the builds of the packages without an image. They do not block: The binaries of a package are
+        scheduled (or the package is inferred) once its build finished (on_build_done).
+        """
         for package_dir in self.packages_to_build:
+            if self.pipeline.in_stage(BUILD_STAGE, package_dir):
+                continue
             if package_dir in self.blacklisted_packages:
                 continue
             if self.found_crash_for_package(package_dir) and self.skip_after_crash_found:
                 if self.first_start:
                     print("Already have a crash for package {0}! Skipping".format(package_dir))
                 continue
-            if os.path.isfile(os.path.join(self.configuration_dir, package_dir)):
-                continue
-            if not any([file.endswith(".json") or file.endswith(".afl_config") for file in
-                        os.listdir(os.path.join(self.configuration_dir, package_dir))]):
+            if package_dir in self.build_failures and time.time() < self.build_failures[package_dir][1]:
+                continue  # Retried by retry_failed_builds
+            if not self.campaign_index.configs(package_dir) and package_dir not in self.packages_to_infer:
                 continue
-            image = None
             build_file = os.path.join(os.getcwd(),
                                       self.configuration_dir + "/" + package_dir + "/" + package_dir + ".build")
-            if os.path.exists(build_file):
-                with open(build_file) as fp:
-                    image_name = json.load(fp).get("docker_image_name")
-                    if image_name:
-                        try:
-                            image = self.docker_client.images.get(image_name)
-                        except docker.errors.ImageNotFound:
-                            image = None
-            if not image:  # We have no build image yet!
-                packages_to_build.append({"package": package_dir, "build_file": build_file})
-                print("Building package {0}".format(package_dir))
-        jobs = group(build_package.s(p["package"], self.fuzzer_image, p["build_file"]) for p in packages_to_build)
-        results = jobs.apply_async()
-        results.join()
-        # print("Build results:")
-        # print(results.get())
+            image_name = self.campaign_index.image_name(package_dir)
+            if image_name and image_name not in self.known_images:
+                try:
+                    self.docker_client.images.get(image_name)
+                    self.known_images.add(image_name)
+                except docker.errors.ImageNotFound:
+                    pass
+            if image_name in self.known_images:
+                self.infer_package(package_dir, build_file)
+            else:  # We have no build image yet!
+                self.pipeline.put(BUILD_STAGE, package_dir, build_file)
+
+    def submit_build(self, package: str, build_file: str) -> str:
+        print("Building package {0}".format(package))
+        return build_package.delay(package, self.fuzzer_image, build_file).task_id
+
+    def on_build_done(self, package: str, build_file: str, task_id: str):
+        """
+        Schedules the binaries of the package that waited for its image.
+        """
+        image_name = AsyncResult(task_id).get(propagate=False)
+        if not isinstance(image_name, str):
+            failures = self.build_failures.get(package, (0, 0))[0] + 1
+            delay = min(BUILD_RETRY_DELAY * 2 ** (failures - 1), BUILD_RETRY_MAX_DELAY)
+            self.build_failures[package] = (failures, time.time() + delay)
+            print("Building package {0} failed: {1}".format(package, image_name))
+            logger.warning("Building package {0} failed ({1} times, retrying in {2}s): {3}".format(
+                package, failures, delay, image_name))
+            return
+        self.build_failures.pop(package, None)
+        self.known_images.add(image_name)
+        self.campaign_index.refresh_crashes([package])
+        self.collect_info([package])
+        self.infer_package(package, build_file)
+        self.prepare_task_lists()
+        self.dispatch_fuzzing()
+
+    def infer_package(self, package: str, build_file: str):
+        """
+        Queues the inference of the package if it has no configs yet and was not inferred before.
+        """
+        if package in self.packages_to_infer and package not in self.inferred:
+            self.pipeline.put(INFERENCE_STAGE, package, build_file)
+
+    def submit_inference(self, package: str, build_file: str) -> str:
+        print("Inferring package {0}".format(package))
+        self.inferred.add(package)
+        docker_name = str(uuid.uuid4())[:8]
+        result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
+        docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v", result_dir + ":/results",
+                       "--entrypoint", "python"]
+        inference_command_args = ["/inputinferer/configfinder/config_finder_for_pacman_package.py", "-p", package,
+                                  "--output_volume", "/results"]
+        return run_inference.delay(docker_name, package, docker_args, self.fuzzer_image, build_file,
+                                   inference_command_args, configfinder.config_settings.MAX_TIMEOUT_PACKAGE_INFERENCE,
+                                   self.qemu).task_id
+
+    def on_inference_done(self, package: str, build_file: str, task_id: str):
+        """
+        Schedules the binaries of the package with the configs the inference wrote
+        (without waiting for their file events, which may be lost).
+        """
+        if not AsyncResult(task_id).get(propagate=False):
+            print("Inferring package {0} failed".format(package))
+            logger.warning("Inferring package {0} failed".format(package))
+        self.scan([os.path.join(self.configuration_dir, package)])
+
+    def retry_failed_builds(self):
+        """
+        Schedules the packages again whose build failed and whose retry delay passed.
+        """
+        now = time.time()
+        due = set(package for package, (_, retry_at) in self.build_failures.items() if retry_at <= now)
+        if due:
+            self.schedule_packages(due)
 
     def valid_config(self, file: str):
         if not os.path.exists(file):
@@ -246,57 +392,64 @@ class RepoFuzzer(object):
             print("No status for file {0}".format(file))
             return False
 
-    def collect_info(self):
+    def collect_info(self, packages: typing.Iterable[str] = None):
+        """
+        Lists the configs of the packages (default: all) that have to be minimized or fuzzed in queue_list,
+        the packages that have to be inferred in packages_to_infer and the packages that need an image
+        in packages_to_build.
+        """
         self.queue_list = []
         self.packages_to_build = set()
+        self.packages_to_infer = set()
+        for package_dir in self.campaign_index.uninferred_packages(packages):
+            if package_dir not in self.blacklisted_packages and package_dir not in self.inferred:
+                self.packages_to_infer.add(package_dir)
+                self.packages_to_build.add(package_dir)
         # self.task_lists = []
         first_process_list = []
         minimizer_list = []
         start_fuzz_list = []
         resume_fuzz_list = []
-        for package_dir in os.listdir(self.configuration_dir):
+        configs_per_package = {}
+        entries = self.campaign_index.configs() if packages is None else [
+            entry for package in packages for entry in self.campaign_index.configs(package)]
+        for entry in entries:
+            configs_per_package.setdefault(entry.package, []).append(entry)
+        for package_dir, entries in sorted(configs_per_package.items()):
             if package_dir in self.blacklisted_packages:
                 continue
             if self.found_crash_for_package(package_dir) and self.skip_after_crash_found:
                 # print("Already have a crash for package {0}! Skipping".format(package_dir))
                 continue
-            if os.path.isdir(os.path.join(self.configuration_dir + "/", package_dir)):  # We got a binary
-                files = os.listdir(os.path.join(self.configuration_dir + "/", package_dir))
-                configtype = ConfigTypes.AFL_CONFIG
-                for file in files:
-                    configfile = None
-                    if self.valid_config(os.path.join(self.configuration_dir, package_dir, file)):
-                        configfile = file
-                        configtype = ConfigTypes.AFL_CONFIG
-                    elif file.endswith(".json") and not self.valid_config(
-                            os.path.join(self.configuration_dir + "/", package_dir,
-                                         file[:-len(".json")] + ".afl_config")):
-                        jsonconfigfile = file
-                        configfile = jsonconfigfile
-                        configtype = ConfigTypes.INFERENCE_CONFIG
-                    if configfile:
-                        if self.binary_list and configfile.rsplit(".", 1) not in self.binary_list:
+            valid_afl_configs = set(entry.path for entry in entries if entry.kind == AFL_CONFIG and entry.valid)
+            for entry in entries:
+                configfile = None
+                if entry.path in valid_afl_configs:
+                    configfile = entry.file_name
+                    configtype = ConfigTypes.AFL_CONFIG
+                elif entry.kind == INFERENCE_CONFIG and \
+                        entry.path[:-len(".json")] + ".afl_config" not in valid_afl_configs:
+                    configfile = entry.file_name
+                    configtype = ConfigTypes.INFERENCE_CONFIG
+                if configfile:
+                    if self.binary_list and configfile.rsplit(".", 1) not in self.binary_list:
+                        continue
+                    append_tuple = (package_dir, entry.path, configtype)
+                    if configtype == ConfigTypes.INFERENCE_CONFIG:
+                        first_process_list.append(append_tuple)
+                    else:
+                        if not entry.status:
                             continue
-                        append_tuple = (
-                            package_dir, os.path.join(self.configuration_dir + "/", package_dir + "/" + configfile),
-                            configtype)
-                        if configtype == ConfigTypes.INFERENCE_CONFIG:
-                            first_process_list.append(append_tuple)
-                        else:
-                            status = self.get_status_for_configfile(
-                                os.path.join(self.configuration_dir, package_dir, configfile))
-                            if status == False:
-                                continue
-                            if status == TaskStatus.MIMIZING and self.minimize:
-                                minimizer_list.append(append_tuple)
-                                self.packages_to_build.add(package_dir)
-                            elif status == TaskStatus.STARTED_FUZZING and self.start_fuzzing:
-                                start_fuzz_list.append(append_tuple)
-                                self.packages_to_build.add(package_dir)
-                            elif status == TaskStatus.RESUMED_FUZZING and self.resume_fuzzing:
-                                resume_fuzz_list.append(append_tuple)
-                                self.packages_to_build.add(package_dir)
-                        # self.queue_list.append((package_dir,os.path.join(self.configuration_dir+"/",package_dir+"/"+configfile),configtype))
+                        status = TaskStatus(entry.status)
+                        if status == TaskStatus.MIMIZING and self.minimize:
+                            minimizer_list.append(append_tuple)
+                            self.packages_to_build.add(package_dir)
+                        elif status == TaskStatus.STARTED_FUZZING and self.start_fuzzing:
+                            start_fuzz_list.append(append_tuple)
+                            self.packages_to_build.add(package_dir)
+                        elif status == TaskStatus.RESUMED_FUZZING and self.resume_fuzzing:
+                            resume_fuzz_list.append(append_tuple)
+                            self.packages_to_build.add(package_dir)
         self.queue_list = first_process_list + minimizer_list + start_fuzz_list + resume_fuzz_list
 
     def append_minimize_to_tasklist(self, package, conf_dict: {}, docker_args, build_file, docker_name: str):
@@ -326,12 +479,12 @@ class RepoFuzzer(object):
         t = run_minimizer.delay(**call_dict)
         fuzztask = FuzzTask(package=package, conf_dict=conf_dict, build_file=build_file, taskid=t.task_id,
                             afl_json_file=afl_json_file, status=TaskStatus.MIMIZING)
-        self.task_lists.append(fuzztask)
+        self.tasks[fuzztask.taskid] = fuzztask
         # if package + "/" + binary_path not in self.ignore_package:
         #    print("Minimizing for {0}".format(package+" : "+binary_path))
         #    self.task_lists.append((os.path.join(package + "/",binary_path), run_minimizer.s(**call_dict)))
         # self.currently_fuzzed.append(package)
-        return True
+        return t.task_id
 
     def append_start_fuzzer_to_tasklist(self, package, conf_dict: {}, docker_args, build_file, afl_json_filepath: str,
                                         docker_name: str):
@@ -366,13 +519,15 @@ class RepoFuzzer(object):
         fuzzer_command_args += ["--afl_out_file", os.path.basename(afl_json_filepath)]
         if self.timeout:
             fuzzer_command_args += ["--timeout", self.timeout]
+        if self.slice_length:
+            fuzzer_command_args += ["--fuzz_duration", str(self.slice_length)]
         call_dict = {"docker_name": docker_name,
                      "package": package,
                      "docker_args": docker_args,
                      "fuzzer_image": self.fuzzer_image,
                      "build_file": build_file,
                      "fuzzer_command_args": fuzzer_command_args,
-                     "timeout_per_package": MAX_TIMEOUT_PER_PACKAGE
+                     "timeout_per_package": self.fuzzing_task_timeout()
                      }
         print("{0} Starting fuzzing {1}".format(str(datetime.datetime.now()), package + " : " + binary_path))
         logging.info("Starting fuzzing for {0}".format(package + " : " + binary_path))
@@ -380,7 +535,7 @@ class RepoFuzzer(object):
         fuzztask = FuzzTask(package=package, conf_dict=conf_dict, build_file=build_file, taskid=t.task_id,
                             afl_json_file=os.path.basename(afl_json_filepath),
                             status=TaskStatus.STARTED_FUZZING)
-        self.task_lists.append(fuzztask)
+        self.tasks[fuzztask.taskid] = fuzztask
         # if package + "/" + binary_path not in self.ignore_package:
         #    print("Starting fuzzing {0}".format(package+" : "+binary_path))
         #    self.task_lists.append((os.path.join(package + "/",binary_path), run_fuzzer.s(**call_dict)))
@@ -416,21 +571,84 @@ class RepoFuzzer(object):
         fuzzer_command_args += ["-adir", afl_out_dir]
         if self.timeout:
             fuzzer_command_args += ["--timeout", self.timeout]
+        # Continue from the checkpoint, reseeding every slice would cost more than it brings.
+        # Sessions that were not stopped cleanly are still reseeded (see fuzzer_wrapper.resume_fuzzer).
+        if self.slice_length:
+            fuzzer_command_args += ["--fuzz_duration", str(self.slice_length), "--no_reseed"]
         call_dict = {"docker_name": docker_name, "package": package, "docker_args": docker_args,
                      "fuzzer_image": self.fuzzer_image, "build_file": build_file,
-                     "fuzzer_command_args": fuzzer_command_args, "timeout_per_package": MAX_TIMEOUT_PER_PACKAGE}
+                     "fuzzer_command_args": fuzzer_command_args, "timeout_per_package": self.fuzzing_task_timeout()}
         print("{0} Resuming fuzzing for for {1}".format(str(datetime.datetime.now()), package + " : " + binary_path))
         logging.info("Resuming fuzzing for {0}".format(package + " : " + binary_path))
         t = run_fuzzer.delay(**call_dict)
         fuzztask = FuzzTask(package=package, conf_dict=conf_dict, build_file=build_file, taskid=t.task_id,
                             afl_out_dir=afl_out_dir,
                             status=TaskStatus.RESUMED_FUZZING)
-        self.task_lists.append(fuzztask)
+        self.tasks[fuzztask.taskid] = fuzztask
         # if package + "/" + binary_path not in self.ignore_package:
         #    print("Resuming fuzzing for {0}".format(package+" : "+binary_path))
         #    self.task_lists.append((package + "/" + binary_path, run_fuzzer.s(**call_dict)))
         return True
 
+    def enqueue_start(self, package, conf_dict: {}, docker_args, build_file, afl_json_filepath: str,
+                      docker_name: str):
+        """
+        Lets the binary wait for its first fuzzing slot, see dispatch_fuzzing.
+        """
+        key = package + ":" + str(conf_dict.get("binary_path"))
+        self.pending_starts[key] = {"package": package, "conf_dict": conf_dict, "docker_args": docker_args,
+                                    "build_file": build_file, "afl_json_filepath": afl_json_filepath,
+                                    "docker_name": docker_name}
+        self.slice_scheduler.add_new(key)
+
+    def enqueue_resume(self, package, conf_dict: {}, docker_args, build_file, docker_name: str,
+                       afl_out_dir: str = None):
+        """
+        Lets the binary wait for a resume slot, see dispatch_fuzzing.
+        """
+        key = package + ":" + str(conf_dict.get("binary_path"))
+        self.pending_resumes[key] = {"package": package, "conf_dict": conf_dict, "docker_args": docker_args,
+                                     "build_file": build_file, "docker_name": docker_name, "afl_out_dir": afl_out_dir}
+        self.slice_scheduler.add_resume(key)
+
+    def dispatch_fuzzing(self):
+        """
+        Starts or resumes the waiting binaries the slice scheduler picks for the free slots
+        (all of them if LARGEFUZZ_RESUME_SLOTS is not set).
+        """
+        if self.resume_slots > 0:
+            fuzzing = sum(1 for task in self.tasks.values() if task.status in (TaskStatus.STARTED_FUZZING,
+                                                                               TaskStatus.RESUMED_FUZZING))
+            free_slots = self.resume_slots - fuzzing
+        else:
+            free_slots = self.slice_scheduler.waiting
+        for key, new in self.slice_scheduler.select(free_slots):
+            if new:
+                self.append_start_fuzzer_to_tasklist(**self.pending_starts.pop(key))
+            else:
+                self.append_resume_fuzzer_to_tasklist(**self.pending_resumes.pop(key))
+
+    def fuzzing_task_timeout(self) -> float:
+        """
+        :return: The timeout of a fuzzing task: One time slice (afl stops itself) or the timeout per package.
+        """
+        if self.slice_length:
+            return self.slice_length + SLICE_STOP_MARGIN
+        return MAX_TIMEOUT_PER_PACKAGE
+
+    def observe_productivity(self, package: str, conf_dict: {}, afl_out_dir: str = None):
+        """
+        Tells the energy scheduler how productive the last fuzzing session of the binary was.
+        """
+        afl_out_dir = afl_out_dir or conf_dict.get("afl_out_dir")
+        if not afl_out_dir:
+            return
+        try:
+            productivity = campaign_productivity(local_path(self.configuration_dir, afl_out_dir))
+        except ValueError:  # Not a /results/... path
+            return
+        self.energy_scheduler.observe(package + ":" + str(conf_dict.get("binary_path")), productivity)
+
     def prepare_task_lists(self):
         for item in self.queue_list:
             next_item = item
@@ -438,13 +656,15 @@ class RepoFuzzer(object):
             if next_item is None:
                 break
             package, json_file, configtype = next_item  # json_file is full path, package is just package name
+            if self.pipeline.in_stage(BUILD_STAGE, package):
+                continue  # Scheduled when the image is built
+            entry = self.campaign_index.config(json_file)  # Parsed once per change of the file
+            if entry is None or not entry.conf:
+                continue
             if configtype == ConfigTypes.INFERENCE_CONFIG:
-                with open(json_file) as json_filepointer:
-                    configurations = json.load(json_filepointer)
-                    conf = configurations[0]
+                conf = entry.conf[0]
             elif configtype == ConfigTypes.AFL_CONFIG:
-                with open(json_file) as json_filepointer:
-                    conf = json.load(json_filepointer)
+                conf = entry.conf
             if conf.get("binary_path") is None:
                 print("No binary_path for", package, "Skipping...")
                 continue
@@ -460,72 +680,166 @@ class RepoFuzzer(object):
                            "--entrypoint", "python"]
             build_file = os.path.join(os.getcwd(), self.configuration_dir + "/" + package + "/" + package + ".build")
             if not conf.get("status") and self.minimize:  # No status - fuzz to minize
-                self.append_minimize_to_tasklist(package=package, conf_dict=conf, docker_args=docker_args,
-                                                 build_file=build_file, docker_name=docker_name)
+                self.pipeline.put(MINIMIZE_STAGE, package + ":" + binary_path,
+                                  {"package": package, "conf_dict": conf, "docker_args": docker_args,
+                                   "build_file": build_file, "docker_name": docker_name})
             elif conf.get("status") == configfinder.config_settings.Status.MINIMIZE_DONE and self.start_fuzzing:
-                self.append_start_fuzzer_to_tasklist(package=package, conf_dict=conf, docker_args=docker_args,
-                                                     build_file=build_file, afl_json_filepath=json_file,
-                                                     docker_name=docker_name)
+                self.enqueue_start(package=package, conf_dict=conf, docker_args=docker_args, build_file=build_file,
+                                   afl_json_filepath=json_file, docker_name=docker_name)
             elif conf.get("status") == configfinder.config_settings.Status.FUZZING and self.resume_fuzzing:
                 if conf.get("afl_out_dir"):
-                    self.append_resume_fuzzer_to_tasklist(package=package, conf_dict=conf, docker_args=docker_args,
-                                                          build_file=build_file, afl_out_dir=conf["afl_out_dir"],
-                                                          docker_name=docker_name)
+                    self.enqueue_resume(package=package, conf_dict=conf, docker_args=docker_args,
+                                        build_file=build_file, afl_out_dir=conf["afl_out_dir"],
+                                        docker_name=docker_name)
             self.already_enqueued.add(package + ":" + binary_path)
         return True
 
+    def on_task_done(self, task: FuzzTask):
+        """
+        Moves the binary of a finished task to its next state: minimized -> start fuzzing -> resume fuzzing.
+        """
+        res = AsyncResult(task.taskid)
+        print("task", task.taskid, "done")
+        print(res.get())
+        if res.get()[1] != True:
+            return
+        if task.status == TaskStatus.MIMIZING:
+            docker_name = str(uuid.uuid4())[:8]
+            result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
+            docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v",
+                           result_dir + ":/results", "--entrypoint", "python"]
+            with open(os.path.join(self.configuration_dir, task.package + "/" + task.afl_json_file)) as fp:
+                conf_dict = json.load(fp)
+            self.enqueue_start(package=task.package, conf_dict=conf_dict, docker_args=docker_args,
+                               build_file=task.build_file, afl_json_filepath=task.afl_json_file,
+                               docker_name=docker_name)
+        elif task.status == TaskStatus.STARTED_FUZZING:
+            docker_name = str(uuid.uuid4())[:8]
+            result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
+            docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v",
+                           result_dir + ":/results", "--entrypoint", "python"]
+            with open(os.path.join(self.configuration_dir, task.package + "/" + task.afl_json_file)) as fp:
+                conf_dict = json.load(fp)
+            self.observe_productivity(task.package, conf_dict)
+            self.enqueue_resume(package=task.package, conf_dict=conf_dict, docker_args=docker_args,
+                                build_file=task.build_file, docker_name=docker_name)
+        elif task.status == TaskStatus.RESUMED_FUZZING:
+            docker_name = str(uuid.uuid4())[:8]
+            result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
+            docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v",
+                           result_dir + ":/results", "--entrypoint", "python"]
+            self.observe_productivity(task.package, task.conf_dict, afl_out_dir=task.afl_out_dir)
+            self.enqueue_resume(package=task.package, conf_dict=task.conf_dict, docker_args=docker_args,
+                                build_file=task.build_file, docker_name=docker_name)
+
+    def watch_tasks(self):
+        """
+        Puts a TASK_EVENT for every celery task that finished (the workers have to send task events).
+        Runs in its own thread.
+        """
+        from celery_tasks.tasks import app
+
+        def on_event(event):
+            self.events.put((TASK_EVENT, event["uuid"]))
+
+        handlers = {"task-succeeded": on_event, "task-failed": on_event, "task-revoked": on_event}
+        while True:
+            try:
+                with app.connection() as connection:
+                    receiver = app.events.Receiver(connection, handlers=handlers)
+                    receiver.capture(limit=None, timeout=None, wakeup=True)
+            except Exception as e:
+                logger.warning("Lost the connection to the celery events: {0}".format(e))
+                time.sleep(EVENT_RECONNECT_DELAY)
+
+    def watch_configuration_dir(self):
+        """
+        Puts a FILE_EVENT for every change in the configuration directory and its package directories
+        (or a RESCAN_EVENT if inotify lost events). Runs in its own thread.
+        """
+        try:
+            watcher = inotify.Inotify()
+            root_watch = watcher.add_watch(self.configuration_dir)
+            for package_dir in os.listdir(self.configuration_dir):
+                if not package_dir.startswith(".") and os.path.isdir(os.path.join(self.configuration_dir, package_dir)):
+                    watcher.add_watch(os.path.join(self.configuration_dir, package_dir))
+        except OSError as e:
+            logger.warning("Can not watch {0}, rescanning periodically: {1}".format(self.configuration_dir, e))
+            return
+        self.watching_files = True
+        self.events.put((RESCAN_EVENT, None))  # Changes before the watches were added
+        while True:
+            for event in watcher.read_events():
+                if event.overflow:
+                    self.events.put((RESCAN_EVENT, None))
+                    continue
+                if event.is_dir and os.path.dirname(event.path) == watcher.watches.get(root_watch) and \
+                        event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                    try:
+                        watcher.add_watch(event.path)
+                    except OSError as e:
+                        logger.warning("Can not watch {0}, rescanning periodically: {1}".format(event.path, e))
+                        self.watching_files = False
+                self.events.put((FILE_EVENT, event.path))
+
+    def wait_for_events(self, timeout: float) -> typing.List[typing.Tuple[str, typing.Any]]:
+        """
+        Blocks until there are events or the timeout passed.
+        :return: The events of the burst, empty on timeout.
+        """
+        try:
+            events = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        time.sleep(EVENT_DEBOUNCE)
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
     def scheduler(self):
-        RESCAN_AFTER = 10
-        count = 0
+        """
+        Reacts to finished tasks and changed configs as they are reported.
+        Events can get lost (e.g. workers started without task events), so the tasks are polled
+        and, without inotify, the configuration directory is rescanned every FALLBACK_POLL_INTERVAL seconds.
+        """
+        threading.Thread(target=self.watch_tasks, daemon=True).start()
+        if inotify.available():
+            threading.Thread(target=self.watch_configuration_dir, daemon=True).start()
+        last_poll = time.time()
         while True:
-            task_list = list(self.task_lists)
-            for task in task_list:  # type: FuzzTask
-                # print("Querying task:")
-                # print(task_list)
-                res = AsyncResult(task.taskid)
-                # print(res.status)
-                if res.ready():
-                    self.task_lists.remove(task)
-                    print("task", task.taskid, "done")
-                    print(res.get())
-                    if res.get()[1] != True:
-                        continue
-                    if task.status == TaskStatus.MIMIZING:
-                        docker_name = str(uuid.uuid4())[:8]
-                        result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
-                        docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v",
-                                       result_dir + ":/results", "--entrypoint", "python"]
-                        with open(os.path.join(self.configuration_dir, task.package + "/" + task.afl_json_file)) as fp:
-                            conf_dict = json.load(fp)
-                        self.append_start_fuzzer_to_tasklist(package=task.package, conf_dict=conf_dict,
-                                                             docker_args=docker_args, build_file=task.build_file,
-                                                             afl_json_filepath=task.afl_json_file,
-                                                             docker_name=docker_name)
-                    elif task.status == TaskStatus.STARTED_FUZZING:
-                        docker_name = str(uuid.uuid4())[:8]
-                        result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
-                        docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v",
-                                       result_dir + ":/results", "--entrypoint", "python"]
-                        with open(os.path.join(self.configuration_dir, task.package + "/" + task.afl_json_file)) as fp:
-                            conf_dict = json.load(fp)
-                        self.append_resume_fuzzer_to_tasklist(package=task.package, conf_dict=conf_dict,
-                                                              docker_args=docker_args, build_file=task.build_file,
-                                                              docker_name=docker_name)
-                    elif task.status == TaskStatus.RESUMED_FUZZING:
-                        docker_name = str(uuid.uuid4())[:8]
-                        result_dir = os.path.join(os.getcwd(), self.configuration_dir + "/")
-                        docker_args = ["--name", docker_name, "--rm", "--cap-add=SYS_PTRACE", "-v",
-                                       result_dir + ":/results", "--entrypoint", "python"]
-                        self.append_resume_fuzzer_to_tasklist(package=task.package, conf_dict=task.conf_dict,
-                                                              docker_args=docker_args, build_file=task.build_file,
-                                                              docker_name=docker_name)
-            time.sleep(5)
-            count += 1
-            count = count % RESCAN_AFTER
-            if count == 0:
-                utils.helpers.temp_print("{0} Rescanning for any new projects....".format(datetime.datetime.now()))
+            finished_task_ids = set()
+            changed_paths = set()
+            rescan = False
+            for kind, value in self.wait_for_events(timeout=max(0, last_poll + FALLBACK_POLL_INTERVAL - time.time())):
+                if kind == TASK_EVENT:
+                    finished_task_ids.add(value)
+                elif kind == FILE_EVENT:
+                    changed_paths.add(value)
+                elif kind == RESCAN_EVENT:
+                    rescan = True
+            if time.time() - last_poll >= FALLBACK_POLL_INTERVAL:
+                utils.temp_print("{0}: Polling Tasks...".format(datetime.datetime.now()))
+                finished_task_ids |= set(task_id for task_id in list(self.tasks) + self.pipeline.running_task_ids()
+                                         if AsyncResult(task_id).ready())
+                rescan = rescan or not self.watching_files
+                last_poll = time.time()
+                if not rescan:
+                    self.retry_failed_builds()
+            for task_id in finished_task_ids:
+                task = self.tasks.pop(task_id, None)
+                if task is not None:  # Otherwise not ours or already handled
+                    self.on_task_done(task)
+                self.pipeline.task_done(task_id)
+            if finished_task_ids:
+                self.dispatch_fuzzing()
+                self.pipeline.pump()
+            if rescan:
+                utils.temp_print("{0} Rescanning for any new projects....".format(datetime.datetime.now()))
                 self.scan()
-            utils.helpers.temp_print("{0}: Polling Tasks...".format(datetime.datetime.now()))
+            elif changed_paths:
+                self.scan(changed_paths)
 
 
 def sanity_checks():
@@ -540,7 +854,7 @@ def sanity_checks():
     if pattern_change_needed:
         print(
             "System is configured to send core dump notifications to an external utility. This will prevent afl-fuzz from starting. ")
-        change_core_pattern = utils.helpers.query_yes_no("Do you want me to change that for you?")
+        change_core_pattern = utils.query_yes_no("Do you want me to change that for you?")
         if not change_core_pattern:
             return False
         else:
@@ -0,0 +1,73 @@
+"""
+Time slicing of the fuzzing slots of a RepoFuzzer.
+Instead of fuzzing a binary for the whole timeout per package, every fuzzing task runs for one slice: afl is stopped
+with SIGINT at the slice boundary (a consistent stop point, afl writes its queue and stats), the session is
+checkpointed next to its output directory (see helpers.fuzzing_checkpoint) and resumed later with -i-, without copying
+anything.
+Binaries that were never fuzzed get a share of the freed slots before binaries waiting for a resume (which the energy
+scheduler picks), so a new binary waits at most about (its position / (slots * new_share)) slices.
+"""
+import collections
+import time
+import typing
+
+from fuzz_managers.energy_scheduler import EnergyScheduler
+
+DEFAULT_NEW_SHARE = 0.5  # The share of the slots binaries that were never fuzzed get while others wait for a resume
+SLICE_STOP_MARGIN = 5 * 60  # A task gets this much more than its slice (building, reseeding, stopping afl)
+
+
+class SliceScheduler(object):
+    def __init__(self, resume_scheduler: EnergyScheduler = None, new_share: float = DEFAULT_NEW_SHARE,
+                 clock: typing.Callable[[], float] = time.time):
+        """
+        :param resume_scheduler: Picks the binaries to resume, defaults to an EnergyScheduler.
+        :param new_share: The share of the selections that goes to new binaries while binaries wait for a resume.
+        """
+        if not 0 < new_share <= 1:
+            raise ValueError("The share of new binaries has to be in (0, 1], got {0}".format(new_share))
+        self.resume_scheduler = resume_scheduler if resume_scheduler is not None else EnergyScheduler()
+        self.new_share = new_share
+        self.clock = clock
+        self.new = collections.OrderedDict()  # type: typing.Dict[typing.Hashable, float]  # key -> waiting since
+        self.selections = 0
+        self.new_selections = 0
+
+    def add_new(self, key: typing.Hashable):
+        """
+        The binary waits for its first slice.
+        """
+        if key not in self.new:
+            self.new[key] = self.clock()
+
+    def add_resume(self, key: typing.Hashable):
+        """
+        The binary waits for its next slice.
+        """
+        self.resume_scheduler.add(key)
+
+    @property
+    def waiting(self) -> int:
+        return len(self.new) + len(self.resume_scheduler.waiting)
+
+    def longest_new_wait(self) -> float:
+        """
+        :return: How long the oldest new binary waits for its first slice, 0 if none waits.
+        """
+        return self.clock() - next(iter(self.new.values())) if self.new else 0
+
+    def select(self, slots: int) -> typing.List[typing.Tuple[typing.Hashable, bool]]:
+        """
+        :return: The binaries that get the free slots and whether they are new (start) or not (resume).
+        """
+        selected = []
+        for _ in range(min(slots, self.waiting)):
+            resumes_waiting = bool(self.resume_scheduler.waiting)
+            if self.new and (not resumes_waiting or self.new_selections < self.new_share * (self.selections + 1)):
+                key, _ = self.new.popitem(last=False)
+                self.new_selections += 1
+                selected.append((key, True))
+            else:
+                selected.append((self.resume_scheduler.select(1)[0], False))
+            self.selections += 1
+        return selected
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Content addressed, persistent cache for per-binary analysis results
+(triage results, inferred input vectors, ...).
+An entry is keyed by the sha256 of the binary, the kind of analysis (namespace),
+a fingerprint of the seeds corpus and a fingerprint of the tools used for the analysis.
+"""
+import argparse
+import hashlib
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import typing
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings
+from helpers.seeds_manifest import SeedsManifest
+
+CACHE_DATABASE_NAME = "analysis_cache.sqlite"
+TRIAGE_NAMESPACE = "triage"
+INPUT_VECTORS_NAMESPACE = "input_vectors"
+
+# The tools whose version (approximated by size and mtime) influences the analysis results.
+ANALYSIS_TOOLS = ["afl-showmap", "afl-qemu-trace", "afl-cmin", "strace"]
+
+
+def tool_fingerprint(tools: typing.List[str] = None) -> str:
+    """
+    Fingerprints the analysis tools (and the version of the analysis code itself).
+    Tools are identified by path, size and mtime, so reinstalling any of them invalidates the cache.
+    """
+    if tools is None:
+        tools = ANALYSIS_TOOLS
+    hash_object = hashlib.sha256(str(configfinder.config_settings.ANALYSIS_CACHE_VERSION).encode("utf-8"))
+    for tool in tools:
+        tool_path = shutil.which(tool)
+        if not tool_path:
+            hash_object.update("{0}:missing".format(tool).encode("utf-8"))
+            continue
+        tool_stat = os.stat(tool_path)
+        hash_object.update("{0}:{1}:{2}".format(tool_path, tool_stat.st_size, tool_stat.st_mtime_ns).encode("utf-8"))
+    preeny_src = os.path.join(configfinder.config_settings.PREENY_PATH, "src")
+    if os.path.isdir(preeny_src):
+        for entry in sorted(e for e in os.listdir(preeny_src) if e.endswith(".so")):
+            entry_stat = os.stat(os.path.join(preeny_src, entry))
+            hash_object.update("{0}:{1}:{2}".format(entry, entry_stat.st_size, entry_stat.st_mtime_ns).encode("utf-8"))
+    return hash_object.hexdigest()
+
+
+def seeds_fingerprint(seeds_dir: str) -> str:
+    """
+    Fingerprints a seeds corpus by the relative path, size and mtime of every seed file (see SeedsManifest).
+    :param seeds_dir: The root of the seeds corpus (one subdirectory per filetype).
+    :return: The fingerprint, an empty string if there is no seeds corpus.
+    """
+    if not seeds_dir or not os.path.isdir(seeds_dir):
+        return ""
+    return SeedsManifest.for_directory(seeds_dir, max_age=0).fingerprint()
+
+
+class AnalysisCache:
+    """
+    The cache lives in a single sqlite database. Besides the entries, it remembers the
+    sha256 for every (path, size, mtime, inode) it has seen, so lookups for unchanged
+    binaries do not need to read the binary again.
+    Entries are evicted least recently used first once the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = None, tools_fingerprint: str = None):
+        """
+        :param cache_dir: The directory the cache database is stored in.
+        :param max_size: The maximal size of all cached values in bytes.
+        :param tools_fingerprint: The fingerprint of the analysis tools. Defaults to tool_fingerprint().
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.database_path = os.path.join(cache_dir, CACHE_DATABASE_NAME)
+        self.max_size = max_size if max_size is not None else configfinder.config_settings.ANALYSIS_CACHE_MAX_SIZE
+        self.tools_fingerprint = tools_fingerprint if tools_fingerprint is not None else tool_fingerprint()
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, namespace TEXT, "
+                               "binary_hash TEXT, binary_path TEXT, value TEXT, size INTEGER, created REAL, "
+                               "last_access REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_binary_hash ON entries(binary_hash)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+            connection.execute("CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, size INTEGER, "
+                               "mtime_ns INTEGER, inode INTEGER, sha256 TEXT)")
+
+    @staticmethod
+    def for_volume(volume_path: str) -> "AnalysisCache":
+        """
+        :return: The cache stored in the default location of the given output volume.
+        """
+        return AnalysisCache(os.path.join(volume_path, configfinder.config_settings.ANALYSIS_CACHE_DIR_NAME))
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can not be shared between threads, the triage pool uses one per thread.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.database_path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def binary_hash(self, binary_path: str) -> str:
+        """
+        :return: The sha256 of the binary. Only rehashed if size, mtime or inode changed.
+        """
+        real_path = os.path.realpath(binary_path)
+        binary_stat = os.stat(real_path)
+        connection = self._connection()
+        row = connection.execute("SELECT size, mtime_ns, inode, sha256 FROM file_hashes WHERE path = ?",
+                                 (real_path,)).fetchone()
+        if row and tuple(row[:3]) == (binary_stat.st_size, binary_stat.st_mtime_ns, binary_stat.st_ino):
+            return row[3]
+        hash_object = hashlib.sha256()
+        with open(real_path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+                hash_object.update(chunk)
+        sha256 = hash_object.hexdigest()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                               (real_path, binary_stat.st_size, binary_stat.st_mtime_ns, binary_stat.st_ino, sha256))
+        return sha256
+
+    def key_for(self, binary_path: str, namespace: str, seeds_fingerprint: str = "") -> str:
+        return self._key(self.binary_hash(binary_path), namespace, seeds_fingerprint)
+
+    def _key(self, binary_hash: str, namespace: str, seeds_fingerprint: str) -> str:
+        return hashlib.sha256("{0}\0{1}\0{2}\0{3}".format(binary_hash, namespace, seeds_fingerprint,
+                                                          self.tools_fingerprint).encode("utf-8")).hexdigest()
+
+    def get(self, binary_path: str, namespace: str, seeds_fingerprint: str = "") -> typing.Any:
+        """
+        :return: The cached value, None if there is no entry.
+        """
+        try:
+            key = self.key_for(binary_path, namespace, seeds_fingerprint)
+        except OSError:
+            return None
+        connection = self._connection()
+        row = connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with connection:
+            connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, binary_path: str, namespace: str, value: typing.Any, seeds_fingerprint: str = ""):
+        """
+        Stores a json serializable value for the binary. Evicts old entries if the cache grows above max_size.
+        """
+        binary_hash = self.binary_hash(binary_path)
+        key = self._key(binary_hash, namespace, seeds_fingerprint)
+        serialized_value = json.dumps(value)
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (key, namespace, binary_hash, os.path.realpath(binary_path), serialized_value,
+                                len(serialized_value), now, now))
+        self.evict()
+
+    def size(self) -> int:
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_size: int = None) -> int:
+        """
+        Removes the least recently used entries until the cache is smaller than max_size.
+        :return: The number of evicted entries.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        connection = self._connection()
+        total_size = self.size()
+        evicted = 0
+        if total_size <= max_size:
+            return evicted
+        with connection:
+            for key, size in connection.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total_size <= max_size:
+                    break
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total_size -= size
+                evicted += 1
+        return evicted
+
+    def entries(self, namespace: str = None) -> typing.List[typing.Dict[str, typing.Any]]:
+        query = "SELECT key, namespace, binary_hash, binary_path, size, created, last_access FROM entries"
+        parameters = ()
+        if namespace:
+            query += " WHERE namespace = ?"
+            parameters = (namespace,)
+        columns = ["key", "namespace", "binary_hash", "binary_path", "size", "created", "last_access"]
+        return [dict(zip(columns, row)) for row in
+                self._connection().execute(query + " ORDER BY last_access DESC", parameters).fetchall()]
+
+    def show(self, key_prefix: str) -> typing.List[typing.Dict[str, typing.Any]]:
+        rows = self._connection().execute("SELECT key, namespace, binary_path, value FROM entries WHERE key LIKE ?",
+                                          (key_prefix + "%",)).fetchall()
+        return [{"key": key, "namespace": namespace, "binary_path": binary_path, "value": json.loads(value)}
+                for key, namespace, binary_path, value in rows]
+
+    def invalidate(self, key_prefix: str = None, binary_path: str = None, namespace: str = None) -> int:
+        """
+        Removes entries by key prefix, by binary (all entries for the binary's content) and/or by namespace.
+        :return: The number of removed entries.
+        """
+        conditions = []
+        parameters = []
+        if key_prefix:
+            conditions.append("key LIKE ?")
+            parameters.append(key_prefix + "%")
+        if binary_path:
+            conditions.append("(binary_hash = ? OR binary_path = ?)")
+            parameters.extend([self.binary_hash(binary_path), os.path.realpath(binary_path)])
+        if namespace:
+            conditions.append("namespace = ?")
+            parameters.append(namespace)
+        if not conditions:
+            return 0
+        connection = self._connection()
+        with connection:
+            return connection.execute("DELETE FROM entries WHERE " + " AND ".join(conditions), parameters).rowcount
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM file_hashes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the analysis cache.")
+    parser.add_argument("cache_dir", help="The cache directory, usually <volume>/{0}".format(
+        configfinder.config_settings.ANALYSIS_CACHE_DIR_NAME))
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    list_parser = subparsers.add_parser("list", help="List the cache entries")
+    list_parser.add_argument("-n", "--namespace", required=False, help="Only list entries of this namespace")
+    show_parser = subparsers.add_parser("show", help="Show the cached values")
+    show_parser.add_argument("key", help="The key (or a prefix of it)")
+    invalidate_parser = subparsers.add_parser("invalidate", help="Remove entries")
+    invalidate_parser.add_argument("-k", "--key", required=False, help="The key (or a prefix of it)")
+    invalidate_parser.add_argument("-b", "--binary", required=False, help="Remove all entries for this binary")
+    invalidate_parser.add_argument("-n", "--namespace", required=False, help="Remove all entries of this namespace")
+    evict_parser = subparsers.add_parser("evict", help="Evict least recently used entries")
+    evict_parser.add_argument("-s", "--max_size", type=int, required=False, help="Evict down to this size in bytes")
+    subparsers.add_parser("clear", help="Remove all entries")
+    args = parser.parse_args()
+    cache = AnalysisCache(args.cache_dir, tools_fingerprint="")
+    if args.command == "list":
+        for entry in cache.entries(namespace=args.namespace):
+            print("{0}  {1:<14} {2:>8}  {3}  {4}".format(entry["key"][:16], entry["namespace"], entry["size"],
+                                                          time.ctime(entry["last_access"]), entry["binary_path"]))
+        print("Total size: {0} bytes".format(cache.size()))
+    elif args.command == "show":
+        print(json.dumps(cache.show(args.key), indent=4))
+    elif args.command == "invalidate":
+        if not (args.key or args.binary or args.namespace):
+            parser.error("invalidate needs at least one of --key, --binary or --namespace")
+        print("Removed {0} entries".format(cache.invalidate(key_prefix=args.key, binary_path=args.binary,
+                                                            namespace=args.namespace)))
+    elif args.command == "evict":
+        print("Evicted {0} entries".format(cache.evict(max_size=args.max_size)))
+    elif args.command == "clear":
+        cache.clear()
+
+
+if __name__ == "__main__":
+    main()
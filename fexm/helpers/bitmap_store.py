@@ -0,0 +1,267 @@
+"""
+Stores classified afl edge bitmaps per (binary, invocation, seed) in one append-only file,
+so coverage unions, intersections and novelty can be computed without running the target again.
+A bitmap has one byte per edge, the hit count bucket bits of the edge (see coverage_oracle.COUNT_CLASS_LOOKUP).
+Only few of the 64 KiB are set for a seed, so every bitmap is stored sparse (the hit edges and their buckets)
+and zlib compressed. A json index maps the keys to the offsets of their records.
+Every row records the hash of the binary and the size and mtime of the seed it was traced with. Rows of a rebuilt
+binary or a changed seed are deleted (forget_stale), the space of deleted and replaced records is reclaimed by flush.
+"""
+import json
+import threading
+import typing
+import zlib
+
+import numpy as np
+import os
+
+MAP_SIZE = 1 << 16
+INDEX_FILE_NAME = "index.json"
+BITMAPS_FILE_NAME = "bitmaps.dat"
+STORE_VERSION = 2  # 1 stored dense rows in a memory mapped file
+COMPACT_MIN_GARBAGE = 1 << 20  # Bytes of deleted records before flush rewrites the bitmaps file
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+STATUS_OK = 0  # Same values as coverage_oracle.RUN_OK, RUN_CRASH and RUN_TIMEOUT
+STATUS_CRASH = 1
+STATUS_TIMEOUT = 2
+
+
+def seed_stamp(seed: str) -> typing.Optional[typing.List[int]]:
+    """
+    :return: The size and mtime of the seed file, None if it does not exist.
+    """
+    try:
+        seed_stat = os.stat(seed)
+    except OSError:
+        return None
+    return [seed_stat.st_size, seed_stat.st_mtime_ns]
+
+
+def count_tuples(bitmap: np.ndarray) -> int:
+    """
+    :return: The number of (edge, hit count bucket) tuples set in the classified bitmap.
+    """
+    return int(POPCOUNT[bitmap].sum(dtype=np.int64))
+
+
+def encode_bitmap(bitmap: np.ndarray) -> bytes:
+    """
+    :return: The hit edges (little endian uint16) followed by their buckets, zlib compressed.
+    """
+    edges = np.flatnonzero(bitmap)
+    return zlib.compress(edges.astype("<u2").tobytes() + bitmap[edges].astype(np.uint8).tobytes())
+
+
+def decode_bitmap(record: bytes) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: The hit edges and their buckets of an encoded bitmap.
+    """
+    data = zlib.decompress(record)
+    count = len(data) // 3
+    return np.frombuffer(data, dtype="<u2", count=count), np.frombuffer(data, dtype=np.uint8, offset=2 * count)
+
+
+class BitmapStore:
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory the bitmaps and the index are stored in, created if necessary.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE_NAME)
+        self.bitmaps_path = os.path.join(directory, BITMAPS_FILE_NAME)
+        self._lock = threading.RLock()
+        self.rows = []  # type: typing.List[typing.Dict[str, typing.Any]]
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as fp:
+                index = json.load(fp)
+            if index.get("version") == STORE_VERSION:
+                self.rows = index["rows"]
+        if not self.rows and os.path.exists(self.bitmaps_path):
+            os.remove(self.bitmaps_path)  # Nothing of it is indexed (or it has an old format)
+        self._index_keys()
+        self.bitmaps = open(self.bitmaps_path, "a+b")
+
+    def _index_keys(self):
+        self.keys = {(row["binary"], row["invocation"], row["seed"]): i
+                     for i, row in enumerate(self.rows)}  # type: typing.Dict[typing.Tuple[str, str, str], int]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def put(self, binary: str, invocation: str, seed: str, bitmap: np.ndarray, label: str = None,
+            status: int = STATUS_OK, binary_hash: str = None) -> int:
+        """
+        Stores (or replaces) the bitmap of a seed.
+        :param label: An optional label for queries, e.g. the filetype of the seed.
+        :param status: How the run ended, crashes and timeouts are excluded from the default queries.
+        :param binary_hash: The hash of the binary the seed was run on, see forget_stale.
+        :return: The row of the bitmap.
+        """
+        key = (binary, invocation or "", seed)
+        record = encode_bitmap(bitmap)
+        with self._lock:
+            row = self.keys.get(key)
+            if row is None:
+                row = len(self.rows)
+                self.rows.append({})
+                self.keys[key] = row
+            self.bitmaps.seek(0, os.SEEK_END)
+            offset = self.bitmaps.tell()
+            self.bitmaps.write(record)
+            self.rows[row] = {"binary": binary, "invocation": invocation or "", "seed": seed, "label": label,
+                              "status": status, "tuples": count_tuples(bitmap), "binary_hash": binary_hash,
+                              "seed_stamp": seed_stamp(seed), "offset": offset, "length": len(record)}
+        return row
+
+    def _record(self, row: int) -> bytes:
+        with self._lock:
+            self.bitmaps.flush()
+            return os.pread(self.bitmaps.fileno(), self.rows[row]["length"], self.rows[row]["offset"])
+
+    def _sparse(self, row: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+        return decode_bitmap(self._record(row))
+
+    def _dense(self, row: int) -> np.ndarray:
+        bitmap = np.zeros(MAP_SIZE, dtype=np.uint8)
+        edges, buckets = self._sparse(row)
+        bitmap[edges] = buckets
+        return bitmap
+
+    def get(self, binary: str, invocation: str, seed: str) -> typing.Optional[np.ndarray]:
+        row = self.keys.get((binary, invocation or "", seed))
+        return None if row is None else self._dense(row)
+
+    def status(self, binary: str, invocation: str, seed: str) -> typing.Optional[int]:
+        row = self.keys.get((binary, invocation or "", seed))
+        return None if row is None else self.rows[row]["status"]
+
+    def forget_stale(self, binary: str, binary_hash: str) -> int:
+        """
+        Deletes the rows of the binary that were traced on another build of it (or without a hash),
+        or with a seed that changed since. This renumbers the rows.
+        :return: The number of deleted rows.
+        """
+        with self._lock:
+            kept = [row for row in self.rows
+                    if row["binary"] != binary
+                    or (row.get("binary_hash") == binary_hash and row.get("seed_stamp") == seed_stamp(row["seed"]))]
+            deleted = len(self.rows) - len(kept)
+            if deleted:
+                self.rows = kept
+                self._index_keys()
+        return deleted
+
+    def select(self, binary: str = None, invocation: str = None, label: str = None, seeds: typing.Iterable[str] = None,
+               status: typing.Optional[int] = STATUS_OK) -> typing.List[int]:
+        """
+        :return: The rows matching all given criteria. status=None selects rows of any status.
+        """
+        seeds = set(seeds) if seeds is not None else None
+        return [i for i, row in enumerate(self.rows)
+                if (binary is None or row["binary"] == binary)
+                and (invocation is None or row["invocation"] == (invocation or ""))
+                and (label is None or row["label"] == label)
+                and (seeds is None or row["seed"] in seeds)
+                and (status is None or row["status"] == status)]
+
+    def union(self, rows: typing.List[int]) -> np.ndarray:
+        """
+        :return: The bitmap of all tuples hit by any of the rows.
+        """
+        result = np.zeros(MAP_SIZE, dtype=np.uint8)
+        for row in rows:
+            edges, buckets = self._sparse(row)
+            result[edges] |= buckets
+        return result
+
+    def intersection(self, rows: typing.List[int]) -> np.ndarray:
+        """
+        :return: The bitmap of the tuples hit by all of the rows (empty for no rows).
+        """
+        if not rows:
+            return np.zeros(MAP_SIZE, dtype=np.uint8)
+        result = self._dense(rows[0])
+        for row in rows[1:]:
+            np.bitwise_and(result, self._dense(row), out=result)
+        return result
+
+    def novelty(self, rows: typing.List[int], baseline_rows: typing.List[int]) -> np.ndarray:
+        """
+        :return: The bitmap of the tuples hit by the rows, but by none of the baseline rows.
+        """
+        return np.bitwise_and(self.union(rows), np.invert(self.union(baseline_rows)))
+
+    def coverage(self, rows: typing.List[int]) -> int:
+        """
+        :return: The number of unique tuples of the rows, what afl-cmin reports for these seeds.
+        """
+        return count_tuples(self.union(rows))
+
+    def coverage_per_label(self, binary: str, invocation: str) -> typing.Dict[str, int]:
+        """
+        :return: For every label of the binary and invocation, the number of unique tuples of its seeds.
+        """
+        rows_per_label = {}
+        for row in self.select(binary=binary, invocation=invocation):
+            rows_per_label.setdefault(self.rows[row]["label"], []).append(row)
+        return {label: self.coverage(rows) for label, rows in rows_per_label.items()}
+
+    def novelty_per_label(self, binary: str, invocation: str) -> typing.Dict[str, int]:
+        """
+        :return: For every label, the number of tuples only its seeds hit (compared to all other labels).
+        """
+        rows_per_label = {}
+        for row in self.select(binary=binary, invocation=invocation):
+            rows_per_label.setdefault(self.rows[row]["label"], []).append(row)
+        unions = {label: self.union(rows) for label, rows in rows_per_label.items()}
+        novelty = {}
+        for label, union in unions.items():
+            others = np.zeros(MAP_SIZE, dtype=np.uint8)
+            for other_label, other_union in unions.items():
+                if other_label != label:
+                    np.bitwise_or(others, other_union, out=others)
+            novelty[label] = count_tuples(np.bitwise_and(union, np.invert(others)))
+        return novelty
+
+    def _compact(self):
+        """
+        Rewrites the bitmaps file with only the records of the rows, dropping deleted and replaced ones.
+        """
+        tmp_bitmaps_path = self.bitmaps_path + ".tmp"
+        with open(tmp_bitmaps_path, "wb") as fp:
+            for row in range(len(self.rows)):
+                record = self._record(row)
+                self.rows[row]["offset"] = fp.tell()
+                fp.write(record)
+        self.bitmaps.close()
+        os.replace(tmp_bitmaps_path, self.bitmaps_path)
+        self.bitmaps = open(self.bitmaps_path, "a+b")
+
+    def flush(self):
+        """
+        Writes the bitmaps and the index to disk.
+        """
+        with self._lock:
+            self.bitmaps.flush()
+            garbage = os.path.getsize(self.bitmaps_path) - sum(row["length"] for row in self.rows)
+            if garbage > COMPACT_MIN_GARBAGE and garbage * 2 > os.path.getsize(self.bitmaps_path):
+                self._compact()
+            tmp_index_path = self.index_path + ".tmp"
+            with open(tmp_index_path, "w") as fp:
+                json.dump({"version": STORE_VERSION, "map_size": MAP_SIZE, "rows": self.rows}, fp)
+            os.replace(tmp_index_path, self.index_path)
+
+    def close(self):
+        if self.bitmaps is not None:
+            self.flush()
+            self.bitmaps.close()
+            self.bitmaps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -2,6 +2,7 @@ import argparse
 import json
 import sys
 import time
+import typing
 import uuid
 
 import os
@@ -13,24 +14,29 @@ os.sys.path.insert(0, parentdir)
 from configfinder import config_settings
 
 
-def build_and_commit(package: str, fuzzer_image: str, json_output_path: str = None, qemu=False, timeout=None) -> str:
+def build_and_commit(package: str, fuzzer_image: str, json_output_path: str = None, qemu=False, timeout=None,
+                     resource_args: typing.List[str] = None) -> str:
     """
     This builds a package inside a docker container and then commits the container to an image.
+    :param resource_args: The docker run arguments limiting the cores and memory of the build,
+                          see helpers.resource_manager.Allocation.docker_args. Defaults to --cpus=0.90.
     :return: 
     """
+    if resource_args is None:
+        resource_args = ['--cpus=0.90']
     start = time.time()
     docker_image_name = package + "_" + str(uuid.uuid4())[:8]
     docker_container_name = str(uuid.uuid4())
     try:
         if not qemu:
-            build_process = docker.run('--cpus=0.90', "--privileged", "--name", docker_container_name, "--entrypoint",
+            build_process = docker.run(*resource_args, "--privileged", "--name", docker_container_name, "--entrypoint",
                                        "python", fuzzer_image, "/inputinferer/configfinder/builder_wrapper.py", "-p",
                                        package, _out=sys.stdout, _ok_code=[config_settings.BUILDER_BUILD_NORMAL,
                                                                            config_settings.BUILDER_BUILD_FAILED,
                                                                            config_settings.BUILDER_BUILD_QEMU],
                                        _timeout=timeout)  # type: sh.RunningCommand
         else:
-            build_process = docker.run('--cpus=0.90', "--privileged", "--name", docker_container_name, "--entrypoint",
+            build_process = docker.run(*resource_args, "--privileged", "--name", docker_container_name, "--entrypoint",
                                        "python", fuzzer_image, "/inputinferer/configfinder/builder_wrapper.py",
                                        "-p", package, "-Q",
                                        _out=sys.stdout,
@@ -61,18 +67,22 @@ def build_and_commit(package: str, fuzzer_image: str, json_output_path: str = No
     return docker_image_name
 
 
+def package_image_exists(package_image: str) -> bool:
+    output = str(docker.images(package_image))
+    print(output.split("\n"))
+    return len(output.split("\n")) > 2
+
+
 def return_current_package_image(package: str, fuzzer_image: str, package_image: str, json_output_path: str = None,
-                                 qemu=False, timeout=None) -> str:
+                                 qemu=False, timeout=None, resource_args: typing.List[str] = None) -> str:
     """
     Checks if the current package_image still exists and if not creates a new one.
     """
-    output = str(docker.images(package_image))
-    print(output.split("\n"))
-    if len(output.split("\n")) > 2:
+    if package_image_exists(package_image):
         return package_image
     else:
         return build_and_commit(package, fuzzer_image=fuzzer_image, json_output_path=json_output_path, qemu=qemu,
-                                timeout=timeout)
+                                timeout=timeout, resource_args=resource_args)
 
 
 def get_image_or_store_in_buildfile(package: str, fuzzer_image, buildfile_path: str, qemu=False):
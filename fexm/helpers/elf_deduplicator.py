@@ -1,7 +1,10 @@
-import uuid
-
 import hashlib
 import os
+import typing
+from multiprocessing.pool import ThreadPool
+
+from helpers.elf_reader import ElfReader, SHF_ALLOC
+from helpers.exceptions import InvalidElfFile
 
 
 class ElfDeDuplicator:
@@ -20,40 +23,74 @@ class ElfDeDuplicator:
         return hash_md5.hexdigest()
 
     @staticmethod
-    def calculate_stripped_md5_hash(elf_path):
-        from sh import strip
-        tmp_elf_path = os.path.join("/tmp", str(uuid.uuid4()))
-        strip([elf_path, "-o", tmp_elf_path])
-        return ElfDeDuplicator.md5(tmp_elf_path)
+    def calculate_section_hash(elf_path):
+        """
+        Hashes the loadable (SHF_ALLOC) sections of the binary.
+        strip only removes non-loadable sections (symbols, debug info), so a binary and its stripped version
+        get the same hash - without writing a stripped copy to disk.
+        Files without section headers are hashed completely.
+        """
+        try:
+            with ElfReader(elf_path) as reader:
+                alloc_sections = [s for s in reader.sections if s.flags & SHF_ALLOC]
+                if not alloc_sections:
+                    return ElfDeDuplicator.md5(elf_path)
+                hash_md5 = hashlib.md5()
+                for section in alloc_sections:
+                    hash_md5.update("{0}:{1}:{2}:{3}:{4}\n".format(section.name, section.type, section.flags,
+                                                                   section.addr, section.size).encode("utf-8"))
+                    hash_md5.update(reader.section_data(section))
+                return hash_md5.hexdigest()
+        except InvalidElfFile:
+            return ElfDeDuplicator.md5(elf_path)
 
     @staticmethod
     def is_binary_stripped(elf_path):
-        from sh import file
-        result = file(elf_path)
-        if "not stripped" in result:
-            return False
-        else:
+        try:
+            with ElfReader(elf_path) as reader:
+                return reader.is_stripped()
+        except InvalidElfFile:
             return True
 
     @staticmethod
-    def deduplicate_binaries(elf_binary_list):
+    def find_duplicate_groups(elf_binary_list, cores: int = None) -> typing.List[typing.List[str]]:
+        """
+        Groups the binaries by the hash of their loadable sections, hashing them in parallel.
+        :param elf_binary_list: The list of elf binaries
+        :param cores: The number of binaries hashed in parallel. Defaults to the number of cpus.
+        :return: A list of groups, every group is a sorted list of binaries that are duplicates of each other.
+                 The groups keep the order of elf_binary_list.
+        """
+        elf_binary_list = list(elf_binary_list)
+        if not elf_binary_list:
+            return []
+        if not cores:
+            cores = os.cpu_count() or 1
+        with ThreadPool(processes=max(1, min(cores, len(elf_binary_list)))) as pool:
+            hashes = pool.map(ElfDeDuplicator.calculate_section_hash, elf_binary_list)
+        hashdict = {}  # Key: hash of the loadable sections, value: list of binaries with this hash
+        for e, section_hash in zip(elf_binary_list, hashes):
+            hashdict.setdefault(section_hash, []).append(e)
+        return [sorted(binary_list) for binary_list in hashdict.values()]
+
+    @staticmethod
+    def representative(duplicate_group: typing.List[str]) -> str:
+        """
+        :return: The binary that stands for the whole group: The first unstripped binary, if there is one.
+        """
+        if len(duplicate_group) == 1:
+            return duplicate_group[0]
+        for b in duplicate_group:
+            if not ElfDeDuplicator.is_binary_stripped(b):
+                return b
+        return duplicate_group[0]
+
+    @staticmethod
+    def deduplicate_binaries(elf_binary_list, cores: int = None):
         """
         :param elf_binary_list: The list of elf binaries
+        :param cores: The number of binaries hashed in parallel.
+        :return: One binary per duplicate group.
         """
-        rhashdict = {}  # Key: md5hash of stripped version, value list of binaries where the stripped version has this md5has
-        result_list = []
-        for e in elf_binary_list:
-            stripped_elf_md5_hash = ElfDeDuplicator.calculate_stripped_md5_hash(e)
-            if rhashdict.get(stripped_elf_md5_hash):
-                rhashdict[stripped_elf_md5_hash].append(e)
-            else:
-                rhashdict[stripped_elf_md5_hash] = [e]
-        for md5_hash, binary_list in rhashdict.items():
-            if len(binary_list) == 1:
-                result_list.append(binary_list[0])
-            elif len(binary_list) > 1:
-                for b in binary_list:
-                    if not ElfDeDuplicator.is_binary_stripped(b):
-                        result_list.append(b)
-                        continue
-        return result_list
+        return [ElfDeDuplicator.representative(group)
+                for group in ElfDeDuplicator.find_duplicate_groups(elf_binary_list, cores=cores)]
@@ -0,0 +1,464 @@
+import glob
+import os
+import struct
+import typing
+
+import numpy as np
+
+from helpers.exceptions import InvalidElfFile
+
+ELF_MAGIC = b"\x7fELF"
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+EM_386 = 3
+EM_X86_64 = 62
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_DYNAMIC = 6
+SHT_NOBITS = 8
+SHT_REL = 9
+SHT_DYNSYM = 11
+
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+AFL_AREA_PTR_SYMBOL = "__afl_area_ptr"
+ASAN_INIT_SYMBOL = "__asan_init"
+
+DEFAULT_LIBRARY_DIRECTORIES = ["/lib", "/usr/lib", "/lib64", "/usr/lib64",
+                               "/lib/x86_64-linux-gnu", "/usr/lib/x86_64-linux-gnu",
+                               "/usr/local/lib"]
+
+
+class Section:
+    def __init__(self, name: str, type: int, flags: int, addr: int, offset: int, size: int, link: int,
+                 info: int, entsize: int):
+        self.name = name
+        self.type = type
+        self.flags = flags
+        self.addr = addr
+        self.offset = offset
+        self.size = size
+        self.link = link
+        self.info = info
+        self.entsize = entsize
+
+
+class Segment:
+    def __init__(self, type: int, offset: int, vaddr: int, filesz: int):
+        self.type = type
+        self.offset = offset
+        self.vaddr = vaddr
+        self.filesz = filesz
+
+
+class ElfReader:
+    """
+    Reads the parts of an elf binary we need for triage (headers, sections, symbols and dynamic entries)
+    directly from the file, instead of spawning file, ldd, readelf or objdump for it.
+    Only the requested parts of the file are read, everything is parsed lazily and cached.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The path to the elf binary.
+        :raises InvalidElfFile: If the file is not an elf binary or its headers are malformed.
+        """
+        self.path = path
+        self._fp = open(path, "rb")
+        self._file_size = os.fstat(self._fp.fileno()).st_size
+        try:
+            self._parse_header()
+            self._sections = None  # type: typing.List[Section]
+            self._segments = None  # type: typing.List[Segment]
+            self._symbols = None  # type: typing.Dict[str, int]
+            self._dynamic = None  # type: typing.List[typing.Tuple[int, int]]
+        except (struct.error, IndexError, ValueError) as e:
+            self.close()
+            raise InvalidElfFile(path, str(e))
+        except InvalidElfFile:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._fp.close()
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if offset < 0 or size < 0 or offset + size > self._file_size:
+            raise InvalidElfFile(self.path, "read of {0} bytes at {1} is out of bounds".format(size, offset))
+        self._fp.seek(offset)
+        return self._fp.read(size)
+
+    def _parse_header(self):
+        ident = self._read(0, 16)
+        if ident[:4] != ELF_MAGIC:
+            raise InvalidElfFile(self.path, "no elf magic")
+        self.elf_class = ident[4]
+        if self.elf_class not in (ELFCLASS32, ELFCLASS64):
+            raise InvalidElfFile(self.path, "unknown elf class {0}".format(self.elf_class))
+        if ident[5] not in (ELFDATA2LSB, ELFDATA2MSB):
+            raise InvalidElfFile(self.path, "unknown data encoding {0}".format(ident[5]))
+        self.endian = "<" if ident[5] == ELFDATA2LSB else ">"
+        if self.elf_class == ELFCLASS64:
+            header_format = "HHIQQQIHHHHHH"
+        else:
+            header_format = "HHIIIIIHHHHHH"
+        header_size = struct.calcsize(self.endian + header_format)
+        (self.type, self.machine, _, self.entry, self.phoff, self.shoff, _, _, self.phentsize, self.phnum,
+         self.shentsize, self.shnum, self.shstrndx) = struct.unpack(self.endian + header_format,
+                                                                    self._read(16, header_size))
+
+    @property
+    def is_64bit(self) -> bool:
+        return self.elf_class == ELFCLASS64
+
+    @property
+    def sections(self) -> typing.List[Section]:
+        if self._sections is None:
+            self._sections = self._parse_sections()
+        return self._sections
+
+    @property
+    def segments(self) -> typing.List[Segment]:
+        if self._segments is None:
+            self._segments = self._parse_segments()
+        return self._segments
+
+    def _parse_sections(self) -> typing.List[Section]:
+        if not self.shoff or not self.shnum:
+            return []
+        if self.is_64bit:
+            section_format = self.endian + "IIQQQQIIQQ"
+        else:
+            section_format = self.endian + "IIIIIIIIII"
+        raw_table = self._read(self.shoff, self.shnum * self.shentsize)
+        raw_sections = [struct.unpack_from(section_format, raw_table, i * self.shentsize)
+                        for i in range(self.shnum)]
+        names = b""
+        if self.shstrndx < len(raw_sections):
+            names_section = raw_sections[self.shstrndx]
+            names = self._read(names_section[4], names_section[5])
+        sections = []
+        for name, type, flags, addr, offset, size, link, info, _, entsize in raw_sections:
+            sections.append(Section(self._string_at(names, name), type, flags, addr, offset, size, link, info,
+                                    entsize))
+        return sections
+
+    def _parse_segments(self) -> typing.List[Segment]:
+        if not self.phoff or not self.phnum:
+            return []
+        segments = []
+        raw_table = self._read(self.phoff, self.phnum * self.phentsize)
+        for i in range(self.phnum):
+            if self.is_64bit:
+                type, _, offset, vaddr, _, filesz, _, _ = struct.unpack_from(self.endian + "IIQQQQQQ", raw_table,
+                                                                             i * self.phentsize)
+            else:
+                type, offset, vaddr, _, filesz, _, _, _ = struct.unpack_from(self.endian + "IIIIIIII", raw_table,
+                                                                             i * self.phentsize)
+            segments.append(Segment(type, offset, vaddr, filesz))
+        return segments
+
+    @staticmethod
+    def _string_at(string_table: bytes, offset: int) -> str:
+        end = string_table.find(b"\x00", offset)
+        if end < 0:
+            end = len(string_table)
+        return string_table[offset:end].decode("utf-8", errors="replace")
+
+    def section_by_name(self, name: str) -> typing.Optional[Section]:
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+    def section_data(self, section: Section) -> bytes:
+        """
+        :return: The content of the section in the file, empty for sections without file content (.bss).
+        """
+        if section.type == SHT_NOBITS:
+            return b""
+        return self._read(section.offset, section.size)
+
+    def _vaddr_to_offset(self, vaddr: int) -> typing.Optional[int]:
+        for segment in self.segments:
+            if segment.type == PT_LOAD and segment.vaddr <= vaddr < segment.vaddr + segment.filesz:
+                return vaddr - segment.vaddr + segment.offset
+        return None
+
+    @property
+    def symbols(self) -> typing.Dict[str, int]:
+        """
+        :return: A dict of symbol name -> symbol value for all symbols in .symtab and .dynsym.
+        """
+        if self._symbols is None:
+            self._symbols = {}
+            for section in self.sections:
+                if section.type not in (SHT_SYMTAB, SHT_DYNSYM) or section.link >= len(self.sections):
+                    continue
+                self._symbols.update(self._parse_symbol_table(section))
+        return self._symbols
+
+    def _parse_symbol_table(self, section: Section) -> typing.Dict[str, int]:
+        if self.is_64bit:
+            symbol_format = self.endian + "IBBHQQ"
+        else:
+            symbol_format = self.endian + "IIIBBH"
+        entsize = section.entsize or struct.calcsize(symbol_format)
+        data = self.section_data(section)
+        names = self.section_data(self.sections[section.link])
+        symbols = {}
+        for i in range(len(data) // entsize):
+            entry = struct.unpack_from(symbol_format, data, i * entsize)
+            name, value = entry[0], (entry[4] if self.is_64bit else entry[1])
+            if name:
+                symbol_name = self._string_at(names, name)
+                # Keep defined symbols over undefined imports of the same name.
+                if value or symbol_name not in symbols:
+                    symbols[symbol_name] = value
+        return symbols
+
+    @property
+    def dynamic_entries(self) -> typing.List[typing.Tuple[int, int]]:
+        """
+        :return: The (tag, value) pairs of the dynamic section.
+        """
+        if self._dynamic is None:
+            self._dynamic = []
+            data = b""
+            dynamic_section = next((s for s in self.sections if s.type == SHT_DYNAMIC), None)
+            if dynamic_section:
+                data = self.section_data(dynamic_section)
+            else:  # Section headers might be missing, use the program headers instead
+                dynamic_segment = next((s for s in self.segments if s.type == PT_DYNAMIC), None)
+                if dynamic_segment:
+                    data = self._read(dynamic_segment.offset, dynamic_segment.filesz)
+            entry_format = self.endian + ("qQ" if self.is_64bit else "iI")
+            entry_size = struct.calcsize(entry_format)
+            for i in range(len(data) // entry_size):
+                tag, value = struct.unpack_from(entry_format, data, i * entry_size)
+                if tag == DT_NULL:
+                    break
+                self._dynamic.append((tag, value))
+        return self._dynamic
+
+    def _dynamic_string_table(self) -> bytes:
+        dynstr = self.section_by_name(".dynstr")
+        if dynstr:
+            return self.section_data(dynstr)
+        strtab_address = next((value for tag, value in self.dynamic_entries if tag == DT_STRTAB), None)
+        if strtab_address is None:
+            return b""
+        offset = self._vaddr_to_offset(strtab_address)
+        if offset is None:
+            return b""
+        return self._read(offset, min(self._file_size - offset, 1024 * 1024))
+
+    def _dynamic_strings(self, wanted_tag: int) -> typing.List[str]:
+        entries = [value for tag, value in self.dynamic_entries if tag == wanted_tag]
+        if not entries:
+            return []
+        string_table = self._dynamic_string_table()
+        return [self._string_at(string_table, value) for value in entries]
+
+    def needed_libraries(self) -> typing.List[str]:
+        """
+        :return: The DT_NEEDED entries of the binary, i.e. the libraries it links directly.
+        """
+        return self._dynamic_strings(DT_NEEDED)
+
+    def library_search_paths(self) -> typing.List[str]:
+        """
+        :return: The DT_RUNPATH/DT_RPATH entries of the binary, $ORIGIN already expanded.
+        """
+        origin = os.path.dirname(os.path.realpath(self.path))
+        paths = []
+        for tag in (DT_RUNPATH, DT_RPATH):
+            for entry in self._dynamic_strings(tag):
+                for path in entry.split(":"):
+                    if path:
+                        paths.append(path.replace("${ORIGIN}", origin).replace("$ORIGIN", origin))
+        return paths
+
+    def interpreter(self) -> typing.Optional[str]:
+        """
+        :return: The program interpreter (PT_INTERP), None for static binaries.
+        """
+        for segment in self.segments:
+            if segment.type == PT_INTERP:
+                return self._read(segment.offset, segment.filesz).rstrip(b"\x00").decode("utf-8",
+                                                                                          errors="replace")
+        return None
+
+    def is_stripped(self) -> bool:
+        """
+        Same semantics as file(1): A binary is stripped if it does not have a .symtab section.
+        """
+        return not any(section.type == SHT_SYMTAB for section in self.sections)
+
+    def has_symbol(self, name: str) -> bool:
+        return name in self.symbols
+
+    def uses_asan(self) -> bool:
+        """
+        :return: True if the binary links libasan or contains the (static) asan runtime.
+        """
+        from helpers import constants
+        if any(constants.ASAN_LIBRARY_STRING in library for library in self.needed_libraries()):
+            return True
+        return self.has_symbol(ASAN_INIT_SYMBOL)
+
+    def _afl_area_ptr_locations(self) -> typing.List[int]:
+        """
+        :return: The addresses an instrumentation site references to get the afl area pointer:
+                 The symbol itself and, for position independent code, the GOT slot pointing to it.
+        """
+        locations = []
+        symbol_address = self.symbols.get(AFL_AREA_PTR_SYMBOL)
+        if symbol_address:
+            locations.append(symbol_address)
+        for section in self.sections:
+            if section.type not in (SHT_RELA, SHT_REL) or section.link >= len(self.sections):
+                continue
+            symbol_table = self.sections[section.link]
+            if symbol_table.type not in (SHT_SYMTAB, SHT_DYNSYM):
+                continue
+            locations.extend(self._relocation_targets_for_symbol(section, symbol_table, AFL_AREA_PTR_SYMBOL))
+        return locations
+
+    def _relocation_targets_for_symbol(self, section: Section, symbol_table: Section, name: str) -> typing.List[int]:
+        if self.is_64bit:
+            relocation_format = self.endian + ("QQq" if section.type == SHT_RELA else "QQ")
+            symbol_format, symbol_index_shift = self.endian + "IBBHQQ", 32
+        else:
+            relocation_format = self.endian + ("IIi" if section.type == SHT_RELA else "II")
+            symbol_format, symbol_index_shift = self.endian + "IIIBBH", 8
+        symbol_size = symbol_table.entsize or struct.calcsize(symbol_format)
+        symbols = self.section_data(symbol_table)
+        names = self.section_data(self.sections[symbol_table.link])
+        relocation_size = section.entsize or struct.calcsize(relocation_format)
+        data = self.section_data(section)
+        targets = []
+        for i in range(len(data) // relocation_size):
+            entry = struct.unpack_from(relocation_format, data, i * relocation_size)
+            symbol_index = entry[1] >> symbol_index_shift
+            if not symbol_index or (symbol_index + 1) * symbol_size > len(symbols):
+                continue
+            symbol_name = struct.unpack_from(self.endian + "I", symbols, symbol_index * symbol_size)[0]
+            if self._string_at(names, symbol_name) == name:
+                targets.append(entry[0])
+        return targets
+
+    def count_instrumentation_sites(self) -> typing.Optional[int]:
+        """
+        Counts the references to __afl_area_ptr in the executable sections.
+        On x86_64 those are rip relative displacements, on x86 absolute addresses.
+        :return: The number of instrumentation sites, None if the architecture is not supported.
+        """
+        if self.machine not in (EM_X86_64, EM_386):
+            return None
+        locations = self._afl_area_ptr_locations()
+        if not locations:
+            return 0
+        locations = np.array(locations, dtype=np.int64)
+        number_of_sites = 0
+        for section in self.sections:
+            if not section.flags & SHF_EXECINSTR or section.type == SHT_NOBITS or section.size < 4:
+                continue
+            data = self.section_data(section)
+            for alignment in range(4):
+                # Interpret every 4 bytes (for all 4 alignments) as a potential displacement/address.
+                usable = (len(data) - alignment) // 4 * 4
+                values = np.frombuffer(data, dtype=np.dtype(self.endian + "i4"), count=usable // 4,
+                                       offset=alignment).astype(np.int64)
+                if self.machine == EM_X86_64:
+                    # The instruction ends after the displacement for loads of __afl_area_ptr.
+                    positions = section.addr + alignment + 4 + 4 * np.arange(len(values), dtype=np.int64)
+                    targets = positions + values
+                else:
+                    targets = values & 0xffffffff
+                number_of_sites += int(np.isin(targets, locations).sum())
+        return number_of_sites
+
+
+def _library_directories_from_ld_so_conf(conf_path: str = "/etc/ld.so.conf", depth: int = 0) -> typing.List[str]:
+    directories = []
+    if depth > 4 or not os.path.isfile(conf_path):
+        return directories
+    with open(conf_path) as fp:
+        for line in fp:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith("include"):
+                pattern = line.split(None, 1)[1] if len(line.split(None, 1)) > 1 else ""
+                if not os.path.isabs(pattern):
+                    pattern = os.path.join(os.path.dirname(conf_path), pattern)
+                for included in sorted(glob.glob(pattern)):
+                    directories.extend(_library_directories_from_ld_so_conf(included, depth + 1))
+            else:
+                directories.append(line)
+    return directories
+
+
+def _find_library(name: str, search_paths: typing.List[str]) -> typing.Optional[str]:
+    if "/" in name:
+        return name if os.path.isfile(name) else None
+    for directory in search_paths:
+        candidate = os.path.join(directory, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def resolve_libraries(path: str) -> typing.List[str]:
+    """
+    Resolves the libraries of an elf binary transitively, like ldd would, but without running the loader.
+    Libraries that can not be found are still reported by name.
+    :param path: The path to the elf binary.
+    :return: The names of all (transitively) linked libraries.
+    :raises InvalidElfFile: If the binary itself can not be parsed.
+    """
+    with ElfReader(path) as reader:
+        pending = reader.needed_libraries()
+        binary_search_paths = reader.library_search_paths()
+    environment_paths = [p for p in os.environ.get("LD_LIBRARY_PATH", "").split(":") if p]
+    system_paths = _library_directories_from_ld_so_conf() + DEFAULT_LIBRARY_DIRECTORIES
+    libraries = []
+    seen = set()
+    while pending:
+        name = pending.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        libraries.append(name)
+        library_path = _find_library(name, binary_search_paths + environment_paths + system_paths)
+        if not library_path:
+            continue
+        try:
+            with ElfReader(library_path) as library:
+                pending.extend(library.needed_libraries())
+        except (InvalidElfFile, OSError):
+            continue
+    return libraries
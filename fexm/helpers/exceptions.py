@@ -19,3 +19,21 @@ class NoCoverageInformation(BaseException):
 
     def __str__(self):
         return "Could not get any coverage information for " + str(self.binary_path)
+
+
+class InvalidElfFile(Exception):
+    def __init__(self, path, reason=""):
+        self.path = path
+        self.reason = reason
+
+    def __str__(self):
+        return "Could not parse the elf file {0}: {1}".format(self.path, self.reason)
+
+
+class ForkserverError(Exception):
+    def __init__(self, binary_path, reason=""):
+        self.binary_path = binary_path
+        self.reason = reason
+
+    def __str__(self):
+        return "Forkserver for {0} failed: {1}".format(self.binary_path, self.reason)
@@ -0,0 +1,75 @@
+"""
+Checkpoints of time sliced afl sessions: How many slices a session ran, for how long,
+and whether afl stopped gracefully at the end of the last one (so its queue and stats are consistent).
+A slice is marked unclean when it begins, so a session that was killed (e.g. by docker after the stop grace period)
+stays unclean. Such a session is reseeded when it is resumed.
+"""
+import json
+import time
+import typing
+
+import os
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def checkpoint_path(afl_out_dir: str) -> str:
+    """
+    The checkpoint lives next to the output directory, afl owns the directory itself.
+    """
+    return os.path.normpath(afl_out_dir) + CHECKPOINT_SUFFIX
+
+
+def read_checkpoint(afl_out_dir: str) -> typing.Dict[str, typing.Any]:
+    """
+    :return: The checkpoint of the session, empty if it was never stopped at a slice boundary.
+    """
+    try:
+        with open(checkpoint_path(afl_out_dir)) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_checkpoint(afl_out_dir: str, checkpoint: typing.Dict[str, typing.Any]):
+    path = checkpoint_path(afl_out_dir)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as fp:
+        json.dump(checkpoint, fp)
+    os.replace(path + ".tmp", path)
+
+
+def begin_slice(afl_out_dir: str) -> typing.Dict[str, typing.Any]:
+    """
+    Records that afl was started for a slice. Until write_checkpoint, the session counts as not stopped cleanly.
+    :return: The new checkpoint.
+    """
+    checkpoint = read_checkpoint(afl_out_dir)
+    checkpoint["last_start"] = time.time()
+    checkpoint["clean"] = False
+    _store_checkpoint(afl_out_dir, checkpoint)
+    return checkpoint
+
+
+def write_checkpoint(afl_out_dir: str, fuzzing_time: float, clean: bool) -> typing.Dict[str, typing.Any]:
+    """
+    Records that a slice of the session ended.
+    :param fuzzing_time: How long afl ran in this slice.
+    :param clean: Whether afl stopped gracefully (its queue and stats are consistent).
+    :return: The new checkpoint.
+    """
+    checkpoint = read_checkpoint(afl_out_dir)
+    checkpoint["slices"] = checkpoint.get("slices", 0) + 1
+    checkpoint["fuzzing_time"] = checkpoint.get("fuzzing_time", 0) + fuzzing_time
+    checkpoint["last_stop"] = time.time()
+    checkpoint["clean"] = clean
+    _store_checkpoint(afl_out_dir, checkpoint)
+    return checkpoint
+
+
+def stopped_cleanly(afl_out_dir: str) -> bool:
+    """
+    :return: False if afl did not stop gracefully at the end of the last slice (it failed or was killed),
+             True otherwise, also for sessions that were never sliced.
+    """
+    return read_checkpoint(afl_out_dir).get("clean", True)
@@ -0,0 +1,152 @@
+"""
+A minimal inotify binding (via ctypes, Linux only), so managers can react to changes in the results directory
+instead of rescanning it periodically.
+"""
+import ctypes
+import ctypes.util
+import errno
+import select
+import struct
+import typing
+
+import os
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000  # Events were lost, the watcher has to rescan
+IN_IGNORED = 0x00008000  # The watch was removed
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Files written in place (json.dump into an open file) and files renamed into place
+DEFAULT_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len of the name
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def available() -> bool:
+    try:
+        return hasattr(_load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class InotifyEvent(object):
+    def __init__(self, path: typing.Optional[str], mask: int):
+        """
+        :param path: The path the event is about, None for IN_Q_OVERFLOW.
+        """
+        self.path = path
+        self.mask = mask
+
+    @property
+    def is_dir(self) -> bool:
+        return bool(self.mask & IN_ISDIR)
+
+    @property
+    def overflow(self) -> bool:
+        return bool(self.mask & IN_Q_OVERFLOW)
+
+    def __repr__(self):
+        return "InotifyEvent({0!r}, {1:#x})".format(self.path, self.mask)
+
+
+class Inotify(object):
+    def __init__(self):
+        """
+        :raises OSError: If inotify is not available.
+        """
+        libc = _load_libc()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # type: typing.Dict[int, str]
+        self.watch_descriptors = {}  # type: typing.Dict[str, int]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: str, mask: int = DEFAULT_MASK) -> int:
+        """
+        Watches the directory (not recursively).
+        :raises OSError: If the path can not be watched, e.g. because it does not exist
+                         or fs.inotify.max_user_watches is reached.
+        """
+        wd = _load_libc().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, "inotify_add_watch failed for {0}: {1}".format(path, os.strerror(error)))
+        self.watches[wd] = path
+        self.watch_descriptors[path] = wd
+        return wd
+
+    def remove_watch(self, path: str):
+        wd = self.watch_descriptors.pop(path, None)
+        if wd is not None:
+            self.watches.pop(wd, None)
+            _load_libc().inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float = None) -> typing.List[InotifyEvent]:
+        """
+        Waits up to timeout seconds (forever for None) for events.
+        :return: The events, empty on timeout.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                events.append(InotifyEvent(None, mask))
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                self.watch_descriptors.pop(directory, None)
+                continue
+            events.append(InotifyEvent(os.path.join(directory, os.fsdecode(name)) if name else directory, mask))
+        return events
+
+    def close(self):
+        if self.fd is not None and self.fd >= 0:
+            os.close(self.fd)
+        self.fd = None
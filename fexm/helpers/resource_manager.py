@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Keeps track of the cores and the memory of the host the celery workers run on, so containers get exclusive cores
+(--cpuset-cpus) and a memory limit instead of sharing all cores with --cpus.
+The allocations of all worker processes on the host are kept in a json state file that is locked (flock) while it is
+read and written. Allocations of processes that died are released on the next acquire.
+Cores of a task are taken from a single NUMA node when possible.
+"""
+import argparse
+import contextlib
+import fcntl
+import glob
+import json
+import time
+import typing
+import uuid
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder import config_settings
+
+
+def parse_cpu_list(cpu_list: str) -> typing.List[int]:
+    """
+    :param cpu_list: A cpu list as in /sys (and --cpuset-cpus), e.g. "0-3,8,10-11".
+    """
+    cpus = []
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpu_list(cpus: typing.Iterable[int]) -> str:
+    """
+    :return: The cpus as ranges, e.g. "0-3,8".
+    """
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(first) if first == last else "{0}-{1}".format(first, last) for first, last in ranges)
+
+
+def host_cpus() -> typing.List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def host_memory() -> int:
+    """
+    :return: The physical memory of the host in bytes.
+    """
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def numa_nodes(node_dir: str = "/sys/devices/system/node") -> typing.Dict[int, typing.List[int]]:
+    """
+    :return: The cpus per NUMA node, a single node 0 with all cpus if the host does not expose NUMA nodes.
+    """
+    nodes = {}
+    for cpu_list_path in glob.glob(os.path.join(node_dir, "node[0-9]*", "cpulist")):
+        node = int(os.path.basename(os.path.dirname(cpu_list_path))[len("node"):])
+        try:
+            with open(cpu_list_path) as fp:
+                cpus = parse_cpu_list(fp.read())
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes[node] = cpus
+    if not nodes:
+        nodes[0] = host_cpus()
+    return nodes
+
+
+class Allocation(object):
+    def __init__(self, allocation_id: str, cpus: typing.List[int], memory: int, mems: typing.List[int] = None):
+        """
+        :param memory: The memory limit in bytes, 0 for none.
+        :param mems: The NUMA nodes the memory should come from, None for any.
+        """
+        self.allocation_id = allocation_id
+        self.cpus = cpus
+        self.memory = memory
+        self.mems = mems
+
+    @property
+    def cpuset(self) -> str:
+        return format_cpu_list(self.cpus)
+
+    def docker_args(self) -> typing.List[str]:
+        """
+        :return: The docker run arguments that confine the container to the allocation.
+                 afl must not bind itself to cores (it would pick cores outside of the cpuset).
+        """
+        args = ["--cpuset-cpus=" + self.cpuset, "-e", "AFL_NO_AFFINITY=1"]
+        if self.mems is not None:
+            args.append("--cpuset-mems=" + format_cpu_list(self.mems))
+        if self.memory:
+            args.append("--memory={0}b".format(self.memory))
+        return args
+
+    def container_kwargs(self) -> typing.Dict[str, typing.Any]:
+        """
+        :return: The arguments of docker_client.containers.run that confine the container to the allocation.
+        """
+        kwargs = {"cpuset_cpus": self.cpuset}
+        if self.mems is not None:
+            kwargs["cpuset_mems"] = format_cpu_list(self.mems)
+        if self.memory:
+            kwargs["mem_limit"] = self.memory
+        return kwargs
+
+    def __repr__(self):
+        return "Allocation({0}, cpus={1}, memory={2})".format(self.allocation_id, self.cpuset, self.memory)
+
+
+class ResourceManager(object):
+    def __init__(self, state_path: str = None, cpus: typing.List[int] = None, memory: int = None,
+                 nodes: typing.Dict[int, typing.List[int]] = None, reserved_memory: int = None):
+        """
+        :param state_path: The json file with the allocations, defaults to config_settings.RESOURCE_STATE_FILE.
+        :param cpus: The cpus to hand out, defaults to the cpus this process may run on.
+        :param memory: The memory to hand out in bytes, defaults to the physical memory minus reserved_memory.
+        :param nodes: The cpus per NUMA node, defaults to the nodes of the host.
+        :param reserved_memory: Memory left to the host, defaults to config_settings.RESOURCE_RESERVED_MEMORY.
+        """
+        self.state_path = state_path or config_settings.RESOURCE_STATE_FILE
+        self.cpus = sorted(cpus if cpus is not None else host_cpus())
+        if reserved_memory is None:
+            reserved_memory = config_settings.RESOURCE_RESERVED_MEMORY
+        self.memory = memory if memory is not None else max(0, host_memory() - reserved_memory)
+        nodes = nodes if nodes is not None else numa_nodes()
+        cpu_set = set(self.cpus)
+        self.nodes = {node: [cpu for cpu in node_cpus if cpu in cpu_set] for node, node_cpus in nodes.items()}
+        self.nodes = {node: node_cpus for node, node_cpus in self.nodes.items() if node_cpus}
+        if not self.nodes:
+            self.nodes = {0: list(self.cpus)}
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        """
+        Yields the allocations (allocation id -> dict), written back when the block is left.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with open(self.state_path, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                fp.seek(0)
+                try:
+                    allocations = json.loads(fp.read() or "{}")
+                except ValueError:
+                    allocations = {}
+                yield allocations
+                fp.seek(0)
+                fp.truncate()
+                json.dump(allocations, fp)
+                fp.flush()
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _pick_cpus(self, free_cpus: typing.Set[int], cores: int) -> typing.Tuple[typing.List[int], typing.List[int]]:
+        """
+        Prefers the NUMA node with the fewest free cores that still fits all cores (keeping larger blocks free),
+        otherwise spreads over the nodes with the most free cores.
+        :return: The cpus and the nodes they are on.
+        """
+        free_per_node = {node: [cpu for cpu in node_cpus if cpu in free_cpus] for node, node_cpus in self.nodes.items()}
+        fitting = [node for node, node_free in free_per_node.items() if len(node_free) >= cores]
+        if fitting:
+            node = min(fitting, key=lambda n: (len(free_per_node[n]), n))
+            return free_per_node[node][:cores], [node]
+        cpus, used_nodes = [], []
+        for node in sorted(free_per_node, key=lambda n: (-len(free_per_node[n]), n)):
+            if len(cpus) >= cores:
+                break
+            if free_per_node[node]:
+                cpus += free_per_node[node][:cores - len(cpus)]
+                used_nodes.append(node)
+        return cpus, used_nodes
+
+    def acquire(self, cores: int = 1, memory: int = 0, owner: str = None) -> typing.Optional[Allocation]:
+        """
+        :param cores: The number of exclusive cores, at most the number of cores of the host.
+        :param memory: The memory limit in bytes, at most the memory of the host, 0 for none (it is not accounted
+                       either).
+        :param owner: A description for the state file, e.g. the task.
+        :return: The allocation, None if not enough cores or memory are free right now.
+        """
+        cores = max(1, min(cores, len(self.cpus)))
+        memory = min(memory, self.memory)  # Otherwise it would never fit, e.g. BUILD_MEMORY on a small host
+        with self._locked_state() as allocations:
+            for allocation_id in [a for a, allocation in allocations.items() if not self._alive(allocation["pid"])]:
+                del allocations[allocation_id]
+            used_cpus = set(cpu for allocation in allocations.values() for cpu in allocation["cpus"])
+            used_memory = sum(allocation["memory"] for allocation in allocations.values())
+            free_cpus = set(self.cpus) - used_cpus
+            if len(free_cpus) < cores or (memory and used_memory + memory > self.memory):
+                return None
+            cpus, nodes = self._pick_cpus(free_cpus, cores)
+            allocation_id = str(uuid.uuid4())
+            allocations[allocation_id] = {"cpus": cpus, "memory": memory, "pid": os.getpid(), "owner": owner,
+                                          "created": time.time()}
+        mems = nodes if len(self.nodes) > 1 and len(nodes) == 1 else None
+        return Allocation(allocation_id, cpus, memory, mems)
+
+    def release(self, allocation: Allocation):
+        with self._locked_state() as allocations:
+            allocations.pop(allocation.allocation_id, None)
+
+    def allocations(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        with self._locked_state() as allocations:
+            return dict(allocations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the cores and memory allocated to fexm containers.")
+    parser.add_argument("-s", "--state_file", required=False, type=str, default=None,
+                        help="The state file, defaults to the one of the config settings")
+    args = parser.parse_args()
+    manager = ResourceManager(state_path=args.state_file)
+    print("{0} cores on {1} NUMA nodes, {2} MB memory".format(len(manager.cpus), len(manager.nodes),
+                                                              manager.memory // (1024 * 1024)))
+    for allocation_id, allocation in sorted(manager.allocations().items(), key=lambda item: item[1]["created"]):
+        print("{0}  pid {1:<7} cpus {2:<10} {3:>7} MB  {4}".format(allocation_id[:8], allocation["pid"],
+                                                                   format_cpu_list(allocation["cpus"]),
+                                                                   allocation["memory"] // (1024 * 1024),
+                                                                   allocation.get("owner")))
+
+
+if __name__ == "__main__":
+    main()
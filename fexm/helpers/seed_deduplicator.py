@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Finds duplicate files in large seed corpora.
+Files are grouped by size first, then by a crc32 of their first bytes and only
+then by a full blake2b hash. Hashes are remembered in an (optional) persistent index,
+keyed by (path, size, mtime, inode), so later runs only hash new or changed files.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import sqlite3
+import typing
+import zlib
+from multiprocessing.pool import ThreadPool
+
+import os
+
+logger = logging.getLogger(__name__)
+
+READ_BUFFER_SIZE = 1024 * 1024  # Read files in 1 MiB chunks
+PREHASH_SIZE = 64 * 1024  # The pre-hash covers the first 64 KiB of a file
+MMAP_THRESHOLD = 16 * 1024 * 1024  # Files above 16 MiB are mmapped for the full hash
+
+
+def prehash_file(path: str) -> int:
+    """
+    A fast, non-cryptographic hash of the beginning of the file.
+    """
+    with open(path, "rb") as fp:
+        return zlib.crc32(fp.read(PREHASH_SIZE))
+
+
+def full_hash_file(path: str) -> str:
+    """
+    The blake2b hash of the complete file.
+    """
+    hash_object = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                hash_object.update(mapped_file)
+        else:
+            for chunk in iter(lambda: fp.read(READ_BUFFER_SIZE), b""):
+                hash_object.update(chunk)
+    return hash_object.hexdigest()
+
+
+class FileIndex:
+    """
+    Persistent (path, size, mtime, inode) -> (prehash, full hash) index in a sqlite database.
+    """
+
+    def __init__(self, index_path: str):
+        index_directory = os.path.dirname(os.path.abspath(index_path))
+        os.makedirs(index_directory, exist_ok=True)
+        self.connection = sqlite3.connect(index_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, "
+                                "mtime_ns INTEGER, inode INTEGER, prehash INTEGER, full_hash TEXT)")
+
+    def lookup(self, path: str, file_stat: os.stat_result) -> typing.Tuple[typing.Optional[int],
+                                                                           typing.Optional[str]]:
+        row = self.connection.execute("SELECT size, mtime_ns, inode, prehash, full_hash FROM files WHERE path = ?",
+                                      (path,)).fetchone()
+        if row and tuple(row[:3]) == (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino):
+            return row[3], row[4]
+        return None, None
+
+    def store(self, entries: typing.List[typing.Tuple[str, os.stat_result, typing.Optional[int],
+                                                      typing.Optional[str]]]):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                [(path, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, prehash, full_hash)
+                 for path, file_stat, prehash, full_hash in entries])
+
+    def close(self):
+        self.connection.close()
+
+
+class SeedDeduplicator:
+    def __init__(self, index_path: str = None, cores: int = None):
+        """
+        :param index_path: Path to the sqlite index. Without an index, nothing is remembered between runs.
+        :param cores: The number of files hashed in parallel. Defaults to the number of cpus.
+        """
+        self.index = FileIndex(index_path) if index_path else None
+        self.cores = cores or os.cpu_count() or 1
+
+    def close(self):
+        if self.index:
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _hash_in_parallel(self, hash_function: typing.Callable, paths: typing.List[str]) -> typing.List:
+        if len(paths) < 2 or self.cores == 1:
+            return [hash_function(path) for path in paths]
+        with ThreadPool(processes=min(self.cores, len(paths))) as pool:
+            return pool.map(hash_function, paths, chunksize=max(1, len(paths) // (self.cores * 4)))
+
+    def _hashes(self, paths: typing.List[str], known: typing.Dict[str, typing.Any],
+                hash_function: typing.Callable) -> typing.Dict[str, typing.Any]:
+        """
+        Returns the hash for every path, only hashing the paths that are not known yet.
+        """
+        missing = [path for path in paths if known.get(path) is None]
+        hashes = {path: known[path] for path in paths if known.get(path) is not None}
+        for path, value in zip(missing, self._hash_in_parallel(hash_function, missing)):
+            hashes[path] = value
+        return hashes
+
+    def find_duplicate_groups(self, files_full_path: typing.Iterable[str]) -> typing.List[typing.List[str]]:
+        """
+        :param files_full_path: The files to check. Directories and inaccessible files are skipped.
+        :return: All groups of identical files (including single files), each group in input order.
+                 The groups are ordered by the position of their first file.
+        """
+        stats = {}  # type: typing.Dict[str, os.stat_result]
+        for full_path in files_full_path:
+            if full_path in stats:
+                continue
+            try:
+                file_stat = os.stat(full_path)
+            except OSError as e:
+                logger.info("Skipping {0}: {1}".format(full_path, e))
+                continue
+            if not os.path.isdir(full_path):
+                stats[full_path] = file_stat
+        order = {path: position for position, path in enumerate(stats)}
+
+        known_prehashes = {}
+        known_full_hashes = {}
+        if self.index:
+            for path, file_stat in stats.items():
+                known_prehashes[path], known_full_hashes[path] = self.index.lookup(path, file_stat)
+
+        by_size = {}
+        for path, file_stat in stats.items():
+            by_size.setdefault(file_stat.st_size, []).append(path)
+        groups = [paths for paths in by_size.values() if len(paths) == 1]
+
+        # Same size: Compare the pre-hash of the first bytes
+        size_collisions = [path for paths in by_size.values() if len(paths) > 1 for path in paths]
+        prehashes = self._hashes(size_collisions, known_prehashes, prehash_file)
+        by_prehash = {}
+        for path in size_collisions:
+            by_prehash.setdefault((stats[path].st_size, prehashes[path]), []).append(path)
+        groups.extend(paths for paths in by_prehash.values() if len(paths) == 1)
+
+        # Same size and pre-hash: Compare the full hash (crc32 alone collides too easily on millions of files).
+        prehash_collisions = [path for paths in by_prehash.values() if len(paths) > 1 for path in paths]
+        full_hashes = self._hashes(prehash_collisions, known_full_hashes, full_hash_file)
+        by_full_hash = {}
+        for path in prehash_collisions:
+            by_full_hash.setdefault((stats[path].st_size, full_hashes[path]), []).append(path)
+        groups.extend(by_full_hash.values())
+
+        if self.index:
+            self.index.store([(path, stats[path], prehashes.get(path), full_hashes.get(path))
+                              for path in size_collisions
+                              if (prehashes.get(path), full_hashes.get(path)) != (known_prehashes.get(path),
+                                                                                  known_full_hashes.get(path))])
+        for group in groups:
+            group.sort(key=order.get)
+        groups.sort(key=lambda group: order[group[0]])
+        return groups
+
+    def unique_files(self, files_full_path: typing.Iterable[str]) -> typing.List[str]:
+        """
+        :return: The first file of every group of identical files.
+        """
+        unique_files = []
+        for group in self.find_duplicate_groups(files_full_path):
+            if len(group) > 1:
+                logger.debug("Duplicates found: {0}".format(", ".join(group)))
+            unique_files.append(group[0])
+        return unique_files
+
+
+def iterate_files(directories: typing.List[str]) -> typing.Iterator[str]:
+    for directory in directories:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                yield os.path.join(dirpath, filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate files in seed corpora.")
+    parser.add_argument("directories", nargs="+", help="The directories to deduplicate")
+    parser.add_argument("-i", "--index", required=False, help="Path to the persistent hash index")
+    parser.add_argument("-c", "--cores", type=int, required=False, default=None, help="Files hashed in parallel")
+    parser.add_argument("--json", action="store_true", default=False, help="Print the duplicate groups as json")
+    parser.add_argument("--delete", action="store_true", default=False,
+                        help="Delete every duplicate, keeping the first file of each group")
+    args = parser.parse_args()
+    with SeedDeduplicator(index_path=args.index, cores=args.cores) as deduplicator:
+        duplicate_groups = [g for g in deduplicator.find_duplicate_groups(iterate_files(args.directories))
+                            if len(g) > 1]
+    if args.json:
+        print(json.dumps(duplicate_groups, indent=4))
+    else:
+        for group in duplicate_groups:
+            print("\n".join([group[0]] + ["  = " + path for path in group[1:]]))
+        print("{0} duplicate groups, {1} redundant files".format(len(duplicate_groups),
+                                                                 sum(len(g) - 1 for g in duplicate_groups)))
+    if args.delete:
+        for group in duplicate_groups:
+            for path in group[1:]:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
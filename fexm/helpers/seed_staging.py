@@ -0,0 +1,142 @@
+"""
+Stages seed files into working directories (afl-cmin inputs, combined seed dirs, ...)
+without copying their content whenever possible:
+Untouched seeds are hardlinked or reflinked, cropped seeds are copied in-kernel
+with copy_file_range/sendfile. Only if all of that fails, the data is copied in userspace.
+"""
+import errno
+import fcntl
+import logging
+import shutil
+import typing
+from multiprocessing.pool import ThreadPool
+
+import os
+
+logger = logging.getLogger(__name__)
+
+FICLONE = 0x40049409  # ioctl to reflink a whole file (btrfs, xfs, ...)
+
+STAGED_LINK = "link"
+STAGED_REFLINK = "reflink"
+STAGED_COPY = "copy"
+STAGED_CROP = "crop"
+
+
+def _remove_existing(destination: str):
+    try:
+        os.unlink(destination)
+    except FileNotFoundError:
+        pass
+
+
+def _reflink(source: str, destination: str) -> bool:
+    try:
+        with open(source, "rb") as source_fp, open(destination, "wb") as destination_fp:
+            fcntl.ioctl(destination_fp.fileno(), FICLONE, source_fp.fileno())
+        return True
+    except OSError:
+        _remove_existing(destination)
+        return False
+
+
+def _copy_prefix(source: str, destination: str, length: int):
+    """
+    Copies the first length bytes of source into destination, in-kernel if possible.
+    """
+    with open(source, "rb") as source_fp, open(destination, "wb") as destination_fp:
+        source_fd = source_fp.fileno()
+        destination_fd = destination_fp.fileno()
+        copied = 0
+        for kernel_copy in (getattr(os, "copy_file_range", None), os.sendfile):
+            if kernel_copy is None:
+                continue
+            try:
+                os.lseek(destination_fd, copied, os.SEEK_SET)
+                while copied < length:
+                    if kernel_copy is os.sendfile:
+                        sent = os.sendfile(destination_fd, source_fd, copied, length - copied)
+                    else:
+                        sent = kernel_copy(source_fd, destination_fd, length - copied, copied, copied)
+                    if not sent:
+                        break
+                    copied += sent
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP):
+                    raise
+        source_fp.seek(copied)
+        destination_fp.seek(copied)
+        destination_fp.write(source_fp.read(length - copied))
+
+
+def stage_file(source: str, destination: str, max_size: int = None, crop_size: int = None,
+               link: bool = True) -> str:
+    """
+    Makes the content of source available at destination.
+    :param source: The seed file.
+    :param destination: Where the seed should be staged. Existing files are replaced.
+    :param max_size: Seeds larger than max_size are cropped. None to never crop.
+    :param crop_size: The size cropped seeds are reduced to. Defaults to max_size.
+    :param link: If hardlinks may be used. Disable if the staged file is modified afterwards.
+    :return: How the file was staged (STAGED_LINK, STAGED_REFLINK, STAGED_COPY or STAGED_CROP).
+    """
+    _remove_existing(destination)
+    if max_size is not None and os.path.getsize(source) > max_size:
+        _copy_prefix(source, destination, max_size if crop_size is None else crop_size)
+        return STAGED_CROP
+    if link:
+        try:
+            os.link(source, destination)
+            return STAGED_LINK
+        except OSError:  # Across filesystems, not permitted (protected_hardlinks), ...
+            pass
+    if _reflink(source, destination):
+        return STAGED_REFLINK
+    shutil.copyfile(source, destination)  # Uses sendfile on linux
+    return STAGED_COPY
+
+
+def stage_files(files: typing.Iterable[typing.Tuple[str, str]], max_size: int = None, crop_size: int = None,
+                link: bool = True, cores: int = None) -> typing.Dict[str, int]:
+    """
+    Stages many (source, destination) pairs in parallel.
+    Destination directories are created as needed. If several sources have the same destination,
+    the last one wins.
+    :return: How many files were staged per method.
+    """
+    files = [(source, destination) for destination, source in
+             {destination: source for source, destination in files}.items()]
+    for destination_directory in {os.path.dirname(destination) for _, destination in files}:
+        if destination_directory:
+            os.makedirs(destination_directory, exist_ok=True)
+    if not cores:
+        cores = os.cpu_count() or 1
+    statistics = {}
+    if not files:
+        return statistics
+
+    def stage(pair):
+        return stage_file(pair[0], pair[1], max_size=max_size, crop_size=crop_size, link=link)
+
+    with ThreadPool(processes=max(1, min(cores, len(files)))) as pool:
+        for method in pool.imap_unordered(stage, files, chunksize=max(1, len(files) // (cores * 4))):
+            statistics[method] = statistics.get(method, 0) + 1
+    logger.debug("Staged {0} files: {1}".format(len(files), statistics))
+    return statistics
+
+
+def stage_directories(seed_directories: typing.List[str], destination_directory: str, max_size: int = None,
+                      crop_size: int = None, link: bool = True, cores: int = None) -> typing.Dict[str, int]:
+    """
+    Stages all files (not recursively) of the seed directories into one destination directory.
+    Files with the same name in several directories overwrite each other, the last directory wins.
+    """
+    staged = {}
+    for seed_directory in seed_directories:
+        for entry in os.scandir(seed_directory):
+            if entry.is_file():
+                staged[entry.name] = entry.path
+    os.makedirs(destination_directory, exist_ok=True)
+    return stage_files([(source, os.path.join(destination_directory, name)) for name, source in staged.items()],
+                       max_size=max_size, crop_size=crop_size, link=link, cores=cores)
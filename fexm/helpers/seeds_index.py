@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Indexes a seeds corpus (one <filetype>_samples directory per filetype, see is_valid_seeds_folder) and chooses
+a small, maximally diverse set of representatives per filetype. Filetype probing runs the representatives first,
+instead of whatever random files it happens to pick.
+Seeds are described by their size, their first bytes and (optionally) the coverage they yield on a few reference
+parsers. The representatives are chosen greedily, each one as far as possible from the ones chosen before
+(farthest point sampling). The result is stored as a manifest in the seeds directory. Filetypes whose files
+did not change since the last indexing keep their representatives.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import typing
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings as config_settings
+from helpers import utils
+from helpers.exceptions import ForkserverError
+from helpers.seeds_manifest import SeedsManifest
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+HEADER_BYTES = 16  # The magic bytes of most formats are in the first few bytes
+MAX_INDEXED_SEEDS = 2000  # Per filetype, larger filetypes are subsampled (deterministically) before indexing
+COVERAGE_SKETCH_BITS = 4096  # Coverage bitmaps are folded into sketches of this many bits for the distances
+
+
+def read_header(path: str) -> np.ndarray:
+    """
+    :return: The first HEADER_BYTES bytes of the file, -1 for the bytes beyond the end of a shorter file.
+    """
+    header = np.full(HEADER_BYTES, -1, dtype=np.int16)
+    with open(path, "rb") as fp:
+        data = fp.read(HEADER_BYTES)
+    header[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+    return header
+
+
+def coverage_sketch(bitmap: np.ndarray) -> np.ndarray:
+    """
+    :return: The covered edges of the bitmap, folded into COVERAGE_SKETCH_BITS bits.
+    """
+    sketch = np.zeros(COVERAGE_SKETCH_BITS, dtype=bool)
+    sketch[np.flatnonzero(bitmap) % COVERAGE_SKETCH_BITS] = True
+    return sketch
+
+
+def select_diverse(sizes: np.ndarray, headers: np.ndarray, sketches: typing.Optional[np.ndarray],
+                   count: int) -> typing.List[int]:
+    """
+    Farthest point sampling over the seeds. The distance of two seeds is the mean of
+    - the difference of their log sizes (relative to the log size range of the filetype),
+    - the fraction of differing header bytes and
+    - the jaccard distance of their coverage sketches (if there are any).
+    :return: The indices of up to count seeds, the first one being the one with the most coverage
+             (or the one of median size without coverage).
+    """
+    seeds = len(sizes)
+    if seeds == 0:
+        return []
+    log_sizes = np.log2(sizes.astype(np.float64) + 1)
+    size_range = max(float(log_sizes.max() - log_sizes.min()), 1.0)
+    sketch_counts = sketches.sum(axis=1) if sketches is not None else None
+
+    def distances_to(index: int) -> np.ndarray:
+        components = [np.abs(log_sizes - log_sizes[index]) / size_range,
+                      (headers != headers[index]).mean(axis=1)]
+        if sketches is not None:
+            intersection = (sketches & sketches[index]).sum(axis=1)
+            union = sketch_counts + sketch_counts[index] - intersection
+            components.append(np.where(union > 0, 1 - intersection / np.maximum(union, 1), 0))
+        return np.mean(components, axis=0)
+
+    if sketch_counts is not None and sketch_counts.any():
+        first = int(np.argmax(sketch_counts))
+    else:
+        first = int(np.argsort(log_sizes, kind="mergesort")[seeds // 2])
+    selected = [first]
+    min_distances = distances_to(first)
+    min_distances[first] = -1
+    while len(selected) < min(count, seeds):
+        candidate = int(np.argmax(min_distances))
+        if min_distances[candidate] <= 0:  # Only duplicates (regarding the features) left
+            break
+        selected.append(candidate)
+        min_distances = np.minimum(min_distances, distances_to(candidate))
+        min_distances[selected] = -1
+    return selected
+
+
+class SeedsIndex(object):
+    def __init__(self, seeds_dir: str, manifest_path: str = None):
+        """
+        :param seeds_dir: The seeds corpus, one directory per filetype.
+        :param manifest_path: Where the manifest is stored, defaults to the manifest in the seeds directory.
+        """
+        self.seeds_dir = seeds_dir
+        self.manifest_path = manifest_path or os.path.join(seeds_dir, config_settings.SEEDS_INDEX_MANIFEST_NAME)
+        self.filetypes = {}  # type: typing.Dict[str, typing.Dict[str, typing.Any]]
+        self.reference_parsers = []  # type: typing.List[typing.List[str]]
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as fp:
+                    manifest = json.load(fp)
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring broken seeds manifest {0}: {1}".format(self.manifest_path, e))
+                return
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.filetypes = manifest.get("filetypes", {})
+                self.reference_parsers = manifest.get("reference_parsers", [])
+
+    def representatives(self, filetype: str) -> typing.List[str]:
+        """
+        :param filetype: The name of the filetype directory, e.g. png_samples.
+        :return: The full paths of the representatives that still exist, most representative first.
+        """
+        entry = self.filetypes.get(filetype)
+        if not entry:
+            return []
+        paths = [os.path.join(self.seeds_dir, filetype, name) for name in entry["representatives"]]
+        return [path for path in paths if os.path.isfile(path)]
+
+    def save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({"version": MANIFEST_VERSION, "reference_parsers": self.reference_parsers,
+                       "filetypes": self.filetypes}, fp, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class SeedsIndexer(object):
+    def __init__(self, seeds_dir: str, reference_parsers: typing.List[typing.Tuple[str, str]] = None,
+                 representatives: int = None, cores: int = 1, manifest_path: str = None):
+        """
+        :param seeds_dir: The seeds corpus, validated with is_valid_seeds_folder.
+        :param reference_parsers: (binary path, invocation) pairs the seeds are run on to compare their coverage,
+                                  defaults to config_settings.SEEDS_INDEX_REFERENCE_PARSERS.
+        :param representatives: The number of representatives per filetype.
+        :param cores: The number of reference parser instances run in parallel.
+        :param manifest_path: Where the manifest is stored, defaults to the manifest in the seeds directory.
+        """
+        if not utils.is_valid_seeds_folder(seeds_dir):
+            raise ValueError("Seeds folder {0} is not valid.".format(seeds_dir))
+        self.seeds_dir = seeds_dir
+        if reference_parsers is None:
+            reference_parsers = config_settings.SEEDS_INDEX_REFERENCE_PARSERS
+        self.reference_parsers = [[binary, invocation] for binary, invocation in reference_parsers
+                                  if os.path.isfile(binary)]
+        self.representatives = representatives or config_settings.SEEDS_INDEX_REPRESENTATIVES
+        self.cores = cores
+        self.manifest_path = manifest_path
+
+    def coverage_sketches(self, files: typing.List[str]) -> typing.Optional[np.ndarray]:
+        """
+        :return: For every file, the sketch of the coverage on all reference parsers together,
+                 None if no reference parser could be run.
+        """
+        from configfinder.coverage_oracle import CoverageOraclePool
+        sketches = None
+        for binary, invocation in self.reference_parsers:
+            chunk_size = max(1, -(-len(files) // self.cores))
+            chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+            with CoverageOraclePool(binary, invocation, env=utils.get_fuzzing_env_for_invocation(invocation),
+                                    timeout=config_settings.AFL_CMIN_INVOKE_TIMEOUT, size=self.cores) as oracle_pool:
+                try:
+                    with ThreadPool(processes=self.cores) as pool:
+                        results = [result for chunk_results in pool.map(oracle_pool.run_batch, chunks)
+                                   for result in chunk_results]
+                except ForkserverError as e:
+                    logger.warning("Can not index coverage on reference parser {0}: {1}".format(binary, e))
+                    continue
+            parser_sketches = np.array([coverage_sketch(result.bitmap) for result in results])
+            sketches = parser_sketches if sketches is None else np.concatenate([sketches, parser_sketches], axis=1)
+        return sketches
+
+    def index_filetype(self, sizes: typing.Dict[str, int]) -> typing.List[str]:
+        """
+        :param sizes: The size of every file of the filetype, by path.
+        :return: The paths of the representatives of the files.
+        """
+        files = sorted(sizes)
+        if len(files) > MAX_INDEXED_SEEDS:
+            files = sorted(files, key=lambda path: hashlib.sha1(path.encode("utf-8")).hexdigest())[
+                    :MAX_INDEXED_SEEDS]
+        sizes = np.array([sizes[path] for path in files], dtype=np.int64)
+        headers = np.array([read_header(path) for path in files])
+        sketches = self.coverage_sketches(files) if self.reference_parsers else None
+        return [files[i] for i in select_diverse(sizes, headers, sketches, self.representatives)]
+
+    def update(self) -> SeedsIndex:
+        """
+        Indexes all filetypes that changed since the last run (or were indexed with other settings)
+        and writes the manifest.
+        :return: The updated index.
+        """
+        index = SeedsIndex(self.seeds_dir, manifest_path=self.manifest_path)
+        settings_changed = index.reference_parsers != self.reference_parsers
+        index.reference_parsers = self.reference_parsers
+        manifest = SeedsManifest.for_directory(self.seeds_dir, max_age=0)
+        filetypes = {}
+        for filetype in manifest.filetypes():
+            fingerprint = manifest.filetype_fingerprint(filetype)
+            entry = index.filetypes.get(filetype)
+            if entry and not settings_changed and entry["fingerprint"] == fingerprint and \
+                    entry["requested"] == self.representatives:
+                filetypes[filetype] = entry
+                continue
+            logger.info("Indexing {0} seeds of {1}".format(manifest.count(filetype), filetype))
+            representatives = self.index_filetype(manifest.sizes(filetype))
+            filetypes[filetype] = {"fingerprint": fingerprint, "files": manifest.count(filetype),
+                                   "requested": self.representatives,
+                                   "representatives": [os.path.basename(path) for path in representatives]}
+        index.filetypes = filetypes
+        index.save()
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Choose diverse representative seeds per filetype.")
+    parser.add_argument("seeds", help="The seeds directory, one directory per filetype")
+    parser.add_argument("-n", "--representatives", type=int, default=None,
+                        help="Representatives per filetype (default: {0})".format(
+                            config_settings.SEEDS_INDEX_REPRESENTATIVES))
+    parser.add_argument("-r", "--reference_parser", action="append", default=None,
+                        help="A reference parser as <binary>:<invocation>, e.g. /usr/bin/file:@@. Can be repeated.")
+    parser.add_argument("-c", "--cores", type=int, default=1, help="Reference parsers run in parallel")
+    parser.add_argument("-m", "--manifest", default=None, help="The manifest path (default: in the seeds directory)")
+    args = parser.parse_args()
+    reference_parsers = None
+    if args.reference_parser is not None:
+        reference_parsers = []
+        for reference_parser in args.reference_parser:
+            binary, _, invocation = reference_parser.partition(":")
+            reference_parsers.append((binary, invocation or "@@"))
+    index = SeedsIndexer(args.seeds, reference_parsers=reference_parsers, representatives=args.representatives,
+                         cores=args.cores, manifest_path=args.manifest).update()
+    for filetype, entry in sorted(index.filetypes.items()):
+        print("{0}: {1} of {2} seeds".format(filetype, len(entry["representatives"]), entry["files"]))
+
+
+if __name__ == "__main__":
+    main()
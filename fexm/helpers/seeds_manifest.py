@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+A versioned manifest of a seeds corpus (filetype -> files with size, mtime and hash), so the seed consumers
+(inference, minimization, the crawlers) do not list the seeds tree over and over, which is slow on NFS.
+The manifest is built once and refreshed incrementally: A filetype directory is only listed again if its mtime
+changed (files were added, removed or renamed), a file is only hashed again if its size or mtime changed.
+Since mtimes are coarse, directories and files modified just before they were scanned are not trusted
+to be unchanged later on.
+Hashes are computed on demand. Within a process, all consumers share one in-memory manifest per corpus
+(see SeedsManifest.for_directory).
+"""
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import time
+import typing
+from multiprocessing.pool import ThreadPool
+
+import os
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+import configfinder.config_settings as config_settings
+from helpers.seed_deduplicator import full_hash_file
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+SIZE = 0  # Indices into the [size, mtime_ns, hash] entry of a file
+MTIME = 1
+HASH = 2
+RACY_WINDOW_NS = 2 * 10 ** 9  # Directories modified this recently are listed again on the next refresh (like git)
+
+_manifests = {}  # type: typing.Dict[str, SeedsManifest]
+_manifests_lock = threading.Lock()
+
+
+class SeedsManifest(object):
+    def __init__(self, seeds_dir: str, manifest_path: str = None):
+        """
+        :param seeds_dir: The seeds corpus, one directory per filetype.
+        :param manifest_path: Where the manifest is persisted, defaults to the manifest in the seeds directory.
+        """
+        self.seeds_dir = seeds_dir
+        self.manifest_path = manifest_path or os.path.join(seeds_dir, config_settings.SEEDS_MANIFEST_NAME)
+        self._lock = threading.RLock()
+        # Matches filetype to the mtime of its directory and its files
+        self.filetypes_dict = {}  # type: typing.Dict[str, typing.Dict[str, typing.Any]]
+        self.last_refresh = 0.0
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def for_directory(seeds_dir: str, max_age: float = None) -> "SeedsManifest":
+        """
+        :param seeds_dir: The seeds corpus.
+        :param max_age: Refresh the shared manifest if its last refresh is older than this many seconds,
+                        defaults to config_settings.SEEDS_MANIFEST_MAX_AGE.
+        :return: The manifest of the corpus, shared by all consumers in this process.
+        """
+        if max_age is None:
+            max_age = config_settings.SEEDS_MANIFEST_MAX_AGE
+        key = os.path.realpath(seeds_dir)
+        with _manifests_lock:
+            manifest = _manifests.get(key)
+            if manifest is None:
+                manifest = _manifests[key] = SeedsManifest(seeds_dir)
+        if time.time() - manifest.last_refresh > max_age:
+            manifest.refresh()
+        return manifest
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path) as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring broken seeds manifest {0}: {1}".format(self.manifest_path, e))
+            return
+        if manifest.get("version") == MANIFEST_VERSION:
+            self.filetypes_dict = manifest.get("filetypes", {})
+
+    def save(self):
+        """
+        Persists the manifest if it changed. A read-only corpus keeps its manifest in memory only.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = self.manifest_path + ".tmp"
+            try:
+                with open(tmp_path, "w") as fp:
+                    json.dump({"version": MANIFEST_VERSION, "filetypes": self.filetypes_dict}, fp)
+                os.replace(tmp_path, self.manifest_path)
+            except OSError as e:
+                logger.debug("Can not persist the seeds manifest {0}: {1}".format(self.manifest_path, e))
+                return
+            self._dirty = False
+
+    @staticmethod
+    def _racy(mtime_ns: int) -> bool:
+        """
+        :return: True if something modified at mtime_ns might still be modified within the same mtime tick.
+        """
+        return int(time.time() * 10 ** 9) - mtime_ns < RACY_WINDOW_NS
+
+    def _scan_filetype(self, filetype: str, directory_mtime_ns: int) -> typing.Dict[str, typing.Any]:
+        old_files = self.filetypes_dict.get(filetype, {}).get("files", {})
+        files = {}
+        with os.scandir(os.path.join(self.seeds_dir, filetype)) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                file_stat = entry.stat()
+                old = old_files.get(entry.name)
+                unchanged = old is not None and old[SIZE] == file_stat.st_size and old[MTIME] == file_stat.st_mtime_ns
+                files[entry.name] = [file_stat.st_size, file_stat.st_mtime_ns, old[HASH] if unchanged else None]
+        return {"mtime_ns": None if self._racy(directory_mtime_ns) else directory_mtime_ns, "files": files}
+
+    def refresh(self, full: bool = False):
+        """
+        Lists the filetype directories whose mtime changed and the new filetype directories.
+        :param full: Also list the unchanged directories, to notice files modified in place.
+        """
+        with self._lock:
+            filetypes = {}
+            with os.scandir(self.seeds_dir) as entries:
+                for entry in entries:
+                    if entry.name == ".git" or not entry.is_dir():
+                        continue
+                    directory_mtime_ns = entry.stat().st_mtime_ns
+                    old = self.filetypes_dict.get(entry.name)
+                    if not full and old is not None and old["mtime_ns"] == directory_mtime_ns:
+                        filetypes[entry.name] = old
+                        continue
+                    filetypes[entry.name] = self._scan_filetype(entry.name, directory_mtime_ns)
+                    if filetypes[entry.name] != old:
+                        self._dirty = True
+            if set(filetypes) != set(self.filetypes_dict):
+                self._dirty = True
+            self.filetypes_dict = filetypes
+            self.last_refresh = time.time()
+        self.save()
+
+    def filetypes(self, include_empty: bool = False) -> typing.List[str]:
+        """
+        :return: The names of the filetype directories, e.g. png_samples.
+        """
+        with self._lock:
+            return sorted(filetype for filetype, entry in self.filetypes_dict.items()
+                          if include_empty or entry["files"])
+
+    def __contains__(self, filetype: str) -> bool:
+        return filetype in self.filetypes_dict
+
+    def files(self, filetype: str) -> typing.List[str]:
+        """
+        :return: The full paths of the files of the filetype, sorted. Empty for an unknown filetype.
+        """
+        with self._lock:
+            names = sorted(self.filetypes_dict.get(filetype, {}).get("files", {}))
+        return [os.path.join(self.seeds_dir, filetype, name) for name in names]
+
+    def count(self, filetype: str) -> int:
+        with self._lock:
+            return len(self.filetypes_dict.get(filetype, {}).get("files", {}))
+
+    def sizes(self, filetype: str) -> typing.Dict[str, int]:
+        """
+        :return: The size of every file of the filetype, by full path.
+        """
+        with self._lock:
+            files = dict(self.filetypes_dict.get(filetype, {}).get("files", {}))
+        return {os.path.join(self.seeds_dir, filetype, name): entry[SIZE] for name, entry in files.items()}
+
+    def hashes(self, filetype: str, cores: int = 1) -> typing.Dict[str, str]:
+        """
+        :return: The blake2b hash (like seed_deduplicator) of every file of the filetype, by full path.
+                 Only files that are new or changed are hashed.
+        """
+        with self._lock:
+            files = self.filetypes_dict.get(filetype, {}).get("files", {})
+            missing = [name for name, entry in files.items() if entry[HASH] is None]
+        if missing:
+            with ThreadPool(processes=max(1, cores)) as pool:
+                new_hashes = pool.map(lambda name: full_hash_file(os.path.join(self.seeds_dir, filetype, name)),
+                                      missing)
+            with self._lock:
+                files = self.filetypes_dict.get(filetype, {}).get("files", {})
+                for name, file_hash in zip(missing, new_hashes):
+                    if name in files and not self._racy(files[name][MTIME]):
+                        files[name][HASH] = file_hash
+                self._dirty = True
+            self.save()
+        with self._lock:
+            files = self.filetypes_dict.get(filetype, {}).get("files", {})
+            return {os.path.join(self.seeds_dir, filetype, name): entry[HASH] for name, entry in files.items()}
+
+    def add_file(self, filetype: str, name: str):
+        """
+        Records a file a consumer just wrote into the corpus (e.g. a downloaded seed), without listing the directory.
+        """
+        path = os.path.join(self.seeds_dir, filetype, name)
+        file_stat = os.stat(path)
+        with self._lock:
+            entry = self.filetypes_dict.setdefault(filetype, {"mtime_ns": None, "files": {}})
+            entry["files"][name] = [file_stat.st_size, file_stat.st_mtime_ns, None]
+            entry["mtime_ns"] = None  # Other files might have been added meanwhile, list it on the next refresh
+            self._dirty = True
+
+    def _update_fingerprint(self, hash_object, filetype: str):
+        files = self.filetypes_dict.get(filetype, {}).get("files", {})
+        for name in sorted(files):
+            hash_object.update("{0}/{1}:{2}:{3}\n".format(filetype, name, files[name][SIZE],
+                                                          files[name][MTIME]).encode("utf-8"))
+
+    def filetype_fingerprint(self, filetype: str) -> str:
+        """
+        Fingerprints the seeds of the filetype by name, size and mtime.
+        """
+        hash_object = hashlib.sha256()
+        with self._lock:
+            self._update_fingerprint(hash_object, filetype)
+        return hash_object.hexdigest()
+
+    def content_fingerprint(self, filetype: str, cores: int = 1) -> str:
+        """
+        Fingerprints the seeds of the filetype by their content only, so copies of the corpus match.
+        """
+        hashes = self.hashes(filetype, cores=cores)
+        # Files modified just now are not hashed in the manifest yet
+        file_hashes = sorted(file_hash if file_hash is not None else full_hash_file(path)
+                             for path, file_hash in hashes.items())
+        return hashlib.sha256("\n".join(file_hashes).encode("utf-8")).hexdigest()
+
+    def fingerprint(self) -> str:
+        """
+        Fingerprints the corpus by filetype, name, size and mtime of every seed.
+        """
+        hash_object = hashlib.sha256()
+        with self._lock:
+            for filetype in sorted(self.filetypes_dict):
+                self._update_fingerprint(hash_object, filetype)
+        return hash_object.hexdigest()
+
+
+def filetype_files(filetype_dir: str) -> typing.List[str]:
+    """
+    :param filetype_dir: A filetype directory of a seeds corpus, e.g. seeds/png_samples.
+    :return: The files of the directory, from the shared manifest of the corpus.
+    """
+    filetype_dir = os.path.normpath(filetype_dir)
+    return SeedsManifest.for_directory(os.path.dirname(filetype_dir)).files(os.path.basename(filetype_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the manifest of a seeds corpus.")
+    parser.add_argument("seeds", help="The seeds directory, one directory per filetype")
+    parser.add_argument("--full", action="store_true", default=False,
+                        help="List all filetype directories, not only those whose mtime changed")
+    parser.add_argument("--hash", action="store_true", default=False, help="Hash all new or changed seeds")
+    parser.add_argument("-c", "--cores", type=int, default=1, help="Files hashed in parallel")
+    args = parser.parse_args()
+    manifest = SeedsManifest(args.seeds)
+    manifest.refresh(full=args.full)
+    for filetype in manifest.filetypes(include_empty=True):
+        if args.hash:
+            manifest.hashes(filetype, cores=args.cores)
+        print("{0}: {1} seeds".format(filetype, manifest.count(filetype)))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,12 @@ import datetime
 import json
 import logging
 import pathlib
+import select
+import signal
 import socket
+import stat
 import subprocess
+import threading
 import time
 import typing
 import uuid
@@ -27,6 +31,8 @@ os.sys.path.insert(0, parentdir)
 import configfinder.config_settings
 from pwd import getpwnam
 from helpers import constants
+from helpers.elf_reader import ElfReader, resolve_libraries
+from helpers.exceptions import InvalidElfFile
 import helpers
 
 logging.basicConfig()
@@ -35,6 +41,8 @@ logger.setLevel(logging.INFO)
 
 LOG_FORMAT = '%(asctime)-15s %(message)s'
 LOG_MAX_SIZE = 1024 * 1024
+CANCEL_POLL_INTERVAL = 0.05  # How often (in seconds) a cancellable process checks if it was cancelled
+MAX_STREAMED_OUTPUT = 1024 * 1024  # check_output_until_match keeps at most 1 MiB of the output (for logging)
 
 fexm_path = os.path.dirname(
     os.path.dirname(os.path.abspath(helpers.__file__)))  # type: str # Gets the absolute path to fexm.
@@ -105,13 +113,12 @@ def get_fuzzing_env_for_invocation(invocation):
 
 
 def crop_file(infile: str, outfile: str, remaining_bytes: int):
-    if os.path.getsize(infile) <= remaining_bytes:
-        copyfile(infile, outfile)
-    else:
-        with open(os.path.join(infile), "rb") as fp:
-            remaining_data = fp.read()[:remaining_bytes]
-        with open(os.path.join(outfile), "wb") as fp:
-            fp.write(remaining_data)
+    """
+    Stages infile as outfile, cropped to at most remaining_bytes.
+    The content is linked or copied in-kernel, see helpers.seed_staging.
+    """
+    from helpers.seed_staging import stage_file
+    stage_file(infile, outfile, max_size=remaining_bytes)
 
 
 def make_combined_seeds_dir(seed_directories: typing.List[str], new_seeds_directory: str):
@@ -121,13 +128,8 @@ def make_combined_seeds_dir(seed_directories: typing.List[str], new_seeds_direct
     :param seed_directories:
     :return:
     """
-    os.makedirs(new_seeds_directory, exist_ok=True)
-    for seed_directory in seed_directories:
-        for file in os.listdir(seed_directory):
-            full_file_path = os.path.join(seed_directory, file)
-            if os.path.isdir(full_file_path):
-                continue
-            crop_file(full_file_path, os.path.join(new_seeds_directory, file), 850)
+    from helpers.seed_staging import stage_directories
+    stage_directories(seed_directories, new_seeds_directory, max_size=850)
     return new_seeds_directory
 
 
@@ -165,61 +167,13 @@ def get_hash(filename: str, first_chunk_only: bool = False, hash: Callable = has
 
 
 def filter_out_duplicates(files_full_path: Iterable[str]):
-    hashes_by_size = {}
-    hashes_on_1k = {}
-    hashes_full = {}
-
-    for full_path in files_full_path:
-        if os.path.isdir(full_path):
-            continue
-        try:
-            file_size = os.path.getsize(full_path)
-        except (OSError,) as e:
-            # not accessible (permissions, etc) - pass on
-            print("Error: {0}".format(e))
-            continue
-
-        duplicate = hashes_by_size.get(file_size)
-
-        if duplicate:
-            hashes_by_size[file_size].append(full_path)
-        else:
-            hashes_by_size[file_size] = []  # create the list for this file size
-            hashes_by_size[file_size].append(full_path)
-
-    # For all files with the same file size, get their hash on the 1st 1024 bytes
-    unique_files = []
-    for __, files in hashes_by_size.items():
-        if len(files) < 2:
-            unique_files.append(files[0])
-            continue  # this file size is unique, no need to spend cpy cycles on it
-
-        for filename in files:
-            small_hash = get_hash(filename, first_chunk_only=True)
-
-            duplicate = hashes_on_1k.get(small_hash)
-            if duplicate:
-                hashes_on_1k[small_hash].append(filename)
-            else:
-                hashes_on_1k[small_hash] = []  # create the list for this 1k hash
-                hashes_on_1k[small_hash].append(filename)
-
-    # For all files with the hash on the 1st 1024 bytes, get their hash on the full file - collisions will be duplicate
-
-    for __, files in hashes_on_1k.items():
-        if len(files) < 2:
-            continue  # this hash of fist 1k file bytes is unique, no need to spend cpy cycles on it
-
-        for filename in files:
-            full_hash = get_hash(filename, first_chunk_only=False)
-
-            duplicate = hashes_full.get(full_hash)
-            if duplicate:
-                print("Duplicate found: %s and %s" % (filename, duplicate))
-            else:
-                hashes_full[full_hash] = filename
-                unique_files.append(filename)
-    return unique_files
+    """
+    Removes duplicate files (same content) from the given files.
+    See helpers.seed_deduplicator for the details.
+    :return: The first file of every group of identical files.
+    """
+    from helpers.seed_deduplicator import SeedDeduplicator
+    return SeedDeduplicator().unique_files(files_full_path)
 
 
 def showmap_inference_possible(binary_path: str, qemu: bool = False, log_dict=None):
@@ -266,8 +220,14 @@ def binary_is_instrumented_with_afl(binary_path: str) -> bool:
 
 def binary_uses_asan(binary_path: str) -> bool:
     """
-    Returns true if compiled with asan (== contains ASAN_LIBRARY_STRING)
+    Returns true if compiled with asan (== links ASAN_LIBRARY_STRING or contains the asan runtime).
+    Falls back to searching for ASAN_LIBRARY_STRING in the file if it can not be parsed as elf.
     """
+    try:
+        with ElfReader(str(pathlib.Path(binary_path).resolve())) as reader:
+            return reader.uses_asan()
+    except InvalidElfFile:
+        pass
     with open(str(pathlib.Path(binary_path).resolve()), "rb") as fp:
         if constants.ASAN_LIBRARY_STRING.encode("utf-8") in fp.read():
             return True
@@ -300,6 +260,17 @@ def qemu_required_for_binary(binary_path: str) -> bool:
 
 
 def count_number_of_tuples_per_binary(path: str) -> int:
+    """
+    Counts the instrumentation sites (references to __afl_area_ptr) of the binary.
+    Uses the elf reader, objdump is only invoked for architectures the reader can not handle.
+    """
+    try:
+        with ElfReader(path) as reader:
+            number_of_tuples = reader.count_instrumentation_sites()
+        if number_of_tuples is not None:
+            return number_of_tuples
+    except InvalidElfFile as e:
+        logger.info(str(e))
     objdump = sh.Command("objdump")
     output = objdump(["-d", path]).stdout.decode("utf-8")
     number_of_tuples = len([line for line in output.split("\n") if "afl_area_ptr" in line])
@@ -312,6 +283,10 @@ def get_libs_for_elf_binary(path: str) -> [str]:
     :param path: The path the elf binary
     :return: A list of strings, each string is one library used by the elf binary.
     """
+    try:
+        return resolve_libraries(path)
+    except (InvalidElfFile, OSError) as e:
+        logger.info("Could not parse {0}, falling back to ldd: {1}".format(path, e))
     command = "ldd"
     try:
         output = subprocess.check_output([command, path]).decode("utf-8")
@@ -393,12 +368,9 @@ def is_fuzzable_binary(path: str) -> bool:
     :return: Whether the binary is fuzzable.
     """
     real_binary_path = os.path.realpath(path)  # Resolve all symbolic links
-    file_command = sh.Command("file")
-    file_command_output = file_command(real_binary_path).split(":")
-    print(file_command_output)
-    if len(file_command_output) < 2:  # Something went wrong (apparently, file also outputs something weird like '...'
+    if not os.path.isfile(real_binary_path):
         return False
-    if "ELF" in file_command_output[1]:
+    if is_elf_binary(real_binary_path):
         if is_gui_elf(real_binary_path):
             return False
         try:
@@ -495,54 +467,99 @@ def extract_elf_binaries_using_file(directory: str):
     return result_list
 
 
-def return_fuzzable_binaries_from_file_list(file_list: [str], log_dict=None) -> [str]:
+def triage_elf_binary(elf: str, cache=None) -> Dict[str, Any]:
+    """
+    Runs the triage stages for a single elf binary, cheapest stage first.
+    As soon as one stage rejects the binary, the remaining (more expensive) stages are skipped.
+    :param elf: The path to the elf binary.
+    :param cache: An optional AnalysisCache, results for unchanged binaries are taken from it.
+    :return: A dict with the log entries for the binary (key "log") and the stages it passed
+             ("executable" and "fuzzable").
+    """
+    from helpers.analysis_cache import TRIAGE_NAMESPACE
+    make_executable(elf)  # Also for cached results, the copy at this path may have lost its mode bits
+    if cache:
+        cached_result = cache.get(elf, TRIAGE_NAMESPACE)
+        if cached_result is not None:
+            cached_result["binary"] = elf
+            return cached_result
+        result = _triage_elf_binary(elf)
+        cache.put(elf, TRIAGE_NAMESPACE, result)
+        return result
+    return _triage_elf_binary(elf)
+
+
+def make_executable(elf: str):
+    try:
+        os.chmod(elf, os.stat(elf).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    except OSError as e:
+        logger.error("Setting {0} as executable did not work. Exception: {1}".format(elf, e))
+
+
+def _triage_elf_binary(elf: str) -> Dict[str, Any]:
+    result = {"binary": elf, "log": {}, "executable": False, "fuzzable": False}
+    if is_gui_elf(elf):
+        result["log"]["is_gui_elf"] = True
+        return result
+    result["log"]["is_gui_elf"] = False
+    if not is_executable_binary(elf):
+        result["log"]["is_executable_elf"] = False
+        return result
+    result["log"]["is_executable_elf"] = True
+    result["executable"] = True
+    binary_log_dict = {elf: {}}  # inference_possible only logs into non-empty dicts
+    if inference_possible(binary_path=elf, log_dict=binary_log_dict):
+        if binary_is_instrumented_with_afl(elf):
+            result["log"]["number_of_tuples"] = count_number_of_tuples_per_binary(elf)
+        result["fuzzable"] = True
+    else:
+        logger.info("Skipping binary {0}, inference is not possible.".format(elf))
+    result["log"].update(binary_log_dict[elf])
+    return result
+
+
+def return_fuzzable_binaries_from_file_list(file_list: [str], log_dict=None, cores: int = None, cache=None) -> [str]:
+    """
+    Filters the given files down to the fuzzable elf binaries.
+    The binaries are triaged in parallel (see triage_elf_binary), the results
+    are merged into log_dict in the order of the deduplicated binaries.
+    :param file_list: The files to check.
+    :param log_dict: The dict the triage results are logged into.
+    :param cores: The number of binaries to triage in parallel. Defaults to config_settings.TRIAGE_CORES.
+    :param cache: An optional AnalysisCache for the triage results.
+    :return: The list of fuzzable binaries.
+    """
     real_paths = [os.path.realpath(f) for f in file_list if os.path.exists(f) and not os.path.isdir(f)]
     elf_files = [f for f in real_paths if is_elf_binary(f)]
     unique_binary_paths = filter_out_duplicates(set(elf_files))
     from helpers.elf_deduplicator import ElfDeDuplicator
-    unique_binaries = ElfDeDuplicator.deduplicate_binaries(unique_binary_paths)
+    if not cores:
+        cores = configfinder.config_settings.TRIAGE_CORES
+    duplicate_groups = ElfDeDuplicator.find_duplicate_groups(unique_binary_paths, cores=cores)
+    unique_binaries = [ElfDeDuplicator.representative(group) for group in duplicate_groups]
     result_list = []
     if not log_dict:
         log_dict = {}
     log_dict["elf_files"] = []
     log_dict["executable_elf_files"] = []
     log_dict["fuzzable_bins"] = []
-    for elf in unique_binaries:
-        if log_dict:
+    log_dict["duplicate_elf_groups"] = [group for group in duplicate_groups if len(group) > 1]
+    if not unique_binaries:
+        return result_list
+    from multiprocessing.pool import ThreadPool
+    with ThreadPool(processes=max(1, min(cores, len(unique_binaries)))) as pool:
+        # imap keeps the order of unique_binaries, so the log_dict is filled deterministically.
+        for triage_result in pool.imap(lambda elf: triage_elf_binary(elf, cache=cache), unique_binaries):
+            elf = triage_result["binary"]
             log_dict["elf_files"].append(elf)
-        chmod = sh.Command("chmod")
-        try:
-            chmod(["+x", elf])
-        except sh.ErrorReturnCode as e:
-            logger.error(
-                "Setting {0} as executable did not work. Exception: {1}".format(elf, e))
-        if log_dict:
             if not log_dict.get(elf):
                 log_dict[elf] = {}
-        if is_gui_elf(elf):
-            log_dict[elf]["is_gui_elf"] = True
-            continue
-        else:
-            log_dict[elf]["is_gui_elf"] = False
-        if is_executable_binary(elf):
-            # assert isinstance(log_dict, object)
-            if log_dict:
-                log_dict[elf]["is_executable_elf"] = True
+            log_dict[elf].update(triage_result["log"])
+            if triage_result["executable"]:
                 log_dict["executable_elf_files"].append(elf)
-        else:
-            if log_dict:
-                log_dict[elf]["is_executable_elf"] = False
-            continue
-        if inference_possible(binary_path=elf, log_dict=log_dict):
-            if binary_is_instrumented_with_afl(elf):
-                log_dict["fuzzable_bins"].append(elf)
-                log_dict[elf]["number_of_tuples"] = count_number_of_tuples_per_binary(
-                    elf)
-            else:
+            if triage_result["fuzzable"]:
                 log_dict["fuzzable_bins"].append(elf)
-            result_list.append(elf)
-        else:
-            logger.info("Skipping binary {0}, inference is not possible.".format(elf))
+                result_list.append(elf)
     return result_list
 
     # unique_real_paths = filter_out_duplicates(set(real_binary_paths))
@@ -648,7 +665,8 @@ def query_yes_no(question, default=None):
 
 
 def check_output_with_timeout_command(process: str, args: [str], timeout: float = 0.5, test_stdin=False,
-                                      dummyfile_path=None, **kwargs) -> (str, bool):
+                                      dummyfile_path=None, cancel_event: threading.Event = None,
+                                      **kwargs) -> (str, bool):
     """
     This function runs a process with a timeout and returns the output.
     It uses unix tools (timeout) instead of check_output with the timeout parameter,
@@ -664,6 +682,8 @@ def check_output_with_timeout_command(process: str, args: [str], timeout: float
     :param timeout: The maximum running time.
     :param test_stdin: If true, dummyfile is redirected to stdin
     :param dummyfile_path: Input is redirected to stdin
+    :param cancel_event: If given, the process (and its children) is killed as soon as the event is set.
+                         A cancelled process counts as timed out.
     :return: A tuple: (output, timeout?).
     """
     timed_out = False
@@ -673,6 +693,13 @@ def check_output_with_timeout_command(process: str, args: [str], timeout: float
         exec_list.append(str(timeout))  # With the timeout parameter
     exec_list.append(process)
     exec_list += args
+    if cancel_event is not None:
+        if test_stdin:
+            with open(dummyfile_path, "r") as dummyfile_fd:
+                output, returncode = _check_output_cancellable(exec_list, cancel_event, stdin=dummyfile_fd, **kwargs)
+        else:
+            output, returncode = _check_output_cancellable(exec_list, cancel_event, **kwargs)
+        return output.decode("utf-8", errors="ignore"), returncode is None or returncode == 124
     try:
         # Also use the timeout argument because the timeout process (linux) sometimes failes!
         if test_stdin:
@@ -691,6 +718,99 @@ def check_output_with_timeout_command(process: str, args: [str], timeout: float
     return output, timed_out
 
 
+def check_output_until_match(process: str, args: [str], line_matches: typing.Callable[[str], bool],
+                             timeout: float = 0.5, test_stdin=False, dummyfile_path=None,
+                             cancel_event: threading.Event = None, skip_lines: int = 0,
+                             **kwargs) -> (str, bool, bool):
+    """
+    Like check_output_with_timeout_command, but parses the output line by line while the process runs.
+    The process (and its children) is killed as soon as a line matches, e.g. as soon as strace shows a read.
+    :param line_matches: Called for every non-empty line of the output.
+    :param skip_lines: The number of non-empty lines at the start of the output that are not matched.
+    :param cancel_event: If given, the process is killed as soon as the event is set. It then counts as timed out.
+    :return: A tuple: (output, timeout?, matched?). Only the first MAX_STREAMED_OUTPUT bytes of output are kept.
+             A process that matched never counts as timed out.
+    """
+    exec_list = []
+    if timeout:
+        exec_list.append("timeout")
+        exec_list.append(str(timeout))
+    exec_list.append(process)
+    exec_list += args
+    stdin_fp = open(dummyfile_path, "r") if test_stdin else None
+    try:
+        process = subprocess.Popen(exec_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=stdin_fp,
+                                   start_new_session=True, **kwargs)
+    finally:
+        if stdin_fp:
+            stdin_fp.close()
+    output = bytearray()
+    pending = b""
+    lines_seen = 0
+    matched = False
+    cancelled = False
+    stdout_fd = process.stdout.fileno()
+
+    def match(lines: [bytes]) -> bool:
+        nonlocal lines_seen
+        for line in lines:
+            if not line.strip():
+                continue
+            lines_seen += 1
+            if lines_seen > skip_lines and line_matches(line.decode("utf-8", errors="ignore")):
+                return True
+        return False
+
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+            break
+        readable, _, _ = select.select([stdout_fd], [], [], CANCEL_POLL_INTERVAL)
+        if not readable:
+            continue
+        chunk = os.read(stdout_fd, 65536)
+        if not chunk:
+            matched = match([pending])
+            break
+        if len(output) < MAX_STREAMED_OUTPUT:
+            output += chunk[:MAX_STREAMED_OUTPUT - len(output)]
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        if match(lines):
+            matched = True
+            break
+    if matched or cancelled:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    process.stdout.close()
+    process.wait()
+    timed_out = cancelled or (not matched and process.returncode == 124)
+    return output.decode("utf-8", errors="ignore"), timed_out, matched
+
+
+def _check_output_cancellable(exec_list: [str], cancel_event: threading.Event, **kwargs) -> (bytes, int):
+    """
+    Like subprocess.check_output, but kills the whole process group once cancel_event is set.
+    :return: The output and the returncode, None if the process was cancelled.
+    """
+    process = subprocess.Popen(exec_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True,
+                               **kwargs)
+    while True:
+        try:
+            output, _ = process.communicate(timeout=CANCEL_POLL_INTERVAL)
+            return output, process.returncode
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                output, _ = process.communicate()
+                return output, None
+
+
 def temp_print(*args):
     """
     Print a line such that it will be eaten up by the next line printed.
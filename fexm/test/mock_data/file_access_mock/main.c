@@ -0,0 +1,29 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+
+// Accesses its input in different ways, used to test the file access tracer.
+int main(int argc, char **argv) {
+    char buffer[16];
+    FILE *fp;
+    if (argc < 2) return 1;
+    if (!strcmp(argv[1], "read") && argc > 2) {
+        fp = fopen(argv[2], "r");
+        if (fp) {
+            fread(buffer, 1, sizeof(buffer), fp);
+            fclose(fp);
+        }
+    } else if (!strcmp(argv[1], "write") && argc > 2) {
+        fp = fopen(argv[2], "w");
+        if (fp) fclose(fp);
+    } else if (!strcmp(argv[1], "stdin")) {
+        fread(buffer, 1, sizeof(buffer), stdin);
+    } else if (!strcmp(argv[1], "readhang") && argc > 2) {
+        fp = fopen(argv[2], "r");
+        if (fp) fread(buffer, 1, sizeof(buffer), fp);
+        sleep(10);
+    } else if (!strcmp(argv[1], "hang")) {
+        sleep(10);
+    }
+    return 0;
+}
@@ -0,0 +1,95 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+os.sys.path.insert(0, os.path.join(parentdir, "configfinder"))
+from configfinder.adaptive_prober import AdaptiveProber
+from configfinder.heuristic_config_creator import HeuristicConfigCreator
+
+
+class TestAdaptiveProber(unittest.TestCase):
+    """
+    Unittesting the successive elimination of filetypes with synthetic coverage.
+    """
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.coverage = {}
+        self.arms = {}
+        for filetype, mean in [("png", 400), ("jpg", 120), ("txt", 100), ("pdf", 90)]:
+            self.arms[filetype] = ["{0}/{1}".format(filetype, i) for i in range(100)]
+            for seed in self.arms[filetype]:
+                self.coverage[seed] = max(0, rng.gauss(mean, 15))
+        self.batches = []
+
+    def measure(self, batch):
+        self.batches.append(batch)
+        return [self.coverage[seed] for _, seed in batch]
+
+    def test_eliminates_filetypes_out_of_contention(self):
+        result = AdaptiveProber(self.arms, self.measure).run()
+        self.assertEqual(result.contenders, ["png"])
+        self.assertEqual(set(result.eliminated), {"jpg", "txt", "pdf"})
+        self.assertGreater(result.confidence, 0.9)
+        self.assertEqual(result.confidence_of("txt"), 0.0)
+        self.assertLess(result.pulls, sum(len(seeds) for seeds in self.arms.values()) // 4)
+
+    def test_budget(self):
+        result = AdaptiveProber(self.arms, self.measure, budget=10).run()
+        self.assertEqual(result.pulls, 10)
+        self.assertEqual(sum(len(batch) for batch in self.batches), 10)
+
+    def test_close_filetypes(self):
+        arms = {"a": ["a/0", "a/1", "a/2", "a/3"], "b": ["b/0", "b/1", "b/2", "b/3"], "empty": []}
+        coverage = {"a/0": 10, "a/1": 12, "a/2": 11, "a/3": 13, "b/0": 11, "b/1": 12, "b/2": 10, "b/3": 12}
+        result = AdaptiveProber(arms, lambda batch: [coverage[seed] for _, seed in batch]).run()
+        self.assertNotIn("empty", result.arms)
+        self.assertEqual(result.pulls, 8)  # Both had to run all their seeds
+        self.assertEqual(result.contenders, ["a"])  # Then the means are exact, a is ahead
+        self.assertEqual(result.means, {"a": 11.5, "b": 11.25})
+
+    def test_no_seeds(self):
+        result = AdaptiveProber({"empty": []}, self.measure).run()
+        self.assertEqual(result.contenders, [])
+        self.assertIsNone(result.leader)
+        self.assertEqual(result.confidence, 0.0)
+        self.assertEqual(result.pulls, 0)
+        self.assertEqual(self.batches, [])
+
+    def test_reproducible(self):
+        first = AdaptiveProber(self.arms, self.measure).run()
+        second = AdaptiveProber(self.arms, self.measure).run()
+        self.assertEqual(first.means, second.means)
+
+
+@unittest.skipUnless(shutil.which("true"), "true is needed as a binary without forkserver")
+class TestAdaptiveProbing(unittest.TestCase):
+    """
+    Unittesting the fallback of the adaptive probing to afl_probe.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.seeds_dir = os.path.join(self.tmp_dir, "seeds")
+        for filetype in ["png", "jpg"]:
+            os.makedirs(os.path.join(self.seeds_dir, filetype))
+            for i in range(3):
+                with open(os.path.join(self.seeds_dir, filetype, str(i)), "w") as fp:
+                    fp.write(filetype + str(i))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_no_forkserver(self):
+        h = HeuristicConfigCreator(binary_path=shutil.which("true"), results_out_dir=self.tmp_dir,
+                                   seeds_dir=self.seeds_dir, cores=2, use_coverage_oracle=True)
+        self.assertIsNone(h.probe_filetypes_adaptively("@@"))  # Instead of waiting for the failed workers
+        self.assertIsNone(h.get_coverage_oracle("@@"))
+
+
+if __name__ == '__main__':
+    unittest.main()
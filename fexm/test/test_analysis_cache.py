@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers.analysis_cache import AnalysisCache, seeds_fingerprint
+
+
+class TestAnalysisCache(unittest.TestCase):
+    """
+    Unittesting the content addressed analysis cache.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.binary = os.path.join(self.tmp_dir, "binary")
+        with open(self.binary, "wb") as fp:
+            fp.write(b"\x7fELF first version")
+        self.cache = AnalysisCache(os.path.join(self.tmp_dir, "cache"), tools_fingerprint="tools")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get(self.binary, "triage"))
+        self.cache.put(self.binary, "triage", {"fuzzable": True})
+        self.assertEqual(self.cache.get(self.binary, "triage"), {"fuzzable": True})
+        self.assertIsNone(self.cache.get(self.binary, "input_vectors"))
+        self.assertIsNone(self.cache.get(self.binary, "triage", seeds_fingerprint="other seeds"))
+        # Same content under a different path hits the same entry
+        copied_binary = os.path.join(self.tmp_dir, "copy")
+        shutil.copy(self.binary, copied_binary)
+        self.assertEqual(self.cache.get(copied_binary, "triage"), {"fuzzable": True})
+
+    def test_changed_binary_or_tools_miss(self):
+        self.cache.put(self.binary, "triage", {"fuzzable": True})
+        other_tools_cache = AnalysisCache(self.cache.cache_dir, tools_fingerprint="newer tools")
+        self.assertIsNone(other_tools_cache.get(self.binary, "triage"))
+        with open(self.binary, "wb") as fp:
+            fp.write(b"\x7fELF second version")
+        self.assertIsNone(self.cache.get(self.binary, "triage"))
+
+    def test_eviction_and_invalidation(self):
+        self.cache.put(self.binary, "a", "x" * 100)
+        self.cache.put(self.binary, "b", "y" * 100)
+        self.cache.get(self.binary, "a")  # "b" is now the least recently used entry
+        self.assertEqual(self.cache.evict(max_size=150), 1)
+        self.assertIsNone(self.cache.get(self.binary, "b"))
+        self.assertIsNotNone(self.cache.get(self.binary, "a"))
+        self.assertEqual(self.cache.invalidate(binary_path=self.binary), 1)
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_seeds_fingerprint(self):
+        seeds_dir = os.path.join(self.tmp_dir, "seeds")
+        os.makedirs(os.path.join(seeds_dir, "png"))
+        with open(os.path.join(seeds_dir, "png", "a.png"), "wb") as fp:
+            fp.write(b"png")
+        fingerprint = seeds_fingerprint(seeds_dir)
+        self.assertEqual(fingerprint, seeds_fingerprint(seeds_dir))
+        with open(os.path.join(seeds_dir, "png", "b.png"), "wb") as fp:
+            fp.write(b"png2")
+        self.assertNotEqual(fingerprint, seeds_fingerprint(seeds_dir))
+        self.assertEqual(seeds_fingerprint(os.path.join(self.tmp_dir, "nonexistent")), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
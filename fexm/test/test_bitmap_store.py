@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.coverage_evaluator import CoverageEvaluator
+from helpers.bitmap_store import BitmapStore, MAP_SIZE, STATUS_CRASH, COMPACT_MIN_GARBAGE
+
+
+def bitmap(edges: dict) -> np.ndarray:
+    result = np.zeros(MAP_SIZE, dtype=np.uint8)
+    for edge, buckets in edges.items():
+        result[edge] = buckets
+    return result
+
+
+class TestBitmapStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = BitmapStore(os.path.join(self.tmp_dir, "bitmaps"))
+        self.store.put("bin", "@@", "a.png", bitmap({1: 1, 2: 3}), label="png_samples")
+        self.store.put("bin", "@@", "b.png", bitmap({2: 1, 3: 1}), label="png_samples")
+        self.store.put("bin", "@@", "a.jpg", bitmap({1: 1, 4: 1}), label="jpg_samples")
+        self.store.put("bin", "@@", "crash.jpg", bitmap({5: 1, 6: 1}), label="jpg_samples", status=STATUS_CRASH)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_queries(self):
+        png_rows = self.store.select(binary="bin", invocation="@@", label="png_samples")
+        jpg_rows = self.store.select(binary="bin", invocation="@@", label="jpg_samples")
+        self.assertEqual(len(jpg_rows), 1)  # The crash is not selected by default
+        self.assertEqual(self.store.coverage(png_rows), 4)
+        self.assertEqual(int(np.unpackbits(self.store.intersection(png_rows)).sum()), 1)
+        self.assertEqual(int(np.unpackbits(self.store.novelty(jpg_rows, png_rows)).sum()), 1)
+        self.assertEqual(self.store.coverage_per_label("bin", "@@"), {"png_samples": 4, "jpg_samples": 2})
+        self.assertEqual(self.store.novelty_per_label("bin", "@@"), {"png_samples": 3, "jpg_samples": 1})
+        self.assertEqual(self.store.status("bin", "@@", "crash.jpg"), STATUS_CRASH)
+        self.assertIsNone(self.store.get("bin", "", "a.png"))
+
+    def test_growth_and_persistence(self):
+        for i in range(128):
+            self.store.put("other", "", str(i), bitmap({i: 1}))
+        self.store.close()
+        store = BitmapStore(os.path.join(self.tmp_dir, "bitmaps"))
+        self.assertEqual(len(store), 128 + 4)
+        self.assertEqual(store.coverage(store.select(binary="other")), 128)
+        self.assertEqual(store.get("bin", "@@", "a.png")[2], 3)
+        store.close()
+
+    def test_sparse_storage_and_compaction(self):
+        dense = bitmap({edge: 1 for edge in range(0, MAP_SIZE, 64)})
+        for i in range(64):
+            self.store.put("big", "", str(i), dense, binary_hash="build1")
+        self.store.flush()
+        bitmaps_size = os.path.getsize(self.store.bitmaps_path)
+        self.assertLess(bitmaps_size, 64 * MAP_SIZE // 10)
+        for i in range(COMPACT_MIN_GARBAGE // (bitmaps_size // 64) + 1):
+            self.store.put("big", "", "replaced", dense, binary_hash="build1")
+        self.store.forget_stale("big", "build2")
+        self.store.flush()  # Only the four rows of bin are left, the rest of the file is reclaimed
+        self.assertLess(os.path.getsize(self.store.bitmaps_path), bitmaps_size // 64)
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual(self.store.get("bin", "@@", "a.png")[2], 3)
+
+    def test_rebuilt_binaries_and_changed_seeds_are_deleted(self):
+        seed = os.path.join(self.tmp_dir, "seed")
+        with open(seed, "w") as fp:
+            fp.write("seed")
+        self.store.put("bin2", "@@", seed, bitmap({1: 1}), binary_hash="build1")
+        self.assertEqual(self.store.forget_stale("bin2", "build1"), 0)
+        self.assertEqual(self.store.forget_stale("bin2", "build2"), 1)  # Rebuilt
+        self.assertIsNone(self.store.get("bin2", "@@", seed))
+        self.assertEqual(self.store.select(binary="bin2"), [])
+        self.assertEqual(len(self.store), 4)  # Deleted
+        self.store.put("bin2", "@@", seed, bitmap({1: 1}), binary_hash="build2")  # Run again
+        self.assertIsNotNone(self.store.get("bin2", "@@", seed))
+        with open(seed, "a") as fp:
+            fp.write("changed")
+        self.assertEqual(self.store.forget_stale("bin2", "build2"), 1)
+        self.assertEqual(len(self.store.select(binary="bin")), 3)  # Other binaries are kept
+
+    def test_coverage_evaluator(self):
+        evaluator = CoverageEvaluator.from_bitmap_store(self.store, "bin", "@@")
+        self.assertEqual(evaluator.type_coverage_list[0], ["jpg_samples", "png_samples"])
+        self.assertEqual(list(evaluator.type_coverage_list[1]), [2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from fuzz_managers.campaign_index import CampaignIndex, AFL_CONFIG, INFERENCE_CONFIG
+from helpers import inotify
+
+
+class TestCampaignIndex(unittest.TestCase):
+    """
+    Unittesting the incremental index of the configs in a results directory.
+    """
+
+    def setUp(self):
+        self.configuration_dir = tempfile.mkdtemp()
+        self.package_dir = os.path.join(self.configuration_dir, "pkg")
+        os.makedirs(self.package_dir)
+        self.write("main.json", [{"binary_path": "main"}])
+        self.index = CampaignIndex(self.configuration_dir)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.configuration_dir)
+
+    def write(self, name, content, age=10):
+        path = os.path.join(self.package_dir, name)
+        with open(path, "w") as fp:
+            json.dump(content, fp)
+        past = time.time() - age  # Outside of the racy window
+        os.utime(path, (past, past))
+        return path
+
+    def test_parses_configs(self):
+        inference_config = os.path.join(self.package_dir, "main.json")
+        self.assertEqual(self.index.refresh(), {inference_config})
+        entry = self.index.config(inference_config)
+        self.assertEqual(entry.kind, INFERENCE_CONFIG)
+        self.assertEqual(entry.conf, [{"binary_path": "main"}])
+        self.assertEqual(self.index.packages(), ["pkg"])
+        self.assertEqual(self.index.refresh(), set())  # Nothing changed
+
+    def test_config_becomes_valid_with_fuzzer_stats(self):
+        afl_config = self.write("main.afl_config", {"status": 3, "afl_out_dir": "/results/pkg/main/afl_fuzz"})
+        self.index.refresh()
+        entry = self.index.config(afl_config)
+        self.assertEqual((entry.kind, entry.status, entry.valid), (AFL_CONFIG, 3, False))
+        os.makedirs(os.path.join(self.package_dir, "main", "afl_fuzz"))
+        with open(os.path.join(self.package_dir, "main", "afl_fuzz", "fuzzer_stats"), "w") as fp:
+            fp.write("execs_done : 1\n")
+        self.assertEqual(self.index.refresh([]), {afl_config})
+        self.assertTrue(self.index.config(afl_config).valid)
+
+    def test_refresh_paths(self):
+        self.index.refresh()
+        afl_config = self.write("main.afl_config", {"status": 2, "min_seeds_dir": "/results/pkg/main/minseeds"})
+        self.assertEqual(self.index.refresh([afl_config]), {afl_config})
+        self.write("pkg.build", {"docker_image_name": "pkg-image"})
+        self.index.refresh([os.path.join(self.package_dir, "pkg.build")])
+        self.assertEqual(self.index.image_name("pkg"), "pkg-image")
+        os.remove(afl_config)
+        self.assertEqual(self.index.refresh([afl_config]), {afl_config})
+        self.assertIsNone(self.index.config(afl_config))
+
+    def test_uninferred_packages(self):
+        other_dir = os.path.join(self.configuration_dir, "other")
+        os.makedirs(other_dir)
+        for package_dir in [self.package_dir, other_dir]:
+            with open(os.path.join(package_dir, os.path.basename(package_dir) + ".build"), "w") as fp:
+                json.dump({"docker_image_name": "image"}, fp)
+        self.index.refresh()
+        self.assertEqual(self.index.uninferred_packages(), ["other"])  # pkg has an inference config
+        self.assertEqual(self.index.uninferred_packages(["pkg"]), [])
+
+    def test_removed_package(self):
+        self.index.refresh()
+        shutil.rmtree(self.package_dir)
+        self.assertEqual(len(self.index.refresh()), 1)
+        self.assertEqual(self.index.configs(), [])
+
+    def test_crash_counts(self):
+        afl_config = self.write("main.afl_config", {"status": 3, "afl_out_dir": "/results/pkg/main/afl_fuzz"})
+        instances = [os.path.join(self.package_dir, "main", "afl_fuzz", name) for name in ["master", "slave1"]]
+        for instance in instances:
+            os.makedirs(os.path.join(instance, "crashes"))
+            with open(os.path.join(instance, "fuzzer_stats"), "w") as fp:
+                fp.write("unique_crashes    : 0\n")
+        self.index.refresh()
+        self.assertEqual(self.index.refresh_crashes(), set())
+        self.assertFalse(self.index.crashed("pkg"))
+        for name in ["README.txt", "id:000000,sig:11"]:
+            with open(os.path.join(instances[1], "crashes", name), "w") as fp:
+                fp.write("crash")
+        self.assertEqual(self.index.refresh_crashes(["pkg"]), {"pkg"})
+        self.assertTrue(self.index.crashed("pkg"))
+        self.assertEqual(self.index.crash_counts("pkg"), {afl_config: {instances[0]: 0, instances[1]: 1}})
+        shutil.rmtree(os.path.join(self.package_dir, "main"))
+        self.assertEqual(self.index.refresh_crashes(), {"pkg"})
+        self.assertFalse(self.index.crashed("pkg"))
+
+
+@unittest.skipUnless(inotify.available(), "inotify is not available")
+class TestInotify(unittest.TestCase):
+    """
+    Unittesting the inotify binding.
+    """
+
+    def test_reports_written_files(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with inotify.Inotify() as watcher:
+                watcher.add_watch(directory)
+                path = os.path.join(directory, "main.afl_config")
+                with open(path, "w") as fp:
+                    fp.write("{}")
+                events = watcher.read_events(timeout=5)
+                self.assertIn(path, [event.path for event in events])
+                self.assertEqual(watcher.read_events(timeout=0), [])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.corpus_minimizer import CorpusMinimizer, CorpusTraces, greedy_cover, tuples_of_bitmap
+from helpers.exceptions import ForkserverError
+
+
+def traces_of(tuple_sets, sizes):
+    tuples = [np.array(sorted(s), dtype=np.uint32) for s in tuple_sets]
+    offsets = np.concatenate([[0], np.cumsum([len(t) for t in tuples])]).astype(np.int64)
+    return CorpusTraces(["f{0}".format(i) for i in range(len(tuples))], np.array(sizes, dtype=np.int64),
+                        np.concatenate(tuples), offsets, [])
+
+
+class TestGreedyCover(unittest.TestCase):
+    """
+    Unittesting the set cover on synthetic traces.
+    """
+
+    def test_covers_all_tuples(self):
+        traces = traces_of([{1, 2, 3}, {1, 2}, {4}, {3, 4}, {1, 2, 3, 4, 5}], [10, 10, 10, 10, 10])
+        self.assertEqual(greedy_cover(traces), [4])
+
+    def test_prefers_cheap_inputs(self):
+        traces = traces_of([{1, 2}, {1}, {2}], [100000, 10, 10])
+        self.assertEqual(sorted(greedy_cover(traces)), [1, 2])
+
+    def test_tuples_of_bitmap(self):
+        bitmap = np.zeros(1 << 16, dtype=np.uint8)
+        bitmap[3] = 1
+        bitmap[5] = 128
+        self.assertEqual(list(tuples_of_bitmap(bitmap)), [24, 47])
+
+
+class DyingTracer(object):
+    """
+    A tracer whose forkserver dies after the first chunk.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+
+    def run_batch(self, files):
+        self.chunks += 1
+        if self.chunks > 1:
+            raise ForkserverError("main", "forkserver is gone")
+        return []
+
+    def close(self):
+        pass
+
+
+class TestTraceFailure(unittest.TestCase):
+    def test_forkserver_dies_while_tracing(self):
+        minimizer = CorpusMinimizer("main", "@@", env={}, timeout=0.5, cores=2)
+        with mock.patch.object(minimizer, "_tracer", return_value=DyingTracer()):
+            with self.assertRaises(ForkserverError):  # Raised for the afl-cmin fallback instead of hanging
+                minimizer.trace(["input{0}".format(i) for i in range(4 * 64)])
+
+
+@unittest.skipUnless(shutil.which("gcc"), "gcc is needed to build the forkserver mock")
+class TestCorpusMinimizer(unittest.TestCase):
+    """
+    Unittesting the minimizer against the forkserver mock (one edge per (byte, position), crashes on "X").
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.binary = os.path.join(cls.tmp_dir, "main")
+        mock_source = os.path.join(os.path.dirname(os.path.realpath(__file__)), "mock_data/forkserver_mock/main.c")
+        subprocess.check_call(["gcc", "-o", cls.binary, mock_source])
+        cls.corpus = os.path.join(cls.tmp_dir, "corpus")
+        os.makedirs(cls.corpus)
+        for name, content in [("a", b"a"), ("ab", b"ab"), ("abc", b"abc"), ("xy", b"xy"), ("crash", b"aX")]:
+            with open(os.path.join(cls.corpus, name), "wb") as fp:
+                fp.write(content)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_minimize(self):
+        out_dir = os.path.join(self.tmp_dir, "cmin")
+        CorpusMinimizer(self.binary, "@@", env={}, timeout=0.5, cores=2).minimize(self.corpus, out_dir)
+        self.assertEqual(sorted(os.listdir(out_dir)), ["abc", "xy"])
+
+    def test_crash_only(self):
+        out_dir = os.path.join(self.tmp_dir, "crashes")
+        CorpusMinimizer(self.binary, "", env={}, timeout=0.5, crash_only=True).minimize(self.corpus, out_dir)
+        self.assertEqual(os.listdir(out_dir), ["crash"])
+
+    def test_deadline_keeps_untraced_inputs(self):
+        out_dir = os.path.join(self.tmp_dir, "untraced")
+        kept = CorpusMinimizer(self.binary, "@@", env={}, timeout=0.5).minimize(self.corpus, out_dir, time_limit=-1)
+        self.assertEqual(len(kept), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.coverage_oracle import CoverageOracle, CoverageOraclePool, RUN_OK, RUN_CRASH, RUN_TIMEOUT, \
+    FORKSRV_FD, invocation_argv, tuples_of_results
+from helpers.exceptions import ForkserverError
+
+
+@unittest.skipUnless(shutil.which("gcc"), "gcc is needed to build the forkserver mock")
+class TestCoverageOracle(unittest.TestCase):
+    """
+    Unittesting the coverage oracle against a mock binary that speaks the afl forkserver protocol.
+    The mock records one edge per (byte, position), crashes on "X" and hangs on "T".
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.binary = os.path.join(cls.tmp_dir, "main")
+        mock_source = os.path.join(os.path.dirname(os.path.realpath(__file__)), "mock_data/forkserver_mock/main.c")
+        subprocess.check_call(["gcc", "-o", cls.binary, mock_source])
+        cls.seeds = {}
+        for name, content in [("a", b"ab"), ("b", b"abc"), ("crash", b"aX"), ("hang", b"T")]:
+            cls.seeds[name] = os.path.join(cls.tmp_dir, name)
+            with open(cls.seeds[name], "wb") as fp:
+                fp.write(content)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_file_and_stdin_invocation(self):
+        for invocation in ["@@", ""]:
+            with CoverageOracle(self.binary, invocation, env={}, timeout=0.5) as oracle:
+                results = oracle.run_batch([self.seeds["a"], self.seeds["b"], self.seeds["crash"], self.seeds["hang"]])
+                self.assertEqual([r.status for r in results], [RUN_OK, RUN_OK, RUN_CRASH, RUN_TIMEOUT])
+                # "ab" -> 2 edges + exit edge, "abc" adds one more edge
+                self.assertEqual(tuples_of_results(results), 4)
+                self.assertEqual(tuples_of_results(results, crash_only=True), 2)
+                # The forkserver survives timeouts and crashes
+                self.assertEqual(oracle.run(self.seeds["a"]).status, RUN_OK)
+
+    def test_pool(self):
+        with CoverageOraclePool(self.binary, "@@", env={}, timeout=0.5, size=2) as pool:
+            coverage, results = pool.coverage([self.seeds["a"], self.seeds["b"]])
+            self.assertEqual(coverage, 4)
+            self.assertEqual(pool.coverage([self.seeds["a"]])[0], 3)
+
+    def test_pool_replaces_broken_oracles(self):
+        with CoverageOraclePool(self.binary, "@@", env={}, timeout=0.5, size=1) as pool:
+            oracle = pool._acquire()
+            waiting = threading.Thread(target=pool.run_batch, args=([self.seeds["a"]],))
+            waiting.start()
+            pool._release(oracle, broken=True)  # Its forkserver died, the waiting thread starts a new one
+            waiting.join(timeout=10)
+            self.assertFalse(waiting.is_alive())
+
+    def test_forkservers_only_get_their_pipes(self):
+        read_fd, write_fd = os.pipe()
+        os.set_inheritable(write_fd, True)  # Would keep readers of the pipe from seeing EOF if the target got it
+        own_fd = os.dup2(read_fd, FORKSRV_FD)  # Another thread's fd on the forkserver fd must stay untouched
+        try:
+            with CoverageOraclePool(self.binary, "@@", env={}, timeout=0.5, size=2) as pool:
+                first, second = pool._acquire(), pool._acquire()
+                for oracle in (first, second):
+                    self.assertEqual(sorted(os.listdir("/proc/{0}/fd".format(oracle.pid)), key=int),
+                                     ["0", "1", "2", "198", "199"])
+                    self.assertEqual(oracle.run(self.seeds["a"]).status, RUN_OK)
+                pool._release(first)
+                pool._release(second)
+            self.assertTrue(os.path.sameopenfile(own_fd, read_fd))
+        finally:
+            os.close(own_fd)
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_no_forkserver(self):
+        with self.assertRaises(ForkserverError):
+            CoverageOracle(shutil.which("true"), "@@", env={}, timeout=0.1).start()
+
+    def test_invocation_argv(self):
+        self.assertEqual(invocation_argv("-f  'a b' --in=@@", "/tmp/x y"), ["-f", "a b", "--in=/tmp/x y"])
+        self.assertEqual(invocation_argv("", "/tmp/x"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
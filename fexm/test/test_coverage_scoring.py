@@ -0,0 +1,55 @@
+import os
+import unittest
+
+import numpy as np
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.coverage_scoring import CoverageScores, rank, rank_input_vectors
+
+
+class TestCoverageScoring(unittest.TestCase):
+    COVERAGE_LISTS = [
+        [("png", 100), ("jpg", 300), ("pdf", 200)],
+        [("png", 50), ("jpg", 50)],
+        [("png", 10), (None, 0), ("xml", 900), ("txt", 20), ("zip", 10)],
+    ]
+
+    def test_matches_per_parameter_scores(self):
+        scores = CoverageScores(self.COVERAGE_LISTS)
+        for row, coverage_list in enumerate(self.COVERAGE_LISTS):
+            filetypes, coverages = zip(*coverage_list)
+            coverages = np.array(coverages, dtype=float)
+            mean, std = coverages.mean(), coverages.std()
+            deviation = np.where(coverages >= mean, coverages - mean, 0)
+            chebyshev = deviation / std if std > 0 else deviation
+            self.assertEqual(scores.deviation_scores_of(row)[0], list(filetypes))
+            np.testing.assert_allclose(scores.deviation_scores_of(row)[1], deviation)
+            np.testing.assert_allclose(scores.chebyshev_scores_of(row)[1], chebyshev)
+            self.assertEqual(scores.best_chebyshev_tuple(row)[0], filetypes[int(np.argmax(chebyshev))])
+        self.assertEqual(scores.best_deviation_tuple(1), ("png", 0.0))  # First maximum wins
+        self.assertEqual(scores.outliers(2, 1.5), ["xml"])
+        self.assertEqual(scores.outliers(1, 0), [])
+
+    def test_abs_statistics(self):
+        # A failed invocation (-1) counts as 1 for the statistics, but is never above the mean
+        scores = CoverageScores.from_dict({"png": -1, "jpg": 0, "pdf": 0, "txt": 0}, abs_statistics=True)
+        self.assertEqual(scores.means[0], 0.25)
+        self.assertEqual(scores.outliers(0, 0), [])
+        self.assertEqual(scores.above_mean(0), [])
+
+    def test_rank(self):
+        self.assertEqual(rank([3, 5, 3, 7]), [3, 1, 0, 2])
+
+        class Config:
+            def __init__(self, name, max_coverage):
+                self.name = name
+                self.max_coverage = max_coverage
+
+        configs = [Config("a", 10), Config("b", 20), Config("c", 10), Config("d", 20)]
+        expected = sorted(configs, key=lambda c: c.max_coverage, reverse=True)
+        self.assertEqual([c.name for c in rank_input_vectors(configs)], [c.name for c in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers.elf_deduplicator import ElfDeDuplicator
+
+
+@unittest.skipUnless(shutil.which("strip"), "strip is needed to create the stripped mock binary")
+class TestElfDeDuplicator(unittest.TestCase):
+    """
+    Unittesting the deduplication of stripped and unstripped binaries.
+    """
+
+    def setUp(self):
+        mock_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "mock_data/input_mock")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.unstripped_binary = os.path.join(self.tmp_dir, "main")
+        self.stripped_binary = os.path.join(self.tmp_dir, "main_stripped")
+        self.other_binary = os.path.join(mock_dir, "shared_library_mock/a.out")
+        shutil.copy(os.path.join(mock_dir, "jpg_binary/main"), self.unstripped_binary)
+        subprocess.check_call(["strip", self.unstripped_binary, "-o", self.stripped_binary])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stripped_and_unstripped_are_duplicates(self):
+        self.assertEqual(ElfDeDuplicator.calculate_section_hash(self.unstripped_binary),
+                         ElfDeDuplicator.calculate_section_hash(self.stripped_binary))
+        groups = ElfDeDuplicator.find_duplicate_groups([self.stripped_binary, self.other_binary,
+                                                        self.unstripped_binary], cores=2)
+        self.assertEqual(groups, [[self.unstripped_binary, self.stripped_binary], [self.other_binary]])
+
+    def test_unstripped_binary_is_kept(self):
+        self.assertEqual(ElfDeDuplicator.deduplicate_binaries([self.stripped_binary, self.unstripped_binary]),
+                         [self.unstripped_binary])
+        self.assertEqual(ElfDeDuplicator.deduplicate_binaries([self.stripped_binary]), [self.stripped_binary])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers.elf_reader import ElfReader
+from helpers.exceptions import InvalidElfFile
+
+
+class TestElfReader(unittest.TestCase):
+    """
+    Unittesting the in-process elf reader against the mock binaries.
+    """
+
+    def setUp(self):
+        self.mock_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "mock_data/input_mock")
+        self.instrumented_binary = os.path.join(self.mock_dir, "jpg_binary/main")
+        self.shared_library_binary = os.path.join(self.mock_dir, "shared_library_mock/a.out")
+
+    def test_instrumented_binary(self):
+        with ElfReader(self.instrumented_binary) as reader:
+            self.assertFalse(reader.is_stripped())
+            self.assertEqual(reader.needed_libraries(), ["libc.so.6"])
+            self.assertEqual(reader.interpreter(), "/lib64/ld-linux-x86-64.so.2")
+            self.assertTrue(reader.has_symbol("__afl_area_ptr"))
+            self.assertFalse(reader.uses_asan())
+            # objdump -d main | grep -c afl_area_ptr
+            self.assertEqual(reader.count_instrumentation_sites(), 3)
+
+    def test_uninstrumented_binary(self):
+        with ElfReader(self.shared_library_binary) as reader:
+            self.assertEqual(reader.needed_libraries(), ["shared.so"])
+            self.assertFalse(reader.has_symbol("__afl_area_ptr"))
+            self.assertEqual(reader.count_instrumentation_sites(), 0)
+
+    def test_not_an_elf(self):
+        with self.assertRaises(InvalidElfFile):
+            ElfReader(os.path.realpath(__file__))
+
+
+if __name__ == '__main__':
+    unittest.main()
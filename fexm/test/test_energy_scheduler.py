@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from fuzz_managers.energy_scheduler import EnergyScheduler, campaign_productivity, instance_productivity
+
+
+class TestProductivity(unittest.TestCase):
+    """
+    Unittesting the productivity estimate from plot_data.
+    """
+
+    def test_session_gaps_are_not_fuzzing_time(self):
+        rows = [(0, 10, 0), (60, 20, 0), (10000, 20, 0), (10060, 30, 1)]
+        gain, fuzzing_time = instance_productivity(rows, crash_weight=10)
+        self.assertEqual((gain, fuzzing_time), (30, 120))
+
+    def test_window(self):
+        rows = [(0, 0, 0), (60, 100, 0), (120, 101, 0)]
+        self.assertEqual(instance_productivity(rows, window=60), (1, 60))
+
+    def test_campaign_productivity(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            self.assertIsNone(campaign_productivity(out_dir))
+            for instance, paths in [("master", 10), ("slave1", 30)]:
+                os.makedirs(os.path.join(out_dir, instance))
+                with open(os.path.join(out_dir, instance, "plot_data"), "w") as fp:
+                    fp.write("# unix_time, cycles_done, cur_path, paths_total, pending_total, pending_favs, "
+                             "map_size, unique_crashes, unique_hangs, max_depth, execs_per_sec\n")
+                    fp.write("0, 0, 0, 1, 1, 1, 0.1%, 0, 0, 1, 100.0\n")
+                    fp.write("60, 0, 0, {0}, 1, 1, 0.1%, 0, 0, 1, 100.0\n".format(1 + paths))
+            self.assertEqual(campaign_productivity(out_dir), 20)  # 40 paths in 2 CPU minutes
+        finally:
+            shutil.rmtree(out_dir)
+
+
+class TestEnergyScheduler(unittest.TestCase):
+    """
+    Unittesting the slot allocation.
+    """
+
+    def setUp(self):
+        self.now = 0
+        self.scheduler = EnergyScheduler(fairness_floor=0, exploration=0, clock=lambda: self.now)
+
+    def wait(self, *keys):
+        for key in keys:
+            self.now += 1
+            self.scheduler.add(key)
+
+    def test_unobserved_binaries_first(self):
+        self.scheduler.observe("a", 100)
+        self.wait("a", "b")
+        self.assertEqual(self.scheduler.select(1), ["b"])
+
+    def test_most_productive_binaries(self):
+        for key, productivity in [("a", 1), ("b", 50), ("c", 10)]:
+            self.scheduler.observe(key, productivity)
+        self.wait("a", "b", "c")
+        self.assertEqual(self.scheduler.select(2), ["b", "c"])
+        self.assertEqual(self.scheduler.select(5), ["a"])
+        self.assertEqual(self.scheduler.select(1), [])
+
+    def test_fairness_floor(self):
+        scheduler = EnergyScheduler(fairness_floor=0.5, exploration=0, clock=lambda: self.now)
+        for key, productivity in [("a", 1), ("b", 50), ("c", 10)]:
+            scheduler.observe(key, productivity)
+            self.now += 1
+            scheduler.add(key)
+        self.assertEqual(scheduler.select(2), ["a", "b"])  # The longest waiting one and the most productive one
+
+    def test_invalid_floor(self):
+        with self.assertRaises(ValueError):
+            EnergyScheduler(fairness_floor=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.file_access_tracer import FileAccessTracer, parse_events
+from helpers.utils import check_output_until_match
+
+
+@unittest.skipUnless(shutil.which("gcc"), "gcc is needed to build fileaccess.so")
+class TestFileAccessTracer(unittest.TestCase):
+    """
+    Unittesting the file access tracer with preeny's fileaccess.so against a mock binary.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        preeny_src = os.path.join(parentdir, "docker_scripts/afl_base_image/preeny/src")
+        cls.library = os.path.join(cls.tmp_dir, "fileaccess.so")
+        subprocess.check_call(["gcc", "-shared", "-fPIC", "-o", cls.library, os.path.join(preeny_src, "fileaccess.c"),
+                               os.path.join(preeny_src, "logging.c"), "-ldl"])
+        cls.binary = os.path.join(cls.tmp_dir, "main")
+        subprocess.check_call(["gcc", "-o", cls.binary,
+                               os.path.join(parentdir, "test/mock_data/file_access_mock/main.c")])
+        cls.dummyfile = os.path.join(cls.tmp_dir, "dummyfile")
+        with open(cls.dummyfile, "w") as fp:
+            fp.write("CONTENT")
+        cls.tracer = FileAccessTracer(cls.binary, library_path=cls.library)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def trace(self, arguments, stdin=False, timeout=5, cancel_event=None):
+        return self.tracer.trace(arguments, self.dummyfile, dict(os.environ), stdin=stdin, timeout=timeout,
+                                 cancel_event=cancel_event)
+
+    def test_file_accesses(self):
+        self.assertTrue(self.tracer.available)
+        self.assertEqual(self.trace(["read", self.dummyfile]), (True, False))
+        self.assertEqual(self.trace(["write", os.path.join(self.tmp_dir, "other")]), (False, False))
+        self.assertEqual(self.trace(["none", self.dummyfile]), (False, False))
+        self.assertEqual(self.trace(["stdin"], stdin=True), (True, False))
+        self.assertEqual(self.trace(["none"], stdin=True), (False, False))
+
+    def test_write_only_does_not_count(self):
+        other = os.path.join(self.tmp_dir, "written")
+        with open(other, "w") as fp:
+            fp.write("CONTENT")
+        accessed, _ = self.tracer.trace(["write", other], other, dict(os.environ), timeout=5)
+        self.assertFalse(accessed)
+
+    def test_timeout_and_cancel(self):
+        self.assertEqual(self.trace(["hang"], timeout=0.2), (False, True))
+        cancel_event = threading.Event()
+        threading.Timer(0.2, cancel_event.set).start()
+        self.assertEqual(self.trace(["hang"], timeout=None, cancel_event=cancel_event), (False, True))
+
+    def test_stop_on_access(self):
+        self.assertEqual(self.trace(["readhang", self.dummyfile], timeout=0.5), (True, True))
+        start = time.time()
+        self.assertEqual(self.tracer.trace(["readhang", self.dummyfile], self.dummyfile, dict(os.environ), timeout=5,
+                                           stop_on_access=True), (True, False))
+        self.assertLess(time.time() - start, 4)
+
+    def test_parse_events(self):
+        events = parse_events(b"O 1 3\nR 0\ngarbage\nO 0 4\n")
+        self.assertEqual([e.reads_file() for e in events], [False, True, True])
+
+    def test_unavailable(self):
+        self.assertFalse(FileAccessTracer(self.binary, qemu=True, library_path=self.library).available)
+        self.assertFalse(FileAccessTracer(self.dummyfile, library_path=self.library).available)
+        self.assertFalse(FileAccessTracer(self.binary, library_path=self.dummyfile + "_missing").available)
+
+
+class TestStreamingOutput(unittest.TestCase):
+    def test_kill_on_match(self):
+        start = time.time()
+        output, timed_out, matched = check_output_until_match(
+            "sh", ["-c", "echo hit; echo; echo other; echo hit; sleep 10"], lambda line: line == "hit", timeout=10,
+            skip_lines=1)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual((output, timed_out, matched), ("hit\n\nother\nhit\n", False, True))
+
+    def test_timeout_without_match(self):
+        output, timed_out, matched = check_output_until_match("sh", ["-c", "echo other; sleep 10"],
+                                                              lambda line: line == "hit", timeout=0.3)
+        self.assertEqual((timed_out, matched), (True, False))
+        output, timed_out, matched = check_output_until_match("printf", ["a\nhit"], lambda line: line == "hit")
+        self.assertEqual((output, timed_out, matched), ("a\nhit", False, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
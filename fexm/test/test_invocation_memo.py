@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+os.sys.path.insert(0, os.path.join(parentdir, "configfinder"))
+from configfinder.heuristic_config_creator import HeuristicConfigCreator
+from invocation_memo import InvocationMemo, CHANNEL_FILE, CHANNEL_STDIN, ENV_DESOCK, ENV_WITHOUT_DESOCK
+
+
+class TestInvocationMemo(unittest.TestCase):
+    """
+    Unittesting the memo of tried invocations.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        self.binary_path = os.path.join(self.tmp_dir, "binary")
+        with open(self.binary_path, "wb") as fp:
+            fp.write(b"\x7fELF first build")
+        self.memo_path = os.path.join(self.tmp_dir, "package", "binary.invocations.json")
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_keys(self):
+        memo = InvocationMemo(self.binary_path)
+        memo.put("-i @@", CHANNEL_FILE, ENV_WITHOUT_DESOCK, True, 0.5)
+        self.assertTrue(memo.get("-i @@", CHANNEL_FILE, ENV_WITHOUT_DESOCK).accepted)
+        self.assertEqual(memo.get("-i @@", CHANNEL_FILE, ENV_WITHOUT_DESOCK).duration, 0.5)
+        self.assertIsNone(memo.get("-i @@", CHANNEL_STDIN, ENV_WITHOUT_DESOCK))
+        self.assertIsNone(memo.get("-i @@", CHANNEL_FILE, ENV_DESOCK))
+
+    def test_persistence(self):
+        memo = InvocationMemo(self.binary_path, path=self.memo_path)
+        memo.put("", CHANNEL_STDIN, ENV_DESOCK, False, 1.2)
+        memo.save()
+        resumed = InvocationMemo(self.binary_path, path=self.memo_path)
+        self.assertFalse(resumed.get("", CHANNEL_STDIN, ENV_DESOCK).accepted)
+        with open(self.binary_path, "wb") as fp:
+            fp.write(b"\x7fELF second build")
+        rebuilt = InvocationMemo(self.binary_path, path=self.memo_path)
+        self.assertEqual(len(rebuilt), 0)
+
+    def test_try_invocation_reuses_verdicts(self):
+        h = HeuristicConfigCreator(self.binary_path, self.tmp_dir, use_coverage_oracle=False,
+                                   invocation_memo=InvocationMemo(self.binary_path, path=self.memo_path))
+        with mock.patch.object(h, "trace_invocation", return_value=True) as trace_invocation:
+            self.assertTrue(h.try_invocation("@@"))
+            self.assertTrue(h.try_invocation("@@"))
+            self.assertTrue(h.try_invocation("@@", stdin=True, without_desock=True))
+        self.assertEqual(trace_invocation.call_count, 2)
+        self.assertEqual(h.invocation_memo.hits, 1)
+
+    def test_cancelled_probes_are_not_memoized(self):
+        h = HeuristicConfigCreator(self.binary_path, self.tmp_dir, use_coverage_oracle=False)
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with mock.patch.object(h, "trace_invocation", return_value=False) as trace_invocation:
+            h.try_invocation("-f @@", cancel_event=cancel_event)
+            h.try_invocation("-f @@")
+        self.assertEqual(trace_invocation.call_count, 2)
+        self.assertFalse(h.invocation_memo.get("-f @@", CHANNEL_FILE, ENV_WITHOUT_DESOCK).accepted)
+
+
+if __name__ == '__main__':
+    unittest.main()
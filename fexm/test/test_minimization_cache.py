@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.minimization_cache import MinimizationCache, remove_orphans
+
+
+class TestMinimizationCache(unittest.TestCase):
+    """
+    Unittesting the cache of minimized corpora and the garbage collection in the volume.
+    """
+
+    def setUp(self):
+        self.volume = tempfile.mkdtemp()
+        self.cache = MinimizationCache(os.path.join(self.volume, ".minimization_cache"), tools_fingerprint="")
+        self.binary_dir = os.path.join(self.volume, "pkg", "main")
+        os.makedirs(self.binary_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.volume)
+
+    def corpus(self, name, files=("a", "b")):
+        path = os.path.join(self.binary_dir, name)
+        os.makedirs(path)
+        for file in files:
+            with open(os.path.join(path, file), "w") as fp:
+                fp.write(file)
+        return path
+
+    def reference(self, min_seeds_dir):
+        with open(os.path.join(self.volume, "pkg", "main.afl_config"), "w") as fp:
+            json.dump({"min_seeds_dir": min_seeds_dir}, fp)
+
+    def test_key_depends_on_settings(self):
+        key = self.cache.key_for("binary", "@@", "seeds", qemu=False, do_tmin=True, tmin_total_time=120)
+        self.assertEqual(key, self.cache.key_for("binary", "@@", "seeds", qemu=False, do_tmin=True,
+                                                 tmin_total_time=120))
+        self.assertNotEqual(key, self.cache.key_for("binary", "", "seeds", qemu=False, do_tmin=True,
+                                                    tmin_total_time=120))
+        self.assertNotEqual(key, self.cache.key_for("binary", "@@", "other seeds", qemu=False, do_tmin=True,
+                                                    tmin_total_time=120))
+        self.assertNotEqual(key, self.cache.key_for("binary", "@@", "seeds", qemu=False, do_tmin=True,
+                                                    tmin_total_time=60))
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get("key"))
+        cached = self.cache.put("key", self.corpus("afl_tmin_1"), metadata={"binary_path": "main"})
+        self.assertEqual(self.cache.get("key"), cached)
+        self.assertEqual(sorted(os.listdir(cached)), ["a", "b"])
+        self.assertFalse(os.path.exists(os.path.join(self.binary_dir, "afl_tmin_1")))
+        # A concurrent minimization of the same key keeps the first corpus
+        self.assertEqual(self.cache.put("key", self.corpus("afl_tmin_2", files=["c"])), cached)
+        self.assertEqual(sorted(os.listdir(cached)), ["a", "b"])
+        self.assertEqual([entry["binary_path"] for entry in self.cache.entries()], ["main"])
+
+    def test_orphans_are_removed(self):
+        referenced = self.corpus("afl_tmin_1")
+        self.corpus("afl_cmin_1")
+        self.corpus("minseeds_1")
+        self.reference(referenced)
+        self.assertEqual(remove_orphans(self.volume, grace_period=60), [])  # Might still be in use
+        removed = remove_orphans(self.volume, grace_period=0)
+        self.assertEqual(sorted(os.path.basename(path) for path in removed), ["afl_cmin_1", "minseeds_1"])
+        self.assertEqual(os.listdir(self.binary_dir), ["afl_tmin_1"])
+
+    def test_container_paths_are_referenced(self):
+        referenced = self.corpus("afl_tmin_1")
+        self.corpus("minseeds_1")
+        self.reference("/results/pkg/main/afl_tmin_1")  # As written by the minimizer container
+        removed = remove_orphans(self.volume, grace_period=0)
+        self.assertEqual([os.path.basename(path) for path in removed], ["minseeds_1"])
+        self.assertTrue(os.path.isdir(referenced))
+        cached = self.cache.put("key", self.corpus("afl_tmin_2"))
+        self.reference("/results/.minimization_cache/key/" + os.path.basename(cached))
+        self.cache.collect_garbage(max_age=0, grace_period=0)
+        self.assertEqual(self.cache.get("key"), cached)
+
+    def test_unused_entries_are_collected(self):
+        referenced = self.cache.put("referenced", self.corpus("afl_tmin_1"))
+        self.cache.put("unused", self.corpus("afl_tmin_2"))
+        self.reference(referenced)
+        past = time.time() - 3600
+        for key in ["referenced", "unused"]:
+            os.utime(os.path.join(self.cache.cache_dir, key, "entry.json"), (past, past))
+        self.cache.collect_garbage(max_age=60, grace_period=0)
+        self.assertEqual(self.cache.get("referenced"), referenced)
+        self.assertIsNone(self.cache.get("unused"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+os.sys.path.insert(0, os.path.join(parentdir, "configfinder"))
+from configfinder.heuristic_config_creator import HeuristicConfigCreator
+
+
+class TestParameterDiscovery(unittest.TestCase):
+    """
+    Unittesting the parallel parameter discovery with a mocked try_invocation.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        self.tried = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def figure_out_parameters(self, valid: set, cores: int, slow: set = frozenset(), error: Exception = None):
+        def try_invocation(invocation, stdin=False, without_desock=False, dummyfile_path=None, cancel_event=None):
+            with self.lock:
+                self.tried.append(invocation)
+            if error:
+                raise error
+            if invocation in slow:  # A probe running into its timeout, unless cancelled
+                cancel_event.wait(10)
+                return False
+            return invocation in valid
+
+        h = HeuristicConfigCreator(binary_path="/bin/true", results_out_dir=self.tmp_dir, cores=cores,
+                                   use_coverage_oracle=False)
+        with mock.patch.object(h, "try_invocation", side_effect=try_invocation), \
+                mock.patch.object(h, "try_inferring_parameter_candidates_from_help", return_value={"--in @@"}):
+            return h.figure_out_parameters()
+
+    def test_same_result_as_serial(self):
+        valid = {"-i @@", "-x @@ /dev/null", "--in @@ -o /dev/nulll", "convert @@"}
+        expected = {"-i @@", "-x @@ /dev/null", "--in @@ -o /dev/nulll"}
+        self.assertEqual(self.figure_out_parameters(valid, cores=1), expected)
+        self.assertEqual(self.figure_out_parameters(valid, cores=8), expected)
+        self.assertEqual(self.figure_out_parameters({"@@ /dev/null", "-i @@"}, cores=8), {"@@ /dev/null"})
+        self.assertEqual(self.figure_out_parameters({"show -"}, cores=8), {"-"})
+        self.assertEqual(self.figure_out_parameters(set(), cores=8), set())
+        self.assertEqual(os.listdir(self.tmp_dir), [])  # The dummyfiles are removed
+
+    def test_lower_priority_probes_are_cancelled(self):
+        start = time.time()
+        slow = {"-a @@", "-b @@ -t", "convert @@"}
+        self.assertEqual(self.figure_out_parameters({""}, cores=4, slow=slow), {""})
+        self.assertLess(time.time() - start, 5)
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(PermissionError):
+            self.figure_out_parameters(set(), cores=4, error=PermissionError("strace not allowed"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from fuzz_managers.pipeline import Pipeline, Stage
+
+
+class FakeResult(object):
+    def __init__(self, ready: bool):
+        self._ready = ready
+
+    def ready(self):
+        return self._ready
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    Unittesting the streaming of items through the stages with fake celery tasks.
+    """
+
+    def setUp(self):
+        self.submitted = []
+        self.finished = set()
+
+        def submit(stage_name):
+            def submit_task(key, item):
+                task_id = stage_name + ":" + key
+                self.submitted.append(task_id)
+                return task_id
+
+            return submit_task
+
+        self.pipeline = Pipeline([Stage("build", submit("build"), concurrency=2,
+                                        on_done=lambda key, item, task_id: self.pipeline.put("minimize", key, item)),
+                                  Stage("minimize", submit("minimize"))])
+
+    def test_items_move_on_independently(self):
+        for package in ["a", "b", "c"]:
+            self.assertTrue(self.pipeline.put("build", package))
+        self.assertFalse(self.pipeline.put("build", "a"))  # Already queued
+        self.assertEqual(self.pipeline.pump(), ["build:a", "build:b"])  # At most two builds at once
+        self.assertTrue(self.pipeline.task_done("build:b"))
+        self.assertEqual(self.pipeline.pump(), ["build:c", "minimize:b"])  # b does not wait for a
+        self.assertTrue(self.pipeline.in_stage("build", "a"))
+        self.assertFalse(self.pipeline.task_done("unknown"))
+
+    def test_dropped_items_are_logged(self):
+        self.pipeline.stages["minimize"].submit = lambda key, item: None  # E.g. no seeds for the binary
+        self.pipeline.put("minimize", "a")
+        with self.assertLogs("fuzz_managers.pipeline", level="WARNING") as logs:
+            self.assertEqual(self.pipeline.pump(), [])
+        self.assertIn("Dropped a from the minimize stage", logs.output[0])
+        self.assertFalse(self.pipeline.in_stage("minimize", "a"))
+        self.assertTrue(self.pipeline.idle)
+
+    def test_poll_until_idle(self):
+        for package in ["a", "b"]:
+            self.pipeline.put("build", package)
+        self.pipeline.pump()
+        self.finished = {"build:a"}
+        self.assertEqual(self.pipeline.poll(result_for=lambda task_id: FakeResult(task_id in self.finished)),
+                         ["build:a"])
+        self.finished = set(self.submitted + ["minimize:a", "minimize:b"])
+        self.pipeline.run(poll_interval=0, result_for=lambda task_id: FakeResult(task_id in self.finished))
+        self.assertTrue(self.pipeline.idle)
+        self.assertEqual(sorted(self.submitted), ["build:a", "build:b", "minimize:a", "minimize:b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers.resource_manager import ResourceManager, format_cpu_list, parse_cpu_list
+
+
+class TestResourceManager(unittest.TestCase):
+    """
+    Unittesting the allocation of cores and memory on a fake host with two NUMA nodes.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.tmp_dir, "resources.json")
+        self.manager = ResourceManager(state_path=self.state_path, cpus=list(range(8)), memory=8 * 1024,
+                                       nodes={0: [0, 1, 2, 3], 1: [4, 5, 6, 7]})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cpu_lists(self):
+        self.assertEqual(parse_cpu_list("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(format_cpu_list([11, 0, 1, 2, 3, 8, 10]), "0-3,8,10-11")
+
+    def test_exclusive_cores(self):
+        first = self.manager.acquire(cores=3)
+        second = self.manager.acquire(cores=3)
+        self.assertEqual(first.cpuset, "0-2")
+        self.assertEqual(second.cpuset, "4-6")  # Does not fit onto node 0 anymore
+        self.assertEqual(second.mems, [1])
+        self.assertIn("--cpuset-cpus=4-6", second.docker_args())
+        self.assertIn("AFL_NO_AFFINITY=1", second.docker_args())
+        self.assertEqual(self.manager.acquire(cores=1).cpuset, "3")  # Fills the fuller node first
+        self.assertIsNone(self.manager.acquire(cores=2))  # Only core 7 is left
+        self.manager.release(first)
+        spanning = self.manager.acquire(cores=4)
+        self.assertEqual(spanning.cpuset, "0-2,7")
+        self.assertIsNone(spanning.mems)
+
+    def test_memory(self):
+        self.assertIsNotNone(self.manager.acquire(cores=1, memory=6 * 1024))
+        self.assertIsNone(self.manager.acquire(cores=1, memory=4 * 1024))
+        self.assertIsNotNone(self.manager.acquire(cores=1, memory=2 * 1024))
+
+    def test_requests_larger_than_the_host(self):
+        allocation = self.manager.acquire(cores=16, memory=64 * 1024)
+        self.assertEqual(len(allocation.cpus), 8)
+        self.assertEqual(allocation.memory, 8 * 1024)
+        self.assertIsNone(self.manager.acquire(cores=1, memory=1024))  # Until it is released
+        self.manager.release(allocation)
+        self.assertIsNotNone(self.manager.acquire(cores=1, memory=1024))
+
+    def test_allocations_of_dead_processes_are_released(self):
+        with open(self.state_path, "w") as fp:
+            json.dump({"stale": {"cpus": list(range(8)), "memory": 0, "pid": 2 ** 22 + 1, "owner": None,
+                                 "created": 0}}, fp)
+        self.assertIsNotNone(self.manager.acquire(cores=8))
+        self.assertEqual(len(self.manager.allocations()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
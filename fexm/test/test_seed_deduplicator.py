@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers import seed_deduplicator
+from helpers.seed_deduplicator import SeedDeduplicator
+from helpers import utils
+
+
+class TestSeedDeduplicator(unittest.TestCase):
+    """
+    Unittesting the seed deduplicator and its persistent index.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        contents = {"a": b"same", "b": b"diff", "c": b"same", "d": b"longer file", "e": b"same"}
+        self.files = []
+        for name in sorted(contents):
+            path = os.path.join(self.tmp_dir, name)
+            with open(path, "wb") as fp:
+                fp.write(contents[name])
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def test_duplicate_groups(self):
+        groups = SeedDeduplicator(cores=2).find_duplicate_groups(self.files + [self.tmp_dir])
+        self.assertEqual(groups, [[self.path("a"), self.path("c"), self.path("e")], [self.path("b")],
+                                  [self.path("d")]])
+        self.assertEqual(utils.filter_out_duplicates(self.files), [self.path("a"), self.path("b"), self.path("d")])
+
+    def test_index_avoids_rehashing(self):
+        index_path = os.path.join(self.tmp_dir, "index", "seeds.sqlite")
+        with SeedDeduplicator(index_path=index_path) as deduplicator:
+            first_groups = deduplicator.find_duplicate_groups(self.files)
+        with unittest.mock.patch("helpers.seed_deduplicator.full_hash_file",
+                                 side_effect=seed_deduplicator.full_hash_file) as full_hash_file:
+            with SeedDeduplicator(index_path=index_path) as deduplicator:
+                self.assertEqual(deduplicator.find_duplicate_groups(self.files), first_groups)
+            full_hash_file.assert_not_called()
+            with open(self.path("c"), "wb") as fp:
+                fp.write(b"sane")
+            with SeedDeduplicator(index_path=index_path) as deduplicator:
+                groups = deduplicator.find_duplicate_groups(self.files)
+            self.assertEqual(groups[0], [self.path("a"), self.path("e")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers import seed_staging
+from helpers import utils
+
+
+class TestSeedStaging(unittest.TestCase):
+    """
+    Unittesting the zero-copy staging of seed files.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.seeds_dir = os.path.join(self.tmp_dir, "seeds")
+        os.makedirs(self.seeds_dir)
+        with open(os.path.join(self.seeds_dir, "small"), "wb") as fp:
+            fp.write(b"small seed")
+        with open(os.path.join(self.seeds_dir, "big"), "wb") as fp:
+            fp.write(bytes(range(256)) * 40)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stage_file(self):
+        destination = os.path.join(self.tmp_dir, "staged")
+        method = seed_staging.stage_file(os.path.join(self.seeds_dir, "small"), destination)
+        self.assertIn(method, [seed_staging.STAGED_LINK, seed_staging.STAGED_REFLINK, seed_staging.STAGED_COPY])
+        with open(destination, "rb") as fp:
+            self.assertEqual(fp.read(), b"small seed")
+        method = seed_staging.stage_file(os.path.join(self.seeds_dir, "big"), destination, max_size=1000,
+                                         crop_size=300)
+        self.assertEqual(method, seed_staging.STAGED_CROP)
+        with open(destination, "rb") as fp:
+            self.assertEqual(fp.read(), (bytes(range(256)) * 2)[:300])
+        with open(os.path.join(self.seeds_dir, "small"), "rb") as fp:  # The staged seed did not touch the source
+            self.assertEqual(fp.read(), b"small seed")
+
+    def test_combined_seeds_dir(self):
+        other_seeds_dir = os.path.join(self.tmp_dir, "other_seeds")
+        os.makedirs(os.path.join(other_seeds_dir, "subdir"))
+        with open(os.path.join(other_seeds_dir, "other"), "wb") as fp:
+            fp.write(b"other")
+        combined = utils.make_combined_seeds_dir([self.seeds_dir, other_seeds_dir],
+                                                 os.path.join(self.tmp_dir, "combined"))
+        self.assertEqual(sorted(os.listdir(combined)), ["big", "other", "small"])
+        self.assertEqual(os.path.getsize(os.path.join(combined, "big")), 850)
+        self.assertEqual(os.path.getsize(os.path.join(combined, "small")), len(b"small seed"))
+
+
+if __name__ == '__main__':
+    unittest.main()
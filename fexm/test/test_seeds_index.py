@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder import coverage_oracle
+from helpers.seeds_index import SeedsIndex, SeedsIndexer
+
+
+class TestSeedsIndex(unittest.TestCase):
+    """
+    Unittesting the choice of representative seeds.
+    """
+
+    def setUp(self):
+        self.seeds_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.seeds_dir, "png_samples"))
+        os.makedirs(os.path.join(self.seeds_dir, "txt_samples"))
+        # Many near identical pngs and a few different ones
+        for i in range(20):
+            self.write("png_samples", "plain{0}.png".format(i), b"\x89PNG\r\n\x1a\n" + bytes([i]) * 100)
+        self.write("png_samples", "huge.png", b"\x89PNG\r\n\x1a\n" + b"A" * 100000)
+        self.write("png_samples", "broken.png", b"GIF89a" + b"B" * 100)
+        self.write("txt_samples", "a.txt", b"hello")
+
+    def tearDown(self):
+        shutil.rmtree(self.seeds_dir)
+
+    def write(self, filetype, name, content):
+        with open(os.path.join(self.seeds_dir, filetype, name), "wb") as fp:
+            fp.write(content)
+
+    def test_representatives_are_diverse(self):
+        SeedsIndexer(self.seeds_dir, reference_parsers=[], representatives=3).update()
+        index = SeedsIndex(self.seeds_dir)
+        names = [os.path.basename(path) for path in index.representatives("png_samples")]
+        self.assertEqual(len(names), 3)
+        self.assertIn("huge.png", names)
+        self.assertIn("broken.png", names)
+        self.assertEqual(index.representatives("txt_samples"), [os.path.join(self.seeds_dir, "txt_samples", "a.txt")])
+        self.assertEqual(index.representatives("pdf_samples"), [])
+
+    def test_unchanged_filetypes_are_not_reindexed(self):
+        SeedsIndexer(self.seeds_dir, reference_parsers=[], representatives=3).update()
+        self.write("txt_samples", "b.txt", b"world")
+        indexer = SeedsIndexer(self.seeds_dir, reference_parsers=[], representatives=3)
+        with mock.patch.object(indexer, "index_filetype", wraps=indexer.index_filetype) as index_filetype:
+            index = indexer.update()
+        self.assertEqual(index_filetype.call_count, 1)
+        self.assertEqual(len(index.representatives("txt_samples")), 2)
+
+    @unittest.skipUnless(shutil.which("true"), "true is needed as a reference parser without forkserver")
+    def test_reference_parser_without_forkserver(self):
+        indexer = SeedsIndexer(self.seeds_dir, reference_parsers=[(shutil.which("true"), "@@")], representatives=3,
+                               cores=2)
+        files = [os.path.join(self.seeds_dir, "png_samples", "plain{0}.png".format(i)) for i in range(4)]
+        self.assertIsNone(indexer.coverage_sketches(files))  # Skipped instead of waiting for the failed workers
+        indexer.update()
+        self.assertEqual(len(SeedsIndex(self.seeds_dir).representatives("png_samples")), 3)
+
+    def test_probing_prefers_representatives(self):
+        SeedsIndexer(self.seeds_dir, reference_parsers=[], representatives=3).update()
+        representatives = SeedsIndex(self.seeds_dir).representatives("png_samples")
+        sample = coverage_oracle.sample_directory(os.path.join(self.seeds_dir, "png_samples"), probe=True,
+                                                  representatives=representatives)
+        self.assertEqual(len(sample), coverage_oracle.PROBE_FILES)
+        self.assertEqual(sample[:3], representatives)
+
+
+if __name__ == '__main__':
+    unittest.main()
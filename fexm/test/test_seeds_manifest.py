@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers import seeds_manifest
+from helpers.seed_deduplicator import full_hash_file
+from helpers.seeds_manifest import SeedsManifest
+
+
+class TestSeedsManifest(unittest.TestCase):
+    """
+    Unittesting the incremental refresh of the seeds manifest.
+    """
+
+    def setUp(self):
+        self.seeds_dir = tempfile.mkdtemp()
+        self.write("png_samples", "a.png", b"\x89PNG a")
+        self.write("png_samples", "b.png", b"\x89PNG bb")
+        self.write("txt_samples", "a.txt", b"hello")
+        os.makedirs(os.path.join(self.seeds_dir, "pdf_samples"))
+        self.age()
+
+    def tearDown(self):
+        seeds_manifest._manifests.clear()
+        shutil.rmtree(self.seeds_dir)
+
+    def write(self, filetype, name, content):
+        os.makedirs(os.path.join(self.seeds_dir, filetype), exist_ok=True)
+        with open(os.path.join(self.seeds_dir, filetype, name), "wb") as fp:
+            fp.write(content)
+
+    def age(self):
+        """
+        Moves the mtimes out of the racy window, as if the corpus was written a while ago.
+        """
+        past = time.time() - 60
+        for root, dirs, files in os.walk(self.seeds_dir):
+            for name in dirs + files:
+                os.utime(os.path.join(root, name), (past, past))
+
+    def test_lists_the_corpus(self):
+        manifest = SeedsManifest(self.seeds_dir)
+        manifest.refresh()
+        self.assertEqual(manifest.filetypes(), ["png_samples", "txt_samples"])
+        self.assertEqual(manifest.filetypes(include_empty=True), ["pdf_samples", "png_samples", "txt_samples"])
+        self.assertEqual(manifest.files("png_samples"), [os.path.join(self.seeds_dir, "png_samples", "a.png"),
+                                                         os.path.join(self.seeds_dir, "png_samples", "b.png")])
+        self.assertEqual(manifest.count("jpg_samples"), 0)
+        self.assertEqual(manifest.sizes("txt_samples"), {os.path.join(self.seeds_dir, "txt_samples", "a.txt"): 5})
+
+    def test_only_changed_directories_are_listed(self):
+        SeedsManifest(self.seeds_dir).refresh()
+        self.write("txt_samples", "b.txt", b"world")
+        past = time.time() - 30
+        os.utime(os.path.join(self.seeds_dir, "txt_samples"), (past, past))
+        manifest = SeedsManifest(self.seeds_dir)
+        with mock.patch.object(manifest, "_scan_filetype", wraps=manifest._scan_filetype) as scan_filetype:
+            manifest.refresh()
+        self.assertEqual([call[0][0] for call in scan_filetype.call_args_list], ["txt_samples"])
+        self.assertEqual(manifest.count("txt_samples"), 2)
+
+    def test_hashes_are_computed_once(self):
+        manifest = SeedsManifest(self.seeds_dir)
+        manifest.refresh()
+        path = os.path.join(self.seeds_dir, "png_samples", "a.png")
+        self.assertEqual(manifest.hashes("png_samples")[path], full_hash_file(path))
+        reloaded = SeedsManifest(self.seeds_dir)
+        with mock.patch.object(seeds_manifest, "full_hash_file") as hash_file:
+            reloaded.refresh()
+            reloaded.hashes("png_samples")
+        hash_file.assert_not_called()
+
+    def test_added_files(self):
+        manifest = SeedsManifest(self.seeds_dir)
+        manifest.refresh()
+        fingerprint = manifest.fingerprint()
+        self.write("png_samples", "c.png", b"\x89PNG ccc")
+        manifest.add_file("png_samples", "c.png")
+        self.assertEqual(manifest.count("png_samples"), 3)
+        self.assertNotEqual(manifest.fingerprint(), fingerprint)
+
+    def test_version_mismatch_is_rebuilt(self):
+        with open(os.path.join(self.seeds_dir, ".seeds_manifest.json"), "w") as fp:
+            json.dump({"version": -1, "filetypes": {"gif_samples": {"mtime_ns": 0, "files": {}}}}, fp)
+        manifest = SeedsManifest(self.seeds_dir)
+        manifest.refresh()
+        self.assertNotIn("gif_samples", manifest)
+        self.assertIn("png_samples", manifest)
+
+
+if __name__ == '__main__':
+    unittest.main()
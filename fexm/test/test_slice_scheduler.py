@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from fuzz_managers.energy_scheduler import EnergyScheduler
+from fuzz_managers.slice_scheduler import SliceScheduler
+from helpers.fuzzing_checkpoint import begin_slice, checkpoint_path, read_checkpoint, stopped_cleanly, \
+    write_checkpoint
+
+
+class TestSliceScheduler(unittest.TestCase):
+    """
+    Unittesting the allocation of time slices to new and resumed binaries.
+    """
+
+    def setUp(self):
+        self.now = 0
+        self.scheduler = SliceScheduler(EnergyScheduler(fairness_floor=0, clock=lambda: self.now), new_share=0.5,
+                                        clock=lambda: self.now)
+
+    def test_new_binaries_share_the_slots(self):
+        for key in ["r1", "r2", "r3"]:
+            self.scheduler.add_resume(key)
+        for key in ["n1", "n2", "n3"]:
+            self.now += 1
+            self.scheduler.add_new(key)
+        self.now += 10
+        self.assertEqual(self.scheduler.longest_new_wait(), 12)
+        selected = self.scheduler.select(4)
+        self.assertEqual([key for key, new in selected if new], ["n1", "n2"])  # Oldest first
+        self.assertEqual(len([key for key, new in selected if not new]), 2)
+        self.assertEqual(self.scheduler.longest_new_wait(), 10)
+
+    def test_new_binaries_take_idle_slots(self):
+        for key in ["n1", "n2", "n3"]:
+            self.scheduler.add_new(key)
+        self.assertEqual(self.scheduler.select(5), [("n1", True), ("n2", True), ("n3", True)])
+        self.assertEqual(self.scheduler.waiting, 0)
+
+
+class TestFuzzingCheckpoint(unittest.TestCase):
+    """
+    Unittesting the checkpoints of sliced afl sessions.
+    """
+
+    def test_checkpoints_accumulate(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            afl_out_dir = os.path.join(tmp_dir, "afl_fuzz") + "/"
+            self.assertEqual(read_checkpoint(afl_out_dir), {})
+            write_checkpoint(afl_out_dir, 60, clean=True)
+            checkpoint = write_checkpoint(afl_out_dir, 30, clean=False)
+            self.assertEqual((checkpoint["slices"], checkpoint["fuzzing_time"], checkpoint["clean"]), (2, 90, False))
+            self.assertEqual(read_checkpoint(afl_out_dir), checkpoint)
+            self.assertEqual(checkpoint_path(afl_out_dir), os.path.join(tmp_dir, "afl_fuzz.checkpoint"))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_killed_sessions_are_not_clean(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            afl_out_dir = os.path.join(tmp_dir, "afl_fuzz")
+            self.assertTrue(stopped_cleanly(afl_out_dir))  # Never sliced
+            begin_slice(afl_out_dir)
+            self.assertFalse(stopped_cleanly(afl_out_dir))  # Killed before the checkpoint was written
+            write_checkpoint(afl_out_dir, 60, clean=True)
+            self.assertTrue(stopped_cleanly(afl_out_dir))
+            begin_slice(afl_out_dir)
+            write_checkpoint(afl_out_dir, 10, clean=False)
+            self.assertFalse(stopped_cleanly(afl_out_dir))
+            self.assertEqual(read_checkpoint(afl_out_dir)["slices"], 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from configfinder.tmin_scheduler import TminScheduler
+
+
+class TestTminScheduler(unittest.TestCase):
+    """
+    Unittesting the time budgets of the parallel afl-tmin stage with a fake clock.
+    """
+
+    def setUp(self):
+        self.seeds_dir = tempfile.mkdtemp()
+        self.files = [self.write("big", os.urandom(8000)), self.write("small", os.urandom(2000)),
+                      self.write("tiny", b"ab")]
+        self.now = 0
+        self.budgets = {}
+        self.kept = []
+
+    def tearDown(self):
+        shutil.rmtree(self.seeds_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.seeds_dir, name)
+        with open(path, "wb") as fp:
+            fp.write(content)
+        return path
+
+    def minimize(self, path, timeout):
+        self.budgets[os.path.basename(path)] = timeout
+        self.now += timeout  # Uses all of its budget
+        return True
+
+    def keep(self, path):
+        self.kept.append(os.path.basename(path))
+
+    def scheduler(self, total_time, **kwargs):
+        return TminScheduler(self.files, self.minimize, self.keep, total_time, clock=lambda: self.now, **kwargs)
+
+    def test_budgets_proportional_to_size(self):
+        self.assertTrue(self.scheduler(100).run())
+        self.assertEqual(self.kept, ["tiny"])
+        self.assertAlmostEqual(self.budgets["big"], 80)
+        self.assertAlmostEqual(self.budgets["small"], 20)
+
+    def test_budget_capped_by_deadline(self):
+        scheduler = self.scheduler(100, cores=4)
+        scheduler.minimize = lambda path, timeout: self.budgets.setdefault(os.path.basename(path), timeout)
+        scheduler.run()
+        self.assertEqual(self.budgets, {"big": 100, "small": 100})
+
+    def test_unused_time_is_reassigned(self):
+        scheduler = self.scheduler(100)
+
+        def minimize(path, timeout):
+            self.budgets[os.path.basename(path)] = timeout
+            self.now += 10  # Done after 10 of the 80 seconds
+            return True
+
+        scheduler.minimize = minimize
+        scheduler.run()
+        self.assertEqual(self.budgets["small"], 90)
+
+    def test_no_work_near_deadline(self):
+        scheduler = self.scheduler(100)
+        self.now = 98
+        scheduler.run()
+        self.assertEqual(self.budgets, {})
+        self.assertEqual(sorted(self.kept), ["big", "small", "tiny"])
+
+    def test_failure_cancels_remaining_files(self):
+        scheduler = self.scheduler(100)
+        scheduler.minimize = lambda path, timeout: False
+        self.assertFalse(scheduler.run())
+        self.assertEqual(sorted(self.kept), ["small", "tiny"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import unittest.mock
+
+parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+os.sys.path.insert(0, parentdir)
+from helpers import utils
+
+
+@unittest.mock.patch("helpers.utils.count_number_of_tuples_per_binary", return_value=42)
+@unittest.mock.patch("helpers.utils.binary_is_instrumented_with_afl", return_value=True)
+@unittest.mock.patch("helpers.utils.inference_possible")
+@unittest.mock.patch("helpers.utils.is_executable_binary")
+@unittest.mock.patch("helpers.utils.is_gui_elf")
+class TestTriage(unittest.TestCase):
+    """
+    Unittesting the parallel triage of elf binaries. The expensive stages are mocked.
+    """
+
+    def test_triage_stops_at_first_rejecting_stage(self, is_gui_elf, is_executable_binary, inference_possible,
+                                                   binary_is_instrumented_with_afl, count_tuples):
+        is_gui_elf.return_value = True
+        result = utils.triage_elf_binary("/bin/true")
+        self.assertEqual(result["log"], {"is_gui_elf": True})
+        self.assertFalse(result["executable"])
+        is_executable_binary.assert_not_called()
+        inference_possible.assert_not_called()
+
+    def test_cached_binaries_are_made_executable(self, is_gui_elf, is_executable_binary, inference_possible,
+                                                 binary_is_instrumented_with_afl, count_tuples):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            elf = os.path.join(tmp_dir, "main")
+            shutil.copyfile(shutil.which("true"), elf)  # copyfile does not copy the mode
+            cache = unittest.mock.Mock()
+            cache.get.return_value = {"log": {}, "executable": True, "fuzzable": True}
+            self.assertTrue(utils.triage_elf_binary(elf, cache=cache)["fuzzable"])
+            self.assertTrue(os.stat(elf).st_mode & stat.S_IXUSR)
+            is_gui_elf.assert_not_called()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_log_dict_is_filled_in_order(self, is_gui_elf, is_executable_binary, inference_possible,
+                                         binary_is_instrumented_with_afl, count_tuples):
+        is_gui_elf.side_effect = lambda path: path.endswith("gui")
+        is_executable_binary.side_effect = lambda path: not path.endswith("lib")
+        inference_possible.side_effect = lambda binary_path, log_dict: not binary_path.endswith("noinf")
+        binaries = ["/a/gui", "/a/lib", "/a/noinf", "/a/ok1", "/a/ok2"]
+        with unittest.mock.patch("helpers.elf_deduplicator.ElfDeDuplicator.find_duplicate_groups",
+                                 return_value=[[b] for b in binaries]):
+            log_dict = {"some": "entry"}
+            result = utils.return_fuzzable_binaries_from_file_list([], log_dict=log_dict, cores=3)
+        self.assertEqual(result, ["/a/ok1", "/a/ok2"])
+        self.assertEqual(log_dict["elf_files"], binaries)
+        self.assertEqual(log_dict["executable_elf_files"], ["/a/noinf", "/a/ok1", "/a/ok2"])
+        self.assertEqual(log_dict["fuzzable_bins"], ["/a/ok1", "/a/ok2"])
+        self.assertTrue(log_dict["/a/gui"]["is_gui_elf"])
+        self.assertFalse(log_dict["/a/lib"]["is_executable_elf"])
+        self.assertEqual(log_dict["/a/ok1"]["number_of_tuples"], 42)
+        self.assertNotIn("number_of_tuples", log_dict["/a/noinf"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@ Crawls seeds from Github.
 """
 import argparse
 import json
+import threading
+import typing
 import uuid
 from multiprocessing.pool import ThreadPool
 from queue import Queue
@@ -15,6 +17,7 @@ parentdir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 os.sys.path.insert(0, parentdir)
 from seed_crawlers.graphql_githubsearcher import GraphQlGithubSearcher
 from helpers import utils
+from helpers.seeds_manifest import SeedsManifest
 
 # Top filetypes as defaults for the crawler.
 DEFAULT_FILETYPES = [
@@ -250,27 +253,41 @@ class GithubSeedsDownloader(object):
         else:
             self.search_string = "size>:5000"
         self.auth_token = auth_token
+        # Counts the seeds so far in memory instead of listing the directory before every download
+        self.seeds_manifest = SeedsManifest.for_directory(out_dir)
+        self.pending_downloads = {}  # type: typing.Dict[str, int]
+        self.download_lock = threading.Lock()
 
-    # TODO: Time of Check Time of Use -> We might download too many files.
     def download(self, blob_entry: GitHubTreeEntry) -> int:
         """
         Given a GithubTreeEntry object, tries to download the respective file.
         """
         file_extension = os.path.splitext(blob_entry.filename)[1][1:]
-        file_out_dir = "{0}/{1}_samples/".format(self.out_dir, file_extension)
+        filetype = file_extension + "_samples"
+        file_out_dir = "{0}/{1}/".format(self.out_dir, filetype)
         # Now: Download
         filename = file_extension + "_" + str(uuid.uuid4()) + "." + file_extension
         if not os.path.exists(file_out_dir):
-            os.makedirs(file_out_dir)
-        number_of_files_of_so_far = len(
-            [name for name in os.listdir(file_out_dir) if os.path.isfile(file_out_dir + os.sep + name)])
+            os.makedirs(file_out_dir, exist_ok=True)
+        with self.download_lock:
+            # Downloads in flight count as well, so concurrent downloads do not exceed max_download
+            number_of_files_of_so_far = self.seeds_manifest.count(filetype) + self.pending_downloads.get(filetype, 0)
+            if number_of_files_of_so_far < self.max_download:
+                self.pending_downloads[filetype] = self.pending_downloads.get(filetype, 0) + 1
         if number_of_files_of_so_far < self.max_download:
             # Download the file
             download_link = "https://raw.githubusercontent.com/{0}/{1}/master/{2}".format(blob_entry.repo_owner,
                                                                                           blob_entry.repo_name,
                                                                                           blob_entry.path)
-            downloaded = utils.download_seed_to_folder(download_link=download_link, to_directory=file_out_dir,
-                                                       filename=filename)
+            downloaded = False
+            try:
+                downloaded = utils.download_seed_to_folder(download_link=download_link, to_directory=file_out_dir,
+                                                           filename=filename)
+            finally:
+                with self.download_lock:
+                    self.pending_downloads[filetype] -= 1
+                    if downloaded:
+                        self.seeds_manifest.add_file(filetype, filename)
             return downloaded
         else:
             try:
@@ -325,9 +342,10 @@ def crawl(out_dir: str, max_number_of_seeds: int, infile_path: str, auth_token:
                     filetype = filetype[1:]
                 filetype = filetype.lower()
                 os.makedirs(os.path.join(out_dir, filetype + "_samples"), exist_ok=True)
-                if len(os.listdir(os.path.join(out_dir, filetype + "_samples"))) >= max_number_of_seeds:
-                    continue
                 desired_filetypes.add(filetype)
+        seeds_manifest = SeedsManifest.for_directory(out_dir, max_age=0)
+        desired_filetypes = set(filetype for filetype in desired_filetypes
+                                if seeds_manifest.count(filetype + "_samples") < max_number_of_seeds)
     else:
         desired_filetypes = set(DEFAULT_FILETYPES)
 
@@ -339,6 +357,7 @@ def crawl(out_dir: str, max_number_of_seeds: int, infile_path: str, auth_token:
         gs = GithubSeedsDownloader(desired_filetypes, max_number_of_seeds, out_dir, auth_token=auth_token,
                                    search_string=filetype)
         gs.get_files()
+        gs.seeds_manifest.save()
 
 
 if __name__ == "__main__":